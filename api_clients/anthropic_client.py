@@ -1,10 +1,8 @@
-from api_clients.base_client import BaseAPIClient
-from dotenv import load_dotenv
-import os
+from api_clients.base_client import BaseAPIClient, empty_token_usage
+from api_clients.model_registry import get_model_registry
 
-load_dotenv()
-
-AVAILABLE_ANTHROPIC_MODELS = os.getenv('AVAILABLE_ANTHROPIC_MODELS').split(',')
+# The models offered in the menus, the first one is the default
+AVAILABLE_ANTHROPIC_MODELS = get_model_registry().models('anthropic')
 
 class AnthropicClient(BaseAPIClient):
     """
@@ -12,15 +10,19 @@ class AnthropicClient(BaseAPIClient):
     It inherits from the BaseAPIClient and provides the implementation for sending requests to the Anthropic API.
     """
 
-    def __init__(self, api_key, api_url):
+    provider = 'anthropic'
+
+    def __init__(self, api_key, api_url, session=None, timeout=None):
         """
         Initialize the AnthropicHTTPClient with the API key and URL.
 
         Args:
             api_key (str): The Anthropic API key for authentication.
             api_url (str): The URL of the Anthropic API endpoint (default: "https://api.anthropic.com/v1/messages").
+            session (requests.Session, optional): The HTTP session to use. Defaults to the shared pooled session.
+            timeout (tuple, optional): The (connect, read) timeouts in seconds.
         """
-        super().__init__(api_key, api_url)
+        super().__init__(api_key, api_url, session=session, timeout=timeout)
         self.model = AVAILABLE_ANTHROPIC_MODELS[0]  # Set the default model
 
     def _get_headers(self):
@@ -33,22 +35,13 @@ class AnthropicClient(BaseAPIClient):
             'Anthropic-Version': '2023-06-01'
         }
 
-    def _get_request_data(self, prompt, chat_history):
+    def _get_request_params(self):
         """
-        Return the request data for the Anthropic API.
+        Return the request parameters for the Anthropic API, the messages are added by the base client.
         """
-        messages = []
-        for message in chat_history["messages"]:
-            role = message["sender"]
-            content = message["text"]
-            messages.append({"role": role, "content": content})
-
-        messages.append({"role": "user", "content": prompt})
-
         return {
             'model': self.model,
-            'max_tokens': 2000,  
-            'messages': messages
+            'max_tokens': self.model_info['max_tokens']
         }
 
     def _parse_response(self, response):
@@ -61,15 +54,97 @@ class AnthropicClient(BaseAPIClient):
         response_data = response.json()
         content_blocks = response_data.get('content', [])
         result = ''
-        for block in content_blocks:
+        for index, block in enumerate(content_blocks):
             if block.get('type') == 'text':
                 result += block.get('text', '')
             elif block.get('type') == 'code':
                 result += f"```\n{block.get('code', '')}\n```"
+            elif block.get('type') == 'tool_use':
+                self._tool_calls.add(index, block.get('id'), block.get('name'), block.get('input', {}))
             # Add other block types as needed
 
-        usage = response_data.get('usage', {})
-        input_tokens = usage.get('input_tokens', 0)
-        output_tokens = usage.get('output_tokens', 0)
+        token_usage = empty_token_usage()
+        self._update_token_usage(response_data.get('usage', {}), token_usage)
+
+        # a response with tool calls may have no text
+        return result or ('' if self._tool_calls else "No response received."), token_usage
+
+    def _format_message(self, message, last=False):
+        """
+        Convert a chat history message to the Anthropic format. With prompt caching enabled, the messages
+        pinned as a stable prefix and the new prompt get a `cache_control` breakpoint, so every turn reads
+        the conversation so far from the cache.
+        """
+        if not (self.prompt_caching and self.model_info['prompt_caching']) or not (last or message.get("cache")):
+            return super()._format_message(message)
+        return {
+            "role": message["sender"],
+            "content": [{"type": "text", "text": message["text"], "cache_control": {"type": "ephemeral"}}]
+        }
+
+    def _format_tools(self, definitions):
+        """
+        Convert the tool definitions to the tools parameter of the Anthropic API.
+        """
+        return [{"name": definition["name"], "description": definition["description"],
+                 "input_schema": definition["parameters"]} for definition in definitions]
+
+    def _format_tool_messages(self, ai_response, tool_calls, results):
+        """
+        Return the messages of a tool round for the Anthropic API: the assistant message with its
+        tool_use blocks, then a user message with their tool_result blocks.
+        """
+        content = [{"type": "text", "text": ai_response}] if ai_response else []
+        content += [{"type": "tool_use", "id": tool_call["id"], "name": tool_call["name"], "input": tool_call["arguments"]}
+                    for tool_call in tool_calls]
+        return [{"role": "assistant", "content": content},
+                {"role": "user", "content": [{"type": "tool_result", "tool_use_id": tool_call["id"], "content": result}
+                                             for tool_call, result in zip(tool_calls, results)]}]
+
+    def _apply_summary(self, params, summary):
+        """
+        Add the summary of the compacted chat history as the system prompt, the Anthropic API has no system messages.
+        """
+        if summary:
+            params['system'] = f"Summary of the earlier conversation:\n{summary}"
+        return []
+
+    def _update_token_usage(self, usage, token_usage):
+        """
+        Copy the token counts of an Anthropic usage object into the token usage dictionary.
+        """
+        for key, usage_key in (("input_tokens", 'input_tokens'), ("output_tokens", 'output_tokens'),
+                               ("cache_read_tokens", 'cache_read_input_tokens'),
+                               ("cache_write_tokens", 'cache_creation_input_tokens')):
+            if usage.get(usage_key) is not None:
+                token_usage[key] = usage[usage_key]
+
+    def _parse_stream_event(self, event, data, token_usage):
+        """
+        Parse a server-sent event from the Anthropic streaming API.
+
+        Returns:
+            str: The text delta carried by the event, if any.
+        """
+        if not isinstance(data, dict):
+            return ''
 
-        return result or "No response received.", {"input_tokens": input_tokens, "output_tokens": output_tokens}
+        event_type = data.get('type', event)
+        if event_type == 'message_start':
+            self._update_token_usage(data.get('message', {}).get('usage', {}), token_usage)
+        elif event_type == 'content_block_start':
+            block = data.get('content_block', {})
+            if block.get('type') == 'tool_use':
+                self._tool_calls.add(data.get('index', 0), block.get('id'), block.get('name'))
+        elif event_type == 'content_block_delta':
+            delta = data.get('delta', {})
+            if delta.get('type') == 'text_delta':
+                return delta.get('text', '')
+            if delta.get('type') == 'input_json_delta':
+                self._tool_calls.add(data.get('index', 0), partial_json=delta.get('partial_json'))
+        elif event_type == 'message_delta':
+            # the counts are cumulative in message_delta events
+            self._update_token_usage(data.get('usage', {}), token_usage)
+        elif event_type == 'error':
+            raise RuntimeError(f"Anthropic stream error: {data.get('error', {}).get('message', data)}")
+        return ''
@@ -0,0 +1,255 @@
+import time
+import asyncio
+import logging
+import httpx
+from api_clients.base_client import BaseAPIClient, empty_token_usage, add_token_usage
+from api_clients.anthropic_client import AnthropicClient
+from api_clients.openai_client import OpenAIClient
+from api_clients.http_session import HTTP_POOL_SIZE, HTTP2_ENABLED
+from api_clients.instrumentation import HTTPXTrace, StreamTimer
+from api_clients.message_buffer import encode_json
+from api_clients.sse import SSEDecoder
+from api_clients.tool_use import MAX_TOOL_ROUNDS
+
+
+def create_async_http_client(pool_size=None, http2=None):
+    """
+    Create an `httpx.AsyncClient` with a keep-alive connection pool, to be shared by the async API clients.
+    The client is bound to the running event loop, so create it inside the coroutine that uses it.
+
+    Args:
+        pool_size (int, optional): The maximum number of connections. Defaults to HTTP_POOL_SIZE.
+        http2 (bool, optional): Use HTTP/2 (requires `httpx[http2]`). Defaults to HTTP2_ENABLED.
+
+    Returns:
+        httpx.AsyncClient: The HTTP client.
+    """
+    pool_size = pool_size or HTTP_POOL_SIZE
+    limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+    return httpx.AsyncClient(http2=HTTP2_ENABLED if http2 is None else http2, limits=limits)
+
+
+class AsyncBaseAPIClient(BaseAPIClient):
+    """
+    This is the asyncio counterpart of the BaseAPIClient. It reuses the request building and
+    response parsing of the provider clients, and sends the requests with `httpx.AsyncClient`.
+    """
+
+    def __init__(self, api_key, api_url, session, timeout=None):
+        """
+        Initialize the AsyncBaseAPIClient with the API key and URL.
+
+        Args:
+            api_key (str): The API key for authentication.
+            api_url (str): The URL of the API endpoint.
+            session (httpx.AsyncClient): The async HTTP client, see `create_async_http_client`.
+            timeout (tuple, optional): The (connect, read) timeouts in seconds. Defaults to DEFAULT_TIMEOUT.
+        """
+        super().__init__(api_key, api_url, session=session, timeout=timeout)
+
+    async def send_request(self, prompt, cache=False):
+        """
+        Send a request to the API with the given prompt and return the response.
+
+        Args:
+            prompt (str): The prompt to send to the AI.
+            cache (bool, optional): Mark the prompt as a stable prefix to cache. Defaults to False.
+
+        Returns:
+            tuple: A tuple containing the AI's response (str) and a dictionary with input and output token counts.
+        """
+        with self.instrumentation.turn(client=type(self).__name__, model=self.model, stream=False) as turn:
+            compaction_usage = await self._fit_context(prompt)
+            texts, tool_messages = [], []
+            token_usage = empty_token_usage()
+            for tool_round in range(MAX_TOOL_ROUNDS + 1):
+                body = self._encode_request(prompt, cache=cache, tool_messages=tool_messages)
+                cached = self._get_cached_response(body)
+                if cached is not None:
+                    ai_response, tool_calls = cached
+                    if turn is not None:
+                        turn.labels["cached"] = True
+                else:
+                    self._tool_calls.reset()
+                    response = await self._post(body)
+                    response.raise_for_status()
+                    ai_response, round_usage = self._parse_timed_response(response)
+                    add_token_usage(token_usage, round_usage)
+                    tool_calls = self._tool_calls.finish()
+                    self._store_cached_response(body, ai_response, round_usage, tool_calls)
+                if ai_response:
+                    texts.append(ai_response)
+                if not tool_calls:
+                    break
+                if tool_round < MAX_TOOL_ROUNDS:
+                    tool_messages += await self._run_tools(ai_response, tool_calls)
+            else:
+                logging.warning(f'Tool call limit reached ({MAX_TOOL_ROUNDS} rounds), ending the turn.')
+            ai_response = "\n\n".join(texts) or "No response received."
+            self.update_chat_history(prompt, ai_response, cache=cache)
+            self.instrumentation.record_token_usage(token_usage)
+        return ai_response, add_token_usage(token_usage, compaction_usage)
+
+    async def complete(self, prompt):
+        """
+        Send a standalone prompt to the API, outside of the chat history. See `BaseAPIClient.complete`.
+        """
+        data = self._get_request_params()
+        data['messages'] = [self._format_message({"sender": "user", "text": prompt})]
+        response = await self._post(encode_json(data))
+        response.raise_for_status()
+        ai_response, token_usage = self._parse_timed_response(response)
+        self.instrumentation.record_token_usage(token_usage)
+        return ai_response, token_usage
+
+    async def stream_request(self, prompt, cache=False):
+        """
+        Send a streaming request to the API and yield the text deltas as they arrive.
+        See `BaseAPIClient.stream_request`.
+
+        Args:
+            prompt (str): The prompt to send to the AI.
+            cache (bool, optional): Mark the prompt as a stable prefix to cache. Defaults to False.
+
+        Yields:
+            str: The text deltas of the AI's response.
+        """
+        self.last_response = None
+        self.last_token_usage = None
+        with self.instrumentation.turn(client=type(self).__name__, model=self.model, stream=True) as turn:
+            compaction_usage = await self._fit_context(prompt)
+            chunks, tool_messages = [], []
+            token_usage = empty_token_usage()
+            try:
+                for tool_round in range(MAX_TOOL_ROUNDS + 1):
+                    body = self._encode_request(prompt, stream=True, cache=cache, tool_messages=tool_messages)
+                    cached = self._get_cached_response(body)
+                    if cached is not None:
+                        round_text, tool_calls = cached
+                        if turn is not None:
+                            turn.labels["cached"] = True
+                        if round_text:
+                            delta = "\n\n" + round_text if chunks else round_text
+                            chunks.append(delta)
+                            yield delta
+                    else:
+                        self._tool_calls.reset()
+                        round_chunks = []
+                        round_usage = empty_token_usage()
+                        response = await self._post(body, stream=True)
+                        stream_timer = StreamTimer(self.instrumentation)
+                        try:
+                            response.raise_for_status()
+                            decoder = SSEDecoder()
+                            async for line in response.aiter_lines():
+                                stream_timer.response_bytes += len(line) + 1
+                                event = decoder.feed(line)
+                                if event is None:
+                                    continue
+                                delta = stream_timer.parse(self._parse_stream_event, event[0], event[1], round_usage)
+                                if delta:
+                                    stream_timer.first_token()
+                                    round_chunks.append(delta)
+                                    if chunks and len(round_chunks) == 1:
+                                        delta = "\n\n" + delta
+                                    chunks.append(delta)
+                                    yield delta
+                        finally:
+                            await response.aclose()
+                            stream_timer.finish(round_usage)
+                            add_token_usage(token_usage, round_usage)
+
+                        round_text = ''.join(round_chunks)
+                        tool_calls = self._tool_calls.finish()
+                        self._store_cached_response(body, round_text, round_usage, tool_calls)
+                    if not tool_calls:
+                        break
+                    if tool_round < MAX_TOOL_ROUNDS:
+                        tool_messages += await self._run_tools(round_text, tool_calls)
+                else:
+                    logging.warning(f'Tool call limit reached ({MAX_TOOL_ROUNDS} rounds), ending the turn.')
+            except (GeneratorExit, asyncio.CancelledError):
+                # closed or cancelled (e.g. it lost a hedged race), keep what has been received and its usage
+                self._finish_stream(prompt, chunks, add_token_usage(token_usage, compaction_usage), cache)
+                raise
+
+            self._finish_stream(prompt, chunks, add_token_usage(token_usage, compaction_usage), cache)
+
+    async def _run_tools(self, ai_response, tool_calls):
+        """
+        Call the tools requested by the model in a worker thread, so reading and searching the project
+        files doesn't block the event loop. See `BaseAPIClient._run_tools`.
+        """
+        results = []
+        for tool_call in tool_calls:
+            logging.info(f'Tool call: {tool_call["name"]}({tool_call["arguments"]})')
+            self.instrumentation.record('tool_calls', 1)
+            results.append(await asyncio.to_thread(self.tools.call, tool_call["name"], tool_call["arguments"]))
+        return self._format_tool_messages(ai_response, tool_calls, results)
+
+    async def _fit_context(self, prompt):
+        """
+        Compact the chat history to fit the context budget, see `ContextWindowManager.fit`.
+
+        Returns:
+            dict: The token usage of the summary request, or None if no summary was requested.
+        """
+        compacted = self.context_manager.compact(self, prompt)
+        if not compacted or self.context_manager.strategy != 'summarize':
+            return None
+
+        try:
+            summary, token_usage = await self.complete(self.context_manager.get_summary_prompt(self.chat_history, compacted))
+        except Exception as e:
+            logging.error(f'Failed to summarise the compacted history: {str(e)}')
+            return None
+        self.chat_history["summary"] = summary
+        return token_usage
+
+    def warm_up(self):
+        """
+        Connections of the async client are opened on the first request of the event loop.
+        """
+        return None
+
+    async def _post(self, body, stream=False):
+        """
+        Post the request body to the API through the async HTTP client and the request scheduler.
+
+        Args:
+            body (bytes): The JSON request body.
+            stream (bool, optional): Whether to stream the response body. Defaults to False.
+
+        Returns:
+            httpx.Response: The response object from the API.
+        """
+        trace = None
+
+        async def send():
+            nonlocal trace
+            trace = HTTPXTrace(self.instrumentation)
+            request = self.session.build_request('POST', self.api_url, headers=self.headers, content=body,
+                                                 timeout=self._get_timeout(), extensions={"trace": trace.async_trace})
+            return await self.session.send(request, stream=stream)
+
+        start = time.perf_counter()
+        response = await self.scheduler.execute_async(send, estimated_tokens=self._estimate_request_tokens(body),
+                                                      retryable_exceptions=(httpx.TransportError,))
+        self._record_request_timings(body, start, trace.started_at, trace.elapsed, stream)
+        return response
+
+    def _get_timeout(self):
+        connect_timeout, read_timeout = self.timeout
+        return httpx.Timeout(read_timeout, connect=connect_timeout)
+
+
+class AsyncAnthropicClient(AsyncBaseAPIClient, AnthropicClient):
+    """
+    This class represents the async Anthropic API client.
+    """
+
+
+class AsyncOpenAIClient(AsyncBaseAPIClient, OpenAIClient):
+    """
+    This class represents the async OpenAI API client.
+    """
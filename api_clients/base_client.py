@@ -1,5 +1,41 @@
-import requests
-from datetime import datetime 
+import os
+import json
+import logging
+import threading
+import time
+from datetime import timedelta
+from urllib.parse import urlparse
+from api_clients.context_manager import ContextWindowManager
+from api_clients.http_session import get_session, DEFAULT_TIMEOUT
+from api_clients.instrumentation import get_instrumentation, StreamTimer
+from api_clients.message_buffer import MessageBuffer, encode_json
+from api_clients.message_store import BlobStore, Message
+from api_clients.model_registry import get_model_registry
+from api_clients.request_scheduler import RequestScheduler
+from api_clients.response_cache import get_response_cache, make_cache_key, CacheMissError
+from api_clients.sse import iter_sse_events
+from api_clients.tool_use import MAX_TOOL_ROUNDS, ToolCallCollector
+
+# Don't re-warm a connection that has been used more recently than this (in seconds)
+WARM_UP_INTERVAL = 15
+
+# Mark the stable prefix of the conversation for the providers' prompt caching (set PROMPT_CACHING=false to disable)
+PROMPT_CACHING = os.getenv('PROMPT_CACHING', 'true').lower() != 'false'
+
+def empty_token_usage():
+    """
+    Return a token usage dictionary with all the counts at zero.
+    Cache read/write tokens are counted separately from the (uncached) input tokens.
+    """
+    return {"input_tokens": 0, "output_tokens": 0, "cache_read_tokens": 0, "cache_write_tokens": 0}
+
+def add_token_usage(token_usage, other_usage):
+    """
+    Add the counts of another token usage dictionary to the token usage dictionary, in place.
+    """
+    for key, value in (other_usage or {}).items():
+        token_usage[key] = token_usage.get(key, 0) + value
+    return token_usage
 
 class BaseAPIClient:
     """
@@ -7,74 +43,502 @@ class BaseAPIClient:
     that make direct HTTP requests.
     """
 
-    def __init__(self, api_key, api_url):
+    # The provider of the API in the model registry
+    provider = None
+
+    def __init__(self, api_key, api_url, session=None, timeout=None):
         """
         Initialize the BaseAPIClient with the API key and URL.
 
         Args:
             api_key (str): The API key for authentication.
             api_url (str): The URL of the API endpoint.
+            session (requests.Session, optional): The HTTP session to use. Defaults to the shared pooled session.
+            timeout (tuple, optional): The (connect, read) timeouts in seconds. Defaults to DEFAULT_TIMEOUT.
         """
         self.api_key = api_key
         self.api_url = api_url
+        self.session = session or get_session()
+        self.timeout = timeout or DEFAULT_TIMEOUT
+        self.scheduler = RequestScheduler(api_key)
+        self._last_activity = 0.0
         self.headers = self._get_headers()
         self.chat_history = {
                 "messages" : [],
                 "summary" : "",
                 "code_references" : []
                 }  
+        self.prompt_caching = PROMPT_CACHING
+        # the large texts of the history (e.g. the project files) are stored once and referenced by the messages
+        self.blob_store = BlobStore()
+        self.message_buffer = MessageBuffer(self._format_message)
+        self.context_manager = ContextWindowManager()
+        self.response_cache = get_response_cache()
+        self.instrumentation = get_instrumentation()
+        self.journal = None
+        self.last_response = None
+        self.last_token_usage = None
+        # the tools the model may call (e.g. `ProjectTools`), with their `definitions` and `call(name, arguments)`
+        self.tools = None
+        self._tool_calls = ToolCallCollector()
 
-    def send_request(self, prompt):
+    @property
+    def model_info(self):
+        """
+        The settings of the client's model in the model registry (pricing, limits and capabilities).
+        """
+        return get_model_registry().get(self.model, self.provider)
+
+    @property
+    def responding_model(self):
+        """
+        The model that answered the last request, the client's model (see `FailoverClient`).
+        """
+        return self.model
+
+    def send_request(self, prompt, cache=False):
         """
         Send a request to the API with the given prompt and return the response.
 
+        Args:
+            prompt (str): The prompt to send to the AI.
+            cache (bool, optional): Mark the prompt as a stable prefix to cache (e.g. a project context). Defaults to False.
+
+        With tools, the tool calls of the model are answered and the request sent again with their results,
+        until the model answers with text only (see `_run_tools`).
+
+        Returns:
+            tuple: A tuple containing the AI's response (str) and a dictionary with input and output token counts.
+        """
+        with self.instrumentation.turn(client=type(self).__name__, model=self.model, stream=False) as turn:
+            compaction_usage = self.context_manager.fit(self, prompt)
+            texts, tool_messages = [], []
+            token_usage = empty_token_usage()
+            for tool_round in range(MAX_TOOL_ROUNDS + 1):
+                body = self._encode_request(prompt, cache=cache, tool_messages=tool_messages)
+                cached = self._get_cached_response(body)
+                if cached is not None:
+                    ai_response, tool_calls = cached
+                    if turn is not None:
+                        turn.labels["cached"] = True
+                else:
+                    self._tool_calls.reset()
+                    response = self._post(body)
+                    response.raise_for_status()
+                    ai_response, round_usage = self._parse_timed_response(response)
+                    add_token_usage(token_usage, round_usage)
+                    tool_calls = self._tool_calls.finish()
+                    self._store_cached_response(body, ai_response, round_usage, tool_calls)
+                if ai_response:
+                    texts.append(ai_response)
+                if not tool_calls:
+                    break
+                if tool_round < MAX_TOOL_ROUNDS:
+                    tool_messages += self._run_tools(ai_response, tool_calls)
+            else:
+                logging.warning(f'Tool call limit reached ({MAX_TOOL_ROUNDS} rounds), ending the turn.')
+            ai_response = "\n\n".join(texts) or "No response received."
+            self.update_chat_history(prompt, ai_response, cache=cache)
+            self.instrumentation.record_token_usage(token_usage)
+        return ai_response, add_token_usage(token_usage, compaction_usage)
+
+    def complete(self, prompt):
+        """
+        Send a standalone prompt to the API, outside of the chat history (e.g. to summarise the history).
+
         Args:
             prompt (str): The prompt to send to the AI.
 
         Returns:
             tuple: A tuple containing the AI's response (str) and a dictionary with input and output token counts.
         """
-        data = self._get_request_data(prompt, self.chat_history)
-        response = requests.post(self.api_url, headers=self.headers, json=data)
+        data = self._get_request_params()
+        data['messages'] = [self._format_message({"sender": "user", "text": prompt})]
+        response = self._post(encode_json(data))
         response.raise_for_status()
-        ai_response, token_usage = self._parse_response(response)
-        self.update_chat_history(prompt, ai_response)
+        ai_response, token_usage = self._parse_timed_response(response)
+        self.instrumentation.record_token_usage(token_usage)
         return ai_response, token_usage
 
-    def update_chat_history(self, prompt, ai_response):
+    def stream_request(self, prompt, cache=False):
+        """
+        Send a streaming request to the API and yield the text deltas as they arrive.
+
+        Once the generator is exhausted, the full response and token usage are available in
+        `last_response` and `last_token_usage`, and the chat history has been updated.
+        If the stream is interrupted (e.g. Ctrl-C), the partial response is kept in the chat history.
+        With tools, the text of every round is streamed (see `send_request`).
+
+        Args:
+            prompt (str): The prompt to send to the AI.
+            cache (bool, optional): Mark the prompt as a stable prefix to cache. Defaults to False.
+
+        Yields:
+            str: The text deltas of the AI's response.
+        """
+        self.last_response = None
+        self.last_token_usage = None
+        with self.instrumentation.turn(client=type(self).__name__, model=self.model, stream=True) as turn:
+            compaction_usage = self.context_manager.fit(self, prompt)
+            chunks, tool_messages = [], []
+            token_usage = empty_token_usage()
+            try:
+                for tool_round in range(MAX_TOOL_ROUNDS + 1):
+                    body = self._encode_request(prompt, stream=True, cache=cache, tool_messages=tool_messages)
+                    cached = self._get_cached_response(body)
+                    if cached is not None:
+                        round_text, tool_calls = cached
+                        if turn is not None:
+                            turn.labels["cached"] = True
+                        if round_text:
+                            delta = "\n\n" + round_text if chunks else round_text
+                            chunks.append(delta)
+                            yield delta
+                    else:
+                        self._tool_calls.reset()
+                        response = self._post(body, stream=True)
+                        response.raise_for_status()
+
+                        round_chunks = []
+                        round_usage = empty_token_usage()
+                        stream_timer = StreamTimer(self.instrumentation)
+                        try:
+                            for event, payload in iter_sse_events(stream_timer.count_lines(response.iter_lines(decode_unicode=True))):
+                                delta = stream_timer.parse(self._parse_stream_event, event, payload, round_usage)
+                                if delta:
+                                    stream_timer.first_token()
+                                    round_chunks.append(delta)
+                                    if chunks and len(round_chunks) == 1:
+                                        delta = "\n\n" + delta
+                                    chunks.append(delta)
+                                    yield delta
+                        finally:
+                            response.close()
+                            stream_timer.finish(round_usage)
+                            add_token_usage(token_usage, round_usage)
+
+                        round_text = ''.join(round_chunks)
+                        tool_calls = self._tool_calls.finish()
+                        self._store_cached_response(body, round_text, round_usage, tool_calls)
+                    if not tool_calls:
+                        break
+                    if tool_round < MAX_TOOL_ROUNDS:
+                        tool_messages += self._run_tools(round_text, tool_calls)
+                else:
+                    logging.warning(f'Tool call limit reached ({MAX_TOOL_ROUNDS} rounds), ending the turn.')
+            except (KeyboardInterrupt, GeneratorExit):
+                # Keep what has been received so far so the conversation stays consistent
+                self._finish_stream(prompt, chunks, add_token_usage(token_usage, compaction_usage), cache)
+                raise
+
+            self._finish_stream(prompt, chunks, add_token_usage(token_usage, compaction_usage), cache)
+
+    def _finish_stream(self, prompt, chunks, token_usage, cache=False):
+        """
+        Assemble the streamed chunks into the final response and update the chat history.
+
+        Args:
+            prompt (str): The user's prompt.
+            chunks (list): The text deltas received.
+            token_usage (dict): The token usage collected from the stream.
+            cache (bool, optional): Whether the prompt is marked as a stable prefix to cache.
+        """
+        ai_response = ''.join(chunks) or "No response received."
+        self.last_response = ai_response
+        self.last_token_usage = token_usage
+        self.update_chat_history(prompt, ai_response, cache=cache)
+
+    def _get_cached_response(self, body):
+        """
+        Return the recorded response of an identical request from the response cache, if enabled.
+        Cached responses cost nothing, so they come with an empty token usage.
+
+        Args:
+            body (bytes): The JSON request body.
+
+        Returns:
+            tuple: The recorded response (str) and its tool calls (list), or None on a miss (or if the cache is disabled).
+
+        Raises:
+            CacheMissError: In replay mode, if the request was not recorded.
+        """
+        if self.response_cache is None:
+            return None
+        cached = self.response_cache.get(make_cache_key(self.api_url, body))
+        if cached is not None:
+            logging.info(f'Response served from the cache for {self.model}.')
+            return cached[0], cached[2]
+        if self.response_cache.replay:
+            raise CacheMissError(f'No recorded response for this request to {self.model} (replay mode).')
+        return None
+
+    def _store_cached_response(self, body, ai_response, token_usage, tool_calls=None):
+        """
+        Record a complete response in the response cache, if enabled. A response with tool calls is
+        recorded with them, so the next round of the turn can be replayed too.
+        """
+        if self.response_cache is None or not (ai_response or tool_calls):
+            return
+        self.response_cache.put(make_cache_key(self.api_url, body), self.model, ai_response, token_usage, tool_calls)
+
+    def warm_up(self):
+        """
+        Open (or refresh) the pooled connection to the API host in a background thread, so the
+        TCP+TLS handshake is done while the user is still typing.
+        """
+        if time.monotonic() - self._last_activity < WARM_UP_INTERVAL:
+            return
+        self._last_activity = time.monotonic()
+        threading.Thread(target=self._warm_up, daemon=True).start()
+
+    def _warm_up(self):
+        parsed_url = urlparse(self.api_url)
+        try:
+            self.session.head(f"{parsed_url.scheme}://{parsed_url.netloc}/", timeout=self.timeout).close()
+        except Exception as e:
+            logging.debug(f'Connection warm-up to {parsed_url.netloc} failed: {str(e)}')
+
+    def _encode_request(self, prompt, stream=False, cache=False, tool_messages=()):
+        """
+        Build the JSON request body for the prompt. The chat history messages are taken from the
+        message buffer, so only the new prompt is formatted and serialised.
+
+        Args:
+            prompt (str): The prompt to send to the AI.
+            stream (bool, optional): Whether to enable streaming. Defaults to False.
+            cache (bool, optional): Mark the prompt as a stable prefix to cache. Defaults to False.
+            tool_messages (list, optional): The tool calls and results of the turn so far, in the API format.
+
+        Returns:
+            bytes: The JSON request body.
+        """
+        with self.instrumentation.span('build_seconds'):
+            self.message_buffer.sync(self.chat_history["messages"])
+            params = self._get_request_params()
+            if stream:
+                params = self._get_stream_request_data(params)
+            if self.tools is not None:
+                params['tools'] = self._format_tools(self.tools.definitions)
+            leading_messages = self._apply_summary(params, self.chat_history.get("summary"))
+            prompt_message = self._format_message({"sender": "user", "text": prompt, "cache": cache}, last=True)
+        with self.instrumentation.span('serialise_seconds'):
+            return self.message_buffer.build_request_body(params, [prompt_message, *tool_messages], leading_messages)
+
+    def _run_tools(self, ai_response, tool_calls):
+        """
+        Call the tools requested by the model. The calls and their results are only part of the
+        requests of the current turn, the chat history keeps the prompt and the final response.
+
+        Args:
+            ai_response (str): The text of the response with the tool calls.
+            tool_calls (list): The tool calls, see `ToolCallCollector.finish`.
+
+        Returns:
+            list: The messages with the tool calls and their results, in the API format.
+        """
+        results = []
+        for tool_call in tool_calls:
+            logging.info(f'Tool call: {tool_call["name"]}({tool_call["arguments"]})')
+            self.instrumentation.record('tool_calls', 1)
+            results.append(self.tools.call(tool_call["name"], tool_call["arguments"]))
+        return self._format_tool_messages(ai_response, tool_calls, results)
+
+    def _post(self, body, stream=False):
+        """
+        Post the request body to the API through the pooled session. The request goes through the
+        scheduler, which throttles it within the rate limit budgets and retries it on transient errors.
+
+        Args:
+            body (bytes): The JSON request body.
+            stream (bool, optional): Whether to stream the response body. Defaults to False.
+
+        Returns:
+            requests.Response: The response object from the API.
+        """
+        sent_at = None
+
+        def send():
+            nonlocal sent_at
+            self._last_activity = time.monotonic()
+            sent_at = time.perf_counter()
+            return self.session.post(self.api_url, headers=self.headers, data=body, stream=stream, timeout=self.timeout)
+
+        start = time.perf_counter()
+        response = self.scheduler.execute(send, estimated_tokens=self._estimate_request_tokens(body))
+        elapsed = getattr(response, 'elapsed', None)
+        ttfb = elapsed.total_seconds() if isinstance(elapsed, timedelta) else None
+        self._record_request_timings(body, start, sent_at, ttfb, stream)
+        return response
+
+    def _record_request_timings(self, body, start, sent_at, ttfb, stream):
+        """
+        Record the timings of a request once its response headers (or its whole response) are received.
+
+        Args:
+            body (bytes): The JSON request body.
+            start (float): When the request was handed to the scheduler (`time.perf_counter`).
+            sent_at (float): When the last attempt was sent.
+            ttfb (float): The seconds from sending the last attempt to the response headers, None if unknown.
+            stream (bool): Whether the body is streamed, and so not received yet.
+        """
+        received_at = time.perf_counter()
+        if ttfb is None:
+            ttfb = received_at - sent_at
+        self.instrumentation.record('request_bytes', len(body))
+        self.instrumentation.record('queue_seconds', sent_at - start)
+        self.instrumentation.record('ttfb_seconds', ttfb)
+        if not stream:
+            self.instrumentation.record('transfer_seconds', max(received_at - sent_at - ttfb, 0.0))
+
+    def _parse_timed_response(self, response):
+        """
+        Parse a complete response with `_parse_response`, recording its size and the parsing time.
+        """
+        content = getattr(response, 'content', None)
+        if isinstance(content, bytes):
+            self.instrumentation.record('response_bytes', len(content))
+        with self.instrumentation.span('parse_seconds'):
+            return self._parse_response(response)
+
+    def _estimate_request_tokens(self, body):
+        """
+        Roughly estimate the tokens of a request (about 4 bytes per token) for the tokens/min budget.
+
+        Args:
+            body (bytes): The JSON request body.
+
+        Returns:
+            int: The estimated input tokens plus the maximum output tokens.
+        """
+        return len(body) // 4 + self._get_request_params().get('max_tokens', 0)
+
+    def update_chat_history(self, prompt, ai_response, cache=False):
         """
         Update the chat history with the user's prompt and the AI's response.
 
         Args:
             prompt (str): The user's prompt.
             ai_response (str): The response from the AI.
+            cache (bool, optional): Mark the prompt as a stable prefix to cache. Defaults to False.
+        """
+        self.chat_history["messages"].append(Message("user", prompt, cache=cache, store=self.blob_store))
+        self.chat_history["messages"].append(Message("assistant", ai_response, store=self.blob_store))
+
+        if self.journal is not None:
+            self.journal.append_messages(self.chat_history["messages"][-2:])
+
+        # encode the new messages now, while the user is reading the response
+        self.message_buffer.sync(self.chat_history["messages"])
+
+    def extend_chat_history(self, messages):
         """
-        message = {
-            "sender": "user",
-            "text": prompt,
-            "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
-        self.chat_history["messages"].append(message)
+        Append past messages (e.g. a conversation loaded from the archive) to the chat history,
+        so they are sent as context with the next requests.
 
-        message = {
-            "sender": "assistant",
-            "text": ai_response,
-            "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
-        self.chat_history["messages"].append(message)
+        Args:
+            messages (list): The messages, with their sender, text and timestamp, in user/assistant pairs.
+        """
+        messages = [Message(message["sender"], message["text"], message.get("timestamp"), store=self.blob_store)
+                    for message in messages]
+        self.chat_history["messages"].extend(messages)
+        if self.journal is not None:
+            self.journal.append_messages(messages)
+        self.message_buffer.sync(self.chat_history["messages"])
 
-    def _get_request_data(self, prompt):
+    def _get_request_data(self, prompt, chat_history):
         """
-        This method should be implemented by the subclasses to return the appropriate request data
-        for the specific API.
+        Return the request data for the API as a dictionary, with the whole chat history formatted.
+        The requests sent by the client are built incrementally by `_encode_request` instead.
 
         Args:
             prompt (str): The prompt to send to the AI.
+            chat_history (dict): The chat history.
+
+        Returns:
+            dict: The request data.
+        """
+        with self.instrumentation.span('build_seconds'):
+            data = self._get_request_params()
+            messages = self._apply_summary(data, chat_history.get("summary"))
+            messages += [self._format_message(message) for message in chat_history["messages"]]
+            messages.append(self._format_message({"sender": "user", "text": prompt}, last=True))
+
+            data['messages'] = messages
+        return data
+
+    def _apply_summary(self, params, summary):
+        """
+        Add the summary of the compacted chat history to the request, as a system message by default.
+        Subclasses can override this when the API takes the system prompt as a parameter.
+
+        Args:
+            params (dict): The request parameters, can be updated in place.
+            summary (str): The summary of the compacted history (empty if there is none).
+
+        Returns:
+            list: The messages to put before the chat history.
+        """
+        if not summary:
+            return []
+        return [{"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"}]
+
+    def _get_request_params(self):
+        """
+        This method should be implemented by the subclasses to return the request parameters
+        other than the messages (model, max_tokens...) for the specific API.
 
         Raises:
             NotImplementedError: If the method is not implemented by the subclass.
         """
-        raise NotImplementedError("_get_request_data method must be implemented")
+        raise NotImplementedError("_get_request_params method must be implemented")
+
+    def _format_message(self, message, last=False):
+        """
+        Convert a chat history message to the message format of the API. Subclasses can override this
+        for provider specific formats.
+
+        Args:
+            message (dict): The chat history message, with its sender and text.
+            last (bool, optional): Whether it is the new prompt at the end of the request. Defaults to False.
+
+        Returns:
+            dict: The message in the API format.
+        """
+        return {"role": message["sender"], "content": message["text"]}
+
+    def _format_tools(self, definitions):
+        """
+        Convert the tool definitions to the tools parameter of the API, as functions by default.
+        Subclasses can override this for provider specific formats.
+
+        Args:
+            definitions (list): The tools, with their "name", "description" and "parameters" (a JSON schema).
+
+        Returns:
+            list: The tools in the API format.
+        """
+        return [{"type": "function", "function": definition} for definition in definitions]
+
+    def _format_tool_messages(self, ai_response, tool_calls, results):
+        """
+        Return the messages of a tool round: the assistant message with the tool calls, then their results,
+        as function calls by default. Subclasses can override this for provider specific formats.
+
+        Args:
+            ai_response (str): The text of the response with the tool calls.
+            tool_calls (list): The tool calls, with their "id", "name" and "arguments".
+            results (list): The results of the calls (str), in the same order.
+
+        Returns:
+            list: The messages in the API format.
+        """
+        messages = [{"role": "assistant", "content": ai_response or None, "tool_calls": [
+            {"id": tool_call["id"], "type": "function",
+             "function": {"name": tool_call["name"], "arguments": json.dumps(tool_call["arguments"])}}
+            for tool_call in tool_calls]}]
+        messages += [{"role": "tool", "tool_call_id": tool_call["id"], "content": result}
+                     for tool_call, result in zip(tool_calls, results)]
+        return messages
 
     def _parse_response(self, response):
         """
@@ -88,3 +552,32 @@ class BaseAPIClient:
             NotImplementedError: If the method is not implemented by the subclass.
         """
         raise NotImplementedError("_parse_response method must be implemented")
+
+    def _get_stream_request_data(self, data):
+        """
+        Return the request data with streaming enabled. Subclasses can override this to add
+        provider specific streaming options.
+
+        Args:
+            data (dict): The request data or parameters.
+        """
+        data['stream'] = True
+        return data
+
+    def _parse_stream_event(self, event, data, token_usage):
+        """
+        This method should be implemented by the subclasses to parse a server-sent event
+        from the streaming API.
+
+        Args:
+            event (str): The event type (None if the API does not send one).
+            data (dict): The decoded event payload.
+            token_usage (dict): The token usage dictionary to update in place.
+
+        Returns:
+            str: The text delta carried by the event, if any.
+
+        Raises:
+            NotImplementedError: If the method is not implemented by the subclass.
+        """
+        raise NotImplementedError("_parse_stream_event method must be implemented")
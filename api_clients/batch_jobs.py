@@ -0,0 +1,274 @@
+import os
+import json
+import time
+import logging
+from urllib.parse import urlparse
+from api_clients.anthropic_client import AnthropicClient
+from api_clients.openai_client import OpenAIClient
+from api_clients.message_buffer import encode_json
+
+# Polling of the provider batches (in seconds), can be overridden in the .env file
+BATCH_POLL_INTERVAL = float(os.getenv('BATCH_POLL_INTERVAL', '10'))
+BATCH_POLL_MAX_INTERVAL = float(os.getenv('BATCH_POLL_MAX_INTERVAL', '300'))
+BATCH_POLL_BACKOFF = 1.5
+
+
+class BatchJobError(RuntimeError):
+    """
+    Raised when a provider batch ended without results (failed, cancelled or expired).
+    """
+
+
+class _ResultResponse:
+    """
+    A batch result body wrapped like an HTTP response, so the clients' `_parse_response` can read it.
+    """
+
+    def __init__(self, data):
+        self._data = data
+
+    def json(self):
+        return self._data
+
+
+class ProviderBatchJob:
+    """
+    This is a base class for the provider batch APIs (Anthropic Message Batches, OpenAI Batch API):
+    many requests are submitted at once and processed asynchronously by the provider, at a discount.
+    The requests are built and the results parsed by the API client, like its synchronous requests,
+    and the HTTP calls go through its pooled session and its scheduler.
+    """
+
+    def __init__(self, ai_chatbot, batch_id=None):
+        """
+        Initialize the ProviderBatchJob.
+
+        Args:
+            ai_chatbot (BaseAPIClient): The API client of the provider, with its model set.
+            batch_id (str, optional): The id of a batch submitted already, to poll it and get its results.
+        """
+        self.ai_chatbot = ai_chatbot
+        self.batch_id = batch_id
+        self.batch = None
+
+    def build_request(self, prompt, model=None):
+        """
+        Return the request parameters of a prompt, sent in its own conversation.
+
+        Args:
+            prompt (str): The prompt.
+            model (str, optional): The model, if not the one of the client.
+
+        Returns:
+            dict: The request parameters.
+        """
+        params = self.ai_chatbot._get_request_data(prompt, {"messages": []})
+        if model:
+            params['model'] = model
+        return params
+
+    def submit(self, requests):
+        """
+        Submit the requests as a new batch.
+
+        Args:
+            requests (list): The (custom id, request parameters) pairs.
+
+        Returns:
+            str: The id of the batch.
+        """
+        raise NotImplementedError("submit method must be implemented")
+
+    def refresh(self):
+        """
+        Fetch the current state of the batch.
+
+        Returns:
+            dict: The batch object of the provider.
+        """
+        raise NotImplementedError("refresh method must be implemented")
+
+    def is_done(self):
+        """
+        Return whether the provider has stopped processing the batch (ended, failed, expired...).
+        """
+        raise NotImplementedError("is_done method must be implemented")
+
+    def results(self):
+        """
+        Download the results of a finished batch, streaming them line by line.
+
+        Yields:
+            tuple: The custom id, the AI's response (str or None), the token usage (dict or None) and the error (str or None).
+        """
+        raise NotImplementedError("results method must be implemented")
+
+    def wait(self, poll_interval=None, max_interval=None, timeout=None, on_poll=None):
+        """
+        Poll the batch until it is done. The delay between the polls grows from `poll_interval` to
+        `max_interval`, as a batch can take from minutes to hours.
+
+        Args:
+            poll_interval (float, optional): The first delay, in seconds. Defaults to BATCH_POLL_INTERVAL.
+            max_interval (float, optional): The longest delay, in seconds. Defaults to BATCH_POLL_MAX_INTERVAL.
+            timeout (float, optional): Give up after this many seconds. Defaults to no limit.
+            on_poll (callable, optional): Called with the batch object after each poll, e.g. to print the progress.
+
+        Returns:
+            dict: The final batch object.
+
+        Raises:
+            TimeoutError: If the batch is not done within the timeout.
+        """
+        interval = BATCH_POLL_INTERVAL if poll_interval is None else poll_interval
+        max_interval = BATCH_POLL_MAX_INTERVAL if max_interval is None else max_interval
+        start = time.monotonic()
+        while True:
+            batch = self.refresh()
+            if on_poll is not None:
+                on_poll(batch)
+            if self.is_done():
+                return batch
+            if timeout is not None and time.monotonic() - start + interval > timeout:
+                raise TimeoutError(f'The batch {self.batch_id} is not done after {timeout}s.')
+            time.sleep(interval)
+            interval = min(interval * BATCH_POLL_BACKOFF, max_interval)
+
+    def _request(self, method, url, headers=None, **kwargs):
+        """
+        Send a request to the batch API through the session and the scheduler of the client.
+
+        Returns:
+            requests.Response: The successful response.
+        """
+        headers = self.ai_chatbot.headers if headers is None else headers
+
+        def send():
+            return self.ai_chatbot.session.request(method, url, headers=headers, timeout=self.ai_chatbot.timeout, **kwargs)
+
+        response = self.ai_chatbot.scheduler.execute(send)
+        response.raise_for_status()
+        return response
+
+    def _iter_jsonl(self, url):
+        response = self._request('GET', url, stream=True)
+        try:
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
+        finally:
+            response.close()
+
+    def _parse_result(self, body):
+        return self.ai_chatbot._parse_response(_ResultResponse(body))
+
+
+class AnthropicBatchJob(ProviderBatchJob):
+    """
+    This class submits requests to the Anthropic Message Batches API.
+    """
+
+    @property
+    def batches_url(self):
+        return self.ai_chatbot.api_url.rstrip('/') + '/batches'
+
+    def submit(self, requests):
+        data = {"requests": [{"custom_id": custom_id, "params": params} for custom_id, params in requests]}
+        self.batch = self._request('POST', self.batches_url, data=encode_json(data)).json()
+        self.batch_id = self.batch['id']
+        logging.info(f'Submitted the Anthropic message batch {self.batch_id} ({len(data["requests"])} requests)')
+        return self.batch_id
+
+    def refresh(self):
+        self.batch = self._request('GET', f'{self.batches_url}/{self.batch_id}').json()
+        return self.batch
+
+    def is_done(self):
+        return self.batch is not None and self.batch.get('processing_status') == 'ended'
+
+    def results(self):
+        results_url = self.batch.get('results_url') or f'{self.batches_url}/{self.batch_id}/results'
+        for record in self._iter_jsonl(results_url):
+            result = record.get('result', {})
+            if result.get('type') == 'succeeded':
+                ai_response, token_usage = self._parse_result(result['message'])
+                yield record['custom_id'], ai_response, token_usage, None
+            else:
+                error = (result.get('error') or {}).get('error', {}).get('message')
+                yield record['custom_id'], None, None, error or result.get('type', 'unknown error')
+
+
+class OpenAIBatchJob(ProviderBatchJob):
+    """
+    This class submits requests to the OpenAI Batch API: the requests are uploaded as a JSONL file,
+    and the results downloaded as output (and error) files.
+    """
+
+    FINAL_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+
+    @property
+    def endpoint(self):
+        return urlparse(self.ai_chatbot.api_url).path
+
+    @property
+    def base_url(self):
+        # e.g. https://api.openai.com/v1 for https://api.openai.com/v1/chat/completions
+        return self.ai_chatbot.api_url.rsplit('/chat/completions', 1)[0]
+
+    def submit(self, requests):
+        lines = [encode_json({"custom_id": custom_id, "method": "POST", "url": self.endpoint, "body": params}) + b'\n'
+                 for custom_id, params in requests]
+        # the upload is multipart, let requests set its content type
+        headers = {name: value for name, value in self.ai_chatbot.headers.items() if name.lower() != 'content-type'}
+        upload = self._request('POST', f'{self.base_url}/files', headers=headers, data={"purpose": "batch"},
+                               files={"file": ("batch.jsonl", b''.join(lines), 'application/jsonl')}).json()
+        data = {"input_file_id": upload['id'], "endpoint": self.endpoint, "completion_window": "24h"}
+        self.batch = self._request('POST', f'{self.base_url}/batches', data=encode_json(data)).json()
+        self.batch_id = self.batch['id']
+        logging.info(f'Submitted the OpenAI batch {self.batch_id} ({len(lines)} requests)')
+        return self.batch_id
+
+    def refresh(self):
+        self.batch = self._request('GET', f'{self.base_url}/batches/{self.batch_id}').json()
+        return self.batch
+
+    def is_done(self):
+        return self.batch is not None and self.batch.get('status') in self.FINAL_STATUSES
+
+    def results(self):
+        file_ids = [self.batch.get('output_file_id'), self.batch.get('error_file_id')]
+        if not any(file_ids):
+            errors = (self.batch.get('errors') or {}).get('data') or []
+            message = '; '.join(error.get('message', '') for error in errors) or 'no results'
+            raise BatchJobError(f'The batch {self.batch_id} is {self.batch.get("status")}: {message}')
+        for file_id in filter(None, file_ids):
+            for record in self._iter_jsonl(f'{self.base_url}/files/{file_id}/content'):
+                response = record.get('response') or {}
+                if response.get('status_code') == 200:
+                    ai_response, token_usage = self._parse_result(response['body'])
+                    yield record['custom_id'], ai_response, token_usage, None
+                else:
+                    error = (record.get('error') or {}).get('message') \
+                        or (response.get('body') or {}).get('error', {}).get('message')
+                    yield record['custom_id'], None, None, error or f'HTTP {response.get("status_code")}'
+
+
+def create_batch_job(ai_chatbot, batch_id=None):
+    """
+    Return the batch job of the provider of an API client.
+
+    Args:
+        ai_chatbot (BaseAPIClient): The API client, with its model set.
+        batch_id (str, optional): The id of a batch submitted already.
+
+    Returns:
+        ProviderBatchJob: The batch job.
+
+    Raises:
+        ValueError: If the provider has no batch API.
+    """
+    if isinstance(ai_chatbot, AnthropicClient):
+        return AnthropicBatchJob(ai_chatbot, batch_id)
+    if isinstance(ai_chatbot, OpenAIClient):
+        return OpenAIBatchJob(ai_chatbot, batch_id)
+    raise ValueError(f'{type(ai_chatbot).__name__} has no batch API.')
@@ -0,0 +1,181 @@
+import os
+import logging
+from api_clients.message_store import message_parts
+from api_clients.token_estimator import estimate_tokens, get_token_estimator, MESSAGE_OVERHEAD, REQUEST_OVERHEAD
+
+# How to compact the history when it exceeds the context budget: 'truncate' or 'summarize'
+CONTEXT_STRATEGY = os.getenv('CONTEXT_STRATEGY', 'truncate')
+# Share of the context window the history may use (the rest is left for the response and estimation errors)
+CONTEXT_BUDGET_RATIO = float(os.getenv('CONTEXT_BUDGET_RATIO', '0.9'))
+
+SUMMARY_PROMPT = "Summarise the following conversation between a user and an AI assistant. " \
+                 "Keep the decisions made, the open questions and any code or facts needed to continue the conversation. " \
+                 "Answer with the summary only.\n"
+
+
+class ContextWindowManager:
+    """
+    This class keeps the chat history of a client within the context window of its model. It tracks
+    the estimated tokens of each message and, when the history is over budget, compacts the oldest turns:
+    they are either dropped or replaced by a rolling summary stored in `chat_history["summary"]`.
+    The messages pinned for prompt caching (e.g. the project context) are never compacted.
+    """
+
+    def __init__(self, strategy=None, budget_ratio=None, context_windows=None, token_estimator=None):
+        """
+        Initialize the ContextWindowManager.
+
+        Args:
+            strategy (str, optional): 'truncate' or 'summarize'. Defaults to CONTEXT_STRATEGY.
+            budget_ratio (float, optional): Share of the context window the request may use. Defaults to CONTEXT_BUDGET_RATIO.
+            context_windows (dict, optional): Context window per model, overriding the model registry.
+            token_estimator (TokenEstimator, optional): The token counter. Defaults to the shared one.
+        """
+        self.strategy = strategy or CONTEXT_STRATEGY
+        self.budget_ratio = CONTEXT_BUDGET_RATIO if budget_ratio is None else budget_ratio
+        self.context_windows = context_windows or {}
+        self.token_estimator = token_estimator or get_token_estimator()
+
+    def get_context_window(self, client):
+        context_window = self.context_windows.get(client.model)
+        if context_window is None:
+            context_window = client.model_info["context_window"]
+        return context_window
+
+    def get_budget(self, client):
+        """
+        Return the input token budget of the client's model: its share of the context window
+        minus the tokens reserved for the response.
+        """
+        max_tokens = client._get_request_params().get('max_tokens', 0)
+        return int(self.get_context_window(client) * self.budget_ratio) - max_tokens
+
+    def message_tokens(self, message, model=None):
+        """
+        Return the estimated tokens of a chat history message for a model, with its formatting overhead.
+        The counts are memoised by the token estimator, so the history is not re-tokenised each turn.
+        """
+        # counted part by part, the stored parts being the same strings every turn their counts are memoised
+        return sum(self.token_estimator.count(part, model) for part in message_parts(message)) + MESSAGE_OVERHEAD
+
+    def history_tokens(self, chat_history, model=None):
+        """
+        Return the estimated tokens of the chat history, including its summary.
+        """
+        tokens = sum(self.message_tokens(message, model) for message in chat_history["messages"])
+        if chat_history.get("summary"):
+            tokens += self.token_estimator.count(chat_history["summary"], model) + MESSAGE_OVERHEAD
+        return tokens
+
+    def estimate_request(self, client, prompt):
+        """
+        Estimate the request of a prompt before it is sent, offline.
+
+        Args:
+            client (BaseAPIClient): The API client.
+            prompt (str): The prompt about to be sent.
+
+        Returns:
+            dict: The estimated "input_tokens" of the request as it stands, the "max_output_tokens", the
+                  "context_window" and input "budget" of the model, whether the history will be compacted
+                  ("compaction") and whether the request can fit in the budget at all ("fits"): the prompt,
+                  the pinned turns, the last turn and the summary are never compacted.
+        """
+        model = client.model
+        chat_history = client.chat_history
+        prompt_tokens = self.token_estimator.count(prompt, model) + MESSAGE_OVERHEAD + REQUEST_OVERHEAD
+        input_tokens = self.history_tokens(chat_history, model) + prompt_tokens
+        messages = chat_history["messages"]
+        kept = [message for i, message in enumerate(messages)
+                if i >= len(messages) - 2 or messages[i - i % 2].get("cache")]
+        minimum_tokens = prompt_tokens + sum(self.message_tokens(message, model) for message in kept)
+        if chat_history.get("summary"):
+            minimum_tokens += self.token_estimator.count(chat_history["summary"], model) + MESSAGE_OVERHEAD
+        budget = self.get_budget(client)
+        return {
+            "input_tokens": input_tokens,
+            "max_output_tokens": client._get_request_params().get('max_tokens', 0),
+            "context_window": self.get_context_window(client),
+            "budget": budget,
+            "compaction": input_tokens > budget,
+            "fits": minimum_tokens <= budget
+        }
+
+    def fit(self, client, prompt):
+        """
+        Compact the client's chat history until it fits in the budget together with the new prompt,
+        summarising the compacted turns with the client's model when the strategy is 'summarize'.
+
+        Args:
+            client (BaseAPIClient): The API client.
+            prompt (str): The prompt about to be sent.
+
+        Returns:
+            dict: The token usage of the summary request, or None if no summary was requested.
+        """
+        compacted = self.compact(client, prompt)
+        if not compacted or self.strategy != 'summarize':
+            return None
+
+        try:
+            summary, token_usage = client.complete(self.get_summary_prompt(client.chat_history, compacted))
+        except Exception as e:
+            logging.error(f'Failed to summarise the compacted history: {str(e)}')
+            return None
+        client.chat_history["summary"] = summary
+        return token_usage
+
+    def compact(self, client, prompt):
+        """
+        Move the oldest turns out of the client's chat history, into `chat_history["compacted_messages"]`,
+        until the history fits in the budget together with the new prompt.
+
+        Args:
+            client (BaseAPIClient): The API client.
+            prompt (str): The prompt about to be sent.
+
+        Returns:
+            list: The compacted messages (empty if the history already fits).
+        """
+        chat_history = client.chat_history
+        budget = self.get_budget(client)
+        excess = self.history_tokens(chat_history, client.model) + estimate_tokens(prompt, client.model) + REQUEST_OVERHEAD - budget
+        if excess <= 0:
+            return []
+
+        compacted = self._select_turns(chat_history["messages"], excess, client.model)
+        if not compacted:
+            logging.warning(f'The request exceeds the context budget of {client.model} ({budget} tokens) but no turn can be compacted.')
+            return []
+
+        compacted_ids = {id(message) for message in compacted}
+        chat_history["messages"] = [message for message in chat_history["messages"] if id(message) not in compacted_ids]
+        chat_history.setdefault("compacted_messages", []).extend(compacted)
+        logging.info(f'Compacted {len(compacted)} messages to fit the context budget of {client.model} ({budget} tokens).')
+        return compacted
+
+    def get_summary_prompt(self, chat_history, compacted):
+        """
+        Return the prompt asking the model to fold the compacted turns into the rolling summary.
+        """
+        transcript = "\n\n".join(f"{message['sender']}: {message['text']}" for message in compacted)
+        if chat_history.get("summary"):
+            transcript = f"Summary of the earlier conversation: {chat_history['summary']}\n\n{transcript}"
+        return SUMMARY_PROMPT + transcript
+
+    def _select_turns(self, messages, excess, model=None):
+        """
+        Select the oldest turns (user prompt and AI response) to compact, skipping the pinned ones.
+        """
+        selected = []
+        freed = 0
+        # keep at least the last turn, the model needs it to follow the conversation
+        for i in range(0, len(messages) - 2, 2):
+            turn = messages[i:i + 2]
+            if turn[0].get("cache"):
+                continue
+            selected.extend(turn)
+            freed += sum(self.message_tokens(message, model) for message in turn)
+            if freed >= excess:
+                break
+        return selected
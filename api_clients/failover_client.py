@@ -0,0 +1,493 @@
+import os
+import copy
+import time
+import queue
+import asyncio
+import logging
+import threading
+from api_clients.base_client import add_token_usage, empty_token_usage
+from api_clients.instrumentation import MetricSummary, get_instrumentation
+from api_clients.tool_use import ToolCallCollector
+
+# Failover settings, can be overridden in the .env file: the fallback model (none if empty) answers
+# when the model of the session fails, and is raced against it (a hedged request) once the model is
+# slower than its usual HEDGE_PERCENTILE latency. Until HEDGE_MIN_SAMPLES latencies of the model are
+# known, the hedged request is sent after HEDGE_INITIAL_DELAY seconds.
+FAILOVER_MODEL = os.getenv('FAILOVER_MODEL', '')
+HEDGE_REQUESTS = os.getenv('HEDGE_REQUESTS', 'true').lower() != 'false'
+HEDGE_PERCENTILE = float(os.getenv('HEDGE_PERCENTILE', '0.95'))
+HEDGE_MIN_SAMPLES = int(os.getenv('HEDGE_MIN_SAMPLES', '5'))
+HEDGE_INITIAL_DELAY = float(os.getenv('HEDGE_INITIAL_DELAY', '10'))
+LATENCY_WINDOW = int(os.getenv('LATENCY_WINDOW', '200'))
+
+
+class LatencyTracker:
+    """
+    This class keeps the recent latencies of each model, streamed (time to the first token) and not
+    streamed (time to the whole response) apart, and gives the delay after which a request is late.
+    """
+
+    def __init__(self, percentile=None, min_samples=None, initial_delay=None, window=None):
+        """
+        Initialize the LatencyTracker.
+
+        Args:
+            percentile (float, optional): The latency percentile after which a request is late. Defaults to HEDGE_PERCENTILE.
+            min_samples (int, optional): The latencies needed before the percentile is used. Defaults to HEDGE_MIN_SAMPLES.
+            initial_delay (float, optional): The delay used until then, in seconds. Defaults to HEDGE_INITIAL_DELAY.
+            window (int, optional): The recent latencies kept per model. Defaults to LATENCY_WINDOW.
+        """
+        self.percentile = HEDGE_PERCENTILE if percentile is None else percentile
+        self.min_samples = HEDGE_MIN_SAMPLES if min_samples is None else min_samples
+        self.initial_delay = HEDGE_INITIAL_DELAY if initial_delay is None else initial_delay
+        self.window = window or LATENCY_WINDOW
+        self._latencies = {}
+        self._lock = threading.Lock()
+
+    def record(self, model, stream, seconds):
+        with self._lock:
+            self._latencies.setdefault((model, stream), MetricSummary(self.window)).add(seconds)
+
+    def hedge_delay(self, model, stream):
+        """
+        Return the seconds after which a request to the model is late (its latency percentile).
+        """
+        with self._lock:
+            latencies = self._latencies.get((model, stream))
+            if latencies is None or len(latencies.recent) < self.min_samples:
+                return self.initial_delay
+            return latencies.percentile(self.percentile)
+
+    def summary(self):
+        with self._lock:
+            return {f"{model}{' (stream)' if stream else ''}": latencies.to_dict()
+                    for (model, stream), latencies in self._latencies.items()}
+
+
+_latency_tracker = None
+_latency_tracker_lock = threading.Lock()
+
+
+def get_latency_tracker():
+    """
+    Return the shared latency tracker, so all the sessions learn the latencies of the models.
+    """
+    global _latency_tracker
+    with _latency_tracker_lock:
+        if _latency_tracker is None:
+            _latency_tracker = LatencyTracker()
+        return _latency_tracker
+
+
+class _Attempt:
+    """
+    A request of a turn to one of the clients: the primary one, or the fallback one (a hedged request or a failover).
+    It is sent by its own copy of the client (see `FailoverClient._request_client`), so it can be left to finish
+    in the background once it lost.
+    """
+
+    def __init__(self, source, client, reason, stream):
+        self.source = source
+        self.client = client
+        self.reason = reason
+        self.stream = stream
+        self.started = time.perf_counter()
+        self.failed = False
+        self.result = None
+        self.cancelled = threading.Event()
+        self.worker = None
+        self.token_usage = None
+        self._lost = False
+        self._lock = threading.Lock()
+
+    def complete(self, token_usage):
+        """
+        Keep the token usage of the request once it's done, and return whether it had already lost.
+        """
+        with self._lock:
+            self.token_usage = token_usage
+            return self._lost
+
+    def lose(self):
+        """
+        Cancel the request that lost, and return its token usage if it was already done (None otherwise).
+        """
+        with self._lock:
+            self._lost = True
+            self.cancelled.set()
+            return self.token_usage
+
+
+def copy_history(chat_history):
+    """
+    Return a copy of a chat history for a request, so a request answered too late (the other one won)
+    doesn't change the history of the session. The messages themselves are shared: they are the same for
+    every provider, each client formats them (roles, content blocks, cache markers) for its own API.
+    """
+    history = dict(chat_history)
+    history["messages"] = list(chat_history["messages"])
+    if "compacted_messages" in chat_history:
+        history["compacted_messages"] = list(chat_history["compacted_messages"])
+    return history
+
+
+class FailoverClient:
+    """
+    This class routes the requests of a chat session to the client of its model, and to the client of a
+    fallback model (possibly of another provider) when the model fails, or is slower than its usual
+    latency: a hedged request is then raced against it, the first to respond answers and the other one
+    is cancelled (a streamed response is closed at its next event, a request not streamed is left to
+    finish in the background). The chat history of the session is kept by the router, and each request
+    is sent by a copy of its client working on a copy of the history, so the answer of the request that
+    lost is discarded; its tokens were paid for all the same, see `pop_lost_usage`. Anything else (the
+    model, its context manager, its settings) is the primary client's.
+    """
+
+    def __init__(self, primary, fallback, tracker=None, hedge=None):
+        """
+        Initialize the FailoverClient.
+
+        Args:
+            primary (BaseAPIClient): The client of the session's model.
+            fallback (BaseAPIClient): The client of the fallback model.
+            tracker (LatencyTracker, optional): The latencies of the models. Defaults to the shared tracker.
+            hedge (bool, optional): Send hedged requests (not only fail over on errors). Defaults to HEDGE_REQUESTS.
+        """
+        self.primary = primary
+        self.fallback = fallback
+        self.tracker = tracker or get_latency_tracker()
+        self.hedge = HEDGE_REQUESTS if hedge is None else hedge
+        # the turns are journaled by the router, once the request that answers is known
+        self.journal, primary.journal, fallback.journal = primary.journal, None, None
+        fallback.blob_store = primary.blob_store
+        self._chat_history = primary.chat_history
+        # the (model, token usage) of the requests that lost, not reported yet
+        self._lost_usage = []
+        self._lost_usage_lock = threading.Lock()
+        self.last_response = None
+        self.last_token_usage = None
+        self.responding_model = primary.model
+
+    def __getattr__(self, name):
+        if name == 'primary':
+            raise AttributeError(name)
+        return getattr(self.primary, name)
+
+    @property
+    def chat_history(self):
+        return self._chat_history
+
+    @chat_history.setter
+    def chat_history(self, chat_history):
+        self._chat_history = chat_history
+
+    @property
+    def tools(self):
+        return self.primary.tools
+
+    @tools.setter
+    def tools(self, tools):
+        self.primary.tools = self.fallback.tools = tools
+
+    def warm_up(self):
+        self.primary.warm_up()
+        self.fallback.warm_up()
+
+    def extend_chat_history(self, messages):
+        self.primary.chat_history = self._chat_history
+        self.primary.extend_chat_history(messages)
+        if self.journal is not None and messages:
+            self.journal.append_messages(self._chat_history["messages"][-len(messages):])
+
+    def send_request(self, prompt, cache=False):
+        """
+        Send a request to the API, see `BaseAPIClient.send_request`.
+        """
+        for _, result in self._run(prompt, cache, stream=False):
+            pass
+        return result
+
+    def stream_request(self, prompt, cache=False):
+        """
+        Send a streaming request to the API and yield the text deltas as they arrive, see `BaseAPIClient.stream_request`.
+        A request is late when its first token is.
+        """
+        for kind, payload in self._run(prompt, cache, stream=True):
+            if kind == 'delta':
+                yield payload
+
+    def pop_lost_usage(self):
+        """
+        Return the token usage of the requests that lost a race since the last call: their response was
+        discarded, but their tokens were paid for. A request left to finish in the background is reported
+        once it's done.
+
+        Returns:
+            list: The (model, token_usage) of the requests.
+        """
+        with self._lost_usage_lock:
+            lost_usage, self._lost_usage = self._lost_usage, []
+        return lost_usage
+
+    def _run(self, prompt, cache, stream):
+        """
+        Run a turn: send the request to the primary client, hedge it or fail over to the fallback one,
+        and yield the ('delta', text) events of the request that responds first, then ('done', (response, token_usage)).
+        """
+        self.last_response = self.last_token_usage = None
+        # the history is compacted for the session's model once, a fallback model compacts its own copy further if needed
+        self.primary.chat_history = self._chat_history
+        compaction_usage = self.primary.context_manager.fit(self.primary, prompt)
+        history = self._chat_history
+        attempts, events = [], queue.Queue()
+        self._start(attempts, events, self.primary, 'primary', history, prompt, cache, stream)
+        delay = self.tracker.hedge_delay(self.primary.model, stream) if self.hedge else None
+        winner = None
+        try:
+            while winner is None:
+                try:
+                    attempt, kind, payload = events.get(timeout=self._hedge_timeout(attempts, delay))
+                except queue.Empty:
+                    self._start(attempts, events, self.fallback, 'hedge', history, prompt, cache, stream)
+                    continue
+                if kind == 'error':
+                    self._failed(attempts, events, attempt, payload, history, prompt, cache, stream)
+                    continue
+                winner = self._won(attempts, attempt, stream)
+            while True:
+                if attempt is winner:
+                    if kind == 'error':
+                        raise payload
+                    if kind == 'done':
+                        winner.result = payload
+                    yield kind, payload
+                    if kind == 'done':
+                        break
+                attempt, kind, payload = events.get()
+        finally:
+            if winner is None:
+                self._lost(attempts)
+            else:
+                if winner.result is None and winner.worker.is_alive():
+                    # an interrupted stream keeps its partial response, once its worker has closed it
+                    winner.cancelled.set()
+                    winner.worker.join(timeout=5)
+                self._finish(winner, prompt, compaction_usage)
+
+    def _spawn(self, attempt, events, prompt, cache, stream):
+        attempt.worker = threading.Thread(target=self._work, args=(attempt, events, prompt, cache, stream), daemon=True)
+        attempt.worker.start()
+
+    def _work(self, attempt, events, prompt, cache, stream):
+        client = attempt.client
+        try:
+            if not stream:
+                result = client.send_request(prompt, cache=cache)
+            else:
+                deltas = client.stream_request(prompt, cache=cache)
+                try:
+                    for delta in deltas:
+                        if attempt.cancelled.is_set():
+                            break
+                        events.put((attempt, 'delta', delta))
+                finally:
+                    # closing the generator closes its response, i.e. cancels the request
+                    deltas.close()
+                result = (client.last_response, client.last_token_usage)
+        except Exception as e:
+            events.put((attempt, 'error', e))
+            return
+        if not self._complete(attempt, result[1]) and not attempt.cancelled.is_set():
+            events.put((attempt, 'done', result))
+
+    def _complete(self, attempt, token_usage):
+        """
+        Keep the token usage of a request once it's done, and return whether it lost (its usage is then recorded).
+        """
+        lost = attempt.complete(token_usage)
+        if lost:
+            self._record_lost_usage(attempt, token_usage)
+        return lost
+
+    def _cancel(self, attempt):
+        self._record_lost_usage(attempt, attempt.lose())
+
+    def _record_lost_usage(self, attempt, token_usage):
+        if token_usage and any(token_usage.values()):
+            logging.info(f'The request to {attempt.client.model} lost the race, its tokens are still paid for.')
+            with self._lost_usage_lock:
+                self._lost_usage.append((attempt.client.model, token_usage))
+
+    def _request_client(self, client, history):
+        """
+        Return a copy of a client for one request, with its own copy of the history, so a request that lost
+        can finish in the background without touching the client of the next turns.
+        """
+        request_client = copy.copy(client)
+        request_client.chat_history = copy_history(history)
+        request_client.message_buffer = client.message_buffer.copy()
+        request_client.last_response = request_client.last_token_usage = None
+        request_client._tool_calls = ToolCallCollector()
+        return request_client
+
+    def _start(self, attempts, events, client, reason, history, prompt, cache, stream):
+        attempt = _Attempt(client, self._request_client(client, history), reason, stream)
+        attempts.append(attempt)
+        if reason != 'primary':
+            logging.info(f'Sending the request to the fallback model {client.model} ({reason}).')
+            get_instrumentation().record('hedged_requests' if reason == 'hedge' else 'failovers', 1)
+        self._spawn(attempt, events, prompt, cache, stream)
+
+    def _hedge_timeout(self, attempts, delay):
+        """
+        The seconds to wait for the primary request before hedging it, None to wait for the next event.
+        """
+        if delay is None or len(attempts) > 1:
+            return None
+        return max(0.0, attempts[0].started + delay - time.perf_counter())
+
+    def _failed(self, attempts, events, attempt, error, history, prompt, cache, stream):
+        """
+        Fail over to the fallback client if it isn't in the race yet, or raise the error once all the requests failed.
+        """
+        attempt.failed = True
+        attempt.result = error
+        logging.warning(f'The request to {attempt.client.model} failed: {str(error)}')
+        if len(attempts) == 1:
+            self._start(attempts, events, self.fallback, 'failover', history, prompt, cache, stream)
+        elif all(other.failed for other in attempts):
+            raise attempts[0].result
+
+    def _won(self, attempts, winner, stream):
+        """
+        Record the latency of the request that responded first, and cancel the other one.
+        """
+        self.tracker.record(winner.client.model, stream, time.perf_counter() - winner.started)
+        for attempt in attempts:
+            if attempt is not winner and not attempt.failed:
+                self._cancel(attempt)
+                # it was at least this slow, which its percentiles must know
+                self.tracker.record(attempt.client.model, stream, time.perf_counter() - attempt.started)
+        self.responding_model = winner.source.model
+        return winner
+
+    def _lost(self, attempts):
+        for attempt in attempts:
+            self._cancel(attempt)
+
+    def _finish(self, winner, prompt, compaction_usage):
+        """
+        Take the response of the request that answered, add its turn to the chat history and journal it.
+        The rest of the history of the request (e.g. a fallback model compacting it for its smaller
+        context window) is discarded.
+        """
+        client = winner.client
+        response, token_usage = winner.result or (client.last_response, client.last_token_usage)
+        if response is None:
+            return
+        # the encoded messages of the request are reused by the next requests of its client
+        winner.source.message_buffer = client.message_buffer
+        turn = client.chat_history["messages"][-2:]
+        self._chat_history["messages"].extend(turn)
+        self.last_response = response
+        self.last_token_usage = add_token_usage(add_token_usage(empty_token_usage(), token_usage), compaction_usage)
+        if self.journal is not None:
+            self.journal.append_messages(turn)
+
+
+class AsyncFailoverClient(FailoverClient):
+    """
+    This is the asyncio counterpart of the FailoverClient, over async clients: the requests are tasks.
+    A streamed request that lost is cancelled right away (with the usage of what it received), a request
+    not streamed is left to finish in the background like with the FailoverClient, so its usage is known.
+    """
+
+    def __init__(self, primary, fallback, tracker=None, hedge=None):
+        super().__init__(primary, fallback, tracker=tracker, hedge=hedge)
+        # the tasks of the requests left to finish, the event loop only keeps weak references to them
+        self._workers = set()
+
+    async def send_request(self, prompt, cache=False):
+        async for _, result in self._run(prompt, cache, stream=False):
+            pass
+        return result
+
+    async def stream_request(self, prompt, cache=False):
+        async for kind, payload in self._run(prompt, cache, stream=True):
+            if kind == 'delta':
+                yield payload
+
+    async def _run(self, prompt, cache, stream):
+        self.last_response = self.last_token_usage = None
+        self.primary.chat_history = self._chat_history
+        compaction_usage = await self.primary._fit_context(prompt)
+        history = self._chat_history
+        attempts, events = [], asyncio.Queue()
+        self._start(attempts, events, self.primary, 'primary', history, prompt, cache, stream)
+        delay = self.tracker.hedge_delay(self.primary.model, stream) if self.hedge else None
+        winner = None
+        try:
+            while winner is None:
+                try:
+                    attempt, kind, payload = await asyncio.wait_for(events.get(), self._hedge_timeout(attempts, delay))
+                except asyncio.TimeoutError:
+                    self._start(attempts, events, self.fallback, 'hedge', history, prompt, cache, stream)
+                    continue
+                if kind == 'error':
+                    self._failed(attempts, events, attempt, payload, history, prompt, cache, stream)
+                    continue
+                winner = self._won(attempts, attempt, stream)
+            while True:
+                if attempt is winner:
+                    if kind == 'error':
+                        raise payload
+                    if kind == 'done':
+                        winner.result = payload
+                    yield kind, payload
+                    if kind == 'done':
+                        break
+                attempt, kind, payload = await events.get()
+        finally:
+            if winner is None:
+                self._lost(attempts)
+            else:
+                if winner.result is None and not winner.worker.done():
+                    # an interrupted stream keeps its partial response, once its worker has closed it
+                    winner.cancelled.set()
+                    await asyncio.wait([winner.worker], timeout=5)
+                self._finish(winner, prompt, compaction_usage)
+
+    def _spawn(self, attempt, events, prompt, cache, stream):
+        attempt.worker = asyncio.create_task(self._work(attempt, events, prompt, cache, stream))
+        self._workers.add(attempt.worker)
+        attempt.worker.add_done_callback(self._workers.discard)
+
+    async def _work(self, attempt, events, prompt, cache, stream):
+        client = attempt.client
+        try:
+            if not stream:
+                result = await client.send_request(prompt, cache=cache)
+            else:
+                deltas = client.stream_request(prompt, cache=cache)
+                try:
+                    async for delta in deltas:
+                        if attempt.cancelled.is_set():
+                            break
+                        events.put_nowait((attempt, 'delta', delta))
+                finally:
+                    await deltas.aclose()
+                result = (client.last_response, client.last_token_usage)
+        except asyncio.CancelledError:
+            # a stream cancelled has the usage of what was received, a request not streamed (the loop closing) has none
+            self._complete(attempt, client.last_token_usage)
+            raise
+        except Exception as e:
+            events.put_nowait((attempt, 'error', e))
+            return
+        if not self._complete(attempt, result[1]) and not attempt.cancelled.is_set():
+            events.put_nowait((attempt, 'done', result))
+
+    def _cancel(self, attempt):
+        super()._cancel(attempt)
+        if attempt.stream:
+            attempt.worker.cancel()
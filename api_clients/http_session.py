@@ -0,0 +1,196 @@
+import os
+import time
+import threading
+from datetime import timedelta
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from api_clients.instrumentation import get_instrumentation, HTTPXTrace
+
+# Connection pool settings, can be overridden in the .env file
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '10'))
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '10'))
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', '120'))
+HTTP2_ENABLED = os.getenv('HTTP2_ENABLED', 'false').lower() == 'true'
+
+DEFAULT_TIMEOUT = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(pool_size=None, http2=None):
+    """
+    Return the shared HTTP session for the given pool settings, creating it on first use.
+    All the API clients reuse the same session, so the TCP+TLS connections are kept alive between turns.
+
+    Args:
+        pool_size (int, optional): The maximum number of connections kept per host. Defaults to HTTP_POOL_SIZE.
+        http2 (bool, optional): Use HTTP/2 (requires `httpx[http2]`). Defaults to HTTP2_ENABLED.
+
+    Returns:
+        requests.Session or HTTPXSession: The shared session.
+    """
+    pool_size = pool_size or HTTP_POOL_SIZE
+    http2 = HTTP2_ENABLED if http2 is None else http2
+
+    key = (pool_size, http2)
+    with _sessions_lock:
+        if key not in _sessions:
+            _sessions[key] = HTTPXSession(pool_size) if http2 else _create_requests_session(pool_size)
+        return _sessions[key]
+
+
+def close_sessions():
+    """
+    Close all the shared sessions and their pooled connections.
+    """
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def _create_requests_session(pool_size):
+    session = requests.Session()
+    adapter = TimedHTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class _TimedConnectMixin:
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        get_instrumentation().record('connect_seconds', time.perf_counter() - start)
+
+
+class _TimedHTTPConnection(_TimedConnectMixin, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnectMixin, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """
+    This adapter records the time spent opening new connections (TCP and TLS handshakes) as `connect_seconds`,
+    so a slow turn can be told apart from a cold connection.
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': _TimedHTTPConnectionPool, 'https': _TimedHTTPSConnectionPool}
+
+
+class HTTPXSession:
+    """
+    This class exposes an `httpx` HTTP/2 client through the subset of the `requests.Session`
+    interface used by the API clients. Its connection errors and timeouts are raised as the `requests`
+    ones, so they are retried by the request scheduler the same way.
+    """
+
+    def __init__(self, pool_size):
+        """
+        Initialize the HTTPXSession with the given pool size.
+
+        Args:
+            pool_size (int): The maximum number of connections kept alive.
+        """
+        try:
+            import httpx
+        except ImportError:
+            raise ImportError("HTTP/2 support requires httpx: pip install 'httpx[http2]'")
+
+        self._httpx = httpx
+        limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        self._client = httpx.Client(http2=True, limits=limits)
+
+    def request(self, method, url, headers=None, json=None, data=None, files=None, stream=False, timeout=DEFAULT_TIMEOUT):
+        connect_timeout, read_timeout = timeout
+        trace = HTTPXTrace()
+        # like requests, `data` is the body, or the form fields (e.g. of a multipart upload with `files`)
+        body = {"data": data} if isinstance(data, dict) else {"content": data}
+        request = self._client.build_request(method, url, headers=headers, json=json, files=files, **body,
+                                             timeout=self._httpx.Timeout(read_timeout, connect=connect_timeout),
+                                             extensions={"trace": trace})
+        try:
+            response = HTTPXResponse(self._client.send(request, stream=stream))
+        except self._httpx.TransportError as e:
+            raise _requests_error(self._httpx, e) from e
+        if trace.elapsed is not None:
+            response.elapsed = timedelta(seconds=trace.elapsed)
+        return response
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request('HEAD', url, **kwargs)
+
+    def close(self):
+        self._client.close()
+
+
+def _requests_error(httpx, error):
+    """
+    Return the `requests` exception matching an `httpx` transport error.
+    """
+    if isinstance(error, httpx.ConnectTimeout):
+        return requests.ConnectTimeout(str(error))
+    if isinstance(error, httpx.TimeoutException):
+        return requests.Timeout(str(error))
+    return requests.ConnectionError(str(error))
+
+
+class HTTPXResponse:
+    """
+    This class wraps an `httpx.Response` so it behaves like a `requests.Response` for the API clients.
+    """
+
+    def __init__(self, response):
+        self._response = response
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.elapsed = None  # the time to the response headers, like `requests.Response.elapsed`
+
+    @property
+    def text(self):
+        return self._response.text
+
+    @property
+    def content(self):
+        return self._response.content
+
+    def json(self):
+        return self._response.json()
+
+    def iter_lines(self, decode_unicode=False):
+        import httpx
+
+        try:
+            yield from self._response.iter_lines()
+        except httpx.TransportError as e:
+            raise _requests_error(httpx, e) from e
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            self._response.read()
+            raise requests.HTTPError(f"{self.status_code} Error for url: {self._response.url}", response=self)
+
+    def close(self):
+        self._response.close()
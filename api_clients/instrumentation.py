@@ -0,0 +1,413 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+
+# Instrumentation settings, can be overridden in the .env file
+INSTRUMENTATION = os.getenv('INSTRUMENTATION', 'true').lower() != 'false'
+STATS_WINDOW = int(os.getenv('STATS_WINDOW', '1000'))  # the recent values kept per metric for the percentiles
+STATS_JSONL_PATH = os.getenv('STATS_JSONL_PATH', '')  # append each turn to this file
+STATS_PROMETHEUS_PATH = os.getenv('STATS_PROMETHEUS_PATH', '')  # keep this Prometheus textfile up to date
+
+# The recorded metrics, with their descriptions
+METRICS = {
+    "queue_seconds": "Time waiting for the rate limit budgets and the retries before the last attempt.",
+    "build_seconds": "Time building the request (parameters and messages).",
+    "serialise_seconds": "Time encoding the request body to JSON.",
+    "connect_seconds": "Time opening new connections (TCP and TLS), 0 when a pooled connection is reused.",
+    "ttfb_seconds": "Time from sending the request to the response headers, including the connection.",
+    "first_token_seconds": "Time from the start of the turn to the first streamed token.",
+    "transfer_seconds": "Time receiving the response body after the headers.",
+    "parse_seconds": "Time parsing the response (or the streamed events).",
+    "total_seconds": "Duration of the whole turn.",
+    "request_bytes": "Size of the request bodies.",
+    "response_bytes": "Size of the response bodies.",
+    "input_tokens": "Input tokens (not cached).",
+    "output_tokens": "Output tokens.",
+    "cache_read_tokens": "Input tokens read from the prompt cache.",
+    "cache_write_tokens": "Input tokens written to the prompt cache.",
+    "ingest_seconds": "Time ingesting the project folder.",
+    "ingest_files": "Files of the ingested project.",
+    "ingest_bytes": "Bytes of the ingested project.",
+    "save_history_seconds": "Time saving the chat history.",
+    "hedged_requests": "Requests hedged with the fallback model, the model being slower than usual.",
+    "failovers": "Requests sent to the fallback model after the model failed.",
+    "tool_calls": "Tool calls of the model answered locally (e.g. the project files read on demand).",
+}
+
+# Where the time of a turn goes, for the /stats breakdown
+BREAKDOWN = (
+    ("client", ("queue_seconds", "build_seconds", "serialise_seconds", "parse_seconds")),
+    ("network", ("connect_seconds", "transfer_seconds")),
+    ("server", ("ttfb_seconds", "first_token_seconds")),
+)
+
+_current_turn = ContextVar('current_turn', default=None)
+
+
+class Turn:
+    """
+    The metrics of one chat turn (a request and its response). The values recorded more than once
+    during the turn (e.g. the requests of a history compaction) are added up.
+    """
+
+    def __init__(self, labels):
+        self.labels = labels
+        self.metrics = {}
+        self.started = time.perf_counter()
+        self.timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def to_dict(self):
+        return {"timestamp": self.timestamp, **self.labels, **self.metrics}
+
+
+class MetricSummary:
+    """
+    The running count and sum of a metric, and its recent values for the percentiles.
+    """
+
+    def __init__(self, window):
+        self.count = 0
+        self.total = 0.0
+        self.recent = deque(maxlen=window)
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.recent.append(value)
+
+    def percentile(self, fraction):
+        values = sorted(self.recent)
+        if not values:
+            return 0.0
+        return values[min(int(fraction * len(values)), len(values) - 1)]
+
+    def to_dict(self):
+        return {"count": self.count, "mean": self.total / self.count if self.count else 0.0,
+                "p50": self.percentile(0.5), "p95": self.percentile(0.95), "max": max(self.recent, default=0.0)}
+
+
+class Instrumentation:
+    """
+    This class collects the timings, payload sizes and token counts of the hot paths. The values recorded
+    during a turn are grouped into that turn (the turns are tracked per thread and per asyncio task),
+    the others (e.g. the project ingestion) are recorded on their own. Each finished turn is passed to the sinks.
+    """
+
+    def __init__(self, enabled=None, sinks=None, window=None):
+        """
+        Initialize the Instrumentation.
+
+        Args:
+            enabled (bool, optional): Whether to record anything. Defaults to INSTRUMENTATION.
+            sinks (list, optional): The sinks of the finished turns (JSONLSink, PrometheusTextfileSink...). Defaults to none.
+            window (int, optional): The recent values kept per metric. Defaults to STATS_WINDOW.
+        """
+        self.enabled = INSTRUMENTATION if enabled is None else enabled
+        self.sinks = list(sinks or [])
+        self.window = window or STATS_WINDOW
+        self.metrics = {}
+        self.turns = 0
+        self.last_turn = None
+        self._lock = threading.Lock()
+
+    def record(self, name, value):
+        """
+        Record a value, in the current turn if there is one.
+
+        Args:
+            name (str): The metric, see METRICS.
+            value (float): The value (seconds, bytes or tokens).
+        """
+        if not self.enabled:
+            return
+        turn = _current_turn.get()
+        if turn is not None:
+            turn.metrics[name] = turn.metrics.get(name, 0) + value
+        else:
+            self._add(name, value)
+
+    def record_token_usage(self, token_usage):
+        """
+        Record the counts of a token usage dictionary.
+        """
+        for name, value in (token_usage or {}).items():
+            self.record(name, value)
+
+    @contextmanager
+    def span(self, name):
+        """
+        Record the duration of the block, in seconds.
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    @contextmanager
+    def turn(self, **labels):
+        """
+        Group the values recorded in the block into a turn. A turn started inside another one is part of it.
+
+        Args:
+            **labels: The description of the turn (client, model, stream...).
+
+        Yields:
+            Turn: The turn, or None when nothing is recorded.
+        """
+        if not self.enabled or _current_turn.get() is not None:
+            yield _current_turn.get()
+            return
+        turn = Turn(labels)
+        token = _current_turn.set(turn)
+        try:
+            yield turn
+        except BaseException as e:
+            turn.labels["error"] = type(e).__name__
+            raise
+        finally:
+            try:
+                _current_turn.reset(token)
+            except ValueError:
+                pass  # a stream generator closed from another context (e.g. garbage collected)
+            turn.metrics["total_seconds"] = turn.elapsed()
+            self._end_turn(turn)
+
+    def current_turn(self):
+        return _current_turn.get()
+
+    def summary(self):
+        """
+        Return the summary (count, mean, p50, p95, max) of each recorded metric.
+        """
+        with self._lock:
+            return {name: metric.to_dict() for name, metric in self.metrics.items()}
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+    def _add(self, name, value):
+        with self._lock:
+            if name not in self.metrics:
+                self.metrics[name] = MetricSummary(self.window)
+            self.metrics[name].add(value)
+
+    def _end_turn(self, turn):
+        for name, value in turn.metrics.items():
+            self._add(name, value)
+        with self._lock:
+            self.turns += 1
+            self.last_turn = turn
+        for sink in self.sinks:
+            try:
+                sink.write(turn, self)
+            except (OSError, TypeError, ValueError) as e:
+                logging.error(f'Failed to write the turn metrics to {sink.path}: {str(e)}')
+
+
+class JSONLSink:
+    """
+    This sink appends each turn to a JSONL file, one line per turn.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def write(self, turn, instrumentation):
+        self._file.write(json.dumps(turn.to_dict(), ensure_ascii=False) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class PrometheusTextfileSink:
+    """
+    This sink rewrites a Prometheus textfile (e.g. for the node exporter textfile collector) with the
+    summaries of the metrics after each turn.
+    """
+
+    def __init__(self, path, prefix='term_chatbot'):
+        self.path = path
+        self.prefix = prefix
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def write(self, turn, instrumentation):
+        lines = [f"# HELP {self.prefix}_turns_total Chat turns.", f"# TYPE {self.prefix}_turns_total counter",
+                 f"{self.prefix}_turns_total {instrumentation.turns}"]
+        with instrumentation._lock:
+            metrics = sorted(instrumentation.metrics.items())
+            for name, metric in metrics:
+                full_name = f"{self.prefix}_{name}"
+                lines.append(f"# HELP {full_name} {METRICS.get(name, name)}")
+                lines.append(f"# TYPE {full_name} summary")
+                for quantile in (0.5, 0.95):
+                    lines.append(f'{full_name}{{quantile="{quantile}"}} {metric.percentile(quantile)}')
+                lines.append(f"{full_name}_sum {metric.total}")
+                lines.append(f"{full_name}_count {metric.count}")
+        # written aside then renamed, so the collector never reads a partial file
+        temporary_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temporary_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(temporary_path, self.path)
+
+    def close(self):
+        pass
+
+
+class StreamTimer:
+    """
+    This class times a streamed response once its headers are received: the first token, the parsing
+    of the events and the transfer of the rest of the stream, and counts its bytes.
+    """
+
+    def __init__(self, instrumentation):
+        self.instrumentation = instrumentation
+        self.started_at = time.perf_counter()
+        self.parse_seconds = 0.0
+        self.response_bytes = 0
+        self._first_token = False
+
+    def count_lines(self, lines):
+        """
+        Pass the lines of the stream through, counting their size.
+        """
+        for line in lines:
+            self.response_bytes += len(line) + 1
+            yield line
+
+    def parse(self, parse_event, *args):
+        """
+        Call the event parser, timing it.
+        """
+        start = time.perf_counter()
+        try:
+            return parse_event(*args)
+        finally:
+            self.parse_seconds += time.perf_counter() - start
+
+    def first_token(self):
+        """
+        Record the time to the first token of the turn, on the first call.
+        """
+        if self._first_token:
+            return
+        self._first_token = True
+        turn = self.instrumentation.current_turn()
+        if turn is not None:
+            self.instrumentation.record('first_token_seconds', turn.elapsed())
+
+    def finish(self, token_usage):
+        """
+        Record the stream metrics, once it is over (or interrupted).
+        """
+        self.instrumentation.record('transfer_seconds', time.perf_counter() - self.started_at - self.parse_seconds)
+        self.instrumentation.record('parse_seconds', self.parse_seconds)
+        self.instrumentation.record('response_bytes', self.response_bytes)
+        self.instrumentation.record_token_usage(token_usage)
+
+
+class HTTPXTrace:
+    """
+    This class collects the timings of an httpx request through its "trace" extension: the new
+    connections are recorded as `connect_seconds`, and the time to the response headers is kept.
+    """
+
+    def __init__(self, instrumentation=None):
+        self.instrumentation = instrumentation or get_instrumentation()
+        self.started_at = time.perf_counter()
+        self.headers_at = None
+        self._connect_started = None
+
+    @property
+    def elapsed(self):
+        """
+        The seconds from the start of the request to the response headers, or None if they were not received.
+        """
+        return None if self.headers_at is None else self.headers_at - self.started_at
+
+    def __call__(self, event_name, info):
+        if event_name == 'connection.connect_tcp.started':
+            self._connect_started = time.perf_counter()
+        elif event_name.endswith('.send_request_headers.started') and self._connect_started is not None:
+            # the new connection is usable (TCP and TLS handshakes done) when the request is sent
+            self.instrumentation.record('connect_seconds', time.perf_counter() - self._connect_started)
+            self._connect_started = None
+        elif event_name.endswith('.receive_response_headers.complete'):
+            self.headers_at = time.perf_counter()
+
+    async def async_trace(self, event_name, info):
+        self(event_name, info)
+
+
+_instrumentation = None
+_instrumentation_lock = threading.Lock()
+
+
+def get_instrumentation():
+    """
+    Return the shared instrumentation, with the sinks of the .env settings, creating it on first use.
+    """
+    global _instrumentation
+    with _instrumentation_lock:
+        if _instrumentation is None:
+            sinks = []
+            try:
+                if STATS_JSONL_PATH:
+                    sinks.append(JSONLSink(STATS_JSONL_PATH))
+                if STATS_PROMETHEUS_PATH:
+                    sinks.append(PrometheusTextfileSink(STATS_PROMETHEUS_PATH))
+            except OSError as e:
+                logging.error(f'Cannot open the stats sink: {str(e)}')
+            _instrumentation = Instrumentation(sinks=sinks)
+        return _instrumentation
+
+
+def format_stats(instrumentation):
+    """
+    Return the /stats report: the breakdown of the last turn, then the summary of the session.
+    """
+    turn = instrumentation.last_turn
+    if turn is None:
+        return "No turn recorded yet."
+
+    def milliseconds(name):
+        return f"{turn.metrics.get(name, 0.0) * 1000:.1f} ms"
+
+    labels = ' '.join(str(value) for name, value in turn.labels.items() if name in ('client', 'model'))
+    flags = [name for name in ('stream', 'cached') if turn.labels.get(name)]
+    if turn.labels.get('error'):
+        flags.append(f"error: {turn.labels['error']}")
+    lines = [f"Last turn: {labels}{' (' + ', '.join(flags) + ')' if flags else ''} {milliseconds('total_seconds')}"]
+    for group, names in BREAKDOWN:
+        parts = [f"{name.rsplit('_', 1)[0].replace('_', ' ')} {milliseconds(name)}" for name in names if name in turn.metrics]
+        lines.append(f"  {group:<8} " + (' · '.join(parts) or '-'))
+    lines.append(f"  payload  request {turn.metrics.get('request_bytes', 0) / 1000:.1f} kB · "
+                 f"response {turn.metrics.get('response_bytes', 0) / 1000:.1f} kB · "
+                 f"tokens I:{turn.metrics.get('input_tokens', 0)} O:{turn.metrics.get('output_tokens', 0)} "
+                 f"CR:{turn.metrics.get('cache_read_tokens', 0)} CW:{turn.metrics.get('cache_write_tokens', 0)}")
+
+    lines.append(f"Session: {instrumentation.turns} turns")
+    lines.append(f"  {'metric':<22}{'mean':>10}{'p50':>10}{'p95':>10}{'max':>10}")
+    for name, summary in sorted(instrumentation.summary().items()):
+        if name.endswith('_seconds'):
+            values = [f"{summary[key] * 1000:.1f}ms" for key in ('mean', 'p50', 'p95', 'max')]
+        else:
+            values = [f"{summary[key]:.0f}" for key in ('mean', 'p50', 'p95', 'max')]
+        lines.append(f"  {name:<22}" + ''.join(f"{value:>10}" for value in values))
+    return '\n'.join(lines)
@@ -0,0 +1,107 @@
+import json
+
+
+def encode_json(obj):
+    """
+    Encode an object to compact JSON bytes.
+
+    Args:
+        obj: The JSON serialisable object.
+
+    Returns:
+        bytes: The UTF-8 encoded JSON.
+    """
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class MessageBuffer:
+    """
+    This class keeps the chat history formatted for a provider and pre-encoded to JSON, one
+    fragment per message. It is appended to incrementally, so only the new messages are formatted
+    and serialised when a request is built, instead of the whole history at every turn.
+    """
+
+    def __init__(self, format_message):
+        """
+        Initialize the MessageBuffer.
+
+        Args:
+            format_message (callable): The function converting a chat history message to the provider format.
+        """
+        self._format_message = format_message
+        self._messages = []
+        self._fragments = []
+
+    def __len__(self):
+        return len(self._fragments)
+
+    @property
+    def fragments(self):
+        """
+        The encoded JSON fragments of the messages, in order.
+        """
+        return self._fragments
+
+    def sync(self, messages):
+        """
+        Bring the buffer in line with the chat history messages. Messages already encoded are reused
+        (matched by identity, e.g. after old turns were compacted), only the new ones are encoded.
+        A message edited in place is not detected, call `reset` after such an edit.
+
+        Args:
+            messages (list): The chat history messages.
+        """
+        buffered = len(self._messages)
+        if buffered and len(messages) >= buffered and messages[0] is self._messages[0] \
+                and messages[buffered - 1] is self._messages[-1]:
+            # fast path: the history was only appended to
+            for message in messages[buffered:]:
+                self._messages.append(message)
+                self._fragments.append(encode_json(self._format_message(message)))
+            return
+
+        # the old lists keep the messages alive, so their ids can't be reused while rebuilding
+        old_messages, old_fragments = self._messages, self._fragments
+        encoded = {id(message): fragment for message, fragment in zip(old_messages, old_fragments)}
+        self._messages, self._fragments = [], []
+        for message in messages:
+            fragment = encoded.get(id(message))
+            if fragment is None:
+                fragment = encode_json(self._format_message(message))
+            self._messages.append(message)
+            self._fragments.append(fragment)
+
+    def copy(self):
+        """
+        Return a copy of the buffer, which is synced on its own (e.g. by a copy of the client for one request).
+        """
+        buffer = MessageBuffer(self._format_message)
+        buffer._messages = list(self._messages)
+        buffer._fragments = list(self._fragments)
+        return buffer
+
+    def reset(self):
+        """
+        Drop all the encoded messages, e.g. after the history has been edited in place.
+        """
+        self._messages = []
+        self._fragments = []
+
+    def build_request_body(self, params, extra_messages=(), leading_messages=()):
+        """
+        Build the JSON request body from the request parameters and the buffered messages.
+
+        Args:
+            params (dict): The request parameters other than the messages (model, max_tokens...).
+            extra_messages (iterable, optional): Provider formatted messages to append after the buffered ones.
+            leading_messages (iterable, optional): Provider formatted messages to put before the buffered ones.
+
+        Returns:
+            bytes: The JSON request body.
+        """
+        fragments = [encode_json(message) for message in leading_messages]
+        fragments += self._fragments
+        fragments += [encode_json(message) for message in extra_messages]
+        head = encode_json(params)[:-1]  # strip the closing brace
+        separator = b',' if params else b''
+        return b''.join((head, separator, b'"messages":[', b','.join(fragments), b']}'))
@@ -0,0 +1,224 @@
+import os
+import sys
+import time
+import hashlib
+import threading
+from datetime import datetime
+
+# Texts of at least this many characters are kept in the blob store, can be overridden in the .env file
+BLOB_MIN_SIZE = int(os.getenv('BLOB_MIN_SIZE', '4096'))
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class BlobRef:
+    """
+    A reference to a text of the blob store, by the hash of its content.
+    """
+
+    __slots__ = ('digest', 'length')
+
+    def __init__(self, digest, length):
+        self.digest = digest
+        self.length = length
+
+    def __eq__(self, other):
+        return isinstance(other, BlobRef) and other.digest == self.digest
+
+    def __hash__(self):
+        return hash(self.digest)
+
+    def __repr__(self):
+        return f'BlobRef({self.digest!r}, {self.length})'
+
+
+class BlobStore:
+    """
+    This class is a content-addressed store of the large texts of the chat history (project dumps,
+    pasted files): each distinct text is kept once, whatever the number of messages referencing it,
+    and the first copy stored is the one kept, so a text also held elsewhere (e.g. in the project
+    files of the CodingAssistant) is shared rather than copied.
+    """
+
+    def __init__(self):
+        self._blobs = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._blobs)
+
+    def __contains__(self, ref):
+        return (ref.digest if isinstance(ref, BlobRef) else ref) in self._blobs
+
+    @property
+    def size(self):
+        """
+        The number of characters stored.
+        """
+        return sum(len(text) for text in self._blobs.values())
+
+    def put(self, text):
+        """
+        Store a text, unless the same text is stored already.
+
+        Args:
+            text (str): The text.
+
+        Returns:
+            BlobRef: The reference to the text.
+        """
+        text = str(text)
+        digest = hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).hexdigest()
+        with self._lock:
+            self._blobs.setdefault(digest, text)
+        return BlobRef(digest, len(text))
+
+    def get(self, ref):
+        """
+        Return the text of a reference (or of its digest).
+
+        Raises:
+            KeyError: If the text is not in the store.
+        """
+        return self._blobs[ref.digest if isinstance(ref, BlobRef) else ref]
+
+
+class ComposedText(str):
+    """
+    A text made of parts (e.g. the files of a project), which is used like the full string while the
+    request is built, and keeps its parts so the chat history can reference them in the blob store
+    instead of keeping the full string.
+    """
+
+    def __new__(cls, parts):
+        parts = tuple(parts)
+        text = super().__new__(cls, ''.join(parts))
+        text.parts = parts
+        return text
+
+
+class Message:
+    """
+    This class is a compact chat history message: the role is interned, the time is an integer epoch,
+    and the large texts are references to the blob store, materialised only when the message is read
+    (to build a request or an export). It can be read like the dictionaries the history used to hold
+    (`message["text"]`, `message.get("cache")`, `dict(message)`), so the journals and exports don't change.
+    """
+
+    __slots__ = ('sender', 'created', 'cache', '_content', '_store')
+
+    KEYS = ('sender', 'text', 'timestamp', 'cache')
+
+    def __init__(self, sender, text, created=None, cache=False, store=None):
+        """
+        Initialize the Message.
+
+        Args:
+            sender (str): 'user' or 'assistant'.
+            text (str): The text, a ComposedText to store its parts separately.
+            created (int or str, optional): The epoch time, or a timestamp string. Defaults to now.
+            cache (bool, optional): Whether the message is pinned as a stable prefix to cache.
+            store (BlobStore, optional): The store of the large texts. Defaults to keeping the text inline.
+        """
+        self.sender = sys.intern(sender)
+        self.created = _to_epoch(created)
+        self.cache = bool(cache)
+        self._store = store
+        self._content = _store_text(text, store)
+
+    @classmethod
+    def from_dict(cls, message, store=None):
+        """
+        Create a message from its dictionary form (e.g. a message of a journal or of the archive).
+        """
+        return cls(message["sender"], message["text"], message.get("timestamp"), message.get("cache", False), store)
+
+    @property
+    def text(self):
+        content = self._content
+        if isinstance(content, str):
+            return content
+        if isinstance(content, BlobRef):
+            return self._store.get(content)
+        return ''.join(self._store.get(part) if isinstance(part, BlobRef) else part for part in content)
+
+    @property
+    def parts(self):
+        """
+        The parts of the text, the stored ones being shared with the blob store (for per-part work, e.g. counting tokens).
+        """
+        content = self._content
+        if isinstance(content, str):
+            return (content,)
+        if isinstance(content, BlobRef):
+            return (self._store.get(content),)
+        return tuple(self._store.get(part) if isinstance(part, BlobRef) else part for part in content)
+
+    @property
+    def timestamp(self):
+        return datetime.fromtimestamp(self.created).strftime(TIMESTAMP_FORMAT) if self.created is not None else None
+
+    def __getitem__(self, key):
+        if key not in self.KEYS or (key == 'cache' and not self.cache):
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return self.KEYS if self.cache else self.KEYS[:3]
+
+    def to_dict(self):
+        return {key: self[key] for key in self.keys()}
+
+    def __repr__(self):
+        return f'Message({self.sender!r}, {self.timestamp!r}, {sum(len(part) for part in self.parts)} chars)'
+
+
+def _store_text(text, store):
+    """
+    Return the content of a message: the text itself, a reference to it in the store, or the parts of a
+    ComposedText with the large ones stored.
+    """
+    if store is None:
+        return str(text)
+    parts = getattr(text, 'parts', None)
+    if parts is not None:
+        return tuple(store.put(part) if len(part) >= BLOB_MIN_SIZE else str(part) for part in parts)
+    if len(text) >= BLOB_MIN_SIZE:
+        return store.put(text)
+    return str(text)
+
+
+def _to_epoch(created):
+    if created is None:
+        return int(time.time())
+    if isinstance(created, str):
+        try:
+            return int(datetime.strptime(created, TIMESTAMP_FORMAT).timestamp())
+        except ValueError:
+            return None
+    return int(created)
+
+
+def message_parts(message):
+    """
+    Return the parts of the text of a message, a Message or a dictionary.
+    """
+    return message.parts if isinstance(message, Message) else (message["text"],)
+
+
+def to_dict(message):
+    """
+    Return the dictionary form of a message, e.g. as the `default` of `json.dump`.
+    """
+    if isinstance(message, Message):
+        return message.to_dict()
+    raise TypeError(f'Object of type {type(message).__name__} is not JSON serializable')
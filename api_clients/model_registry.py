@@ -0,0 +1,156 @@
+import os
+import json
+import logging
+import threading
+import importlib
+from api_clients.token_estimator import model_family
+
+# The model registry file, can be overridden in the .env file
+MODEL_REGISTRY_PATH = os.getenv('MODEL_REGISTRY_PATH', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config', 'models.json'))
+
+# The settings of the models missing from the registry and from their provider's defaults
+DEFAULT_MODEL_SETTINGS = {
+    "provider": None,
+    "context_window": 8192,
+    "max_tokens": 1000,
+    "max_output_tokens": 4096,
+    "streaming": True,
+    "prompt_caching": False,
+    "batch": False,
+    "pricing": None
+}
+
+
+class ModelRegistry:
+    """
+    This class holds what the app knows about each model: its provider, pricing (with the cache and
+    batch rates, in $ per million tokens), context window, output limits and capabilities. The settings
+    of a model are its provider's defaults overridden by its own entry, and the models the app doesn't
+    know get the defaults of their model family, so a new model can be used before it is registered.
+    """
+
+    def __init__(self, providers=None, models=None):
+        """
+        Initialize the ModelRegistry.
+
+        Args:
+            providers (dict, optional): The default settings of the models of each provider, keyed by provider.
+            models (dict, optional): The settings of each model, keyed by model name.
+        """
+        self.providers = providers or {}
+        self._models = models or {}
+        self._settings = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path=None):
+        """
+        Load the registry from its JSON file.
+
+        Args:
+            path (str, optional): The registry file. Defaults to MODEL_REGISTRY_PATH.
+
+        Returns:
+            ModelRegistry: The registry, empty if the file can't be read.
+        """
+        path = path or MODEL_REGISTRY_PATH
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.error(f'Cannot load the model registry {path}: {str(e)}')
+            return cls()
+        return cls(data.get("providers"), data.get("models"))
+
+    def get(self, model, provider=None):
+        """
+        Return the settings of a model.
+
+        Args:
+            model (str): The model name.
+            provider (str, optional): The provider of the model if it isn't registered, e.g. the one of the
+                                      client sending the request. Defaults to the provider of its model family.
+
+        Returns:
+            dict: The "provider", "pricing" (dict or None), "context_window", "max_tokens" (the default output
+                  cap of the requests), "max_output_tokens" (the model's limit), "streaming", "prompt_caching"
+                  and "batch" settings of the model.
+        """
+        key = (model, provider)
+        settings = self._settings.get(key)
+        if settings is None:
+            entry = self._models.get(model, {})
+            provider = entry.get("provider") or provider or self._guess_provider(model)
+            settings = dict(DEFAULT_MODEL_SETTINGS)
+            settings.update({key: value for key, value in self.providers.get(provider, {}).items() if key in settings})
+            settings.update(entry)
+            settings["provider"] = provider
+            with self._lock:
+                self._settings[key] = settings
+        return settings
+
+    def models(self, provider):
+        """
+        Return the models of a provider offered in the menus. The AVAILABLE_<PROVIDER>_MODELS
+        environment variable (e.g. AVAILABLE_OPENAI_MODELS) selects and orders them, if set.
+
+        Args:
+            provider (str): The provider.
+
+        Returns:
+            list: The model names.
+        """
+        available = os.getenv(f'AVAILABLE_{provider.upper()}_MODELS')
+        if available:
+            return [model.strip() for model in available.split(',') if model.strip()]
+        return [model for model, entry in self._models.items() if entry.get("provider") == provider]
+
+    def client_class(self, provider, asynchronous=False):
+        """
+        Import and return the API client class of a provider, so the provider modules and the HTTP stack
+        are only loaded once a provider is chosen.
+
+        Args:
+            provider (str): The provider.
+            asynchronous (bool, optional): Return the async client (httpx) instead of the synchronous one (requests).
+
+        Returns:
+            type: The client class, or None if the provider has none.
+        """
+        path = self.providers.get(provider, {}).get("async_client" if asynchronous else "client")
+        if not path:
+            return None
+        module_name, _, class_name = path.rpartition('.')
+        return getattr(importlib.import_module(module_name), class_name)
+
+    def client_provider(self, class_name):
+        """
+        Return the provider of a client class name (e.g. 'AnthropicClient' or 'AsyncAnthropicClient' in a
+        session journal), or None.
+        """
+        for provider, settings in self.providers.items():
+            if class_name and class_name in (settings.get(key, "").rpartition('.')[2] for key in ("client", "async_client")):
+                return provider
+        return None
+
+    def pricing(self, model):
+        return self.get(model)["pricing"]
+
+    def _guess_provider(self, model):
+        family = model_family(model)
+        return family if family in self.providers else None
+
+
+_model_registry = None
+_model_registry_lock = threading.Lock()
+
+
+def get_model_registry():
+    """
+    Return the shared model registry, loading it on first use.
+    """
+    global _model_registry
+    with _model_registry_lock:
+        if _model_registry is None:
+            _model_registry = ModelRegistry.load()
+        return _model_registry
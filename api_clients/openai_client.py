@@ -1,10 +1,8 @@
-from api_clients.base_client import BaseAPIClient
-from dotenv import load_dotenv
-import os
+from api_clients.base_client import BaseAPIClient, empty_token_usage
+from api_clients.model_registry import get_model_registry
 
-load_dotenv()
-
-AVAILABLE_OPENAI_MODELS = os.getenv('AVAILABLE_ANTHROPIC_MODELS').split(',')
+# The models offered in the menus, the first one is the default
+AVAILABLE_OPENAI_MODELS = get_model_registry().models('openai')
 
 class OpenAIClient(BaseAPIClient):
     """
@@ -12,15 +10,19 @@ class OpenAIClient(BaseAPIClient):
     It provides the implementation for sending requests to the OpenAI API.
     """
 
-    def __init__(self, api_key, api_url):
+    provider = 'openai'
+
+    def __init__(self, api_key, api_url, session=None, timeout=None):
         """
         Initialize the OpenAIClient with the API key and URL.
 
         Args:
             api_key (str): The OpenAI API key for authentication.
             api_url (str): The URL of the OpenAI API endpoint.
+            session (requests.Session, optional): The HTTP session to use. Defaults to the shared pooled session.
+            timeout (tuple, optional): The (connect, read) timeouts in seconds.
         """
-        super().__init__(api_key, api_url)
+        super().__init__(api_key, api_url, session=session, timeout=timeout)
         self.model = AVAILABLE_OPENAI_MODELS[0]  # Set the default model
 
     def _get_headers(self):
@@ -32,22 +34,13 @@ class OpenAIClient(BaseAPIClient):
             'Authorization': f'Bearer {self.api_key}'
         }
 
-    def _get_request_data(self, prompt, chat_history):
+    def _get_request_params(self):
         """
-        Return the request data for the OpenAI API.
+        Return the request parameters for the OpenAI API, the messages are added by the base client.
         """
-        messages = []
-        for message in chat_history["messages"]:
-            role = message["sender"]
-            content = message["text"]
-            messages.append({"role": role, "content": content})
-
-        messages.append({"role": "user", "content": prompt})
-
         return {
             'model': self.model,
-            'max_tokens': 1000,  # Adjust as needed
-            'messages': messages
+            'max_tokens': self.model_info['max_tokens']
         }
 
     def _parse_response(self, response):
@@ -60,14 +53,57 @@ class OpenAIClient(BaseAPIClient):
         response_data = response.json()
 
         # Extract the AI's response
-        result = response_data.get('choices', [])[0].get('message', {}).get('content', '')
+        message = response_data.get('choices', [])[0].get('message', {})
+        result = message.get('content') or ''
+        for index, tool_call in enumerate(message.get('tool_calls') or []):
+            function = tool_call.get('function', {})
+            self._tool_calls.add(index, tool_call.get('id'), function.get('name'), partial_json=function.get('arguments'))
 
         # Extract token usage
-        usage = response_data.get('usage', {})
-        input_tokens = usage.get('prompt_tokens', 0)
-        output_tokens = usage.get('completion_tokens', 0)
+        token_usage = empty_token_usage()
+        self._update_token_usage(response_data.get('usage', {}), token_usage)
+
+        # a response with tool calls may have no text
+        return result or ('' if self._tool_calls else "No response received."), token_usage
 
-        return result or "No response received.", {"input_tokens": input_tokens, "output_tokens": output_tokens}
+    def _update_token_usage(self, usage, token_usage):
+        """
+        Copy the token counts of an OpenAI usage object into the token usage dictionary.
+        OpenAI caches the prompt prefixes automatically and reports the cached tokens as part of the prompt tokens.
+        """
+        cached_tokens = (usage.get('prompt_tokens_details') or {}).get('cached_tokens', 0)
+        token_usage["input_tokens"] = usage.get('prompt_tokens', 0) - cached_tokens
+        token_usage["output_tokens"] = usage.get('completion_tokens', 0)
+        token_usage["cache_read_tokens"] = cached_tokens
 
+    def _get_stream_request_data(self, data):
+        """
+        Return the request data with streaming enabled, asking for the token usage in the last chunk.
+        """
+        data = super()._get_stream_request_data(data)
+        data['stream_options'] = {'include_usage': True}
+        return data
 
+    def _parse_stream_event(self, event, data, token_usage):
+        """
+        Parse a server-sent event from the OpenAI streaming API.
 
+        Returns:
+            str: The text delta carried by the event, if any.
+        """
+        if not isinstance(data, dict):  # the stream ends with `data: [DONE]`
+            return ''
+        if 'error' in data:
+            raise RuntimeError(f"OpenAI stream error: {data['error'].get('message', data['error'])}")
+
+        usage = data.get('usage')
+        if usage:
+            self._update_token_usage(usage, token_usage)
+
+        choices = data.get('choices') or [{}]
+        delta = choices[0].get('delta', {})
+        for tool_call in delta.get('tool_calls') or []:
+            function = tool_call.get('function', {})
+            self._tool_calls.add(tool_call.get('index', 0), tool_call.get('id'), function.get('name'),
+                                 partial_json=function.get('arguments'))
+        return delta.get('content') or ''
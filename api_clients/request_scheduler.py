@@ -0,0 +1,310 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import requests
+
+# Status codes worth retrying: timeouts, rate limits, overloaded and server errors
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+# Retry and client-side budget settings, can be overridden in the .env file (0 disables a budget)
+MAX_RETRIES = int(os.getenv('MAX_RETRIES', '5'))
+RETRY_BASE_DELAY = float(os.getenv('RETRY_BASE_DELAY', '1'))
+RETRY_MAX_DELAY = float(os.getenv('RETRY_MAX_DELAY', '60'))
+RATE_LIMIT_RPM = int(os.getenv('RATE_LIMIT_RPM', '0'))
+RATE_LIMIT_TPM = int(os.getenv('RATE_LIMIT_TPM', '0'))
+
+# Rate limit headers sent by the providers: (limit, remaining, reset) for requests and tokens
+RATE_LIMIT_HEADERS = {
+    "requests": [
+        ('anthropic-ratelimit-requests-limit', 'anthropic-ratelimit-requests-remaining', 'anthropic-ratelimit-requests-reset'),
+        ('x-ratelimit-limit-requests', 'x-ratelimit-remaining-requests', 'x-ratelimit-reset-requests'),
+    ],
+    "tokens": [
+        ('anthropic-ratelimit-tokens-limit', 'anthropic-ratelimit-tokens-remaining', 'anthropic-ratelimit-tokens-reset'),
+        ('x-ratelimit-limit-tokens', 'x-ratelimit-remaining-tokens', 'x-ratelimit-reset-tokens'),
+    ],
+}
+
+_DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+
+class TokenBucket:
+    """
+    This class implements a token bucket refilled continuously over one minute.
+    It is used to keep the requests/min and tokens/min budgets of an API key.
+    """
+
+    def __init__(self, capacity, period=60.0, clock=time.monotonic):
+        """
+        Initialize the TokenBucket full.
+
+        Args:
+            capacity (int): The budget per period.
+            period (float, optional): The refill period in seconds. Defaults to 60.
+            clock (callable, optional): The monotonic clock. Defaults to time.monotonic.
+        """
+        self.capacity = capacity
+        self.period = period
+        self.tokens = float(capacity)
+        self._clock = clock
+        self._last_refill = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount=1):
+        """
+        Take `amount` from the bucket, going into debt if needed.
+
+        Returns:
+            float: The number of seconds to wait before the reservation is covered.
+        """
+        with self._lock:
+            self._refill()
+            self.tokens -= min(amount, self.capacity)
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens * self.period / self.capacity
+
+    def sync(self, limit, remaining, reset_in):
+        """
+        Align the bucket with the limit and remaining budget reported by the provider.
+
+        Args:
+            limit (int): The budget per period reported by the provider (None if unknown).
+            remaining (int): The remaining budget reported by the provider.
+            reset_in (float): The seconds until the budget is fully restored (None if unknown).
+        """
+        with self._lock:
+            self._refill()
+            if limit:
+                self.capacity = limit
+            if reset_in and remaining < self.capacity:
+                # the provider refills what is missing by the reset time
+                self.period = reset_in * self.capacity / (self.capacity - remaining)
+            self.tokens = min(self.tokens, float(remaining))
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._last_refill) * self.capacity / self.period)
+        self._last_refill = now
+
+
+class RequestScheduler:
+    """
+    This class schedules the requests of an API client: it throttles them proactively with the
+    requests/min and tokens/min budgets of the API key, and retries the failed ones with a jittered
+    exponential backoff that honours the `retry-after` header.
+    """
+
+    _budgets = {}
+    _budgets_lock = threading.Lock()
+
+    def __init__(self, api_key, requests_per_minute=None, tokens_per_minute=None, max_retries=None,
+                 base_delay=None, max_delay=None, sleep=time.sleep, clock=time.monotonic):
+        """
+        Initialize the RequestScheduler for the given API key.
+
+        Args:
+            api_key (str): The API key, the budgets are shared by all the clients using it.
+            requests_per_minute (int, optional): The requests/min budget. Defaults to RATE_LIMIT_RPM.
+            tokens_per_minute (int, optional): The tokens/min budget. Defaults to RATE_LIMIT_TPM.
+            max_retries (int, optional): The maximum number of retries. Defaults to MAX_RETRIES.
+            base_delay (float, optional): The initial backoff delay in seconds. Defaults to RETRY_BASE_DELAY.
+            max_delay (float, optional): The maximum backoff delay in seconds. Defaults to RETRY_MAX_DELAY.
+            sleep (callable, optional): The sleep function. Defaults to time.sleep.
+            clock (callable, optional): The monotonic clock. Defaults to time.monotonic.
+        """
+        self.max_retries = MAX_RETRIES if max_retries is None else max_retries
+        self.base_delay = RETRY_BASE_DELAY if base_delay is None else base_delay
+        self.max_delay = RETRY_MAX_DELAY if max_delay is None else max_delay
+        self._sleep = sleep
+        self._clock = clock
+
+        requests_per_minute = RATE_LIMIT_RPM if requests_per_minute is None else requests_per_minute
+        tokens_per_minute = RATE_LIMIT_TPM if tokens_per_minute is None else tokens_per_minute
+        with self._budgets_lock:
+            budgets = self._budgets.setdefault(api_key, {})
+            for name, capacity in (("requests", requests_per_minute), ("tokens", tokens_per_minute)):
+                if capacity and name not in budgets:
+                    budgets[name] = TokenBucket(capacity, clock=clock)
+            self.budgets = budgets
+
+    def execute(self, send, estimated_tokens=0):
+        """
+        Send a request through the scheduler.
+
+        Args:
+            send (callable): A function sending the request and returning the response.
+            estimated_tokens (int, optional): The estimated tokens of the request, for the tokens/min budget.
+
+        Returns:
+            requests.Response: The response of the last attempt.
+        """
+        attempt = 0
+        while True:
+            self._sleep_for(self._throttle(estimated_tokens))
+            try:
+                response = send()
+            except (requests.ConnectionError, requests.Timeout) as e:
+                delay = self._handle_error(e, attempt)
+            else:
+                delay = self._handle_response(response, attempt)
+                if delay is None:
+                    return response
+                response.close()
+            self._sleep_for(delay)
+            attempt += 1
+
+    async def execute_async(self, send, estimated_tokens=0, retryable_exceptions=(OSError,)):
+        """
+        Send a request through the scheduler from a coroutine. See `execute`.
+
+        Args:
+            send (callable): A coroutine function sending the request and returning the response.
+            estimated_tokens (int, optional): The estimated tokens of the request, for the tokens/min budget.
+            retryable_exceptions (tuple, optional): The transport exceptions worth retrying.
+
+        Returns:
+            httpx.Response: The response of the last attempt.
+        """
+        attempt = 0
+        while True:
+            await asyncio.sleep(self._throttle(estimated_tokens))
+            try:
+                response = await send()
+            except retryable_exceptions as e:
+                delay = self._handle_error(e, attempt)
+            else:
+                delay = self._handle_response(response, attempt)
+                if delay is None:
+                    return response
+                await response.aclose()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def _throttle(self, estimated_tokens):
+        delay = 0.0
+        if "requests" in self.budgets:
+            delay = max(delay, self.budgets["requests"].reserve(1))
+        if "tokens" in self.budgets and estimated_tokens:
+            delay = max(delay, self.budgets["tokens"].reserve(estimated_tokens))
+        if delay:
+            logging.info(f'Rate limit budget exhausted, waiting {delay:.2f}s before sending the request.')
+        return delay
+
+    def _handle_error(self, error, attempt):
+        if attempt >= self.max_retries:
+            raise error
+        delay = self._backoff_delay(attempt)
+        logging.warning(f'Request failed ({str(error)}), retrying in {delay:.2f}s (attempt {attempt + 1}/{self.max_retries}).')
+        return delay
+
+    def _handle_response(self, response, attempt):
+        """
+        Update the budgets from the response headers and decide whether to retry.
+
+        Returns:
+            float: The delay before retrying, or None if the response should be returned.
+        """
+        self._sync_budgets(response.headers)
+        if response.status_code not in RETRYABLE_STATUS_CODES or attempt >= self.max_retries:
+            return None
+
+        delay = get_retry_after(response.headers)
+        if delay is None:
+            delay = self._backoff_delay(attempt)
+        else:
+            delay = min(delay, self.max_delay) + random.uniform(0, self.base_delay / 4)
+        logging.warning(f'API returned {response.status_code}, retrying in {delay:.2f}s (attempt {attempt + 1}/{self.max_retries}).')
+        return delay
+
+    def _backoff_delay(self, attempt):
+        # "full jitter" exponential backoff
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _sync_budgets(self, headers):
+        for name, header_sets in RATE_LIMIT_HEADERS.items():
+            for limit_header, remaining_header, reset_header in header_sets:
+                remaining = headers.get(remaining_header)
+                if remaining is None:
+                    continue
+                try:
+                    limit = int(headers.get(limit_header) or 0)
+                    remaining = int(remaining)
+                except ValueError:
+                    continue
+                with self._budgets_lock:
+                    if name not in self.budgets and limit:
+                        self.budgets[name] = TokenBucket(limit, clock=self._clock)
+                if name in self.budgets:
+                    self.budgets[name].sync(limit, remaining, parse_reset(headers.get(reset_header)))
+
+    def _sleep_for(self, delay):
+        if delay:
+            self._sleep(delay)
+
+
+def get_retry_after(headers):
+    """
+    Return the delay requested by the `retry-after-ms` or `retry-after` headers.
+
+    Returns:
+        float: The delay in seconds, or None if the headers are absent.
+    """
+    retry_after_ms = headers.get('retry-after-ms')
+    if retry_after_ms:
+        try:
+            return max(0.0, float(retry_after_ms) / 1000)
+        except ValueError:
+            pass
+
+    retry_after = headers.get('retry-after')
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_reset(value):
+    """
+    Parse a rate limit reset header: an RFC 3339 timestamp (Anthropic) or a duration like `6m0s` (OpenAI).
+
+    Returns:
+        float: The seconds until the reset, or None if the value can't be parsed.
+    """
+    if not value:
+        return None
+
+    if value[0].isdigit() and value[-1] in 'smh':
+        seconds = 0.0
+        number = ''
+        i = 0
+        while i < len(value):
+            char = value[i]
+            if char.isdigit() or char == '.':
+                number += char
+                i += 1
+                continue
+            unit = 'ms' if value[i:i + 2] == 'ms' else char
+            if unit not in _DURATION_UNITS or not number:
+                return None
+            seconds += float(number) * _DURATION_UNITS[unit]
+            number = ''
+            i += len(unit)
+        return seconds
+
+    try:
+        reset_time = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    return max(0.0, (reset_time - datetime.now(timezone.utc)).total_seconds())
@@ -0,0 +1,180 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+
+# Response cache settings, can be overridden in the .env file:
+# 'off' (default), 'on' (serve identical requests from the cache and record the new ones)
+# or 'replay' (serve only from the recorded cache, a request not recorded fails)
+RESPONSE_CACHE = os.getenv('RESPONSE_CACHE', 'off').lower()
+RESPONSE_CACHE_PATH = os.getenv('RESPONSE_CACHE_PATH', os.path.join('~', '.cache', 'term_chatbot', 'responses.sqlite3'))
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', '0'))  # seconds, 0 to never expire
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '1000'))
+
+# Request fields that don't change the generated response
+TRANSPORT_FIELDS = ('stream', 'stream_options')
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+class CacheMissError(RuntimeError):
+    """
+    Raised in replay mode when a request has no recorded response.
+    """
+
+
+def normalize_request(body):
+    """
+    Normalise a JSON request body for the cache key: the transport fields (streaming) and the prompt
+    caching breakpoints are dropped, and the keys are sorted.
+
+    Args:
+        body (bytes): The JSON request body.
+
+    Returns:
+        bytes: The normalised JSON.
+    """
+    def strip(value):
+        if isinstance(value, dict):
+            return {key: strip(item) for key, item in value.items() if key != 'cache_control'}
+        if isinstance(value, list):
+            return [strip(item) for item in value]
+        return value
+
+    data = json.loads(body)
+    for field in TRANSPORT_FIELDS:
+        data.pop(field, None)
+    return json.dumps(strip(data), sort_keys=True, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def make_cache_key(api_url, body):
+    """
+    Return the content address of a request: the SHA-256 of the API URL and the normalised body.
+    """
+    return hashlib.sha256(api_url.encode('utf-8') + b'\n' + normalize_request(body)).hexdigest()
+
+
+class ResponseCache:
+    """
+    This class is a SQLite store of the AI responses, addressed by the hash of the normalised request.
+    A response with tool calls is stored with them, so a turn using tools is replayed round by round.
+    Entries expire after a TTL and the least recently used ones are evicted above a maximum size.
+    """
+
+    def __init__(self, path, ttl=None, max_entries=None, replay=False, clock=time.time):
+        """
+        Initialize the ResponseCache.
+
+        Args:
+            path (str): The path of the SQLite database (':memory:' for an in-memory cache).
+            ttl (float, optional): Entries older than this (in seconds) are ignored, 0 to never expire. Defaults to RESPONSE_CACHE_TTL.
+            max_entries (int, optional): The maximum number of entries. Defaults to RESPONSE_CACHE_MAX_ENTRIES.
+            replay (bool, optional): Serve only from the cache, failing on misses. Defaults to False.
+            clock (callable, optional): The wall clock, for the tests. Defaults to time.time.
+        """
+        self.path = path
+        self.ttl = RESPONSE_CACHE_TTL if ttl is None else ttl
+        self.max_entries = max_entries or RESPONSE_CACHE_MAX_ENTRIES
+        self.replay = replay
+        self.clock = clock
+        self._lock = threading.Lock()
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT, response TEXT NOT NULL, token_usage TEXT NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL, tool_calls TEXT)")
+        # a cache recorded before the tool calls were stored
+        if 'tool_calls' not in {row[1] for row in self._connection.execute("PRAGMA table_info(responses)")}:
+            self._connection.execute("ALTER TABLE responses ADD COLUMN tool_calls TEXT")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self._connection.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def get(self, key):
+        """
+        Return the recorded response of a request.
+
+        Args:
+            key (str): The cache key, see `make_cache_key`.
+
+        Returns:
+            tuple: The response (str), its recorded token usage (dict) and its tool calls (list), or None on a miss.
+        """
+        now = self.clock()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT response, token_usage, created, tool_calls FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            response, token_usage, created, tool_calls = row
+            if self.ttl and now - created > self.ttl:
+                self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._connection.commit()
+                return None
+            self._connection.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._connection.commit()
+        return response, json.loads(token_usage), json.loads(tool_calls) if tool_calls else []
+
+    def put(self, key, model, response, token_usage, tool_calls=None):
+        """
+        Record the response of a request, evicting the least recently used entries above the maximum size.
+
+        Args:
+            key (str): The cache key, see `make_cache_key`.
+            model (str): The model that generated the response.
+            response (str): The AI's response.
+            token_usage (dict): The token usage of the request.
+            tool_calls (list, optional): The tool calls of the response, see `ToolCallCollector.finish`. Defaults to none.
+        """
+        now = self.clock()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, token_usage, created, accessed, tool_calls) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", (key, model, response, json.dumps(token_usage), now, now,
+                                                 json.dumps(tool_calls) if tool_calls else None))
+            self._connection.execute(
+                "DELETE FROM responses WHERE key NOT IN "
+                "(SELECT key FROM responses ORDER BY accessed DESC LIMIT ?)", (self.max_entries,))
+            self._connection.commit()
+
+    def clear(self):
+        with self._lock:
+            self._connection.execute("DELETE FROM responses")
+            self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+def get_response_cache(mode=None, path=None):
+    """
+    Return the response cache shared by the API clients, or None if it is disabled.
+
+    Args:
+        mode (str, optional): 'off', 'on' or 'replay'. Defaults to RESPONSE_CACHE.
+        path (str, optional): The path of the SQLite database. Defaults to RESPONSE_CACHE_PATH.
+
+    Returns:
+        ResponseCache: The cache, or None.
+    """
+    mode = mode or RESPONSE_CACHE
+    if mode not in ('on', 'replay'):
+        return None
+    path = os.path.expanduser(path or RESPONSE_CACHE_PATH)
+    with _caches_lock:
+        cache = _caches.get((path, mode))
+        if cache is None:
+            logging.info(f'Response cache enabled ({mode}): {path}')
+            cache = ResponseCache(path, replay=mode == 'replay')
+            _caches[(path, mode)] = cache
+    return cache
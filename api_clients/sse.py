@@ -0,0 +1,86 @@
+import json
+
+
+class SSEDecoder:
+    """
+    This class decodes a server-sent-events stream line by line.
+    Both the Anthropic and OpenAI streaming endpoints use this format: blocks of
+    `event:` / `data:` fields separated by a blank line.
+    """
+
+    def __init__(self):
+        """
+        Initialize the SSEDecoder with an empty event buffer.
+        """
+        self._event = None
+        self._data = []
+
+    def feed(self, line):
+        """
+        Feed a single line of the stream to the decoder.
+
+        Args:
+            line (str): A line of the stream without its trailing newline.
+
+        Returns:
+            tuple: (event, data) once a full event has been received, where data is the parsed JSON
+            payload (or the raw string when it is not JSON, e.g. OpenAI's `[DONE]`). None otherwise.
+        """
+        if line is None:
+            return None
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.rstrip('\r')
+
+        if not line:
+            return self.flush()
+        if line.startswith(':'):  # comment / keep-alive
+            return None
+
+        field, _, value = line.partition(':')
+        if value.startswith(' '):
+            value = value[1:]
+
+        if field == 'event':
+            self._event = value
+        elif field == 'data':
+            self._data.append(value)
+        return None
+
+    def flush(self):
+        """
+        Return the buffered event (if any) and reset the buffer.
+
+        Returns:
+            tuple: (event, data) or None if nothing is buffered.
+        """
+        if not self._data:
+            self._event = None
+            return None
+
+        raw = '\n'.join(self._data)
+        event = self._event
+        self._event = None
+        self._data = []
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            data = raw
+        return event, data
+
+
+def iter_sse_events(lines):
+    """
+    Yield (event, data) tuples from an iterable of stream lines.
+
+    Args:
+        lines (iterable): The lines of the stream, e.g. `response.iter_lines(decode_unicode=True)`.
+    """
+    decoder = SSEDecoder()
+    for line in lines:
+        event = decoder.feed(line)
+        if event is not None:
+            yield event
+    event = decoder.flush()
+    if event is not None:
+        yield event
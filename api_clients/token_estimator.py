@@ -0,0 +1,177 @@
+import os
+import re
+import math
+import logging
+import threading
+from functools import lru_cache
+
+# Token estimation settings, can be overridden in the .env file: 'auto' counts the OpenAI tokens
+# with tiktoken when it is installed (`pip install tiktoken`), 'heuristic' never does
+TOKEN_ESTIMATOR = os.getenv('TOKEN_ESTIMATOR', 'auto').lower()
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', '4096'))
+
+# Calibration of the heuristic per model family: the letters per token of a word, and a scale for
+# the tokenizers less efficient than OpenAI's cl100k on English text and code
+FAMILY_PROFILES = {
+    "anthropic": {"word_chars": 5.0, "scale": 1.1},
+    "openai": {"word_chars": 6.0, "scale": 1.0},
+    "default": {"word_chars": 4.0, "scale": 1.1},
+}
+
+# Tokens added by the formatting of each message (role, separators) and of each request
+MESSAGE_OVERHEAD = 4
+REQUEST_OVERHEAD = 3
+
+# The pieces a BPE tokenizer splits a text into first: words, numbers (up to 3 digits), runs of
+# punctuation (with their leading space) and runs of whitespace
+_PIECES = re.compile(r" ?[A-Za-z]+| ?[0-9]{1,3}| ?[^\sA-Za-z0-9]+|\s+")
+
+
+def model_family(model):
+    """
+    Return the tokenizer family of a model: 'anthropic', 'openai' or 'default'.
+    """
+    model = (model or '').lower()
+    if model.startswith('claude'):
+        return 'anthropic'
+    if model.startswith(('gpt-', 'o1', 'o3', 'o4', 'text-', 'chatgpt')):
+        return 'openai'
+    return 'default'
+
+
+def heuristic_tokens(text, word_chars=4.0, scale=1.0):
+    """
+    Estimate the tokens of a text from its BPE pieces: a word costs a token per `word_chars` letters,
+    a number a token, a run of punctuation a token per 2 characters, a non-ASCII character a token.
+
+    Args:
+        text (str): The text.
+        word_chars (float, optional): The letters per token of a word. Defaults to 4.
+        scale (float, optional): The calibration of the tokenizer family. Defaults to 1.
+
+    Returns:
+        int: The estimated number of tokens.
+    """
+    tokens = 0
+    for piece in _PIECES.findall(text):
+        word = piece.lstrip(' ')
+        if not word or word.isspace():
+            tokens += 1
+        elif word[0].isascii() and word[0].isalpha():
+            tokens += math.ceil(len(word) / word_chars)
+        elif word[0].isdigit():
+            tokens += 1
+        else:
+            non_ascii = sum(1 for char in word if not char.isascii())
+            tokens += non_ascii + math.ceil((len(word) - non_ascii) / 2)
+    return math.ceil(tokens * scale)
+
+
+class TokenEstimator:
+    """
+    This class counts tokens offline, before a request is sent: with the model's tokenizer when one is
+    available locally (tiktoken for the OpenAI models), otherwise with a heuristic calibrated per model
+    family. The counts are memoised per text, so the messages of the history are tokenised once and
+    every later turn only pays a dictionary lookup for them.
+    """
+
+    def __init__(self, mode=None, cache_size=None):
+        """
+        Initialize the TokenEstimator.
+
+        Args:
+            mode (str, optional): 'auto' or 'heuristic'. Defaults to TOKEN_ESTIMATOR.
+            cache_size (int, optional): The number of texts whose count is memoised. Defaults to TOKEN_CACHE_SIZE.
+        """
+        self.mode = mode or TOKEN_ESTIMATOR
+        self._tokenizers = {}
+        self._encodings = {}
+        self._lock = threading.Lock()
+        self._count = lru_cache(maxsize=cache_size or TOKEN_CACHE_SIZE)(self._count_uncached)
+
+    def count(self, text, model=None):
+        """
+        Return the tokens of a text for a model.
+
+        Args:
+            text (str): The text.
+            model (str, optional): The model. Defaults to the default heuristic.
+
+        Returns:
+            int: The number of tokens.
+        """
+        if not text:
+            return 0
+        return self._count(self.tokenizer(model), text)
+
+    def count_messages(self, messages, model=None):
+        """
+        Return the tokens of chat history messages, with their formatting overhead.
+        """
+        return sum(self.count(message["text"], model) + MESSAGE_OVERHEAD for message in messages)
+
+    def tokenizer(self, model):
+        """
+        Return the key of the tokenizer of a model: a tiktoken encoding name, or a heuristic family.
+        """
+        tokenizer = self._tokenizers.get(model)
+        if tokenizer is None:
+            with self._lock:
+                tokenizer = self._tokenizers[model] = self._load_tokenizer(model)
+        return tokenizer
+
+    def cache_info(self):
+        return self._count.cache_info()
+
+    def _load_tokenizer(self, model):
+        family = model_family(model)
+        if family != 'openai' or self.mode != 'auto':
+            return family
+        try:
+            import tiktoken
+        except ImportError:
+            return family
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding('cl100k_base')
+        except Exception as e:  # the encodings are downloaded on first use
+            logging.warning(f'Cannot load the tiktoken encoding of {model}, using the heuristic: {str(e)}')
+            return family
+        self._encodings[encoding.name] = encoding
+        return encoding.name
+
+    def _count_uncached(self, tokenizer, text):
+        encoding = self._encodings.get(tokenizer)
+        if encoding is not None:
+            return len(encoding.encode(text, disallowed_special=()))
+        return heuristic_tokens(text, **FAMILY_PROFILES[tokenizer])
+
+
+_token_estimator = None
+_token_estimator_lock = threading.Lock()
+
+
+def get_token_estimator():
+    """
+    Return the shared token estimator, creating it on first use.
+    """
+    global _token_estimator
+    with _token_estimator_lock:
+        if _token_estimator is None:
+            _token_estimator = TokenEstimator()
+        return _token_estimator
+
+
+def estimate_tokens(text, model=None):
+    """
+    Estimate the number of tokens of a text, see `TokenEstimator.count`.
+
+    Args:
+        text (str): The text.
+        model (str, optional): The model. Defaults to the default heuristic.
+
+    Returns:
+        int: The estimated number of tokens.
+    """
+    return get_token_estimator().count(text, model)
@@ -0,0 +1,66 @@
+import os
+import json
+import logging
+
+# The tool rounds of a turn, can be overridden in the .env file: after MAX_TOOL_ROUNDS requests answered
+# with tool calls, the turn ends with the text received so far
+MAX_TOOL_ROUNDS = int(os.getenv('MAX_TOOL_ROUNDS', '8'))
+
+
+class ToolCallCollector:
+    """
+    This class collects the tool calls of a response, whole (a complete response) or in fragments
+    (the streamed events, whose arguments arrive as pieces of JSON), keyed by their index in the response.
+    """
+
+    def __init__(self):
+        self._calls = {}
+
+    def __bool__(self):
+        return bool(self._calls)
+
+    def add(self, index, call_id=None, name=None, arguments=None, partial_json=None):
+        """
+        Add a tool call, or a fragment of it.
+
+        Args:
+            index (int): The index of the call in the response.
+            call_id (str, optional): The id of the call, to answer it with its result.
+            name (str, optional): The name of the tool.
+            arguments (dict, optional): The arguments, when they come decoded.
+            partial_json (str, optional): A piece of the JSON encoded arguments.
+        """
+        call = self._calls.setdefault(index, {"id": None, "name": None, "arguments": None, "json": []})
+        if call_id:
+            call["id"] = call_id
+        if name:
+            call["name"] = name
+        if arguments is not None:
+            call["arguments"] = arguments
+        if partial_json:
+            call["json"].append(partial_json)
+
+    def reset(self):
+        self._calls = {}
+
+    def finish(self):
+        """
+        Return the tool calls of the response, and start collecting the next one.
+
+        Returns:
+            list: The calls, with their "id", "name" and "arguments" (dict), in order.
+        """
+        calls = []
+        for _, call in sorted(self._calls.items()):
+            if not call["name"]:
+                continue
+            arguments = call["arguments"]
+            if call["json"]:
+                try:
+                    arguments = json.loads(''.join(call["json"]))
+                except ValueError:
+                    logging.warning(f'Invalid arguments of the tool call {call["name"]}: {"".join(call["json"])}')
+            calls.append({"id": call["id"], "name": call["name"],
+                          "arguments": arguments if isinstance(arguments, dict) else {}})
+        self._calls = {}
+        return calls
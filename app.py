@@ -1,14 +1,9 @@
 import os
-import json
+import sys
+import time
+import argparse
 import logging
-from dotenv import load_dotenv
-from api_clients.anthropic_client import AnthropicClient
-from api_clients.openai_client import OpenAIClient
-from utils.pricing_model import PricingModel
-from utils.file_utils import save_chat_history
-from utils.input_utils import get_user_input
-from utils.time_utils import get_current_time
-from assistants.coding_assistant import CodingAssistant
+from utils.config import get_config
 
 # Logging configuration 
 logging.basicConfig(
@@ -18,30 +13,500 @@ logging.basicConfig(
         , datefmt='%Y-%m-%d %H:%M:%S'
         )
 
-# Load environment variables from .env file
-load_dotenv()
+# Load the .env file once, before the modules reading their settings from the environment are imported.
+# The provider clients, the HTTP stack and the assistants are imported when they are chosen, to start fast.
+CONFIG = get_config()
+
+from api_clients.model_registry import get_model_registry
+from core.chat_engine import ChatEngine, ASSISTANT_TYPES
+from utils.pricing_model import PricingModel
+from utils.session_journal import find_latest_journal
+from utils.input_utils import get_user_input
+from utils.time_utils import get_current_time
+
+def get_ai_response(ai_chatbot, prompt, cache=False):
+    """
+    Send the prompt to the AI and print its response, streaming it as it arrives when enabled.
+    A streamed response can be interrupted with Ctrl-C without leaving the chat.
+    Set `cache` for a stable prompt (e.g. the project context) to be cached by the provider.
+
+    Returns:
+        tuple: A tuple containing the AI's response (str) and a dictionary with input and output token counts.
+    """
+    from api_clients.base_client import empty_token_usage
+
+    if not CONFIG.stream_responses or not ai_chatbot.model_info["streaming"]:
+        response, token_usage = ai_chatbot.send_request(prompt, cache=cache)
+        print(f'\n{get_current_time()} AI 💡: ' + response + ' \n')
+        return response, token_usage
+
+    print(f'\n{get_current_time()} AI 💡: ', end='', flush=True)
+    try:
+        for delta in ai_chatbot.stream_request(prompt, cache=cache):
+            print(delta, end='', flush=True)
+    except KeyboardInterrupt:
+        logging.info('Response interrupted by the user.')
+        print('\n[Response interrupted]', end='')
+    print(' \n')
+
+    token_usage = ai_chatbot.last_token_usage or empty_token_usage()
+    return ai_chatbot.last_response or '', token_usage
+
+def preflight_check(session, prompt):
+    """
+    Estimate the request of a prompt offline and print its projected input tokens and cost, before
+    anything is paid for. A request too big for the context window of the model even after compacting
+    the history would fail, so the user is asked whether to send it anyway.
+
+    Args:
+        session (ChatSession): The chat session.
+        prompt (str): The prompt about to be sent.
+
+    Returns:
+        bool: Whether to send the request.
+    """
+    if not CONFIG.preflight_estimate:
+        return True
+    estimate = session.estimate(prompt)
+    input_tokens = min(estimate["input_tokens"], estimate["budget"]) if estimate["fits"] else estimate["input_tokens"]
+    line = f'Estimate: ~{input_tokens} input tokens'
+    if estimate["input_cost"] is not None:
+        line += f', C:💵{estimate["input_cost"]:.5f}$ (≤💵{estimate["max_cost"]:.5f}$ with the response)'
+    if estimate["compaction"] and estimate["fits"]:
+        line += ', the oldest turns will be compacted'
+    print(line)
+    if estimate["fits"]:
+        return True
+
+    logging.warning(f'The request ({estimate["input_tokens"]} tokens) exceeds the context budget of {session.model} ({estimate["budget"]} tokens).')
+    print(f'⚠️  The request exceeds the context budget of {session.model} ({estimate["budget"]} of '
+          f'{estimate["context_window"]} tokens) and will likely be rejected.')
+    return input("Send it anyway? (y/n): ").lower().strip() == 'y'
+
+def get_available_chatbots():
+    """
+    Return the chatbot menu: each provider of the model registry with a client and models available, then the compare mode.
+    The client modules are not imported until a provider is chosen.
+
+    Returns:
+        dict: The (menu label, provider or None for the compare mode) pairs, keyed by menu number.
+    """
+    registry = get_model_registry()
+    available_chatbots = {}
+    for provider in ChatEngine(CONFIG, registry).providers():
+        available_chatbots[str(len(available_chatbots) + 1)] = (f'{registry.providers[provider].get("label", provider)} 🟢', provider)
+    available_chatbots[str(len(available_chatbots) + 1)] = ("Compare models 🔀", None)
+    return available_chatbots
+
+def format_model(model, provider=None):
+    """
+    Format a model for the menus, with its context window and prices from the model registry.
+    """
+    model_info = get_model_registry().get(model, provider)
+    description = f'{model} ({model_info["context_window"] // 1000}k context'
+    if model_info["pricing"]:
+        description += f', 💵{model_info["pricing"]["input"]:g}$/{model_info["pricing"]["output"]:g}$ per M tokens'
+    return description + ')'
+
+def print_token_usage(token_usage, token_cost, usage):
+    """
+    Print the token usage and cost of a turn, and the totals of the session (a SessionUsage).
+    """
+    print('!! TOKEN USAGE !!')
+    cache_usage = ''
+    if token_usage.get("cache_read_tokens") or token_usage.get("cache_write_tokens"):
+        cache_usage = f', CR:{token_usage.get("cache_read_tokens", 0)}, CW:{token_usage.get("cache_write_tokens", 0)}'
+    if token_cost is not None:
+        print(f'Token usage: C:💵{token_cost:.5f}$, I:{token_usage["input_tokens"]}, O:{token_usage["output_tokens"]}{cache_usage}')
+    else:
+        print(f'Token usage: C:💵0.00000$, I:{token_usage["input_tokens"]}, O:{token_usage["output_tokens"]}{cache_usage}')
+    print(f'Total tokens: C:💵{usage.cost:.5f}$, I:{usage.input_tokens}, O:{usage.output_tokens}')
+    print('!! TOKEN USAGE !!\n')
+
+def select_compare_models():
+    """
+    Ask the user which models to compare.
+
+    Returns:
+        list: The selected (async client class, API key, API URL, model) tuples.
+    """
+    registry = get_model_registry()
+    candidates = [(registry.client_class(provider, asynchronous=True), *CONFIG.api_settings(provider), model)
+                  for provider, _ in get_available_chatbots().values() if provider is not None
+                  for model in registry.models(provider)]
+
+    print("Available models:")
+    for i, (client_class, _, _, model) in enumerate(candidates, start=1):
+        print(f"{i}. {model} ({client_class.__name__})")
+
+    model_indexes = input("Select the models to compare (comma-separated numbers): ")
+    selected_models = []
+    for model_index in model_indexes.split(","):
+        try:
+            model_index = int(model_index)
+        except ValueError:
+            continue
+        if 1 <= model_index <= len(candidates) and candidates[model_index - 1] not in selected_models:
+            selected_models.append(candidates[model_index - 1])
+    return selected_models
+
+async def timed_request(ai_chatbot, prompt):
+    """
+    Send the prompt with an async client and measure the latency.
+
+    Returns:
+        tuple: The client, the AI's response, the token usage, the latency in seconds and the error raised (if any).
+    """
+    start = time.perf_counter()
+    try:
+        response, token_usage = await ai_chatbot.send_request(prompt)
+        return ai_chatbot, response, token_usage, time.perf_counter() - start, None
+    except Exception as e:
+        return ai_chatbot, None, None, time.perf_counter() - start, e
+
+async def run_comparison(ai_chatbots, prompt, pricing_model):
+    """
+    Send the prompt to all the models concurrently and print the responses as they complete.
+
+    Returns:
+        float: The total cost of the comparison.
+    """
+    import asyncio
+
+    total_cost = 0.0
+    tasks = [asyncio.create_task(timed_request(ai_chatbot, prompt)) for ai_chatbot in ai_chatbots]
+    for task in asyncio.as_completed(tasks):
+        ai_chatbot, response, token_usage, latency, error = await task
+        if error is not None:
+            logging.error(f'Error occurred with {ai_chatbot.model}: {str(error)}')
+            print(f'\n{get_current_time()} {ai_chatbot.model} ❌ ({latency:.2f}s): {str(error)}\n')
+            continue
+
+        token_cost = pricing_model.get_usage_cost(ai_chatbot.model, token_usage)
+        total_cost += token_cost or 0.0
+        print(f'\n{get_current_time()} {ai_chatbot.model} 💡 ({latency:.2f}s): ' + response + ' \n')
+        print(f'Token usage: C:💵{token_cost or 0.0:.5f}$, I:{token_usage["input_tokens"]}, O:{token_usage["output_tokens"]}\n')
+    return total_cost
+
+async def compare_models(selected_models):
+    """
+    Chat loop of the compare mode: every prompt is sent to all the selected models concurrently.
+
+    Args:
+        selected_models (list): The (async client class, API key, API URL, model) tuples to compare.
+    """
+    import asyncio
+    from api_clients.async_client import create_async_http_client
+
+    pricing_model = PricingModel()
+    total_cost = 0.0
+    async with create_async_http_client() as http_client:
+        ai_chatbots = []
+        for client_class, api_key, api_url, model in selected_models:
+            ai_chatbot = client_class(api_key=api_key, api_url=api_url, session=http_client)
+            ai_chatbot.model = model
+            ai_chatbots.append(ai_chatbot)
+
+        while True:
+            user_input = await asyncio.to_thread(get_user_input)
+            if user_input is None or user_input.lower().strip() == 'exit':
+                break
+
+            print(f'\n{get_current_time()} User 🕯️ : ' + user_input)
+            start = time.perf_counter()
+            total_cost += await run_comparison(ai_chatbots, user_input, pricing_model)
+            print(f'All models done in {time.perf_counter() - start:.2f}s. Total cost: 💵{total_cost:.5f}$\n')
+
+def handle_archive_command(user_input, ai_chatbot, archive):
+    """
+    Run the in-chat archive commands: `/search <words> [model:...] [since:YYYY-MM-DD] [until:YYYY-MM-DD]
+    [mincost:...] [maxcost:...]` and `/load <session id>`, which adds a past conversation to the context.
+
+    Returns:
+        bool: True if the input was an archive command.
+    """
+    command, _, arguments = user_input.strip().partition(' ')
+    if command not in ('/search', '/load'):
+        return False
+    if archive is None:
+        print('\nThe chat archive is disabled.\n')
+        return True
+
+    if command == '/search':
+        from utils.chat_archive import parse_search_command, format_search_results
+
+        query, filters = parse_search_command(arguments)
+        print('\n' + format_search_results(archive.search(query, **filters)) + '\n')
+        return True
+
+    try:
+        session = archive.get_session(int(arguments))
+    except ValueError:
+        session = None
+    if session is None:
+        print(f'\nNo archived session {arguments.strip()}. Use /search to find one.\n')
+        return True
+    ai_chatbot.extend_chat_history(session["messages"])
+    print(f"\nLoaded the session #{session['id']} ({session['model']}, {session['started']}, {session['turns']} turns) as context.\n")
+    return True
+
+def chat_loop(session):
+    """
+    Run the chat with the AI until the user exits, then offer to save the chat history.
+
+    Args:
+        session (ChatSession): The chat session, with its API client, assistant and the usage already spent
+                               (e.g. by the initial prompt).
+    """
+    import requests
+    from api_clients.instrumentation import format_stats
+    from utils.chat_archive import open_archive
+    from utils.file_utils import save_chat_history
+
+    ai_chatbot = session.ai_chatbot
+    archive = open_archive()
+
+    # start chat loop
+    try:
+        while True:
+            try:
+                ai_chatbot.warm_up()
+                user_input = get_user_input()
+                if user_input is None:
+                    break
+
+                if user_input.lower().strip() == 'exit':
+                    break
+
+                if handle_archive_command(user_input, ai_chatbot, archive):
+                    continue
+
+                if user_input.strip() == '/stats':
+                    # where the time of the turns goes: our code, the network or the model
+                    print('\n' + format_stats(ai_chatbot.instrumentation) + '\n')
+                    continue
+
+                if user_input.strip() == '/refresh':
+                    # send the project changes since the last ingestion instead of the whole project
+                    try:
+                        prompt = session.refresh_project()
+                    except ValueError as e:
+                        print(f'\n{str(e)}\n')
+                        continue
+                    if prompt is None:
+                        print('\nNo project file changed.\n')
+                        continue
+                    user_input = prompt
+                else:
+                    # add the project excerpts relevant to the question, when the project wasn't sent in full
+                    prompt = session.prepare_prompt(user_input)
 
-ANTHROPIC_API_KEY = os.getenv('ANTHROPIC_API_KEY')
-OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+                print(f'\n{get_current_time()} User 🕯️ : ' + user_input)
+                if not preflight_check(session, prompt):
+                    print('\nRequest not sent.\n')
+                    continue
+                try:
+                    response, token_usage = get_ai_response(ai_chatbot, prompt)
+                except (requests.RequestException, RuntimeError) as e:
+                    # the request was already retried by the scheduler, keep the conversation going
+                    logging.error(f'Request failed: {str(e)}')
+                    print(f'\nThe request failed: {str(e)}\nYour conversation is kept, please try again.\n')
+                    continue
+
+                token_cost = session.record_usage(token_usage)
+                print_token_usage(token_usage, token_cost, session.usage)
+
+            except KeyboardInterrupt:
+                print("Exiting...")
+                logging.info('Exiting due to keyboard interrupt.')
+                break
+
+    except Exception as e:
+        logging.error(f'Error occurred: {str(e)}')
+        print('An unexpected error occured. Please check the log file for more details.')
+
+    save_choice = input("Do you want to save the chat history? (y/n): ")
+    if save_choice.lower() == 'y':
+        save_chat_history(ai_chatbot, archive=archive, cost=session.usage.cost)
+        print("Chat history saved. Goodbye! 👋✨")
+    else:
+        print("Chat history not saved. Goodbye! 👋✨")
+    if session.journal is not None:
+        session.close()
+        print(f"Session journal: {session.journal.path} (continue it with --resume {session.journal.path})")
+    logging.info('Exiting the chat application')
+
+def resume_session(journal_path):
+    """
+    Reload a session journal into a new API client, which keeps appending to the same journal.
+
+    Args:
+        journal_path (str): The path of the journal, or 'latest' for the most recent one.
+
+    Returns:
+        ChatSession: The session with its chat history and usage, or None if it can't be resumed.
+    """
+    if journal_path == 'latest':
+        journal_path = find_latest_journal()
+        if journal_path is None:
+            print("No session to resume.")
+            return None
 
-AVAILABLE_ANTHROPIC_MODELS = os.getenv('AVAILABLE_ANTHROPIC_MODELS').split(',')
-AVAILABLE_OPENAI_MODELS = os.getenv('AVAILABLE_OPENAI_MODELS').split(',')
+    try:
+        session = ChatEngine(CONFIG).resume_session(journal_path)
+    except OSError as e:
+        logging.error(f'Cannot read the session journal {journal_path}: {str(e)}')
+        print(f"Cannot read the session journal: {str(e)}")
+        return None
+    except ValueError as e:
+        print(str(e))
+        return None
 
-def load_assistant_config(assistant_type):
-    config_file = f"config/{assistant_type}_config.json"
-    with open(config_file, 'r') as f:
-        config = json.load(f)
-    return config
+    print(f"Resumed the session {journal_path} with {session.model} ({len(session.messages) // 2} turns).\n")
+    return session
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Terminal-based chat with AI models.")
+    parser.add_argument('--resume', nargs='?', const='latest', metavar='JOURNAL',
+                        help="resume a session from its journal (default: the most recent session)")
+    subparsers = parser.add_subparsers(dest='command')
+    search_parser = subparsers.add_parser('search', help="search the archived chat sessions")
+    search_parser.add_argument('query', nargs='+', help="the words to search for")
+    search_parser.add_argument('--model', help="only the sessions of models containing this text")
+    search_parser.add_argument('--since', help="only the sessions started on or after this date (YYYY-MM-DD)")
+    search_parser.add_argument('--until', help="only the sessions started on or before this date (YYYY-MM-DD)")
+    search_parser.add_argument('--min-cost', type=float, dest='mincost', help="only the sessions that cost at least this much")
+    search_parser.add_argument('--max-cost', type=float, dest='maxcost', help="only the sessions that cost at most this much")
+    search_parser.add_argument('--limit', type=int, default=20, help="the maximum number of results")
+    batch_parser = subparsers.add_parser('batch', help="answer the prompts of a JSONL file (or stdin) without interaction")
+    batch_parser.add_argument('--provider', choices=['anthropic', 'openai'], default='anthropic', help="the API provider")
+    batch_parser.add_argument('--model', help="the model (default: the first available model of the provider)")
+    batch_parser.add_argument('--input', default='-', help="the JSONL prompts, one per line (default: stdin)")
+    batch_parser.add_argument('--output', required=True, help="the JSONL results, appended in completion order")
+    batch_parser.add_argument('--concurrency', type=int, help="the number of prompts in flight (default: BATCH_CONCURRENCY)")
+    batch_parser.add_argument('--no-resume', dest='resume', action='store_false',
+                              help="answer every prompt again, even those already in the output")
+    batch_parser.add_argument('--provider-batch', action='store_true',
+                              help="use the batch API of the provider: half price, results within 24 hours")
+    serve_parser = subparsers.add_parser('serve', help="host many chat sessions behind a local HTTP/WebSocket server")
+    serve_parser.add_argument('--host', help="the interface to listen on (default: CHAT_SERVER_HOST)")
+    serve_parser.add_argument('--port', type=int, help="the port to listen on (default: CHAT_SERVER_PORT)")
+    return parser.parse_args(argv)
+
+def search_archive(args):
+    """
+    Print the archived messages matching the `search` subcommand.
+    """
+    from utils.chat_archive import ChatArchive, format_search_results
+
+    archive = ChatArchive()
+    try:
+        results = archive.search(' '.join(args.query), model=args.model, since=args.since, until=args.until,
+                                 mincost=args.mincost, maxcost=args.maxcost, limit=args.limit)
+    finally:
+        archive.close()
+    print(format_search_results(results))
+
+def get_batch_settings(args):
+    """
+    Return the API key, API URL and model of the `batch` subcommand.
+    """
+    api_key, api_url = CONFIG.api_settings(args.provider)
+    return api_key, api_url, args.model or get_model_registry().models(args.provider)[0]
+
+async def run_batch(args):
+    """
+    Run the `batch` subcommand: answer the prompts of the input concurrently, appending the results to the output.
+    The prompts already answered in the output are skipped, so an interrupted batch is resumed by running it again.
+    """
+    from api_clients.async_client import create_async_http_client
+    from utils.batch_runner import BatchRunner, load_completed_ids, open_batch_input, open_batch_output, format_batch_summary
+
+    client_class = get_model_registry().client_class(args.provider, asynchronous=True)
+    api_key, api_url, model = get_batch_settings(args)
+
+    def client_factory(http_client):
+        ai_chatbot = client_class(api_key=api_key, api_url=api_url, session=http_client)
+        ai_chatbot.model = model
+        return ai_chatbot
+
+    completed_ids = load_completed_ids(args.output) if args.resume else set()
+    runner = BatchRunner(client_factory, concurrency=args.concurrency)
+    input_file = open_batch_input(args.input)
+    try:
+        with open_batch_output(args.output, resume=args.resume) as output_file:
+            async with create_async_http_client(pool_size=runner.concurrency) as http_client:
+                summary = await runner.run(input_file, output_file, http_client, completed_ids)
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+    logging.info(format_batch_summary(summary))
+    print(format_batch_summary(summary), file=sys.stderr)
+    return summary
+
+def run_provider_batch_command(args):
+    """
+    Run the `batch` subcommand through the batch API of the provider: cheaper, but the results can take up to 24 hours.
+    Running it again after an interruption waits for the same batch.
+    """
+    from api_clients.batch_jobs import create_batch_job
+    from utils.batch_runner import run_provider_batch, load_completed_ids, open_batch_input, open_batch_output, format_batch_summary
+
+    api_key, api_url, model = get_batch_settings(args)
+    client_class = get_model_registry().client_class(args.provider)
+    ai_chatbot = client_class(api_key=api_key, api_url=api_url)
+    ai_chatbot.model = model
+    job = create_batch_job(ai_chatbot)
+
+    def print_progress(batch):
+        status = batch.get('processing_status') or batch.get('status')
+        print(f"{get_current_time()} Batch {job.batch_id}: {status} {batch.get('request_counts', {})}", file=sys.stderr)
+
+    state_path = args.output + '.batch.json'
+    if not args.resume and os.path.exists(state_path):
+        os.remove(state_path)
+    completed_ids = load_completed_ids(args.output) if args.resume else set()
+    input_file = open_batch_input(args.input)
+    try:
+        with open_batch_output(args.output, resume=args.resume) as output_file:
+            summary = run_provider_batch(job, input_file, output_file, completed_ids, state_path=state_path, on_poll=print_progress)
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+    logging.info(format_batch_summary(summary))
+    print(format_batch_summary(summary), file=sys.stderr)
+    return summary
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == 'search':
+        search_archive(args)
+        return None
+    if args.command == 'serve':
+        # the server and its async HTTP stack are only imported for this command
+        from server.chat_server import run_server
+        run_server(args.host, args.port)
+        return None
+    if args.command == 'batch':
+        if args.provider_batch:
+            run_provider_batch_command(args)
+        else:
+            import asyncio
+            asyncio.run(run_batch(args))
+        return None
 
-def main():
     logging.info('Starting the chat application...')
     print('Welcome to the AI Chat App!')
     print('Type "exit" to quit the application.')
 
-    available_chatbots = {
-        "1": ("Anthropic 🟢", AnthropicClient),
-        "2": ("OpenAI 🟢", OpenAIClient)
-    }
+    if args.resume:
+        session = resume_session(args.resume)
+        if session is not None:
+            chat_loop(session)
+        return None
+
+    available_chatbots = get_available_chatbots()
 
     print("Available AI chatbots:")
     for key, (chatbot_name, _) in available_chatbots.items():
@@ -54,24 +519,32 @@ def main():
         print('\nKeyboard Interrupted. Exiting the chat application.')
         return None
 
+    if chatbot_choice in available_chatbots and available_chatbots[chatbot_choice][1] is None:
+        try:
+            selected_models = select_compare_models()
+            if not selected_models:
+                print("No model selected. Exiting...")
+                return None
+            import asyncio
+            asyncio.run(compare_models(selected_models))
+        except KeyboardInterrupt:
+            logging.info('Keyboard Interrupted. Exiting the chat application.')
+            print('\nKeyboard Interrupted. Exiting the chat application.')
+        logging.info('Exiting the chat application')
+        return None
+
     if chatbot_choice in available_chatbots:
-        _, chatbot_class = available_chatbots[chatbot_choice]
+        _, provider = available_chatbots[chatbot_choice]
+        engine = ChatEngine(CONFIG)
 
         try:
-            if chatbot_class == AnthropicClient:
-                api_url = "https://api.anthropic.com/v1/messages"
-            elif chatbot_class == OpenAIClient:
-                api_url = "https://api.openai.com/v1/chat/completions"
-
-            if chatbot_class == AnthropicClient:
-                ai_chatbot = chatbot_class(api_key=ANTHROPIC_API_KEY, api_url=api_url)
-            elif chatbot_class == OpenAIClient:
-                ai_chatbot = chatbot_class(api_key=OPENAI_API_KEY, api_url=api_url)
-
-            print(f"Available models for {chatbot_class.__name__}:")
-            available_models = AVAILABLE_ANTHROPIC_MODELS if chatbot_class == AnthropicClient else AVAILABLE_OPENAI_MODELS
+            # the client and the HTTP stack are only imported now that the provider is chosen
+            ai_chatbot = engine.create_client(provider)
+
+            print(f"Available models for {type(ai_chatbot).__name__}:")
+            available_models = get_model_registry().models(provider)
             for i, model in enumerate(available_models, start=1):
-                print(f"{i}. {model}")
+                print(f"{i}. {format_model(model, provider)}")
 
             model_index = input("Select a model (enter the corresponding number): ")
 
@@ -90,18 +563,20 @@ def main():
             print(f"Invalid model selection. Using the default model: {available_models[0]}")
             ai_chatbot.model = available_models[0]
 
-        # init variables
-        total_input_tokens = 0
-        total_output_tokens = 0
-        pricing_model = PricingModel()
-        total_cost = 0.0
+        try:
+            ai_chatbot = engine.with_failover(ai_chatbot)
+        except ValueError as e:
+            logging.warning(f'No failover: {str(e)}')
+            print(f"The fallback model isn't available, no failover: {str(e)}")
+
+        # open the connection to the API while the user is setting up the chat
+        ai_chatbot.warm_up()
 
         use_assistant = input("Do you want to use an AI assistant? (y/n): ")
 
+        assistant = None
         if use_assistant.lower().strip() == 'y':
-            available_assistants = {
-                "1": "CodingAssistant",
-            }
+            available_assistants = {str(i): assistant_type for i, assistant_type in enumerate(ASSISTANT_TYPES, start=1)}
 
             print("Available AI assistants:")
             for key, assistant_type in available_assistants.items():
@@ -111,107 +586,41 @@ def main():
 
             if assistant_choice in available_assistants:
                 assistant_type = available_assistants[assistant_choice]
-                config = load_assistant_config(assistant_type)
-
-                name = config["name"]
-                motivation = config["motivation"]
-                role = config["role"]
-                environment = config["environment"]
-                emotions = config["emotions"]
-                personalities = config["personalities"]
-
                 tasks_input = input("Enter the tasks for the assistant (comma-separated): ")
                 tasks = [task.strip() for task in tasks_input.split(",")]
 
-                if assistant_type == "CodingAssistant":
-                    print("Enter the path to the coding project folder: ")
-                    project_folder = get_user_input()
-                    assistant = CodingAssistant(name=name, motivation=motivation, role=role,
-                                                environment=environment, emotions=emotions,
-                                                personalities=personalities, tasks=tasks, 
-                                                project_folder=project_folder)
-                    assistant.introduce()
-                    assistant.process_project_folder()
-                else:
-                    # TODO: Implement other specialized assistants
-                    pass
-
-                # sending intial prompt
-                initial_prompt = assistant.generate_initial_prompt()
-                print(f'\n{get_current_time()} Intial Prompt: \n{initial_prompt}\n')
-                try:
-                    response, token_usage = ai_chatbot.send_request(initial_prompt)
-                except Exception as e:
-                    logging.error(f'Error occurred: {str(e)}')
-                    print('An unexpected error occured. Please check the log file for more details.')
-                    return None
-
-                token_cost = pricing_model.get_token_cost(ai_chatbot.model, token_usage["input_tokens"], token_usage["output_tokens"])
-
-                if token_cost is not None:
-                    total_cost += token_cost
-                total_input_tokens += token_usage["input_tokens"]
-                total_output_tokens += token_usage["output_tokens"]
-
-                print(f'\n{get_current_time()} AI 💡: ' + response + ' \n')
-                print('!! TOKEN USAGE !!')
-                if token_cost is not None:
-                    print(f'Token usage: C:💵{token_cost:.5f}$, I:{token_usage["input_tokens"]}, O:{token_usage["output_tokens"]}')
-                else:
-                    print(f'Token usage: C:💵0.00000$, I:{token_usage["input_tokens"]}, O:{token_usage["output_tokens"]}')
-                print(f'Total tokens: C:💵{total_cost:.5f}$, I:{total_input_tokens}, O:{total_output_tokens}')
-                print('!! TOKEN USAGE !!\n')
-
+                print("Enter the path to the coding project folder: ")
+                project_folder = get_user_input()
+                assistant = engine.create_assistant(assistant_type, tasks, project_folder, ai_chatbot, introduce=True)
             else:
                 print("Invalid assistant choice. Exiting...")
         else:
             print("No assistant selected. Proceeding with the chatbot only.\n")
-        # start chat loop
-        try:
-            while True:
-                try:
-                    user_input = get_user_input()
-                    if user_input is None:
-                        break
-
-                    if user_input.lower().strip() == 'exit':
-                        break
-
-                    print(f'\n{get_current_time()} User 🕯️ : ' + user_input)
-                    response, token_usage = ai_chatbot.send_request(user_input)
-
-                    token_cost = pricing_model.get_token_cost(ai_chatbot.model, token_usage["input_tokens"], token_usage["output_tokens"])
-
-                    if token_cost is not None:
-                        total_cost += token_cost
-                    total_input_tokens += token_usage["input_tokens"]
-                    total_output_tokens += token_usage["output_tokens"]
-
-                    print(f'\n{get_current_time()} AI 💡: ' + response + ' \n')
-                    print('!! TOKEN USAGE !!')
-                    if token_cost is not None:
-                        print(f'Token usage: C:💵{token_cost:.5f}$, I:{token_usage["input_tokens"]}, O:{token_usage["output_tokens"]}')
-                    else:
-                        print(f'Token usage: C:💵0.00000$, I:{token_usage["input_tokens"]}, O:{token_usage["output_tokens"]}')
-                    print(f'Total tokens: C:💵{total_cost:.5f}$, I:{total_input_tokens}, O:{total_output_tokens}')
-                    print('!! TOKEN USAGE !!\n')
-
-                except KeyboardInterrupt:
-                    print("Exiting...")
-                    logging.info('Exiting due to keyboard interrupt.')
-                    break
-
-        except Exception as e:
-            logging.error(f'Error occurred: {str(e)}')
-            print('An unexpected error occured. Please check the log file for more details.')
 
-        save_choice = input("Do you want to save the chat history? (y/n): ")
-        if save_choice.lower() == 'y':
-            save_chat_history(ai_chatbot)
-            print("Chat history saved. Goodbye! 👋✨")
-        else:
-            print("Chat history not saved. Goodbye! 👋✨")
-        logging.info('Exiting the chat application')
+        session = engine.create_session(ai_chatbot, assistant)
+
+        if assistant is not None:
+            # sending intial prompt
+            initial_prompt = session.initial_prompt()
+            print(f'\n{get_current_time()} Intial Prompt: \n{initial_prompt}\n')
+            if not preflight_check(session, initial_prompt):
+                print('Initial prompt not sent. Exiting...')
+                session.close()
+                return None
+            try:
+                response, token_usage = get_ai_response(ai_chatbot, initial_prompt, cache=True)
+                # the history keeps the project files by reference, the full prompt string can be freed
+                del initial_prompt
+            except Exception as e:
+                logging.error(f'Error occurred: {str(e)}')
+                print('An unexpected error occured. Please check the log file for more details.')
+                session.close()
+                return None
+
+            token_cost = session.record_usage(token_usage)
+            print_token_usage(token_usage, token_cost, session.usage)
+
+        chat_loop(session)
         return None
 
     else:
@@ -1,64 +1,219 @@
 import os
-import fnmatch
+import logging
 from assistants.base_assistant import BaseAssistant
+from utils.project_ingest import ingest_project, format_ingestion_summary
+from utils.project_snapshot import PROJECT_CACHE, ProjectSnapshot, diff_project_files, format_unified_diff
+from api_clients.token_estimator import estimate_tokens
+from api_clients.instrumentation import get_instrumentation
+from api_clients.message_store import ComposedText
+from utils.project_tools import ProjectTools
+
+# Token budgets of the project files, can be overridden in the .env file: a project bigger than
+# RETRIEVAL_TOKEN_BUDGET is not sent in full, only its chunks most relevant to the tasks, and each
+# user turn then brings up to RETRIEVAL_TURN_BUDGET tokens of relevant chunks not sent yet
+RETRIEVAL_TOKEN_BUDGET = int(os.getenv('RETRIEVAL_TOKEN_BUDGET', '50000'))
+RETRIEVAL_TURN_BUDGET = int(os.getenv('RETRIEVAL_TURN_BUDGET', '4000'))
+# Share of the model's context budget the project files may take, leaving room for the conversation
+RETRIEVAL_CONTEXT_SHARE = float(os.getenv('RETRIEVAL_CONTEXT_SHARE', '0.5'))
+# How the project files are sent, can be overridden in the .env file: 'eager' puts them in the initial prompt,
+# 'lazy' only a map of the project, the model then reads the files it needs with tools (see ProjectTools)
+PROJECT_FILES_MODE = os.getenv('PROJECT_FILES_MODE', 'eager').lower()
 
 class CodingAssistant(BaseAssistant):
-    def __init__(self, name, motivation, role, environment, emotions, personalities, tasks, project_folder):
+    def __init__(self, name, motivation, role, environment, emotions, personalities, tasks, project_folder,
+                 context_budget=None, model=None, lazy=None):
         super().__init__(name, motivation, role, environment, emotions, personalities, tasks)
-        self.project_folder = project_folder
+        self.project_folder = os.path.expanduser(project_folder.strip())
+        # the input token budget of the model, and the model whose tokens are counted
+        self.context_budget = context_budget
+        self.model = model
         self.project_files = {}
+        self.snapshot = None
+        self._index = None
+        self.full_project_sent = False
+        self.sent_chunks = set()
+        self.lazy = PROJECT_FILES_MODE == 'lazy' if lazy is None else lazy
+        # the tools serving the project files to the model in lazy mode
+        self.tools = ProjectTools(self.project_files) if self.lazy else None
 
 
     def process_project_folder(self):
-        gitignore_path = os.path.join(self.project_folder, ".gitignore")
-        ignored_patterns = []
-
-        if os.path.exists(gitignore_path):
-            with open(gitignore_path, "r") as file:
-                ignored_patterns = [line.strip() for line in file.readlines()]
-            print(f"DEBUGGER: Ignored patterns: {ignored_patterns}")
-
-        for root, dirs, files in os.walk(self.project_folder):
-            print(f"DEBUGGER; Processing directory: {root}")
-            for file in files:
-                file_path = os.path.join(root, file)
-                relative_path = os.path.relpath(file_path, self.project_folder)
-
-                is_ignored = False
-                for pattern in ignored_patterns:
-                    if fnmatch.fnmatch(relative_path, pattern):
-                        print(f"DEBUGGER: Ignored file: {relative_path} (Matched pattern: {pattern})")
-                        is_ignored = True
-                        break
-
-                if not is_ignored:
-                    with open(file_path, "r") as f:
-                        content = f.read()
-                        self.project_files[relative_path] = content
-                        print(f"DEBUGGER: Processed file: {relative_path}")
-
-        print(f"DEBUGGER: Project files: {list(self.project_files.keys())}")
+        """
+        Read the project files, skipping the ignored, binary and oversized ones. The files unchanged
+        since the last run are taken from the on-disk project snapshot instead of being read again.
+        """
+        instrumentation = get_instrumentation()
+        with instrumentation.span('ingest_seconds'):
+            if PROJECT_CACHE and self.snapshot is None:
+                self.snapshot = ProjectSnapshot.load(self.project_folder)
+            self.project_files, summary = ingest_project(self.project_folder, snapshot=self.snapshot)
+            if self.snapshot is not None:
+                self.snapshot.save()
+        instrumentation.record('ingest_files', summary["files"])
+        instrumentation.record('ingest_bytes', summary["bytes"])
+        self._index = None
+        if self.tools is not None:
+            self.tools.project_files = self.project_files
+        logging.info(f'Ingested {self.project_folder}: {summary}')
+        print(format_ingestion_summary(summary))
+
+    @property
+    def index(self):
+        """
+        The retrieval index of the project files, built on first use.
+        """
+        if self._index is None:
+            # NumPy is only loaded for the projects too big to be sent in full
+            from utils.retrieval_index import RetrievalIndex
+            self._index = RetrievalIndex.from_files(self.project_files)
+        return self._index
+
+    @property
+    def project_token_budget(self):
+        """
+        The tokens the project files may take in the initial prompt: RETRIEVAL_TOKEN_BUDGET, and at most
+        RETRIEVAL_CONTEXT_SHARE of the model's context budget so the dump can't overflow its context window.
+        """
+        if self.context_budget is None:
+            return RETRIEVAL_TOKEN_BUDGET
+        return max(0, min(RETRIEVAL_TOKEN_BUDGET, int(self.context_budget * RETRIEVAL_CONTEXT_SHARE)))
+
+    def get_project_files_prompt(self):
+        """
+        Return the project files to include in the initial prompt: all of them if they fit in
+        the project token budget, otherwise the chunks most relevant to the tasks. The full project is
+        a ComposedText whose parts are the file contents themselves, so the chat history references them
+        in its blob store instead of keeping a second copy of the project. In lazy mode, it is the map
+        of the project only.
+        """
+        if self.lazy:
+            from utils.repo_map import build_repo_map
+            return build_repo_map(self.project_files)
+
+        budget = self.project_token_budget
+        # sorted so the prompt is byte-stable across runs, which keeps it cacheable by the providers
+        project_tokens = sum(estimate_tokens(content, self.model) for content in self.project_files.values())
+        if project_tokens <= budget:
+            self.full_project_sent = True
+            parts = []
+            for file_path, content in sorted(self.project_files.items()):
+                parts.extend([f"\n\n#{file_path}\n" if parts else f"#{file_path}\n", content])
+            return ComposedText(parts)
+
+        from utils.retrieval_index import format_chunks
+
+        chunks = self.index.select(" ".join(self.tasks), budget)
+        self.sent_chunks.update(chunk["id"] for chunk in chunks)
+        logging.info(f'Project too big for the prompt ({project_tokens} tokens), sending {len(chunks)} relevant chunks.')
+
+        sent_files = {chunk["path"] for chunk in chunks}
+        other_files = "\n".join(file_path for file_path in sorted(self.project_files) if file_path not in sent_files)
+        return f"The project is too big to be sent in full, here are the parts most relevant to the tasks. " \
+               f"More excerpts will be provided along the conversation.\n\n{format_chunks(chunks, self.project_files)}" \
+               f"\n\nOther project files, not included:\n{other_files}"
+
+    def augment_prompt(self, prompt):
+        """
+        Append to a user prompt the project chunks relevant to it that were not sent yet.
+        Nothing is added when the whole project is already in the initial prompt, or in lazy mode.
+
+        Args:
+            prompt (str): The user prompt.
+
+        Returns:
+            str: The prompt, followed by the relevant project excerpts if any.
+        """
+        if self.full_project_sent or self.lazy or not self.project_files:
+            return prompt
+
+        from utils.retrieval_index import format_chunks
+
+        chunks = self.index.select(prompt, RETRIEVAL_TURN_BUDGET, exclude=self.sent_chunks)
+        if not chunks:
+            return prompt
+        self.sent_chunks.update(chunk["id"] for chunk in chunks)
+        return f"{prompt}\n\n<relevant-project-excerpts>\n{format_chunks(chunks, self.project_files)}\n</relevant-project-excerpts>"
+
+    def resume(self):
+        """
+        Restore what the initial prompt sent (the whole project, or its chunks relevant to the tasks), for a
+        session resumed from its journal, whose chat history already has the initial prompt.
+        """
+        if not self.lazy:
+            self.get_project_files_prompt()
+
+    def refresh_project(self):
+        """
+        Re-scan the project folder and return a prompt with the changes since the last ingestion:
+        the new files, the diffs of the modified ones and the names of the deleted ones.
+
+        Returns:
+            str: The refresh prompt, or None if no file changed.
+        """
+        old_files = self.project_files
+        self.process_project_folder()
+        changes = diff_project_files(old_files, self.project_files)
+        if not any(changes.values()):
+            return None
+        return self.generate_refresh_prompt(old_files, changes)
+
+    def generate_refresh_prompt(self, old_files, changes):
+        """
+        Generate the prompt telling the AI which project files changed.
+
+        Args:
+            old_files (dict): The previous file contents keyed by relative path.
+            changes (dict): The "added", "modified" and "deleted" relative paths.
+
+        Returns:
+            str: The refresh prompt.
+        """
+        sections = []
+        if changes["added"] and self.lazy:
+            sections.append("New files (read them with the tools):\n" + "\n".join(changes["added"]))
+        elif changes["added"]:
+            sections.append("New files:\n" + "\n\n".join(f"#{file_path}\n{self.project_files[file_path]}" for file_path in changes["added"]))
+        if changes["modified"]:
+            sections.append("Modified files (unified diffs):\n" + "\n".join(
+                format_unified_diff(file_path, old_files[file_path], self.project_files[file_path]) for file_path in changes["modified"]))
+        if changes["deleted"]:
+            sections.append("Deleted files:\n" + "\n".join(changes["deleted"]))
+        changes_prompt = "\n\n".join(sections)
+
+        return f"""The project files have changed since you last saw them. Here are the changes:
+        \n<project-changes>
+        \n{changes_prompt}
+        \n</project-changes>
+        \nTake these changes into account from now on. Briefly acknowledge them and continue where we left off.
+        """
 
     def generate_initial_prompt(self):
         base_prompt = super().generate_initial_prompt()
 
-        coding_specific_prompt = f"You will be provided with the content of project located at: {self.project_folder}." \
+        if self.lazy:
+            files_prompt = f"You will be provided with the map of the project located at: {self.project_folder}: its files, " \
+                           f"and the classes and functions of its Python files. Read the files you need with the read_file, " \
+                           f"grep and list_dir tools, only the parts relevant to the tasks."
+        else:
+            files_prompt = f"You will be provided with the content of project located at: {self.project_folder}."
+        coding_specific_prompt = f"{files_prompt}" \
                                  f"You can utilize the project files and your coding knowledge to assist the user with their project coding tasks." \
                                  f"Please note that you will not be able to directly interact with the files. You can only suggest changes to be made by sending code snippets to the user." \
                                  f"Only provide the new code snippets or relevant code sections to update in order to save token usage." \
                                  f"Use a git diff notation to show what is new, what is replaced, what is deleted." \
                                  f"Do not show what hasn't changed."
 
-        file_contents_prompt = "\n\n".join([f"#{file_path}\n{content}" for file_path, content in self.project_files.items()])
+        file_contents_prompt = self.get_project_files_prompt()
 
-        return f"""
+        header = f"""
         <ai-agent-contextualisation>
         \n{base_prompt}
         \n\n{coding_specific_prompt}
         </ai-agent-contextualisation>
-        \n\nProject Files content provided:
+        \n\n{"Project map provided" if self.lazy else "Project Files content provided"}:
         \n<project-files>    
-        \n{file_contents_prompt}.
+        \n"""
+        footer = """.
         \n</project-files>
         \nStep 1: First make sure that you understand what is required from the tasks. 
         Propose a plan with specific steps and milestones.
@@ -74,3 +229,6 @@ class CodingAssistant(BaseAssistant):
         \nStep 3: Once you have covered all steps in the plan, summarise what has been done, discussed. 
         Include all the relevant revisions and feedbacks.
         """ # the XML tags are best for Claude but it wouldn't to include for other AIs.
+
+        # the project files stay separate parts of the prompt (see get_project_files_prompt)
+        return ComposedText([header, *getattr(file_contents_prompt, 'parts', (file_contents_prompt,)), footer])
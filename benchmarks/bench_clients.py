@@ -0,0 +1,207 @@
+"""
+End-to-end latency benchmarks of the API clients, against the local mock provider server.
+
+Run from the project root:
+    python -m benchmarks.bench_clients
+    python -m benchmarks.bench_clients --output before.json
+    python -m benchmarks.bench_clients --compare before.json
+"""
+import json
+import time
+import asyncio
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from api_clients.anthropic_client import AnthropicClient
+from api_clients.openai_client import OpenAIClient
+from api_clients.async_client import AsyncAnthropicClient, AsyncOpenAIClient, create_async_http_client
+from tests.mock_provider_server import MockProviderServer
+
+PROVIDERS = {
+    "anthropic": (AnthropicClient, AsyncAnthropicClient, "anthropic_url"),
+    "openai": (OpenAIClient, AsyncOpenAIClient, "openai_url")
+}
+
+# A chat turn of a typical length, repeated to build long histories
+TURN_TEXT = "Can you refactor the request handling so the retries don't block the event loop? " * 4
+
+
+def summarize(samples):
+    """
+    Return the median and 95th percentile of timing samples, in milliseconds.
+    """
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))]
+    return {"median_ms": statistics.median(samples) * 1000, "p95_ms": p95 * 1000}
+
+
+def make_client(provider, server):
+    client_class, _, url_attribute = PROVIDERS[provider]
+    return client_class(api_key=f'bench-{provider}', api_url=getattr(server, url_attribute))
+
+
+def fill_history(client, turns):
+    for _ in range(turns):
+        client.update_chat_history(TURN_TEXT, TURN_TEXT)
+
+
+def bench_ttfb(provider, server, runs):
+    """
+    Time to the first streamed token and to the end of the stream.
+    """
+    first_token, total = [], []
+    for _ in range(runs):
+        client = make_client(provider, server)
+        start = time.perf_counter()
+        stream = client.stream_request("Hello there")
+        next(stream)
+        first_token.append(time.perf_counter() - start)
+        for _ in stream:
+            pass
+        total.append(time.perf_counter() - start)
+    return {"first_token": summarize(first_token), "total": summarize(total)}
+
+
+def bench_turn_overhead(provider, server, runs, history_lengths):
+    """
+    Wall time of a non-streamed turn for growing history lengths, minus the emulated server latency.
+    """
+    results = {}
+    for turns in history_lengths:
+        client = make_client(provider, server)
+        fill_history(client, turns)
+        samples = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            client.send_request("Next question")
+            samples.append(time.perf_counter() - start - server.latency)
+        results[str(turns)] = summarize(samples)
+    return results
+
+
+def bench_payload(provider, server, runs, history_lengths):
+    """
+    Time to build and serialise a request body, incrementally (warm buffer) and from scratch.
+    """
+    results = {}
+    for turns in history_lengths:
+        client = make_client(provider, server)
+        fill_history(client, turns)
+        warm, cold = [], []
+        for _ in range(runs):
+            start = time.perf_counter()
+            body = client._encode_request("Next question")
+            warm.append(time.perf_counter() - start)
+            client.message_buffer.reset()
+            start = time.perf_counter()
+            client._encode_request("Next question")
+            cold.append(time.perf_counter() - start)
+        results[str(turns)] = {"incremental": summarize(warm), "full": summarize(cold), "bytes": len(body)}
+    return results
+
+
+def bench_concurrency(provider, server, requests_count, concurrency_levels):
+    """
+    Throughput of concurrent requests, from threads with the sync client and from asyncio with the async client.
+    """
+    _, async_class, url_attribute = PROVIDERS[provider]
+    results = {}
+    for concurrency in concurrency_levels:
+        def send(_):
+            make_client(provider, server).send_request("Hello there")
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(send, range(requests_count)))
+        threads_elapsed = time.perf_counter() - start
+
+        async def run():
+            semaphore = asyncio.Semaphore(concurrency)
+            async with create_async_http_client(pool_size=concurrency) as http_client:
+                async def send_async():
+                    async with semaphore:
+                        client = async_class(api_key=f'bench-{provider}', api_url=getattr(server, url_attribute),
+                                             session=http_client)
+                        await client.send_request("Hello there")
+                await asyncio.gather(*(send_async() for _ in range(requests_count)))
+
+        start = time.perf_counter()
+        asyncio.run(run())
+        async_elapsed = time.perf_counter() - start
+
+        results[str(concurrency)] = {"threads_rps": requests_count / threads_elapsed,
+                                     "asyncio_rps": requests_count / async_elapsed}
+    return results
+
+
+def run_benchmarks(args):
+    results = {"settings": vars(args).copy(), "providers": {}}
+    results["settings"].pop("output")
+    results["settings"].pop("compare")
+    history_lengths = [int(length) for length in args.history.split(',')]
+    concurrency_levels = [int(level) for level in args.concurrency.split(',')]
+
+    for provider in args.providers.split(','):
+        with MockProviderServer(latency=args.latency, token_rate=args.token_rate,
+                                response_tokens=args.response_tokens) as server:
+            results["providers"][provider] = {
+                "ttfb": bench_ttfb(provider, server, args.runs),
+                "turn_overhead": bench_turn_overhead(provider, server, args.runs, history_lengths),
+                "payload": bench_payload(provider, server, args.runs, history_lengths),
+                "concurrency": bench_concurrency(provider, server, args.requests, concurrency_levels)
+            }
+    return results
+
+
+def flatten(results, prefix=''):
+    """
+    Flatten the nested results to {"provider.benchmark.case.metric": value}.
+    """
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, name))
+        else:
+            flat[name] = value
+    return flat
+
+
+def print_results(results, baseline=None):
+    current = flatten(results["providers"])
+    previous = flatten(baseline["providers"]) if baseline else {}
+    width = max(len(name) for name in current)
+    for name, value in current.items():
+        line = f"{name:<{width}}  {value:>12.3f}"
+        if name in previous and previous[name]:
+            line += f"  ({(value - previous[name]) / previous[name] * 100:+.1f}%)"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the API clients against a local mock provider server.")
+    parser.add_argument('--providers', default='anthropic,openai', help="comma-separated providers")
+    parser.add_argument('--runs', type=int, default=20, help="samples per measurement")
+    parser.add_argument('--latency', type=float, default=0.0, help="emulated time to first byte (s)")
+    parser.add_argument('--token-rate', type=float, default=0.0, help="emulated streamed tokens per second")
+    parser.add_argument('--response-tokens', type=int, default=50, help="tokens per response")
+    parser.add_argument('--history', default='0,10,100,500', help="comma-separated history lengths (turns)")
+    parser.add_argument('--concurrency', default='1,4,16', help="comma-separated concurrency levels")
+    parser.add_argument('--requests', type=int, default=64, help="requests per concurrency level")
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--compare', help="show the change against the results in this JSON file")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args)
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
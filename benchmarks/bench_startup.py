@@ -0,0 +1,130 @@
+"""
+Startup time benchmark of the app: the import time of `app` (from `python -X importtime`) and the
+wall-clock time of a cold `python app.py --help`, with the slowest modules imported at startup.
+
+Run from the project root:
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --output before.json
+    python -m benchmarks.bench_startup --compare before.json --max-ms 100
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The modules that must not be imported until they are needed: the provider clients and the HTTP
+# stack until a provider is chosen, NumPy until a project is indexed, the timezone data until a
+# timestamp is shown, readline until the first prompt
+LAZY_MODULES = [
+    "requests", "urllib3", "httpx", "numpy", "pytz", "readline", "asyncio", "sqlite3",
+    "api_clients.base_client", "api_clients.anthropic_client", "api_clients.openai_client",
+    "api_clients.async_client", "assistants.coding_assistant"
+]
+
+
+def parse_importtime(stderr, root='app'):
+    """
+    Parse the `-X importtime` report into {module: cumulative_us} for `root` and the modules it imports
+    (the modules imported by the interpreter startup, e.g. the site packages' .pth files, are left out).
+    """
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative_us, module = line[len('import time:'):].split('|')
+        name = module.strip()
+        # a top-level import is reported after the modules it imported, one more space of indent per level
+        if len(module) - len(module.lstrip()) == 1:
+            if name == root:
+                modules[name] = int(cumulative_us)
+                return modules
+            modules = {}
+        else:
+            modules[name] = int(cumulative_us)
+    return modules
+
+
+def run_python(args):
+    return subprocess.run([sys.executable] + args, cwd=PROJECT_ROOT, capture_output=True, text=True)
+
+
+def bench_import(runs):
+    """
+    The import time of `app` and of the modules it imports, medians over the runs (in milliseconds).
+    """
+    samples = {}
+    for _ in range(runs):
+        result = run_python(['-X', 'importtime', '-c', 'import app'])
+        if result.returncode != 0:
+            raise RuntimeError(f'Cannot import app: {result.stderr.strip().splitlines()[-1]}')
+        for module, cumulative_us in parse_importtime(result.stderr).items():
+            samples.setdefault(module, []).append(cumulative_us / 1000)
+    return {module: statistics.median(values) for module, values in samples.items()}
+
+
+def bench_cold_start(runs):
+    """
+    The wall-clock time of `python app.py --help`, interpreter start included (median, in milliseconds).
+    """
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        run_python(['app.py', '--help'])
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def imported_lazy_modules():
+    """
+    Return the modules of LAZY_MODULES that `import app` imports.
+    """
+    code = f"import sys, app; print('\\n'.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+    return run_python(['-c', code]).stdout.split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the startup time of the app.")
+    parser.add_argument('--runs', type=int, default=10, help="samples per measurement")
+    parser.add_argument('--top', type=int, default=15, help="number of slowest modules to show")
+    parser.add_argument('--max-ms', type=float, help="fail if the import time of app is over this budget (ms)")
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--compare', help="show the change against the results in this JSON file")
+    args = parser.parse_args()
+
+    modules = bench_import(args.runs)
+    results = {
+        "import_app_ms": modules.get('app', 0.0),
+        "cold_start_ms": bench_cold_start(args.runs),
+        "lazy_modules_imported": imported_lazy_modules()
+    }
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+
+    for name in ("import_app_ms", "cold_start_ms"):
+        line = f"{name:<16}  {results[name]:>9.1f}"
+        if baseline and baseline.get(name):
+            line += f"  ({(results[name] - baseline[name]) / baseline[name] * 100:+.1f}%)"
+        print(line)
+    print("\nSlowest modules imported by app (cumulative ms):")
+    slowest = sorted((module for module in modules if module != 'app'), key=modules.get, reverse=True)[:args.top]
+    for module in slowest:
+        print(f"  {module:<40}  {modules[module]:>7.1f}")
+    if results["lazy_modules_imported"]:
+        print(f"\nImported at startup but should be lazy: {', '.join(results['lazy_modules_imported'])}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+    if results["lazy_modules_imported"] or (args.max_ms is not None and results["import_app_ms"] > args.max_ms):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
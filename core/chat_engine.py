@@ -0,0 +1,442 @@
+import re
+import json
+import uuid
+import logging
+from datetime import datetime
+from utils.config import get_config
+from utils.pricing_model import PricingModel
+from utils.session_journal import (CHAT_JOURNAL, SessionJournal, load_journal, load_journal_usage, journal_path,
+                                   journal_session_id)
+from api_clients.model_registry import get_model_registry
+
+ASSISTANT_TYPES = ("CodingAssistant",)
+
+# The session ids are part of the journal file names, so they are restricted to safe characters
+SESSION_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+def load_assistant_config(assistant_type):
+    config_file = f"config/{assistant_type}_config.json"
+    with open(config_file, 'r') as f:
+        config = json.load(f)
+    return config
+
+
+def new_session_id():
+    """
+    Return a new session id: its creation time, then random characters so the sessions created
+    in the same second (e.g. by the server) don't share a journal.
+    """
+    return f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+
+
+def session_settings(ai_chatbot, assistant=None):
+    """
+    Return the settings of a session recorded in the header of its journal, besides its client and model:
+    its fallback model (see `ChatEngine.with_failover`) and its assistant, with its tasks and project.
+    """
+    settings = {}
+    fallback = getattr(ai_chatbot, 'fallback', None)
+    if fallback is not None:
+        settings["failover_model"] = fallback.model
+    if assistant is not None:
+        settings["assistant"] = {"type": type(assistant).__name__, "tasks": list(assistant.tasks),
+                                 "project_folder": assistant.project_folder, "lazy": assistant.lazy}
+    return settings
+
+
+class SessionUsage:
+    """
+    This class holds the running totals of a chat session: its cost and its input and output tokens.
+    """
+
+    def __init__(self, cost=0.0, input_tokens=0, output_tokens=0):
+        self.cost = cost
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+
+    def add(self, token_cost, token_usage):
+        self.cost += token_cost or 0.0
+        self.input_tokens += token_usage["input_tokens"]
+        self.output_tokens += token_usage["output_tokens"]
+
+    def to_dict(self):
+        return {"cost": self.cost, "input_tokens": self.input_tokens, "output_tokens": self.output_tokens}
+
+
+class ChatSession:
+    """
+    This class is a chat session of the chat engine: an API client with its chat history, the assistant
+    bootstrapped for it if any, and the usage of the session priced with the pricing model. It is used
+    the same way by the terminal chat and by the chat server, with a synchronous or an async client.
+    """
+
+    def __init__(self, ai_chatbot, assistant=None, pricing_model=None, session_id=None, usage=None):
+        """
+        Initialize the ChatSession.
+
+        Args:
+            ai_chatbot (BaseAPIClient): The API client, with its model selected (sync or async).
+            assistant (BaseAssistant, optional): The assistant of the session. Defaults to none.
+            pricing_model (PricingModel, optional): The pricing model. Defaults to one on the shared model registry.
+            session_id (str, optional): The id of the session. Defaults to the id of its journal, or a new id.
+            usage (SessionUsage, optional): The usage already spent (e.g. by a resumed session). Defaults to none.
+        """
+        self.ai_chatbot = ai_chatbot
+        self.assistant = assistant
+        self.pricing_model = pricing_model or PricingModel()
+        if session_id is None:
+            session_id = journal_session_id(ai_chatbot.journal.path) if ai_chatbot.journal is not None else new_session_id()
+        self.session_id = session_id
+        self.usage = usage or SessionUsage()
+        # the cost of the last turn, None if the model has no pricing
+        self.last_cost = None
+        self.created = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    @property
+    def model(self):
+        return self.ai_chatbot.model
+
+    @property
+    def journal(self):
+        return self.ai_chatbot.journal
+
+    @property
+    def messages(self):
+        """
+        The messages of the conversation, the ones compacted out of the context window included.
+        """
+        chat_history = self.ai_chatbot.chat_history
+        return chat_history.get('compacted_messages', []) + chat_history['messages']
+
+    def initial_prompt(self):
+        """
+        Return the initial prompt of the assistant, or None if the session has no assistant.
+        """
+        return self.assistant.generate_initial_prompt() if self.assistant is not None else None
+
+    def prepare_prompt(self, user_input):
+        """
+        Return the prompt to send for a user input: with the CodingAssistant, the project excerpts
+        relevant to it are added when the project wasn't sent in full.
+        """
+        from assistants.coding_assistant import CodingAssistant
+
+        if isinstance(self.assistant, CodingAssistant):
+            return self.assistant.augment_prompt(user_input)
+        return user_input
+
+    def refresh_project(self):
+        """
+        Re-scan the project of the CodingAssistant, see `CodingAssistant.refresh_project`.
+
+        Returns:
+            str: The prompt with the project changes, or None if no file changed.
+
+        Raises:
+            ValueError: If the session has no CodingAssistant.
+        """
+        from assistants.coding_assistant import CodingAssistant
+
+        if not isinstance(self.assistant, CodingAssistant):
+            raise ValueError('/refresh is only available with the CodingAssistant.')
+        return self.assistant.refresh_project()
+
+    def estimate(self, prompt):
+        """
+        Estimate the request of a prompt offline, before anything is paid for.
+        See `ContextWindowManager.estimate_request`.
+
+        Returns:
+            dict: The estimate, with the projected "input_cost" and "max_cost" (with the longest response)
+                  in $, None if the model has no pricing.
+        """
+        estimate = self.ai_chatbot.context_manager.estimate_request(self.ai_chatbot, prompt)
+        input_tokens = min(estimate["input_tokens"], estimate["budget"]) if estimate["fits"] else estimate["input_tokens"]
+        estimate["input_cost"] = self.pricing_model.get_token_cost(self.model, input_tokens, 0)
+        estimate["max_cost"] = self.pricing_model.get_token_cost(self.model, input_tokens, estimate["max_output_tokens"])
+        return estimate
+
+    def record_usage(self, token_usage):
+        """
+        Price the token usage of a turn and add it to the session totals (and to its journal).
+
+        Returns:
+            float: The cost of the turn, or None if the model has no pricing.
+        """
+        # the fallback model may have answered, see `ChatEngine.with_failover`
+        token_cost = self.last_cost = self._add_usage(self.ai_chatbot.responding_model, token_usage)
+        # the requests that lost a hedged race were paid for too, see `FailoverClient.pop_lost_usage`
+        for model, lost_usage in getattr(self.ai_chatbot, 'pop_lost_usage', list)():
+            self._add_usage(model, lost_usage)
+        return token_cost
+
+    def _add_usage(self, model, token_usage):
+        token_cost = self.pricing_model.get_usage_cost(model, token_usage)
+        self.usage.add(token_cost, token_usage)
+        if self.journal is not None:
+            self.journal.append({"type": "usage", "cost": token_cost, "input_tokens": token_usage["input_tokens"],
+                                 "output_tokens": token_usage["output_tokens"]})
+        return token_cost
+
+    def send(self, prompt, cache=False):
+        """
+        Send a prompt with the synchronous client.
+
+        Returns:
+            tuple: The AI's response, the token usage and the cost of the turn.
+        """
+        response, token_usage = self.ai_chatbot.send_request(prompt, cache=cache)
+        return response, token_usage, self.record_usage(token_usage)
+
+    async def send_async(self, prompt, cache=False):
+        """
+        Send a prompt with the async client.
+
+        Returns:
+            tuple: The AI's response, the token usage and the cost of the turn.
+        """
+        response, token_usage = await self.ai_chatbot.send_request(prompt, cache=cache)
+        return response, token_usage, self.record_usage(token_usage)
+
+    async def stream_async(self, prompt, cache=False):
+        """
+        Stream the response to a prompt with the async client. Once the generator is exhausted, the
+        response and its token usage are in `ai_chatbot.last_response` and `ai_chatbot.last_token_usage`,
+        and the usage of the turn has been recorded.
+
+        Yields:
+            str: The text deltas of the AI's response.
+        """
+        try:
+            async for delta in self.ai_chatbot.stream_request(prompt, cache=cache):
+                yield delta
+        finally:
+            # an interrupted stream still has the usage of what was received
+            if self.ai_chatbot.last_token_usage is not None:
+                self.record_usage(self.ai_chatbot.last_token_usage)
+
+    def state(self):
+        """
+        Return the description of the session: its id, client, model, assistant, turns and usage.
+        """
+        return {
+            "id": self.session_id,
+            "chatbot": type(getattr(self.ai_chatbot, 'primary', self.ai_chatbot)).__name__,
+            "provider": self.ai_chatbot.provider,
+            "model": self.model,
+            "assistant": type(self.assistant).__name__ if self.assistant is not None else None,
+            "created": self.created,
+            "turns": len(self.messages) // 2,
+            "usage": self.usage.to_dict(),
+            "journal": self.journal.path if self.journal is not None else None
+        }
+
+    def close(self):
+        """
+        Close the journal of the session, which can be resumed later.
+        """
+        if self.journal is not None:
+            self.journal.close()
+
+
+class ChatEngine:
+    """
+    This class is the core of the chat application, shared by the terminal chat and the chat server:
+    it selects the API clients from the model registry, bootstraps the assistants, and creates
+    and resumes the chat sessions.
+    """
+
+    def __init__(self, config=None, registry=None, pricing_model=None):
+        """
+        Initialize the ChatEngine.
+
+        Args:
+            config (Config, optional): The settings. Defaults to the shared configuration.
+            registry (ModelRegistry, optional): The model registry. Defaults to the shared one.
+            pricing_model (PricingModel, optional): The pricing model. Defaults to one on the registry.
+        """
+        self.config = config or get_config()
+        self.registry = registry or get_model_registry()
+        self.pricing_model = pricing_model or PricingModel(self.registry)
+
+    def providers(self):
+        """
+        Return the providers with a client, an API URL and models available.
+        """
+        return [provider for provider, settings in self.registry.providers.items()
+                if settings.get("client") and self.config.api_settings(provider)[1] and self.registry.models(provider)]
+
+    def create_client(self, provider, model=None, asynchronous=False, http_client=None):
+        """
+        Create the API client of a provider. The client modules are imported on first use.
+
+        Args:
+            provider (str): The provider, e.g. 'anthropic'.
+            model (str, optional): The model. Defaults to the first model of the provider.
+            asynchronous (bool, optional): Create the async client. Defaults to False.
+            http_client (optional): The HTTP client to share: an `httpx.AsyncClient` (required by the async
+                                    clients, see `create_async_http_client`), or the session of the sync
+                                    clients. Defaults to the shared pooled session of the sync clients.
+
+        Returns:
+            BaseAPIClient: The API client, with its model selected.
+
+        Raises:
+            ValueError: If the provider or the model isn't available.
+        """
+        if provider not in self.providers():
+            raise ValueError(f'Unknown or unavailable provider: {provider}')
+        models = self.registry.models(provider)
+        if model is not None and model not in models:
+            raise ValueError(f'Unknown model for {provider}: {model}')
+        client_class = self.registry.client_class(provider, asynchronous=asynchronous)
+        api_key, api_url = self.config.api_settings(provider)
+        ai_chatbot = client_class(api_key=api_key, api_url=api_url, session=http_client)
+        ai_chatbot.model = model or models[0]
+        return ai_chatbot
+
+    def with_failover(self, ai_chatbot, asynchronous=False, http_client=None, model=None):
+        """
+        Route the requests of a client through a FailoverClient, which fails over to the fallback model
+        (possibly of another provider) and hedges the requests slower than usual.
+
+        Args:
+            ai_chatbot (BaseAPIClient): The API client, see `create_client`.
+            asynchronous (bool, optional): The client is an async client. Defaults to False.
+            http_client (optional): The HTTP client to share, see `create_client`.
+            model (str, optional): The fallback model. Defaults to FAILOVER_MODEL.
+
+        Returns:
+            The FailoverClient, or the client itself if there is no fallback model, or it is the client's model.
+
+        Raises:
+            ValueError: If the fallback model isn't available.
+        """
+        from api_clients.failover_client import FAILOVER_MODEL, FailoverClient, AsyncFailoverClient
+
+        model = model or FAILOVER_MODEL
+        if not model or model == ai_chatbot.model:
+            return ai_chatbot
+        provider = self.registry.get(model).get("provider")
+        if provider is None:
+            raise ValueError(f'Unknown fallback model: {model}')
+        fallback = self.create_client(provider, model, asynchronous=asynchronous, http_client=http_client)
+        logging.info(f'Failing over from {ai_chatbot.model} to {model}.')
+        return (AsyncFailoverClient if asynchronous else FailoverClient)(ai_chatbot, fallback)
+
+    def create_assistant(self, assistant_type, tasks, project_folder, ai_chatbot, introduce=False, lazy=None):
+        """
+        Create an assistant from its config, and ingest its project. In lazy mode, the client gets the
+        tools serving the project files to the model.
+
+        Args:
+            assistant_type (str): The assistant type, see ASSISTANT_TYPES.
+            tasks (list): The tasks of the assistant.
+            project_folder (str): The project folder of the CodingAssistant.
+            ai_chatbot (BaseAPIClient): The API client of the session, whose context budget limits the project files.
+            introduce (bool, optional): Print the assistant's introduction. Defaults to False.
+            lazy (bool, optional): Let the model read the project files with tools. Defaults to PROJECT_FILES_MODE.
+
+        Returns:
+            BaseAssistant: The assistant.
+
+        Raises:
+            ValueError: If the assistant type is unknown.
+        """
+        if assistant_type not in ASSISTANT_TYPES:
+            raise ValueError(f'Unknown assistant: {assistant_type}')
+        from assistants.coding_assistant import CodingAssistant
+
+        config = load_assistant_config(assistant_type)
+        assistant = CodingAssistant(name=config["name"], motivation=config["motivation"], role=config["role"],
+                                    environment=config["environment"], emotions=config["emotions"],
+                                    personalities=config["personalities"], tasks=tasks,
+                                    project_folder=project_folder,
+                                    context_budget=ai_chatbot.context_manager.get_budget(ai_chatbot),
+                                    model=ai_chatbot.model, lazy=lazy)
+        if introduce:
+            assistant.introduce()
+        assistant.process_project_folder()
+        if assistant.tools is not None:
+            ai_chatbot.tools = assistant.tools
+        return assistant
+
+    def create_session(self, ai_chatbot, assistant=None, journal=None, session_id=None):
+        """
+        Create a chat session for an API client, with its journal. The journal header has what
+        `resume_session` needs to recreate the session: its client, its fallback model and its assistant.
+
+        Args:
+            ai_chatbot (BaseAPIClient): The API client, see `create_client`.
+            assistant (BaseAssistant, optional): The assistant, see `create_assistant`. Defaults to none.
+            journal (bool, optional): Journal the session. Defaults to CHAT_JOURNAL.
+            session_id (str, optional): The id of the session. Defaults to a new id.
+
+        Returns:
+            ChatSession: The session.
+        """
+        session_id = session_id or new_session_id()
+        if CHAT_JOURNAL if journal is None else journal:
+            # the journal names the client of the session's model, a FailoverClient is recreated on resume
+            chatbot = type(getattr(ai_chatbot, 'primary', ai_chatbot)).__name__
+            ai_chatbot.journal = SessionJournal.create(chatbot, ai_chatbot.model, session_id=session_id,
+                                                       settings=session_settings(ai_chatbot, assistant))
+        return ChatSession(ai_chatbot, assistant, self.pricing_model, session_id=session_id)
+
+    def resume_session(self, path, asynchronous=False, http_client=None):
+        """
+        Reload a session journal into a new API client, which keeps appending to the same journal.
+        The fallback model and the assistant of the session are recreated, the project of the assistant
+        is ingested again.
+
+        Args:
+            path (str): The path of the journal.
+            asynchronous (bool, optional): Resume it with the async client. Defaults to False.
+            http_client (optional): The HTTP client to share, see `create_client`.
+
+        Returns:
+            ChatSession: The session, with its chat history and usage.
+
+        Raises:
+            OSError: If the journal can't be read.
+            ValueError: If the client of the journal is unknown.
+        """
+        from api_clients.message_store import Message
+
+        header, messages = load_journal(path)
+        provider = self.registry.client_provider(header.get("chatbot"))
+        if provider is None:
+            raise ValueError(f"Unknown chatbot in the session journal: {header.get('chatbot')}")
+        client_class = self.registry.client_class(provider, asynchronous=asynchronous)
+        api_key, api_url = self.config.api_settings(provider)
+        ai_chatbot = client_class(api_key=api_key, api_url=api_url, session=http_client)
+        ai_chatbot.model = header.get("model", ai_chatbot.model)
+        ai_chatbot.chat_history["messages"] = [Message.from_dict(message, ai_chatbot.blob_store) for message in messages]
+        usage = SessionUsage(**load_journal_usage(path))
+        ai_chatbot.journal = SessionJournal(path)
+        try:
+            ai_chatbot = self.with_failover(ai_chatbot, asynchronous=asynchronous, http_client=http_client,
+                                            model=header.get("failover_model"))
+        except ValueError as e:
+            logging.warning(f'No failover for the resumed session: {str(e)}')
+
+        assistant = None
+        settings = header.get("assistant")
+        if settings:
+            try:
+                assistant = self.create_assistant(settings["type"], settings.get("tasks", []), settings["project_folder"],
+                                                  ai_chatbot, lazy=settings.get("lazy"))
+                assistant.resume()
+            except (OSError, ValueError) as e:
+                logging.warning(f'Resumed the session without its assistant: {str(e)}')
+        logging.info(f'Resumed the session {path}')
+        return ChatSession(ai_chatbot, assistant, self.pricing_model, session_id=journal_session_id(path), usage=usage)
+
+    def session_journal_path(self, session_id):
+        """
+        Return the journal path of a session id, or None if the id isn't valid.
+        """
+        if not SESSION_ID_PATTERN.match(session_id or ''):
+            return None
+        return journal_path(session_id)
@@ -0,0 +1,466 @@
+import os
+import re
+import json
+import hmac
+import time
+import asyncio
+import logging
+import contextlib
+import httpx
+from core.chat_engine import ChatEngine
+from api_clients.async_client import create_async_http_client
+from api_clients.instrumentation import get_instrumentation
+from api_clients.failover_client import get_latency_tracker
+from server.http_protocol import HTTPError, MAX_HEAD_SIZE, read_request, json_response, error_response, stream_head, format_sse
+from server.websocket import WebSocket, WebSocketClosed, handshake_response
+
+# Chat server settings, can be overridden in the .env file
+CHAT_SERVER_HOST = os.getenv('CHAT_SERVER_HOST', '127.0.0.1')
+CHAT_SERVER_PORT = int(os.getenv('CHAT_SERVER_PORT', '8765'))
+# Set a token to require `Authorization: Bearer <token>` (or `?token=<token>`, e.g. for the browsers' WebSockets)
+CHAT_SERVER_TOKEN = os.getenv('CHAT_SERVER_TOKEN', '')
+# The sessions idle for longer (in seconds) are unloaded, their journals are reloaded on their next request
+# (0 keeps them loaded). A session with a WebSocket open isn't idle.
+CHAT_SERVER_IDLE_TIMEOUT = float(os.getenv('CHAT_SERVER_IDLE_TIMEOUT', '1800'))
+# The upstream connections to the providers, shared by all the sessions
+CHAT_SERVER_POOL_SIZE = int(os.getenv('CHAT_SERVER_POOL_SIZE', '20'))
+
+SESSION_PATH = r'/sessions/(?P<session_id>[^/]+)'
+
+# (method, path pattern, handler method)
+ROUTES = [
+    ('GET', r'/health', 'handle_health'),
+    ('GET', r'/models', 'handle_models'),
+    ('GET', r'/stats', 'handle_stats'),
+    ('GET', r'/sessions', 'handle_list_sessions'),
+    ('POST', r'/sessions', 'handle_create_session'),
+    ('GET', SESSION_PATH, 'handle_get_session'),
+    ('DELETE', SESSION_PATH, 'handle_close_session'),
+    ('POST', SESSION_PATH + r'/messages', 'handle_message'),
+    ('POST', SESSION_PATH + r'/estimate', 'handle_estimate'),
+    ('GET', SESSION_PATH + r'/ws', 'handle_websocket'),
+]
+
+
+class HostedSession:
+    """
+    A chat session hosted by the server. Its turns are run one at a time, the turns of
+    different sessions concurrently.
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self.lock = asyncio.Lock()
+        self.last_active = time.monotonic()
+        # the WebSockets open on the session, which keep it loaded
+        self.connections = 0
+
+
+class ChatServer:
+    """
+    This class is a local asyncio chat server hosting many chat sessions in one process, over a JSON
+    HTTP API (with server-sent events to stream the responses) and WebSockets. The sessions use the
+    async API clients on one pooled `httpx.AsyncClient`, so the upstream connections are shared by
+    all of them, and are journaled, so they survive a restart of the server.
+
+    Usage:
+        server = ChatServer(port=0)
+        await server.start()
+        ...
+        await server.close()
+    """
+
+    def __init__(self, engine=None, host=None, port=None, token=None, idle_timeout=None, pool_size=None):
+        """
+        Initialize the ChatServer.
+
+        Args:
+            engine (ChatEngine, optional): The chat engine. Defaults to one on the shared configuration.
+            host (str, optional): The interface to listen on. Defaults to CHAT_SERVER_HOST.
+            port (int, optional): The port, 0 for any free port. Defaults to CHAT_SERVER_PORT.
+            token (str, optional): The token required from the clients. Defaults to CHAT_SERVER_TOKEN (none if empty).
+            idle_timeout (float, optional): Unload the sessions idle for longer, in seconds (0 to keep them). Defaults to CHAT_SERVER_IDLE_TIMEOUT.
+            pool_size (int, optional): The upstream connections. Defaults to CHAT_SERVER_POOL_SIZE.
+        """
+        self.engine = engine or ChatEngine()
+        self.host = host or CHAT_SERVER_HOST
+        self.port = CHAT_SERVER_PORT if port is None else port
+        self.token = CHAT_SERVER_TOKEN if token is None else token
+        self.idle_timeout = CHAT_SERVER_IDLE_TIMEOUT if idle_timeout is None else idle_timeout
+        self.pool_size = pool_size or CHAT_SERVER_POOL_SIZE
+        self.sessions = {}
+        self.http_client = None
+        self._server = None
+        self._reaper = None
+        # the sessions being reloaded from their journal
+        self._loading = {}
+        self._routes = [(method, re.compile(pattern + '$'), getattr(self, name)) for method, pattern, name in ROUTES]
+
+    @property
+    def url(self):
+        return f'http://{self.host}:{self.port}'
+
+    async def start(self):
+        """
+        Open the upstream connection pool and start listening.
+        """
+        self.http_client = create_async_http_client(pool_size=self.pool_size)
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port, limit=MAX_HEAD_SIZE)
+        self.port = self._server.sockets[0].getsockname()[1]
+        if self.idle_timeout > 0:
+            self._reaper = asyncio.create_task(self._unload_idle_sessions())
+        logging.info(f'Chat server listening on {self.url}')
+
+    async def serve_forever(self):
+        await self._server.serve_forever()
+
+    async def close(self):
+        """
+        Stop listening, close the sessions (their journals are kept) and the upstream connections.
+        """
+        if self._reaper is not None:
+            self._reaper.cancel()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for hosted in self.sessions.values():
+            hosted.session.close()
+        self.sessions.clear()
+        if self.http_client is not None:
+            await self.http_client.aclose()
+        logging.info('Chat server stopped')
+
+    async def _handle_connection(self, reader, writer):
+        """
+        Serve the requests of a connection (kept alive between requests) until it is closed,
+        streamed or upgraded to a WebSocket.
+        """
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except HTTPError as e:
+                    writer.write(error_response(e, keep_alive=False))
+                    break
+                if request is None:
+                    break
+                response = await self._dispatch(request, reader, writer)
+                if response is None:
+                    break
+                writer.write(response)
+                await writer.drain()
+                if not request.keep_alive:
+                    break
+        except (ConnectionError, WebSocketClosed):
+            pass
+        finally:
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def _dispatch(self, request, reader, writer):
+        """
+        Route a request to its handler.
+
+        Returns:
+            bytes: The response, or None if the handler answered on the connection itself (stream, WebSocket).
+        """
+        keep_alive = request.keep_alive
+        try:
+            self._authenticate(request)
+            allowed = []
+            for method, pattern, handler in self._routes:
+                match = pattern.match(request.path)
+                if match is None:
+                    continue
+                if method == request.method:
+                    return await handler(request, reader, writer, **match.groupdict())
+                allowed.append(method)
+            raise HTTPError(405 if allowed else 404)
+        except (ConnectionError, WebSocketClosed):
+            raise
+        except HTTPError as e:
+            return error_response(e, keep_alive)
+        except ValueError as e:
+            return error_response(HTTPError(400, str(e)), keep_alive)
+        except httpx.HTTPStatusError as e:
+            logging.error(f'Upstream error: {str(e)}')
+            return error_response(HTTPError(502, f'The provider answered {e.response.status_code}.'), keep_alive)
+        except httpx.TransportError as e:
+            logging.error(f'Upstream error: {str(e)}')
+            return error_response(HTTPError(502, f'The provider could not be reached: {str(e)}'), keep_alive)
+        except Exception as e:
+            logging.exception(f'Error occurred handling {request.method} {request.path}: {str(e)}')
+            return error_response(HTTPError(500), keep_alive)
+
+    def _authenticate(self, request):
+        if not self.token:
+            return
+        authorization = request.headers.get('authorization', '')
+        token = authorization[len('Bearer '):] if authorization.startswith('Bearer ') else request.query.get('token', '')
+        if not hmac.compare_digest(token.encode('utf-8'), self.token.encode('utf-8')):
+            raise HTTPError(401)
+
+    async def get_session(self, session_id):
+        """
+        Return a hosted session, reloading it from its journal if it isn't in memory (e.g. after a restart,
+        or once it was unloaded for being idle). The requests arriving while it is reloaded wait for it.
+
+        Raises:
+            HTTPError: 404 if there is no such session.
+        """
+        hosted = self.sessions.get(session_id)
+        if hosted is not None:
+            return hosted
+        path = self.engine.session_journal_path(session_id)
+        if path is None or not os.path.isfile(path):
+            raise HTTPError(404, f'No session {session_id}.')
+        loading = self._loading.get(session_id)
+        if loading is None:
+            loading = self._loading[session_id] = asyncio.ensure_future(self._reload_session(session_id, path))
+            loading.add_done_callback(lambda _: self._loading.pop(session_id, None))
+        return await asyncio.shield(loading)
+
+    async def _reload_session(self, session_id, path):
+        try:
+            # the project of its assistant is ingested again, in a thread not to block the other sessions
+            session = await asyncio.to_thread(self.engine.resume_session, path, asynchronous=True, http_client=self.http_client)
+        except OSError as e:
+            logging.error(f'Cannot read the session journal {path}: {str(e)}')
+            raise HTTPError(404, f'No session {session_id}.')
+        hosted = self.sessions[session_id] = HostedSession(session)
+        return hosted
+
+    async def run_turn(self, hosted, text, on_delta=None):
+        """
+        Run a turn of a session: prepare the prompt (e.g. add the relevant project excerpts, or the project
+        changes for `/refresh`), send it, and stream the response to `on_delta` if given.
+
+        Args:
+            hosted (HostedSession): The session.
+            text (str): The user input.
+            on_delta (coroutine function, optional): Called with each text delta of the response.
+
+        Returns:
+            dict: The "response", its "token_usage" and "cost", and the "usage" of the session.
+        """
+        session = hosted.session
+        async with hosted.lock:
+            hosted.last_active = time.monotonic()
+            # the project files are read and searched in a thread, not to block the other sessions
+            if text.strip() == '/refresh':
+                prompt = await asyncio.to_thread(session.refresh_project)
+                if prompt is None:
+                    return {"response": None, "notice": "No project file changed.", "usage": session.usage.to_dict()}
+            else:
+                prompt = await asyncio.to_thread(session.prepare_prompt, text)
+
+            if on_delta is None or not session.ai_chatbot.model_info["streaming"]:
+                response, token_usage, token_cost = await session.send_async(prompt)
+                if on_delta is not None:
+                    await on_delta(response)
+            else:
+                async with contextlib.aclosing(session.stream_async(prompt)) as deltas:
+                    async for delta in deltas:
+                        await on_delta(delta)
+                response, token_usage, token_cost = session.ai_chatbot.last_response, session.ai_chatbot.last_token_usage, session.last_cost
+            hosted.last_active = time.monotonic()
+        return {"response": response, "token_usage": token_usage, "cost": token_cost, "usage": session.usage.to_dict()}
+
+    async def handle_health(self, request, reader, writer):
+        return json_response(200, {"status": "ok", "sessions": len(self.sessions)}, request.keep_alive)
+
+    async def handle_models(self, request, reader, writer):
+        registry = self.engine.registry
+        providers = {provider: [{"model": model, **{key: registry.get(model, provider)[key] for key in ("context_window", "pricing", "streaming")}}
+                                for model in registry.models(provider)]
+                     for provider in self.engine.providers()}
+        return json_response(200, {"providers": providers}, request.keep_alive)
+
+    async def handle_stats(self, request, reader, writer):
+        instrumentation = get_instrumentation()
+        return json_response(200, {"turns": instrumentation.turns, "metrics": instrumentation.summary(),
+                                   "latencies": get_latency_tracker().summary()}, request.keep_alive)
+
+    async def handle_list_sessions(self, request, reader, writer):
+        return json_response(200, {"sessions": [hosted.session.state() for hosted in self.sessions.values()]}, request.keep_alive)
+
+    async def handle_create_session(self, request, reader, writer):
+        """
+        Create a session: `{"provider": "anthropic", "model": "...", "assistant": "CodingAssistant",
+        "tasks": [...], "project_folder": "...", "failover_model": "...", "lazy": true}`, all optional. With an assistant, its initial prompt is sent.
+        """
+        data = request.json()
+        providers = self.engine.providers()
+        provider = data.get("provider") or (providers[0] if providers else None)
+        ai_chatbot = self.engine.create_client(provider, data.get("model"), asynchronous=True, http_client=self.http_client)
+        ai_chatbot = self.engine.with_failover(ai_chatbot, asynchronous=True, http_client=self.http_client,
+                                               model=data.get("failover_model"))
+
+        assistant = None
+        if data.get("assistant"):
+            project_folder = data.get("project_folder")
+            if not project_folder or not os.path.isdir(os.path.expanduser(project_folder)):
+                raise HTTPError(400, 'A CodingAssistant needs an existing "project_folder".')
+            tasks = data.get("tasks") or []
+            if isinstance(tasks, str):
+                tasks = [task.strip() for task in tasks.split(",")]
+            assistant = await asyncio.to_thread(self.engine.create_assistant, data["assistant"], tasks, project_folder,
+                                                ai_chatbot, lazy=data.get("lazy"))
+
+        session = self.engine.create_session(ai_chatbot, assistant)
+        hosted = self.sessions[session.session_id] = HostedSession(session)
+        result = {}
+        if assistant is not None:
+            try:
+                async with hosted.lock:
+                    initial_prompt = await asyncio.to_thread(session.initial_prompt)
+                    response, token_usage, token_cost = await session.send_async(initial_prompt, cache=True)
+                    del initial_prompt
+            except BaseException:
+                # a session without its project context is of no use
+                self.sessions.pop(session.session_id, None)
+                session.close()
+                raise
+            result.update({"response": response, "token_usage": token_usage, "cost": token_cost})
+        result["session"] = session.state()
+        return json_response(201, result, request.keep_alive)
+
+    async def handle_get_session(self, request, reader, writer, session_id):
+        session = (await self.get_session(session_id)).session
+        return json_response(200, {"session": session.state(), "messages": [dict(message) for message in session.messages]},
+                             request.keep_alive)
+
+    async def handle_close_session(self, request, reader, writer, session_id):
+        """
+        Unload a session and close its journal, which is kept (for the archive, `--resume`, or a later request).
+        """
+        hosted = await self.get_session(session_id)
+        async with hosted.lock:
+            self.sessions.pop(session_id, None)
+            hosted.session.close()
+        return json_response(200, {"closed": session_id}, request.keep_alive)
+
+    async def handle_estimate(self, request, reader, writer, session_id):
+        hosted = await self.get_session(session_id)
+        text = self._get_text(request.json())
+        prompt = await asyncio.to_thread(hosted.session.prepare_prompt, text)
+        return json_response(200, hosted.session.estimate(prompt), request.keep_alive)
+
+    async def handle_message(self, request, reader, writer, session_id):
+        """
+        Send a message: `{"text": "...", "stream": false}`. With `"stream": true`, the response is streamed
+        as server-sent events: `delta` events (`{"text": "..."}`), then a `done` event with the usage
+        (or an `error` event).
+        """
+        hosted = await self.get_session(session_id)
+        data = request.json()
+        text = self._get_text(data)
+        if not data.get("stream"):
+            return json_response(200, await self.run_turn(hosted, text), request.keep_alive)
+
+        writer.write(stream_head())
+
+        async def send_delta(delta):
+            writer.write(format_sse('delta', {"text": delta}))
+            await writer.drain()
+
+        try:
+            result = await self.run_turn(hosted, text, send_delta)
+        except (ConnectionError, asyncio.CancelledError):
+            raise
+        except Exception as e:
+            logging.error(f'Streamed turn of the session {session_id} failed: {str(e)}')
+            writer.write(format_sse('error', {"error": str(e)}))
+        else:
+            writer.write(format_sse('done', result))
+        await writer.drain()
+        return None
+
+    async def handle_websocket(self, request, reader, writer, session_id):
+        """
+        Chat over a WebSocket: each message of the client is a user input (`{"text": "..."}` or plain text),
+        answered with `{"type": "delta", "text": "..."}` messages, then `{"type": "done", ...}` with the
+        usage (or `{"type": "error", "error": "..."}`).
+        """
+        hosted = await self.get_session(session_id)
+        response = handshake_response(request)
+        if response is None:
+            raise HTTPError(426, 'Expected a WebSocket upgrade.')
+        writer.write(response)
+        await writer.drain()
+
+        websocket = WebSocket(reader, writer)
+
+        async def send_delta(delta):
+            await websocket.send_json({"type": "delta", "text": delta})
+
+        hosted.connections += 1
+        try:
+            while True:
+                message = await websocket.receive()
+                if message is None:
+                    break
+                try:
+                    text = self._get_text(_parse_ws_message(message))
+                    result = await self.run_turn(hosted, text, send_delta)
+                except WebSocketClosed:
+                    break
+                except Exception as e:
+                    logging.error(f'WebSocket turn of the session {session_id} failed: {str(e)}')
+                    await websocket.send_json({"type": "error", "error": str(e)})
+                    continue
+                await websocket.send_json({"type": "done", **result})
+        finally:
+            hosted.connections -= 1
+            hosted.last_active = time.monotonic()
+        await websocket.close()
+        return None
+
+    def _get_text(self, data):
+        text = data.get("text")
+        if not isinstance(text, str) or not text.strip():
+            raise HTTPError(400, 'The message needs a "text".')
+        return text
+
+    async def _unload_idle_sessions(self):
+        """
+        Unload the sessions idle for longer than the idle timeout, to free their memory. The sessions
+        running a turn or with a WebSocket open are kept.
+        """
+        while True:
+            await asyncio.sleep(min(60.0, max(self.idle_timeout, 1.0)))
+            now = time.monotonic()
+            for session_id, hosted in list(self.sessions.items()):
+                if not hosted.lock.locked() and not hosted.connections and now - hosted.last_active > self.idle_timeout:
+                    self.sessions.pop(session_id, None)
+                    hosted.session.close()
+                    logging.info(f'Unloaded the idle session {session_id}')
+
+
+def _parse_ws_message(message):
+    try:
+        data = json.loads(message)
+    except ValueError:
+        return {"text": message}
+    return data if isinstance(data, dict) else {"text": message}
+
+
+async def serve(host=None, port=None):
+    """
+    Run the chat server until it is interrupted.
+    """
+    server = ChatServer(host=host, port=port)
+    await server.start()
+    print(f'Chat server listening on {server.url} (Ctrl-C to stop)')
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
+
+
+def run_server(host=None, port=None):
+    try:
+        asyncio.run(serve(host, port))
+    except KeyboardInterrupt:
+        print('\nChat server stopped.')
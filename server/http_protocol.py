@@ -0,0 +1,171 @@
+import json
+import asyncio
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qsl
+
+# The largest request head (request line and headers) and body accepted, in bytes
+MAX_HEAD_SIZE = 64 * 1024
+MAX_BODY_SIZE = 16 * 1024 * 1024
+
+
+class HTTPError(Exception):
+    """
+    An error answered to the client with its HTTP status.
+    """
+
+    def __init__(self, status, message=None):
+        self.status = HTTPStatus(status)
+        super().__init__(message or self.status.phrase)
+
+
+class HTTPRequest:
+    """
+    This class is an HTTP/1.1 request read from a connection of the chat server.
+    """
+
+    def __init__(self, method, target, version, headers, body=b''):
+        """
+        Initialize the HTTPRequest.
+
+        Args:
+            method (str): The method, e.g. 'POST'.
+            target (str): The request target, the path and the query string.
+            version (str): The HTTP version, e.g. 'HTTP/1.1'.
+            headers (dict): The headers, keyed by lowercase name.
+            body (bytes, optional): The body.
+        """
+        self.method = method
+        self.version = version
+        self.headers = headers
+        self.body = body
+        url = urlsplit(target)
+        self.path = url.path
+        self.query = dict(parse_qsl(url.query))
+
+    @property
+    def keep_alive(self):
+        connection = self.headers.get('connection', '').lower()
+        if self.version == 'HTTP/1.0':
+            return connection == 'keep-alive'
+        return connection != 'close'
+
+    def json(self):
+        """
+        Return the JSON body of the request, an empty object if there is none.
+
+        Raises:
+            HTTPError: 400 if the body isn't a JSON object.
+        """
+        if not self.body:
+            return {}
+        try:
+            data = json.loads(self.body)
+        except ValueError:
+            raise HTTPError(400, 'The body is not valid JSON.')
+        if not isinstance(data, dict):
+            raise HTTPError(400, 'The body must be a JSON object.')
+        return data
+
+
+async def read_request(reader):
+    """
+    Read the next request of a connection.
+
+    Args:
+        reader (asyncio.StreamReader): The reader of the connection.
+
+    Returns:
+        HTTPRequest: The request, or None if the client closed the connection.
+
+    Raises:
+        HTTPError: If the request is malformed or too large.
+    """
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            return None
+        raise HTTPError(400, 'Incomplete request.')
+    except asyncio.LimitOverrunError:
+        raise HTTPError(431)
+    if len(head) > MAX_HEAD_SIZE:
+        raise HTTPError(431)
+
+    lines = head.decode('latin-1').split('\r\n')
+    try:
+        method, target, version = lines[0].split(' ')
+    except ValueError:
+        raise HTTPError(400, 'Malformed request line.')
+    headers = {}
+    for line in lines[1:]:
+        if not line:
+            continue
+        name, separator, value = line.partition(':')
+        if not separator:
+            raise HTTPError(400, 'Malformed header.')
+        headers[name.strip().lower()] = value.strip()
+
+    if 'chunked' in headers.get('transfer-encoding', '').lower():
+        raise HTTPError(411)
+    try:
+        length = int(headers.get('content-length', '0'))
+    except ValueError:
+        raise HTTPError(400, 'Malformed Content-Length.')
+    if length > MAX_BODY_SIZE:
+        raise HTTPError(413)
+    try:
+        body = await reader.readexactly(length) if length else b''
+    except asyncio.IncompleteReadError:
+        raise HTTPError(400, 'Incomplete body.')
+    return HTTPRequest(method.upper(), target, version, headers, body)
+
+
+def format_response(status, body=b'', content_type='application/json', headers=None, keep_alive=True):
+    """
+    Format an HTTP/1.1 response.
+
+    Args:
+        status (int): The status code.
+        body (bytes, optional): The body.
+        content_type (str, optional): The Content-Type of the body. Defaults to JSON.
+        headers (dict, optional): More headers.
+        keep_alive (bool, optional): Keep the connection open for the next request. Defaults to True.
+
+    Returns:
+        bytes: The response.
+    """
+    status = HTTPStatus(status)
+    lines = [f'HTTP/1.1 {status.value} {status.phrase}', f'Content-Type: {content_type}',
+             f'Content-Length: {len(body)}', f'Connection: {"keep-alive" if keep_alive else "close"}']
+    lines.extend(f'{name}: {value}' for name, value in (headers or {}).items())
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+
+
+def json_response(status, data, keep_alive=True):
+    """
+    Format an HTTP/1.1 response with a JSON body.
+    """
+    return format_response(status, json.dumps(data, ensure_ascii=False).encode('utf-8'), keep_alive=keep_alive)
+
+
+def error_response(error, keep_alive=True):
+    """
+    Format the response of an HTTPError, e.g. `{"error": "Not Found"}`.
+    """
+    return json_response(error.status, {"error": str(error)}, keep_alive=keep_alive)
+
+
+def stream_head(content_type='text/event-stream'):
+    """
+    Return the head of a streamed response, whose body ends when the connection is closed.
+    """
+    return (f'HTTP/1.1 200 OK\r\nContent-Type: {content_type}\r\nCache-Control: no-cache\r\n'
+            f'Connection: close\r\n\r\n').encode('latin-1')
+
+
+def format_sse(event, data):
+    """
+    Format a server-sent event with a JSON payload, e.g. `event: delta\\ndata: {"text": "Hi"}\\n\\n`.
+    """
+    return f'event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'.encode('utf-8')
+
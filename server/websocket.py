@@ -0,0 +1,197 @@
+import os
+import json
+import base64
+import struct
+import hashlib
+import asyncio
+
+# The GUID of the WebSocket handshake (RFC 6455)
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+OPCODE_CONTINUATION = 0x0
+OPCODE_TEXT = 0x1
+OPCODE_BINARY = 0x2
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xA
+
+# The largest message accepted from a client, in bytes
+MAX_MESSAGE_SIZE = 16 * 1024 * 1024
+
+
+class WebSocketClosed(Exception):
+    """
+    The peer closed the WebSocket, or the connection was lost.
+    """
+
+
+def accept_key(key):
+    """
+    Return the Sec-WebSocket-Accept header of a handshake key.
+    """
+    return base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode('ascii')).digest()).decode('ascii')
+
+
+def handshake_response(request):
+    """
+    Return the response accepting the WebSocket upgrade of a request, or None if it isn't a valid upgrade.
+
+    Args:
+        request (HTTPRequest): The request.
+
+    Returns:
+        bytes: The 101 Switching Protocols response.
+    """
+    key = request.headers.get('sec-websocket-key')
+    if request.method != 'GET' or request.headers.get('upgrade', '').lower() != 'websocket' or not key:
+        return None
+    return ('HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+            f'Sec-WebSocket-Accept: {accept_key(key)}\r\n\r\n').encode('latin-1')
+
+
+def encode_frame(opcode, payload, mask=False):
+    """
+    Encode a WebSocket frame (a whole message, FIN set). The frames of a client must be masked.
+
+    Args:
+        opcode (int): The opcode, e.g. OPCODE_TEXT.
+        payload (bytes): The payload.
+        mask (bool, optional): Mask the payload. Defaults to False.
+
+    Returns:
+        bytes: The frame.
+    """
+    head = bytearray([0x80 | opcode])
+    mask_bit = 0x80 if mask else 0
+    length = len(payload)
+    if length < 126:
+        head.append(mask_bit | length)
+    elif length < 1 << 16:
+        head.append(mask_bit | 126)
+        head += struct.pack('!H', length)
+    else:
+        head.append(mask_bit | 127)
+        head += struct.pack('!Q', length)
+    if mask:
+        key = os.urandom(4)
+        head += key
+        payload = _apply_mask(payload, key)
+    return bytes(head) + payload
+
+
+async def read_frame(reader, max_size=MAX_MESSAGE_SIZE):
+    """
+    Read a WebSocket frame.
+
+    Args:
+        reader (asyncio.StreamReader): The reader of the connection.
+        max_size (int, optional): The largest payload accepted. Defaults to MAX_MESSAGE_SIZE.
+
+    Returns:
+        tuple: The FIN flag, the opcode and the (unmasked) payload.
+
+    Raises:
+        WebSocketClosed: If the connection is lost or the frame is too large.
+    """
+    try:
+        first, second = await reader.readexactly(2)
+        length = second & 0x7F
+        if length == 126:
+            length, = struct.unpack('!H', await reader.readexactly(2))
+        elif length == 127:
+            length, = struct.unpack('!Q', await reader.readexactly(8))
+        if length > max_size:
+            raise WebSocketClosed(f'Frame too large ({length} bytes).')
+        key = await reader.readexactly(4) if second & 0x80 else None
+        payload = await reader.readexactly(length)
+    except (asyncio.IncompleteReadError, ConnectionError) as e:
+        raise WebSocketClosed(str(e))
+    if key is not None:
+        payload = _apply_mask(payload, key)
+    return bool(first & 0x80), first & 0x0F, payload
+
+
+def _apply_mask(payload, key):
+    # XOR with the 4-byte key repeated, done on integers rather than byte by byte
+    repeated = (key * (len(payload) // 4 + 1))[:len(payload)]
+    return (int.from_bytes(payload, 'big') ^ int.from_bytes(repeated, 'big')).to_bytes(len(payload), 'big')
+
+
+class WebSocket:
+    """
+    This class is the server side of a WebSocket connection, after the handshake: it receives the
+    text messages of the client (answering its pings, reassembling the fragmented messages) and
+    sends text messages back.
+    """
+
+    def __init__(self, reader, writer, max_size=MAX_MESSAGE_SIZE):
+        """
+        Initialize the WebSocket.
+
+        Args:
+            reader (asyncio.StreamReader): The reader of the connection.
+            writer (asyncio.StreamWriter): The writer of the connection.
+            max_size (int, optional): The largest message accepted. Defaults to MAX_MESSAGE_SIZE.
+        """
+        self.reader = reader
+        self.writer = writer
+        self.max_size = max_size
+        self.closed = False
+
+    async def receive(self):
+        """
+        Receive the next message of the client.
+
+        Returns:
+            str: The message, or None once the client closed the WebSocket.
+        """
+        fragments = []
+        size = 0
+        while not self.closed:
+            try:
+                fin, opcode, payload = await read_frame(self.reader, self.max_size)
+            except WebSocketClosed:
+                self.closed = True
+                return None
+            if opcode == OPCODE_PING:
+                await self._send_frame(OPCODE_PONG, payload)
+                continue
+            if opcode == OPCODE_PONG:
+                continue
+            if opcode == OPCODE_CLOSE:
+                await self.close()
+                return None
+            size += len(payload)
+            if size > self.max_size:
+                await self.close(1009)
+                return None
+            fragments.append(payload)
+            if fin:
+                return b''.join(fragments).decode('utf-8', 'replace')
+        return None
+
+    async def send_text(self, text):
+        await self._send_frame(OPCODE_TEXT, text.encode('utf-8'))
+
+    async def send_json(self, data):
+        await self.send_text(json.dumps(data, ensure_ascii=False))
+
+    async def close(self, code=1000):
+        """
+        Send the close frame, unless the WebSocket is closed already.
+        """
+        if self.closed:
+            return
+        try:
+            await self._send_frame(OPCODE_CLOSE, struct.pack('!H', code))
+        except WebSocketClosed:
+            pass
+        self.closed = True
+
+    async def _send_frame(self, opcode, payload):
+        try:
+            self.writer.write(encode_frame(opcode, payload))
+            await self.writer.drain()
+        except ConnectionError as e:
+            self.closed = True
+            raise WebSocketClosed(str(e))
@@ -0,0 +1,385 @@
+import json
+import time
+import random
+import threading
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANTHROPIC_PATH = '/v1/messages'
+OPENAI_PATH = '/v1/chat/completions'
+ANTHROPIC_BATCHES_PATH = '/v1/messages/batches'
+OPENAI_BATCHES_PATH = '/v1/batches'
+OPENAI_FILES_PATH = '/v1/files'
+
+
+class MockProviderServer:
+    """
+    This class is a local stand-in for the Anthropic Messages and OpenAI Chat Completions endpoints,
+    for the tests and the benchmarks. It answers with generated text, streamed or not, after a
+    configurable latency and at a configurable token rate, and can inject 429/5xx errors.
+    It also stands in for the Anthropic Message Batches and OpenAI Batch APIs: a batch is answered
+    when it is submitted, and reported as done after `batch_polls` polls. With `tool_calls`, the
+    requests with tools are answered with these tool calls first, one per round, then with text
+    echoing the last tool result.
+
+    Usage:
+        with MockProviderServer(latency=0.05) as server:
+            client = AnthropicClient(api_key='key', api_url=server.anthropic_url)
+    """
+
+    def __init__(self, latency=0.0, token_rate=0.0, response_tokens=20, error_rate=0.0,
+                 error_status=529, errors=(), retry_after=None, seed=0, batch_polls=2, tool_calls=()):
+        """
+        Initialize the MockProviderServer.
+
+        Args:
+            latency (float, optional): Seconds before the first byte of each response. Defaults to 0.
+            token_rate (float, optional): Streamed tokens per second, 0 for no delay. Defaults to 0.
+            response_tokens (int, optional): The number of tokens (words) of each response. Defaults to 20.
+            error_rate (float, optional): The share of requests answered with `error_status`. Defaults to 0.
+            error_status (int, optional): The status of the injected random errors. Defaults to 529 (overloaded).
+            errors (iterable, optional): Statuses to answer the next requests with, in order (e.g. [429, 503]).
+            retry_after (float, optional): The retry-after header of the error responses. Defaults to none.
+            seed (int, optional): The seed of the random error injection. Defaults to 0.
+            batch_polls (int, optional): The number of polls of a batch until it is done. Defaults to 2.
+            tool_calls (iterable, optional): The (tool name, arguments) calls made before answering, one per round.
+        """
+        self.latency = latency
+        self.token_rate = token_rate
+        self.response_tokens = response_tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.errors = list(errors)
+        self.retry_after = retry_after
+        self.batch_polls = batch_polls
+        self.tool_calls = list(tool_calls)
+        self.requests = []
+        self.batches = {}
+        self.files = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    @property
+    def anthropic_url(self):
+        return self.url + ANTHROPIC_PATH
+
+    @property
+    def openai_url(self):
+        return self.url + OPENAI_PATH
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def next_error(self):
+        """
+        Return the status of the error to inject for the next request, or None.
+        """
+        with self._lock:
+            if self.errors:
+                return self.errors.pop(0)
+            if self.error_rate and self._random.random() < self.error_rate:
+                return self.error_status
+        return None
+
+    def response_words(self, prompt):
+        words = (prompt.split() or ['ok'])[:3]
+        return [f"{words[i % len(words)]} " for i in range(self.response_tokens)]
+
+    def next_tool_call(self, request):
+        """
+        Return the (id, name, arguments) of the tool call answering a request, or None to answer with text.
+        The tool rounds already done are counted from the tool results of the request.
+        """
+        if not request.get('tools'):
+            return None
+        rounds = sum(1 for message in request.get('messages', []) if message.get('role') == 'tool' or (
+            isinstance(message.get('content'), list) and any(block.get('type') == 'tool_result' for block in message['content'])))
+        if rounds >= len(self.tool_calls):
+            return None
+        name, arguments = self.tool_calls[rounds]
+        return f"call_{rounds}", name, arguments
+
+    def answer(self, path, request, input_tokens):
+        """
+        Return the (not streamed) response body of a request to the Anthropic or OpenAI endpoint.
+        """
+        tool_call = self.next_tool_call(request)
+        if tool_call is not None:
+            call_id, name, arguments = tool_call
+            if path == ANTHROPIC_PATH:
+                return {"content": [{"type": "text", "text": "Let me look."},
+                                    {"type": "tool_use", "id": call_id, "name": name, "input": arguments}],
+                        "stop_reason": "tool_use", "usage": {"input_tokens": input_tokens, "output_tokens": 10}}
+            return {"choices": [{"message": {"role": "assistant", "content": None, "tool_calls": [
+                        {"id": call_id, "type": "function", "function": {"name": name, "arguments": json.dumps(arguments)}}]},
+                        "finish_reason": "tool_calls"}],
+                    "usage": {"prompt_tokens": input_tokens, "completion_tokens": 10}}
+        words = self.response_words(_last_prompt(request))
+        if path == ANTHROPIC_PATH:
+            return {"content": [{"type": "text", "text": ''.join(words)}],
+                    "usage": {"input_tokens": input_tokens, "output_tokens": len(words)}}
+        return {"choices": [{"message": {"role": "assistant", "content": ''.join(words)}}],
+                "usage": {"prompt_tokens": input_tokens, "completion_tokens": len(words)}}
+
+    def create_batch(self, endpoint, requests):
+        """
+        Answer the (custom id, request) pairs of a new batch. The injected errors fail single requests.
+
+        Returns:
+            str: The id of the batch.
+        """
+        results = []
+        for custom_id, request in requests:
+            status = self.next_error()
+            response = None if status is not None else self.answer(endpoint, request, len(json.dumps(request)) // 4)
+            results.append((custom_id, status, response))
+        with self._lock:
+            batch_id = f"batch_{len(self.batches) + 1}"
+            self.batches[batch_id] = {"endpoint": endpoint, "results": results, "polls": 0}
+        return batch_id
+
+    def poll_batch(self, batch_id):
+        """
+        Return the batch object of a batch, in the format of its provider.
+        """
+        batch = self.batches[batch_id]
+        with self._lock:
+            batch["polls"] += 1
+            done = batch["polls"] >= self.batch_polls
+        succeeded = sum(1 for _, status, _ in batch["results"] if status is None)
+        failed = len(batch["results"]) - succeeded
+        if batch["endpoint"] == ANTHROPIC_PATH:
+            return {"id": batch_id, "type": "message_batch", "processing_status": "ended" if done else "in_progress",
+                    "request_counts": {"processing": 0 if done else len(batch["results"]),
+                                       "succeeded": succeeded if done else 0, "errored": failed if done else 0},
+                    "results_url": f"{self.url}{ANTHROPIC_BATCHES_PATH}/{batch_id}/results" if done else None}
+        data = {"id": batch_id, "object": "batch", "status": "completed" if done else "in_progress",
+                "output_file_id": None, "error_file_id": None,
+                "request_counts": {"total": len(batch["results"]), "completed": succeeded if done else 0,
+                                   "failed": failed if done else 0}}
+        if done:
+            output, errors = [], []
+            for custom_id, status, response in batch["results"]:
+                if status is None:
+                    output.append({"custom_id": custom_id, "response": {"status_code": 200, "body": response}, "error": None})
+                else:
+                    errors.append({"custom_id": custom_id, "error": None, "response": {
+                        "status_code": status, "body": {"error": {"message": f"injected {status}"}}}})
+            data["output_file_id"] = self.add_file(output) if output else None
+            data["error_file_id"] = self.add_file(errors) if errors else None
+        return data
+
+    def anthropic_batch_results(self, batch_id):
+        lines = []
+        for custom_id, status, response in self.batches[batch_id]["results"]:
+            if status is None:
+                result = {"type": "succeeded", "message": response}
+            else:
+                result = {"type": "errored", "error": {"type": "error", "error": {
+                    "type": "invalid_request_error", "message": f"injected {status}"}}}
+            lines.append({"custom_id": custom_id, "result": result})
+        return lines
+
+    def add_file(self, records):
+        with self._lock:
+            file_id = f"file_{len(self.files) + 1}"
+            self.files[file_id] = ''.join(json.dumps(record) + '\n' for record in records).encode('utf-8')
+        return file_id
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # the headers and the body are separate writes, don't let Nagle delay the body
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_HEAD(self):
+                self.send_response(200)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def do_GET(self):
+                with server._lock:
+                    server.requests.append({"method": "GET", "path": self.path, "headers": dict(self.headers), "body": b''})
+                parts = self.path.strip('/').split('/')
+                if self.path.startswith(ANTHROPIC_BATCHES_PATH + '/') and parts[3] in server.batches:
+                    if len(parts) == 5 and parts[4] == 'results':
+                        return self.send_jsonl(server.anthropic_batch_results(parts[3]))
+                    return self.send_json(200, server.poll_batch(parts[3]))
+                if self.path.startswith(OPENAI_BATCHES_PATH + '/') and parts[2] in server.batches:
+                    return self.send_json(200, server.poll_batch(parts[2]))
+                if self.path.startswith(OPENAI_FILES_PATH + '/') and parts[2] in server.files:
+                    return self.send_bytes(200, server.files[parts[2]], 'application/jsonl')
+                self.send_json(404, {"error": {"message": "not found"}})
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                with server._lock:
+                    server.requests.append({"method": "POST", "path": self.path, "headers": dict(self.headers), "body": body})
+                if self.path == ANTHROPIC_BATCHES_PATH:
+                    requests = [(request["custom_id"], request["params"]) for request in json.loads(body)["requests"]]
+                    return self.send_json(200, server.poll_batch(server.create_batch(ANTHROPIC_PATH, requests)))
+                if self.path == OPENAI_FILES_PATH:
+                    fields = _parse_multipart(self.headers['Content-Type'], body)
+                    with server._lock:
+                        file_id = f"file_{len(server.files) + 1}"
+                        server.files[file_id] = fields["file"]
+                    return self.send_json(200, {"id": file_id, "object": "file", "purpose": fields["purpose"].decode()})
+                if self.path == OPENAI_BATCHES_PATH:
+                    data = json.loads(body)
+                    records = [json.loads(line) for line in server.files[data["input_file_id"]].splitlines() if line.strip()]
+                    batch_id = server.create_batch(data["endpoint"], [(record["custom_id"], record["body"]) for record in records])
+                    return self.send_json(200, {"id": batch_id, "object": "batch", "status": "validating"})
+                if self.path not in (ANTHROPIC_PATH, OPENAI_PATH):
+                    return self.send_json(404, {"error": {"message": "not found"}})
+
+                time.sleep(server.latency)
+                status = server.next_error()
+                if status is not None:
+                    headers = {} if server.retry_after is None else {'retry-after': str(server.retry_after)}
+                    return self.send_json(status, {"error": {"type": "injected", "message": f"injected {status}"}}, headers)
+
+                request = json.loads(body)
+                input_tokens = len(body) // 4
+                if request.get('stream'):
+                    tool_call = server.next_tool_call(request)
+                    if tool_call is not None:
+                        events = _anthropic_tool_events if self.path == ANTHROPIC_PATH else _openai_tool_events
+                        return self.stream(events(tool_call, input_tokens))
+                    words = server.response_words(_last_prompt(request))
+                    events = _anthropic_events if self.path == ANTHROPIC_PATH else _openai_events
+                    return self.stream(events(words, input_tokens))
+                return self.send_json(200, server.answer(self.path, request, input_tokens))
+
+            def send_json(self, status, data, headers=None):
+                self.send_bytes(status, json.dumps(data).encode('utf-8'), 'application/json', headers)
+
+            def send_jsonl(self, records):
+                self.send_bytes(200, ''.join(json.dumps(record) + '\n' for record in records).encode('utf-8'), 'application/jsonl')
+
+            def send_bytes(self, status, payload, content_type, headers=None):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def stream(self, events):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                for event, is_token in events:
+                    if is_token and server.token_rate:
+                        time.sleep(1 / server.token_rate)
+                    chunk = event.encode('utf-8')
+                    self.wfile.write(f"{len(chunk):x}\r\n".encode('ascii') + chunk + b"\r\n")
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+
+        return Handler
+
+
+def _parse_multipart(content_type, body):
+    """
+    Return the fields (name: bytes) of a multipart/form-data body.
+    """
+    message = BytesParser(policy=HTTP).parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode('latin-1') + body)
+    return {part.get_param('name', header='content-disposition'): part.get_payload(decode=True)
+            for part in message.iter_parts()}
+
+
+def _last_prompt(request):
+    content = request.get('messages', [{}])[-1].get('content', '')
+    if isinstance(content, list):
+        content = ' '.join(block.get('text') or block.get('content', '') for block in content)
+    return content
+
+
+def _anthropic_events(words, input_tokens):
+    """
+    Yield the (server-sent event, is a token) pairs of an Anthropic streamed response.
+    """
+    def sse(event, data):
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    yield sse('message_start', {"type": "message_start", "message": {"usage": {"input_tokens": input_tokens, "output_tokens": 1}}}), False
+    for word in words:
+        yield sse('content_block_delta', {"type": "content_block_delta", "index": 0,
+                                          "delta": {"type": "text_delta", "text": word}}), True
+    yield sse('message_delta', {"type": "message_delta", "usage": {"output_tokens": len(words)}}), False
+    yield sse('message_stop', {"type": "message_stop"}), False
+
+
+def _openai_events(words, input_tokens):
+    """
+    Yield the (server-sent event, is a token) pairs of an OpenAI streamed response.
+    """
+    for word in words:
+        yield f"data: {json.dumps({'choices': [{'delta': {'content': word}}]})}\n\n", True
+    usage = {"prompt_tokens": input_tokens, "completion_tokens": len(words)}
+    yield f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n", False
+    yield "data: [DONE]\n\n", False
+
+
+def _anthropic_tool_events(tool_call, input_tokens):
+    """
+    Yield the (server-sent event, is a token) pairs of an Anthropic streamed response with a tool call,
+    its arguments split in two JSON fragments.
+    """
+    def sse(event, data):
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    call_id, name, arguments = tool_call
+    encoded = json.dumps(arguments)
+    yield sse('message_start', {"type": "message_start", "message": {"usage": {"input_tokens": input_tokens, "output_tokens": 1}}}), False
+    yield sse('content_block_start', {"type": "content_block_start", "index": 0,
+                                      "content_block": {"type": "tool_use", "id": call_id, "name": name, "input": {}}}), False
+    for fragment in (encoded[:len(encoded) // 2], encoded[len(encoded) // 2:]):
+        yield sse('content_block_delta', {"type": "content_block_delta", "index": 0,
+                                          "delta": {"type": "input_json_delta", "partial_json": fragment}}), True
+    yield sse('content_block_stop', {"type": "content_block_stop", "index": 0}), False
+    yield sse('message_delta', {"type": "message_delta", "delta": {"stop_reason": "tool_use"}, "usage": {"output_tokens": 10}}), False
+    yield sse('message_stop', {"type": "message_stop"}), False
+
+
+def _openai_tool_events(tool_call, input_tokens):
+    """
+    Yield the (server-sent event, is a token) pairs of an OpenAI streamed response with a tool call.
+    """
+    call_id, name, arguments = tool_call
+    encoded = json.dumps(arguments)
+    first = {"index": 0, "id": call_id, "type": "function", "function": {"name": name, "arguments": encoded[:len(encoded) // 2]}}
+    second = {"index": 0, "function": {"arguments": encoded[len(encoded) // 2:]}}
+    for delta in (first, second):
+        yield f"data: {json.dumps({'choices': [{'delta': {'tool_calls': [delta]}}]})}\n\n", True
+    usage = {"prompt_tokens": input_tokens, "completion_tokens": 10}
+    yield f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n", False
+    yield "data: [DONE]\n\n", False
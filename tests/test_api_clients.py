@@ -1,21 +1,37 @@
 import unittest
-from unittest.mock import patch, Mock
-from api_clients.anthropic_client import AnthropicHTTPClient, AVAILABLE_ANTHROPIC_MODELS
+from api_clients.anthropic_client import AnthropicClient, AVAILABLE_ANTHROPIC_MODELS
 from api_clients.openai_client import OpenAIClient, AVAILABLE_OPENAI_MODELS
+from api_clients.request_scheduler import RequestScheduler
+from tests.mock_provider_server import MockProviderServer
 
 
 
 class TestAPIClients(unittest.TestCase):
     """
-    This class contains unit tests for the API client classes.
+    This class contains unit tests for the API client classes, end to end against the local mock provider server.
     """
 
-    def test_anthropic_http_client_headers(self):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = MockProviderServer(response_tokens=5, retry_after=0).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def make_client(self, client_class, model):
+        api_url = self.server.anthropic_url if client_class is AnthropicClient else self.server.openai_url
+        client = client_class(api_key='test-api-key', api_url=api_url)
+        client.model = model
+        client.scheduler = RequestScheduler('test-api-key', base_delay=0, max_delay=0)
+        return client
+
+    def test_anthropic_client_headers(self):
         """
-        Test the headers returned by the AnthropicHTTPClient.
+        Test the headers returned by the AnthropicClient.
         """
         api_key = 'test-api-key'
-        client = AnthropicHTTPClient(api_key=api_key, api_url='https://api.anthropic.com/v1/messages')
+        client = AnthropicClient(api_key=api_key, api_url='https://api.anthropic.com/v1/messages')
 
         expected_headers = {
             'Content-Type': 'application/json',
@@ -25,18 +41,19 @@ class TestAPIClients(unittest.TestCase):
 
         self.assertEqual(client._get_headers(), expected_headers)
 
-    def test_anthropic_http_client_request_data(self):
+    def test_anthropic_client_request_data(self):
         """
-        Test the request data constructed by the AnthropicHTTPClient.
+        Test the request data constructed by the AnthropicClient.
         """
-        client = AnthropicHTTPClient(api_key='test-api-key', api_url='https://api.anthropic.com/v1/messages')
+        client = AnthropicClient(api_key='test-api-key', api_url='https://api.anthropic.com/v1/messages')
         client.model = AVAILABLE_ANTHROPIC_MODELS[0]  # Select the first available model
+        client.prompt_caching = False
         prompt = 'Hello, world!'
-        chat_history = []
+        chat_history = {"messages": [], "summary": ""}
 
         expected_request_data = {
             'model': AVAILABLE_ANTHROPIC_MODELS[0],
-            'max_tokens': 1000,
+            'max_tokens': 2000,
             'messages': [
                 {
                     'role': 'user',
@@ -47,53 +64,52 @@ class TestAPIClients(unittest.TestCase):
 
         self.assertEqual(client._get_request_data(prompt, chat_history), expected_request_data)
 
-    @patch('requests.post')
-    def test_anthropic_client(self, mock_post):
+    def test_anthropic_client(self):
         """
-        Test the AnthropicHTTPClient by mocking the requests.post method.
+        Test the AnthropicClient against the mock Anthropic Messages endpoint.
         """
-        mock_response = Mock()
-        mock_response.json.return_value = {
-            "content": [
-                {
-                    "type": "text",
-                    "text": "This is a test response from the AI."
-                }
-            ],
-            "usage": {  # Include this if your method processes token usage 
-                "input_tokens": 5,
-                "output_tokens": 30
-            } 
-        }
+        client = self.make_client(AnthropicClient, AVAILABLE_ANTHROPIC_MODELS[0])
 
-        mock_post.return_value = mock_response
+        response, token_usage = client.send_request('Hello')
 
-        api_key ='test-api-key' 
-        api_url = 'https://api.anthropic.com/v1/messages'
-        client = AnthropicHTTPClient(api_key=api_key, api_url=api_url)
-        client.model = AVAILABLE_ANTHROPIC_MODELS[0]  # Select the first available model
+        self.assertEqual(response, 'Hello Hello Hello Hello Hello ')
+        self.assertEqual(token_usage["output_tokens"], 5)
+        self.assertEqual(self.server.requests[-1]["headers"]["X-API-Key"], 'test-api-key')
+        self.assertEqual(len(client.chat_history["messages"]), 2)
+
+    def test_openai_client(self):
+        """
+        Test the OpenAIClient against the mock Chat Completions endpoint.
+        """
+        client = self.make_client(OpenAIClient, AVAILABLE_OPENAI_MODELS[0])
+
+        response, token_usage = client.send_request('Hello world')
+
+        self.assertEqual(response, 'Hello world Hello world Hello ')
+        self.assertEqual(token_usage["output_tokens"], 5)
+
+    def test_streaming(self):
+        """
+        Test that both clients stream the response token by token.
+        """
+        for client_class, model in ((AnthropicClient, AVAILABLE_ANTHROPIC_MODELS[0]), (OpenAIClient, AVAILABLE_OPENAI_MODELS[0])):
+            client = self.make_client(client_class, model)
+            deltas = list(client.stream_request('Hi'))
+            self.assertEqual(deltas, ['Hi '] * 5)
+            self.assertEqual(client.last_token_usage["output_tokens"], 5)
+
+    def test_retry_on_injected_errors(self):
+        """
+        Test that the clients retry the rate limit and overload errors.
+        """
+        client = self.make_client(AnthropicClient, AVAILABLE_ANTHROPIC_MODELS[0])
+        self.server.errors = [429, 529]
+        requests_before = len(self.server.requests)
+
+        response, _ = client.send_request('Retry')
 
-        response = client.send_request('Hello')
-
-        self.assertEqual(response[0], 'This is a test response from the AI.')
-
-    # @patch('requests.post')
-    # def test_openai_client(self, mock_post):
-    #     """
-    #     Test the OpenAIClient by mocking the requests.post method.
-    #     """
-    #     mock_response = Mock()
-    #     mock_response.json.return_value = {'choices': [{'text': 'Hello, world!'}]}
-    #     mock_post.return_value = mock_response
-    #
-    #     api_key = 'test_key'
-    #     api_url = 'https://api.openai.com/v1/engines/davinci/completions'
-    #     client = OpenAIClient(api_key=api_key, api_url=api_url)
-    #     client.model = AVAILABLE_OPENAI_MODELS[0]  # Select the first available model
-    #
-    #     response = client.send_request('Hello')
-    #
-    #     self.assertEqual(response, 'Hello, world!')
+        self.assertEqual(response, 'Retry ' * 5)
+        self.assertEqual(len(self.server.requests) - requests_before, 3)
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,92 @@
+import asyncio
+import json
+import unittest
+import httpx
+from api_clients.async_client import AsyncAnthropicClient, AsyncOpenAIClient
+
+
+def anthropic_handler(request):
+    body = json.loads(request.content)
+    if body.get('stream'):
+        stream = (
+            'event: message_start\n'
+            'data: {"type": "message_start", "message": {"usage": {"input_tokens": 4, "output_tokens": 1}}}\n\n'
+            'event: content_block_delta\n'
+            'data: {"type": "content_block_delta", "delta": {"type": "text_delta", "text": "Hi there"}}\n\n'
+            'event: message_delta\n'
+            'data: {"type": "message_delta", "usage": {"output_tokens": 3}}\n\n'
+        )
+        return httpx.Response(200, text=stream, headers={'Content-Type': 'text/event-stream'})
+    content = body['messages'][-1]['content']
+    if isinstance(content, list):
+        content = content[0]['text']
+    return httpx.Response(200, json={
+        "content": [{"type": "text", "text": f"Echo: {content}"}],
+        "usage": {"input_tokens": 5, "output_tokens": 2}
+    })
+
+
+def openai_handler(request):
+    return httpx.Response(200, json={
+        "choices": [{"message": {"content": "Hello from OpenAI"}}],
+        "usage": {"prompt_tokens": 6, "completion_tokens": 3}
+    })
+
+
+class TestAsyncClients(unittest.TestCase):
+    """
+    This class contains unit tests for the async API clients.
+    """
+
+    def test_async_anthropic_send_request(self):
+        """
+        Test that the async Anthropic client builds the request and parses the response like the sync one.
+        """
+        async def run():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(anthropic_handler)) as http_client:
+                client = AsyncAnthropicClient(api_key='test-api-key', api_url='https://api.anthropic.com/v1/messages',
+                                              session=http_client)
+                return client, await client.send_request('Hello')
+
+        client, (response, token_usage) = asyncio.run(run())
+        self.assertEqual(response, 'Echo: Hello')
+        self.assertEqual((token_usage["input_tokens"], token_usage["output_tokens"]), (5, 2))
+        self.assertEqual(len(client.chat_history["messages"]), 2)
+
+    def test_async_stream_request(self):
+        """
+        Test that the async client yields the streamed text deltas.
+        """
+        async def run():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(anthropic_handler)) as http_client:
+                client = AsyncAnthropicClient(api_key='test-api-key', api_url='https://api.anthropic.com/v1/messages',
+                                              session=http_client)
+                deltas = [delta async for delta in client.stream_request('Hello')]
+                return client, deltas
+
+        client, deltas = asyncio.run(run())
+        self.assertEqual(deltas, ['Hi there'])
+        self.assertEqual((client.last_token_usage["input_tokens"], client.last_token_usage["output_tokens"]), (4, 3))
+
+    def test_concurrent_fan_out(self):
+        """
+        Test that several providers can be queried concurrently on the same event loop.
+        """
+        async def run():
+            anthropic_http = httpx.AsyncClient(transport=httpx.MockTransport(anthropic_handler))
+            openai_http = httpx.AsyncClient(transport=httpx.MockTransport(openai_handler))
+            clients = [
+                AsyncAnthropicClient(api_key='key', api_url='https://api.anthropic.com/v1/messages', session=anthropic_http),
+                AsyncOpenAIClient(api_key='key', api_url='https://api.openai.com/v1/chat/completions', session=openai_http),
+            ]
+            results = await asyncio.gather(*(client.send_request('Hello') for client in clients))
+            await anthropic_http.aclose()
+            await openai_http.aclose()
+            return results
+
+        results = asyncio.run(run())
+        self.assertEqual([response for response, _ in results], ['Echo: Hello', 'Hello from OpenAI'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+import io
+import os
+import json
+import tempfile
+import unittest
+from api_clients.anthropic_client import AnthropicClient
+from api_clients.openai_client import OpenAIClient
+from api_clients.request_scheduler import RequestScheduler
+from api_clients.batch_jobs import AnthropicBatchJob, OpenAIBatchJob, create_batch_job
+from utils.batch_runner import run_provider_batch, load_completed_ids
+from utils.pricing_model import PricingModel
+from tests.mock_provider_server import MockProviderServer, ANTHROPIC_BATCHES_PATH, OPENAI_BATCHES_PATH
+
+
+class TestBatchJobs(unittest.TestCase):
+    """
+    This class contains unit tests for the provider batch APIs, against the local mock provider server.
+    """
+
+    def setUp(self):
+        self.server = MockProviderServer(response_tokens=3, retry_after=0).start()
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.server.stop()
+        self.directory.cleanup()
+
+    def make_client(self, client_class, model):
+        api_url = self.server.anthropic_url if client_class is AnthropicClient else self.server.openai_url
+        ai_chatbot = client_class(api_key='test-api-key', api_url=api_url)
+        ai_chatbot.model = model
+        ai_chatbot.scheduler = RequestScheduler('test-api-key', base_delay=0, max_delay=0)
+        return ai_chatbot
+
+    def run_job(self, job, prompts):
+        job.submit([(str(i), job.build_request(prompt)) for i, prompt in enumerate(prompts)])
+        job.wait(poll_interval=0)
+        return {custom_id: (response, token_usage, error) for custom_id, response, token_usage, error in job.results()}
+
+    def posted(self, path):
+        return [request for request in self.server.requests if request.get("method") == "POST" and request["path"] == path]
+
+    def test_create_batch_job(self):
+        """
+        Test that the batch job matches the provider of the client.
+        """
+        self.assertIsInstance(create_batch_job(self.make_client(AnthropicClient, 'claude-3-haiku-20240307')), AnthropicBatchJob)
+        self.assertIsInstance(create_batch_job(self.make_client(OpenAIClient, 'gpt-4')), OpenAIBatchJob)
+
+    def test_anthropic_batch(self):
+        """
+        Test an Anthropic message batch: the requests are built like the synchronous ones and the results parsed.
+        """
+        self.server.errors = [400]
+        job = create_batch_job(self.make_client(AnthropicClient, 'claude-3-haiku-20240307'))
+        results = self.run_job(job, ["first prompt here", "second prompt here"])
+
+        requests = json.loads(self.posted(ANTHROPIC_BATCHES_PATH)[0]["body"])["requests"]
+        self.assertEqual(requests[1]["custom_id"], "1")
+        self.assertEqual(requests[1]["params"]["model"], 'claude-3-haiku-20240307')
+        self.assertEqual(requests[1]["params"]["max_tokens"], 2000)
+        self.assertEqual(requests[1]["params"]["messages"][-1]["role"], "user")
+        self.assertEqual(results["0"], (None, None, "injected 400"))
+        response, token_usage, error = results["1"]
+        self.assertEqual(response.strip(), "second prompt here")
+        self.assertEqual(token_usage["output_tokens"], 3)
+        self.assertIsNone(error)
+
+    def test_openai_batch(self):
+        """
+        Test an OpenAI batch: the requests are uploaded as a JSONL file, and the output and error files downloaded.
+        """
+        self.server.errors = [500]
+        job = create_batch_job(self.make_client(OpenAIClient, 'gpt-4'))
+        results = self.run_job(job, ["first prompt here", "second prompt here"])
+
+        batch = json.loads(self.posted(OPENAI_BATCHES_PATH)[0]["body"])
+        self.assertEqual(batch["endpoint"], "/v1/chat/completions")
+        uploaded = [json.loads(line) for line in self.server.files[batch["input_file_id"]].splitlines()]
+        self.assertEqual([record["url"] for record in uploaded], ["/v1/chat/completions"] * 2)
+        self.assertEqual(uploaded[0]["body"]["model"], 'gpt-4')
+        self.assertEqual(results["0"], (None, None, "injected 500"))
+        self.assertEqual(results["1"][0].strip(), "second prompt here")
+        self.assertGreater(results["1"][1]["input_tokens"], 0)
+
+    def test_wait_polls_until_done(self):
+        """
+        Test that the batch is polled until done, and that the wait can time out.
+        """
+        self.server.batch_polls = 4
+        job = create_batch_job(self.make_client(AnthropicClient, 'claude-3-haiku-20240307'))
+        job.submit([("0", job.build_request("hello"))])
+        polls = []
+        job.wait(poll_interval=0.001, on_poll=polls.append)
+        self.assertEqual([batch["processing_status"] for batch in polls], ["in_progress", "in_progress", "ended"])
+
+        self.server.batch_polls = 1000
+        job.submit([("0", job.build_request("hello"))])
+        with self.assertRaises(TimeoutError):
+            job.wait(poll_interval=0.01, timeout=0.05)
+
+    def test_batch_pricing(self):
+        """
+        Test that the batch requests are billed at half price.
+        """
+        pricing_model = PricingModel()
+        token_usage = {"input_tokens": 1000, "output_tokens": 500}
+        self.assertAlmostEqual(pricing_model.get_usage_cost('gpt-4', token_usage, batch=True),
+                               pricing_model.get_usage_cost('gpt-4', token_usage) / 2)
+
+    def test_run_provider_batch_resumes_the_same_batch(self):
+        """
+        Test that an interrupted provider batch is waited for again instead of being submitted twice.
+        """
+        output_path = os.path.join(self.directory.name, 'results.jsonl')
+        state_path = output_path + '.batch.json'
+        job = create_batch_job(self.make_client(OpenAIClient, 'gpt-4'))
+        lines = '{"id": "a", "prompt": "alpha prompt"}\n{"id": "b", "prompt": "beta prompt"}\n'
+
+        def interrupt(batch):
+            raise KeyboardInterrupt
+
+        with open(output_path, 'a', encoding='utf-8') as output_file:
+            with self.assertRaises(KeyboardInterrupt):
+                run_provider_batch(job, io.StringIO(lines), output_file, state_path=state_path, on_poll=interrupt)
+        self.assertTrue(os.path.exists(state_path))
+
+        job = create_batch_job(self.make_client(OpenAIClient, 'gpt-4'))
+        with open(output_path, 'a', encoding='utf-8') as output_file:
+            summary = run_provider_batch(job, io.StringIO(lines), output_file, state_path=state_path, poll_interval=0)
+
+        self.assertEqual(len(self.posted(OPENAI_BATCHES_PATH)), 1)
+        self.assertFalse(os.path.exists(state_path))
+        self.assertEqual(load_completed_ids(output_path), {"a", "b"})
+        with open(output_path, 'r', encoding='utf-8') as f:
+            result = json.loads(f.readline())
+        self.assertEqual(result["batch_id"], job.batch_id)
+        self.assertAlmostEqual(result["cost"], PricingModel().get_usage_cost('gpt-4', result["token_usage"], batch=True))
+        self.assertEqual((summary["done"], summary["failed"]), (2, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
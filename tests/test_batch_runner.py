@@ -0,0 +1,122 @@
+import io
+import os
+import json
+import asyncio
+import tempfile
+import unittest
+from api_clients.async_client import AsyncAnthropicClient, create_async_http_client
+from api_clients.request_scheduler import RequestScheduler
+from utils.batch_runner import BatchRunner, parse_prompt_line, load_completed_ids, open_batch_output
+from tests.mock_provider_server import MockProviderServer
+
+
+class TestBatchRunner(unittest.TestCase):
+    """
+    This class contains unit tests for the batch mode, against the local mock provider server.
+    """
+
+    def setUp(self):
+        self.server = MockProviderServer(response_tokens=3, retry_after=0).start()
+        self.directory = tempfile.TemporaryDirectory()
+        self.output_path = os.path.join(self.directory.name, 'results.jsonl')
+
+    def tearDown(self):
+        self.server.stop()
+        self.directory.cleanup()
+
+    def client_factory(self, http_client):
+        ai_chatbot = AsyncAnthropicClient(api_key='test-api-key', api_url=self.server.anthropic_url, session=http_client)
+        ai_chatbot.model = 'claude-3-haiku-20240307'
+        ai_chatbot.scheduler = RequestScheduler('test-api-key', base_delay=0, max_delay=0)
+        return ai_chatbot
+
+    def run_batch(self, lines, concurrency=4, resume=True):
+        async def run():
+            runner = BatchRunner(self.client_factory, concurrency=concurrency)
+            completed_ids = load_completed_ids(self.output_path) if resume else set()
+            with open_batch_output(self.output_path, resume=resume) as output_file:
+                async with create_async_http_client() as http_client:
+                    return await runner.run(io.StringIO('\n'.join(lines) + '\n'), output_file, http_client, completed_ids)
+        return asyncio.run(run())
+
+    def read_results(self):
+        with open(self.output_path, 'r', encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def test_parse_prompt_line(self):
+        """
+        Test that JSON objects and plain text lines are accepted, and blank lines ignored.
+        """
+        self.assertEqual(parse_prompt_line('{"id": 7, "prompt": "hi"}', 1), {"id": "7", "prompt": "hi"})
+        self.assertEqual(parse_prompt_line('hello there\n', 3), {"id": "3", "prompt": "hello there"})
+        self.assertIsNone(parse_prompt_line('  \n', 4))
+        with self.assertRaises(ValueError):
+            parse_prompt_line('{"text": "no prompt"}', 5)
+
+    def test_results_have_usage_and_cost(self):
+        """
+        Test that every prompt gets a result with its response, token usage and cost.
+        """
+        lines = [json.dumps({"id": f"q{i}", "prompt": f"question{i} about batching"}) for i in range(10)]
+        summary = self.run_batch(lines)
+
+        results = {result["id"]: result for result in self.read_results()}
+        self.assertEqual(sorted(results), sorted(f"q{i}" for i in range(10)))
+        self.assertEqual(results["q3"]["response"].strip(), "question3 about batching")
+        self.assertEqual(results["q3"]["token_usage"]["output_tokens"], 3)
+        self.assertGreater(results["q3"]["cost"], 0)
+        self.assertIsNone(results["q3"]["error"])
+        self.assertEqual((summary["done"], summary["failed"], summary["skipped"]), (10, 0, 0))
+        self.assertAlmostEqual(summary["cost"], sum(result["cost"] for result in results.values()))
+
+    def test_malformed_line_is_recorded(self):
+        """
+        Test that a line that isn't a valid item gets an error record, and the other prompts are still sent.
+        """
+        summary = self.run_batch(["first prompt", '{"text": "no prompt"}', "third prompt"], concurrency=1)
+
+        results = {result["id"]: result for result in self.read_results()}
+        self.assertIn('"prompt"', results["2"]["error"])
+        self.assertIsNone(results["3"]["error"])
+        self.assertEqual((summary["done"], summary["failed"]), (2, 1))
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_each_prompt_is_a_separate_conversation(self):
+        """
+        Test that the prompts don't share a chat history.
+        """
+        self.run_batch(["first prompt", "second prompt"], concurrency=1)
+        bodies = [json.loads(request["body"]) for request in self.server.requests]
+        self.assertEqual([len(body["messages"]) for body in bodies], [1, 1])
+
+    def test_resume_skips_answered_prompts_and_retries_failures(self):
+        """
+        Test that running the batch again only sends the prompts that failed or were not answered.
+        """
+        self.server.errors = [400]
+        lines = ["alpha prompt", "beta prompt", "gamma prompt"]
+        summary = self.run_batch(lines, concurrency=1)
+        self.assertEqual((summary["done"], summary["failed"]), (2, 1))
+
+        # a result truncated by an interruption is ignored
+        with open(self.output_path, 'a', encoding='utf-8') as f:
+            f.write('{"id": "4", "resp')
+        self.server.requests.clear()
+        summary = self.run_batch(lines + ["delta prompt"], concurrency=1)
+
+        self.assertEqual((summary["done"], summary["failed"], summary["skipped"]), (2, 0, 2))
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(load_completed_ids(self.output_path), {"1", "2", "3", "4"})
+
+    def test_no_resume_starts_over(self):
+        """
+        Test that without resume the output is replaced and every prompt is sent.
+        """
+        self.run_batch(["alpha prompt"])
+        summary = self.run_batch(["alpha prompt"], resume=False)
+        self.assertEqual(summary["done"], 1)
+        self.assertEqual(len(self.read_results()), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
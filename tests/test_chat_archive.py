@@ -0,0 +1,78 @@
+import unittest
+from api_clients.anthropic_client import AnthropicClient
+from utils.chat_archive import ChatArchive, parse_search_command, to_match_query
+
+
+def conversation(*texts, day='2024-05-02'):
+    senders = ['user', 'assistant']
+    return [{"sender": senders[i % 2], "text": text, "timestamp": f"{day} 10:00:0{i}"} for i, text in enumerate(texts)]
+
+
+class TestChatArchive(unittest.TestCase):
+    """
+    This class contains unit tests for the searchable chat archive.
+    """
+
+    def setUp(self):
+        self.archive = ChatArchive(':memory:')
+        self.first = self.archive.archive_session(
+            'first', conversation('How do I retry failed HTTP requests?', 'Use an exponential backoff.'),
+            chatbot='OpenAIClient', model='gpt-4', cost=0.2)
+        self.second = self.archive.archive_session(
+            'second', conversation('Write a retry decorator', 'Here is a decorator retrying requests.', day='2024-06-10'),
+            chatbot='AnthropicClient', model='claude-3-haiku-20240307', cost=0.01)
+
+    def tearDown(self):
+        self.archive.close()
+
+    def test_full_text_search(self):
+        """
+        Test that all the words must match, with stemming, and that punctuation is harmless.
+        """
+        results = self.archive.search('retrying request')
+        self.assertEqual({result["session_id"] for result in results}, {self.first, self.second})
+        self.assertEqual(self.archive.search('backoff "exponential" (AND)'), [])
+        self.assertEqual(self.archive.search('exponential backoff')[0]["session_id"], self.first)
+        self.assertEqual(self.archive.search(''), [])
+
+    def test_filters(self):
+        """
+        Test the model, date and cost filters.
+        """
+        self.assertEqual({r["session_id"] for r in self.archive.search('retry', model='claude')}, {self.second})
+        self.assertEqual({r["session_id"] for r in self.archive.search('retry', since='2024-06-01')}, {self.second})
+        self.assertEqual({r["session_id"] for r in self.archive.search('retry', until='2024-05-02')}, {self.first})
+        self.assertEqual({r["session_id"] for r in self.archive.search('retry', mincost=0.1)}, {self.first})
+        self.assertEqual({r["session_id"] for r in self.archive.search('retry', maxcost=0.1)}, {self.second})
+
+    def test_archiving_again_replaces_the_session(self):
+        """
+        Test that saving a session again replaces it, including in the full-text index.
+        """
+        self.archive.archive_session('first', conversation('Something else entirely', 'ok'), model='gpt-4', cost=0.3)
+        self.assertEqual({r["session_id"] for r in self.archive.search('exponential')}, set())
+        self.assertEqual(len(self.archive.search('entirely')), 1)
+
+    def test_load_session_as_context(self):
+        """
+        Test that a past conversation can be added to a client's chat history.
+        """
+        session = self.archive.get_session(self.first)
+        client = AnthropicClient(api_key='key', api_url='https://api.anthropic.com/v1/messages')
+        client.extend_chat_history(session["messages"])
+        self.assertEqual([m["text"] for m in client.chat_history["messages"]],
+                         ['How do I retry failed HTTP requests?', 'Use an exponential backoff.'])
+        self.assertEqual(len(client.message_buffer), 2)
+
+    def test_parse_search_command(self):
+        """
+        Test the parsing of the in-chat /search arguments.
+        """
+        query, filters = parse_search_command('retry backoff model:gpt-4 since:2024-05-01 maxcost:0.5 mincost:abc')
+        self.assertEqual(query, 'retry backoff')
+        self.assertEqual(filters, {'model': 'gpt-4', 'since': '2024-05-01', 'maxcost': 0.5})
+        self.assertEqual(to_match_query('retr* "x" OR'), '"retr"* "x" "OR"')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,199 @@
+import os
+import json
+import asyncio
+import tempfile
+import unittest
+from unittest.mock import patch
+import httpx
+from core.chat_engine import ChatEngine
+from server.chat_server import ChatServer
+from server.http_protocol import read_request
+from server.websocket import OPCODE_TEXT, OPCODE_CLOSE, encode_frame, read_frame
+from utils.config import Config
+from tests.mock_provider_server import MockProviderServer
+
+
+class TestChatServer(unittest.TestCase):
+    """
+    This class contains unit tests for the chat server, against the mock provider server.
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.provider = MockProviderServer(response_tokens=3).start()
+        config = Config({"ANTHROPIC_API_KEY": "key", "ANTHROPIC_API_URL": self.provider.anthropic_url,
+                         "OPENAI_API_URL": ""})
+        self.engine = ChatEngine(config)
+        self.journal_dir = patch('utils.session_journal.CHAT_JOURNAL_DIR', self.tmp.name)
+        self.journal_dir.start()
+
+    def tearDown(self):
+        self.journal_dir.stop()
+        self.provider.stop()
+        self.tmp.cleanup()
+
+    def run_server(self, scenario, **kwargs):
+        async def run():
+            server = ChatServer(self.engine, host='127.0.0.1', port=0, **kwargs)
+            await server.start()
+            try:
+                async with httpx.AsyncClient(base_url=server.url) as client:
+                    return await scenario(server, client)
+            finally:
+                await server.close()
+        return asyncio.run(run())
+
+    def test_sessions_over_http(self):
+        """
+        Test that concurrent sessions keep separate histories and usage, and that a streamed
+        response is sent as server-sent events.
+        """
+        async def scenario(server, client):
+            first = (await client.post('/sessions', json={"provider": "anthropic"})).json()["session"]
+            second = (await client.post('/sessions', json={})).json()["session"]
+            answers = await asyncio.gather(
+                client.post(f'/sessions/{first["id"]}/messages', json={"text": "alpha beta gamma"}),
+                client.post(f'/sessions/{second["id"]}/messages', json={"text": "delta epsilon"}))
+            streamed = await client.post(f'/sessions/{first["id"]}/messages', json={"text": "zeta eta", "stream": True})
+            state = (await client.get(f'/sessions/{first["id"]}')).json()
+            listed = (await client.get('/sessions')).json()["sessions"]
+            return first, second, [answer.json() for answer in answers], streamed, state, listed
+
+        first, second, answers, streamed, state, listed = self.run_server(scenario)
+        self.assertNotEqual(first["id"], second["id"])
+        self.assertEqual(answers[0]["response"], 'alpha beta gamma ')
+        self.assertEqual(answers[1]["response"], 'delta epsilon delta ')
+        self.assertEqual(answers[0]["usage"]["output_tokens"], 3)
+
+        self.assertEqual(streamed.headers["content-type"], 'text/event-stream')
+        events = [block.split('\n') for block in streamed.text.strip().split('\n\n')]
+        self.assertEqual(''.join(json.loads(lines[1][len('data: '):])["text"] for lines in events if lines[0] == 'event: delta'),
+                         'zeta eta zeta ')
+        self.assertEqual(events[-1][0], 'event: done')
+
+        self.assertEqual([message["text"] for message in state["messages"]],
+                         ['alpha beta gamma', 'alpha beta gamma ', 'zeta eta', 'zeta eta zeta '])
+        self.assertEqual(state["session"]["turns"], 2)
+        self.assertEqual(len(listed), 2)
+
+    def test_sessions_survive_a_restart(self):
+        """
+        Test that a session is reloaded from its journal, with its history and usage, by a new server.
+        """
+        async def first_run(server, client):
+            session = (await client.post('/sessions', json={})).json()["session"]
+            await client.post(f'/sessions/{session["id"]}/messages', json={"text": "remember this"})
+            return session["id"]
+
+        async def second_run(server, client):
+            return (await client.get(f'/sessions/{session_id}')).json(), (await client.get('/sessions/unknown')).status_code
+
+        session_id = self.run_server(first_run)
+        self.assertTrue(os.path.exists(os.path.join(self.tmp.name, f'session_{session_id}.jsonl')))
+        state, missing_status = self.run_server(second_run)
+        self.assertEqual([message["text"] for message in state["messages"]], ['remember this', 'remember this remember '])
+        self.assertEqual(state["session"]["usage"]["output_tokens"], 3)
+        self.assertEqual(state["session"]["chatbot"], 'AsyncAnthropicClient')
+        self.assertEqual(missing_status, 404)
+
+    def test_websocket_chat(self):
+        """
+        Test a conversation over a WebSocket: deltas then the usage of each turn, and that the session
+        isn't unloaded while the WebSocket is open.
+        """
+        async def scenario(server, client):
+            session_id = (await client.post('/sessions', json={})).json()["session"]["id"]
+            reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+            writer.write((f'GET /sessions/{session_id}/ws HTTP/1.1\r\nHost: localhost\r\nUpgrade: websocket\r\n'
+                          'Connection: Upgrade\r\nSec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n'
+                          'Sec-WebSocket-Version: 13\r\n\r\n').encode('latin-1'))
+            handshake = await reader.readuntil(b'\r\n\r\n')
+            # idle for longer than the idle timeout, with the WebSocket open
+            await asyncio.sleep(1.3)
+            loaded = session_id in server.sessions
+
+            messages = []
+            writer.write(encode_frame(OPCODE_TEXT, json.dumps({"text": "hello there"}).encode('utf-8'), mask=True))
+            while not messages or messages[-1]["type"] != 'done':
+                _, _, payload = await read_frame(reader)
+                messages.append(json.loads(payload))
+            writer.write(encode_frame(OPCODE_CLOSE, b'\x03\xe8', mask=True))
+            _, opcode, _ = await read_frame(reader)
+            writer.close()
+            return handshake, messages, opcode, loaded
+
+        handshake, messages, opcode, loaded = self.run_server(scenario, idle_timeout=0.1)
+        self.assertTrue(loaded)
+        self.assertIn(b'101 Switching Protocols', handshake)
+        self.assertIn(b's3pPLMBiTxaQ9kYGzzhZRbK+xOo=', handshake)
+        self.assertEqual(''.join(message["text"] for message in messages if message["type"] == 'delta'), 'hello there hello ')
+        self.assertEqual(messages[-1]["usage"]["output_tokens"], 3)
+        self.assertEqual(opcode, OPCODE_CLOSE)
+
+    def test_assistant_session_survives_unloading(self):
+        """
+        Test that a CodingAssistant session unloaded for being idle is reloaded with its assistant, its
+        tools and its fallback model.
+        """
+        project = os.path.join(self.tmp.name, 'project')
+        os.makedirs(project)
+        with open(os.path.join(project, 'app.py'), 'w') as f:
+            f.write('def main():\n    pass\n')
+        fallback_model = self.engine.registry.models('anthropic')[1]
+
+        async def scenario(server, client):
+            created = (await client.post('/sessions', json={"assistant": "CodingAssistant", "tasks": "review",
+                                                             "project_folder": project, "lazy": True,
+                                                             "failover_model": fallback_model})).json()
+            session_id = created["session"]["id"]
+            await asyncio.sleep(1.3)
+            unloaded = session_id not in server.sessions
+            state = (await client.get(f'/sessions/{session_id}')).json()
+            refreshed = (await client.post(f'/sessions/{session_id}/messages', json={"text": "/refresh"})).json()
+            return unloaded, state, refreshed, server.sessions[session_id].session
+
+        with patch('assistants.coding_assistant.PROJECT_CACHE', False), patch('builtins.print'):
+            unloaded, state, refreshed, session = self.run_server(scenario, idle_timeout=0.1)
+        self.assertTrue(unloaded)
+        self.assertEqual(state["session"]["assistant"], 'CodingAssistant')
+        self.assertEqual(len(state["messages"]), 2)
+        self.assertEqual(refreshed["notice"], 'No project file changed.')
+        self.assertEqual(session.assistant.tasks, ['review'])
+        self.assertEqual(session.ai_chatbot.tools.call('list_dir', {}), 'app.py')
+        self.assertEqual(session.ai_chatbot.fallback.model, fallback_model)
+
+    def test_errors_and_authentication(self):
+        """
+        Test the token authentication and the error responses.
+        """
+        async def scenario(server, client):
+            unauthorized = await client.get('/sessions')
+            headers = {"Authorization": "Bearer secret"}
+            created = await client.post('/sessions', json={"provider": "unknown"}, headers=headers)
+            missing = await client.post('/sessions/nope/messages', json={"text": "hi"}, headers=headers)
+            not_allowed = await client.put('/sessions', headers=headers)
+            health = await client.get('/health?token=secret')
+            return [response.status_code for response in (unauthorized, created, missing, not_allowed, health)], created.json()
+
+        statuses, created = self.run_server(scenario, token='secret')
+        self.assertEqual(statuses, [401, 400, 404, 405, 200])
+        self.assertIn('unknown', created["error"])
+
+    def test_read_request(self):
+        """
+        Test that a request is parsed from the stream, and that a closed connection gives None.
+        """
+        async def run():
+            reader = asyncio.StreamReader()
+            reader.feed_data(b'POST /sessions?x=1 HTTP/1.1\r\nContent-Length: 2\r\nConnection: close\r\n\r\n{}')
+            reader.feed_eof()
+            return await read_request(reader), await read_request(reader)
+
+        request, closed = asyncio.run(run())
+        self.assertEqual((request.method, request.path, request.query, request.json()), ('POST', '/sessions', {"x": "1"}, {}))
+        self.assertFalse(request.keep_alive)
+        self.assertIsNone(closed)
+
+
+if __name__ == '__main__':
+    unittest.main()
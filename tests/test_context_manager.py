@@ -0,0 +1,79 @@
+import json
+import unittest
+from unittest.mock import patch
+from api_clients.anthropic_client import AnthropicClient
+from api_clients.openai_client import OpenAIClient
+from api_clients.context_manager import ContextWindowManager
+
+
+class TestContextWindowManager(unittest.TestCase):
+    """
+    This class contains unit tests for the context window manager.
+    """
+
+    def make_client(self, client_class=AnthropicClient, strategy='truncate'):
+        client = client_class(api_key='key', api_url='https://api.example.com/v1')
+        client.model = 'test-model'
+        # 1000 tokens window, 90% budget minus the max_tokens of the client
+        client.context_manager = ContextWindowManager(strategy=strategy, context_windows={'test-model': 1000 + 2000 / 0.9})
+        return client
+
+    def test_history_within_budget_is_kept(self):
+        """
+        Test that nothing is compacted while the history fits in the budget.
+        """
+        client = self.make_client()
+        client.update_chat_history('a' * 400, 'b' * 400)
+        self.assertEqual(client.context_manager.compact(client, 'hello'), [])
+        self.assertEqual(len(client.chat_history["messages"]), 2)
+
+    def test_truncate_oldest_turns(self):
+        """
+        Test that the oldest turns are moved out of the history, keeping the pinned context and the last turn.
+        """
+        client = self.make_client()
+        client.update_chat_history('project ' * 100, 'plan', cache=True)
+        for i in range(5):
+            client.update_chat_history(f'{i}' * 800, f'{i}' * 800)
+
+        compacted = client.context_manager.compact(client, 'next')
+
+        texts = [message["text"][0] for message in client.chat_history["messages"]]
+        self.assertEqual(texts, ['p', 'p', '4', '4'])
+        self.assertEqual(len(compacted), 8)
+        self.assertEqual(client.chat_history["compacted_messages"], compacted)
+
+    def test_summarize_compacted_turns(self):
+        """
+        Test that the compacted turns are replaced by a summary sent as the system prompt.
+        """
+        client = self.make_client(strategy='summarize')
+        for i in range(3):
+            client.update_chat_history(f'{i}' * 1600, f'{i}' * 1600)
+
+        usage = {"input_tokens": 100, "output_tokens": 10}
+        with patch.object(client, 'complete', return_value=('we talked about numbers', usage)) as complete:
+            self.assertEqual(client.context_manager.fit(client, 'next'), usage)
+
+        self.assertIn('0000', complete.call_args.args[0])
+        self.assertEqual(client.chat_history["summary"], 'we talked about numbers')
+        data = json.loads(client._encode_request('next'))
+        self.assertIn('we talked about numbers', data['system'])
+        self.assertEqual(len(data['messages']), 3)
+
+    def test_openai_summary_system_message(self):
+        """
+        Test that the OpenAI client sends the summary as a leading system message.
+        """
+        client = self.make_client(OpenAIClient)
+        client.chat_history["summary"] = 'earlier summary'
+        client.update_chat_history('question', 'answer')
+
+        messages = json.loads(client._encode_request('next'))['messages']
+
+        self.assertEqual(messages[0]['role'], 'system')
+        self.assertEqual(messages[1]['content'], 'question')
+
+
+if __name__ == '__main__':
+    unittest.main()
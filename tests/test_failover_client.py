@@ -0,0 +1,207 @@
+import time
+import asyncio
+import tempfile
+import unittest
+import httpx
+from api_clients.anthropic_client import AnthropicClient
+from api_clients.openai_client import OpenAIClient
+from api_clients.async_client import AsyncAnthropicClient, AsyncOpenAIClient
+from api_clients.failover_client import FailoverClient, AsyncFailoverClient, LatencyTracker
+from api_clients.model_registry import get_model_registry
+from utils.session_journal import SessionJournal, load_journal
+from tests.mock_provider_server import MockProviderServer
+
+
+class TestFailoverClient(unittest.TestCase):
+    """
+    This class contains unit tests for the hedged requests and the failover, against the mock provider server.
+    """
+
+    def setUp(self):
+        self.anthropic_model = get_model_registry().models('anthropic')[0]
+        self.openai_model = get_model_registry().models('openai')[0]
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.stop()
+
+    def start_server(self, **kwargs):
+        server = MockProviderServer(response_tokens=3, **kwargs).start()
+        self.servers.append(server)
+        return server
+
+    def create_router(self, primary_server, fallback_server, tracker=None, **kwargs):
+        primary = AnthropicClient(api_key='key', api_url=primary_server.anthropic_url)
+        primary.model = self.anthropic_model
+        fallback = OpenAIClient(api_key='key', api_url=fallback_server.openai_url)
+        fallback.model = self.openai_model
+        return FailoverClient(primary, fallback, tracker or LatencyTracker(min_samples=5, initial_delay=5), **kwargs)
+
+    def test_primary_answers(self):
+        """
+        Test that a request answered in time isn't hedged, and that its turn is journaled once.
+        """
+        primary_server, fallback_server = self.start_server(), self.start_server()
+        router = self.create_router(primary_server, fallback_server)
+        with tempfile.TemporaryDirectory() as tmp:
+            router.journal = SessionJournal.create('AnthropicClient', self.anthropic_model, directory=tmp)
+            deltas = list(router.stream_request('alpha beta'))
+            response, token_usage = router.send_request('gamma delta')
+            router.journal.close()
+            _, journaled = load_journal(router.journal.path)
+
+        self.assertEqual(''.join(deltas), 'alpha beta alpha ')
+        self.assertEqual(response, 'gamma delta gamma ')
+        self.assertEqual(token_usage["output_tokens"], 3)
+        self.assertEqual(router.responding_model, self.anthropic_model)
+        self.assertEqual([message.text for message in router.chat_history["messages"]],
+                         ['alpha beta', 'alpha beta alpha ', 'gamma delta', 'gamma delta gamma '])
+        self.assertEqual(len(journaled), 4)
+        self.assertEqual(len(fallback_server.requests), 0)
+
+    def test_hedged_request(self):
+        """
+        Test that a request slower than the hedge delay is raced against the fallback model, which answers,
+        and that the late response of the primary model is discarded.
+        """
+        primary_server, fallback_server = self.start_server(latency=1.0), self.start_server()
+        tracker = LatencyTracker(min_samples=5, initial_delay=0.05)
+        router = self.create_router(primary_server, fallback_server, tracker)
+        deltas = list(router.stream_request('alpha beta'))
+
+        self.assertEqual(''.join(deltas), 'alpha beta alpha ')
+        self.assertEqual(router.responding_model, self.openai_model)
+        self.assertEqual(len(router.chat_history["messages"]), 2)
+        self.assertEqual(router.last_token_usage["output_tokens"], 3)
+        self.assertEqual(len(fallback_server.requests), 1)
+        # the primary model was at least as slow as the fallback one
+        summary = tracker.summary()
+        self.assertEqual(summary[f"{self.anthropic_model} (stream)"]["count"], 1)
+        self.assertEqual(summary[f"{self.openai_model} (stream)"]["count"], 1)
+
+        # the late primary request doesn't touch the history of the next turn
+        router.hedge = False
+        response, _ = router.send_request('gamma')
+        self.assertEqual(response, 'gamma gamma gamma ')
+        self.assertEqual([message.text for message in router.chat_history["messages"]],
+                         ['alpha beta', 'alpha beta alpha ', 'gamma', 'gamma gamma gamma '])
+        # the tokens of the request that lost are reported
+        self.assertEqual([model for model, _ in router.pop_lost_usage()], [self.anthropic_model])
+        self.assertEqual(router.pop_lost_usage(), [])
+
+    def test_hedged_request_not_streamed(self):
+        """
+        Test that the request that lost a race isn't waited for by the next turn, and that its tokens
+        are reported once it's done.
+        """
+        primary_server, fallback_server = self.start_server(latency=1.0), self.start_server()
+        router = self.create_router(primary_server, fallback_server, LatencyTracker(min_samples=5, initial_delay=0.05))
+        response, _ = router.send_request('alpha beta')
+        self.assertEqual(response, 'alpha beta alpha ')
+
+        # the next request of the primary model is fast, the one that lost is still running
+        primary_server.latency = 0.0
+        router.hedge = False
+        start = time.perf_counter()
+        router.send_request('gamma')
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertEqual(router.pop_lost_usage(), [])
+
+        deadline = time.perf_counter() + 5
+        while not router._lost_usage and time.perf_counter() < deadline:
+            time.sleep(0.05)
+        (model, token_usage), = router.pop_lost_usage()
+        self.assertEqual((model, token_usage["output_tokens"]), (self.anthropic_model, 3))
+        self.assertEqual([message.text for message in router.chat_history["messages"]],
+                         ['alpha beta', 'alpha beta alpha ', 'gamma', 'gamma gamma gamma '])
+
+    def test_failover(self):
+        """
+        Test that a failed request is sent to the fallback model, and that the error is raised once both fail.
+        """
+        primary_server, fallback_server = self.start_server(errors=[400, 400]), self.start_server()
+        router = self.create_router(primary_server, fallback_server, hedge=False)
+        response, _ = router.send_request('alpha beta')
+        self.assertEqual(response, 'alpha beta alpha ')
+        self.assertEqual(router.responding_model, self.openai_model)
+
+        fallback_server.errors = [400]
+        with self.assertRaises(Exception):
+            router.send_request('gamma')
+        self.assertEqual(len(router.chat_history["messages"]), 2)
+        # the usage of the previous turn isn't reported again
+        self.assertIsNone(router.last_token_usage)
+
+    def test_latency_tracker(self):
+        """
+        Test that the hedge delay is the initial delay until enough latencies are known, then their percentile.
+        """
+        tracker = LatencyTracker(percentile=0.9, min_samples=3, initial_delay=7)
+        tracker.record('model', True, 0.1)
+        tracker.record('model', True, 0.2)
+        self.assertEqual(tracker.hedge_delay('model', True), 7)
+        for seconds in (0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0):
+            tracker.record('model', True, seconds)
+        self.assertAlmostEqual(tracker.hedge_delay('model', True), 0.9, delta=0.1)
+        self.assertEqual(tracker.hedge_delay('model', False), 7)
+
+    def test_async_hedged_request(self):
+        """
+        Test that the async router hedges a slow request, and cancels the primary one.
+        """
+        primary_server, fallback_server = self.start_server(latency=1.0), self.start_server()
+
+        async def run():
+            async with httpx.AsyncClient() as http_client:
+                primary = AsyncAnthropicClient(api_key='key', api_url=primary_server.anthropic_url, session=http_client)
+                primary.model = self.anthropic_model
+                fallback = AsyncOpenAIClient(api_key='key', api_url=fallback_server.openai_url, session=http_client)
+                fallback.model = self.openai_model
+                router = AsyncFailoverClient(primary, fallback, LatencyTracker(min_samples=5, initial_delay=0.05))
+                response = await router.send_request('alpha beta')
+                deltas = [delta async for delta in router.stream_request('gamma')]
+                return router, response, deltas
+
+        router, (response, token_usage), deltas = asyncio.run(run())
+        self.assertEqual(response, 'alpha beta alpha ')
+        self.assertEqual(''.join(deltas), 'gamma gamma gamma ')
+        self.assertEqual(router.responding_model, self.openai_model)
+        self.assertEqual(len(router.chat_history["messages"]), 4)
+
+    def test_async_lost_usage(self):
+        """
+        Test that the async router reports the tokens of the requests that lost: a streamed one cancelled
+        after its first events, and one not streamed left to finish.
+        """
+        # the primary stream has sent its first events, but not its first token, when the fallback one answers
+        primary_server, fallback_server = self.start_server(latency=0.3, token_rate=2), self.start_server(latency=0.4)
+
+        async def run():
+            async with httpx.AsyncClient() as http_client:
+                primary = AsyncAnthropicClient(api_key='key', api_url=primary_server.anthropic_url, session=http_client)
+                primary.model = self.anthropic_model
+                fallback = AsyncOpenAIClient(api_key='key', api_url=fallback_server.openai_url, session=http_client)
+                fallback.model = self.openai_model
+                router = AsyncFailoverClient(primary, fallback, LatencyTracker(min_samples=5, initial_delay=0.05))
+                deltas = [delta async for delta in router.stream_request('alpha beta')]
+                # the cancelled task records its usage once it runs again
+                await asyncio.sleep(0.1)
+                streamed = router.pop_lost_usage()
+                fallback_server.latency = 0.0
+                response, _ = await router.send_request('gamma')
+                await asyncio.sleep(0.6)
+                return router, deltas, streamed, response, router.pop_lost_usage()
+
+        router, deltas, streamed, response, not_streamed = asyncio.run(run())
+        self.assertEqual(''.join(deltas), 'alpha beta alpha ')
+        self.assertEqual(response, 'gamma gamma gamma ')
+        self.assertEqual([model for model, _ in streamed], [self.anthropic_model])
+        self.assertGreater(streamed[0][1]["input_tokens"], 0)
+        self.assertEqual([(model, token_usage["output_tokens"]) for model, token_usage in not_streamed],
+                         [(self.anthropic_model, 3)])
+        self.assertEqual(len(router.chat_history["messages"]), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+from unittest.mock import patch, Mock
+from api_clients.anthropic_client import AnthropicClient
+from api_clients.openai_client import OpenAIClient
+from api_clients.http_session import get_session, DEFAULT_TIMEOUT
+
+
+class TestHTTPSession(unittest.TestCase):
+    """
+    This class contains unit tests for the pooled HTTP session shared by the API clients.
+    """
+
+    def test_clients_share_session(self):
+        """
+        Test that all the provider clients reuse the same pooled session.
+        """
+        anthropic_client = AnthropicClient(api_key='test-api-key', api_url='https://api.anthropic.com/v1/messages')
+        openai_client = OpenAIClient(api_key='test-api-key', api_url='https://api.openai.com/v1/chat/completions')
+
+        self.assertIs(anthropic_client.session, openai_client.session)
+        self.assertIs(anthropic_client.session, get_session())
+
+    def test_pool_size(self):
+        """
+        Test that the session adapter uses the configured pool size.
+        """
+        session = get_session(pool_size=3)
+        adapter = session.get_adapter('https://api.anthropic.com')
+        self.assertEqual(adapter._pool_maxsize, 3)
+
+    @patch('requests.Session.post')
+    def test_send_request_uses_timeout(self, mock_post):
+        """
+        Test that the requests are sent through the session with the connect/read timeouts.
+        """
+        mock_response = Mock(status_code=200, headers={})
+        mock_response.json.return_value = {"content": [{"type": "text", "text": "Hi"}], "usage": {}}
+        mock_post.return_value = mock_response
+
+        client = AnthropicClient(api_key='test-api-key', api_url='https://api.anthropic.com/v1/messages')
+        client.send_request('Hello')
+
+        self.assertEqual(mock_post.call_args.kwargs['timeout'], DEFAULT_TIMEOUT)
+
+    @patch('api_clients.base_client.threading.Thread')
+    @patch('requests.Session.head')
+    def test_warm_up(self, mock_head, mock_thread):
+        """
+        Test that the warm-up opens a connection to the API host and is skipped when the connection was just used.
+        """
+        client = AnthropicClient(api_key='test-api-key', api_url='https://api.anthropic.com/v1/messages')
+        client.warm_up()
+        client.warm_up()
+        self.assertEqual(mock_thread.call_count, 1)
+
+        client._warm_up()
+        self.assertEqual(mock_head.call_args.args[0], 'https://api.anthropic.com/')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+from utils import input_utils
+from utils.file_watcher import FileWatcher, PollingBackend
+
+
+class TestFileWatcher(unittest.TestCase):
+    """
+    This class contains unit tests for the file watcher used by the editor mode.
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'prompt.md')
+        with open(self.path, 'w') as f:
+            f.write('')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def append_later(self, text):
+        def append():
+            with open(self.path, 'a') as f:
+                f.write(text)
+        timer = threading.Timer(0.05, append)
+        timer.start()
+        return timer
+
+    def check_watcher(self, use_inotify):
+        with FileWatcher(self.path, use_inotify=use_inotify) as watcher:
+            timer = self.append_later('hello\nsend\n')
+            self.assertTrue(watcher.wait_for(lambda: input_utils.has_marker(self.path), timeout=5))
+            timer.join()
+            self.assertFalse(watcher.wait_for(lambda: False, timeout=0.05))
+        self.assertEqual(input_utils.read_prompt_file(self.path), 'hello')
+
+    def test_inotify_watcher(self):
+        """
+        Test that the watcher wakes up when the marker is written (inotify on Linux).
+        """
+        self.check_watcher(use_inotify=True)
+
+    def test_polling_watcher(self):
+        """
+        Test the polling fallback.
+        """
+        watcher = FileWatcher(self.path, use_inotify=False)
+        self.assertIsInstance(watcher.backend, PollingBackend)
+        watcher.close()
+        self.check_watcher(use_inotify=False)
+
+
+class TestEditorMode(unittest.TestCase):
+    """
+    This class contains unit tests for the editor mode.
+    """
+
+    def test_blocking_editor_mode(self):
+        """
+        Test that the blocking mode runs $EDITOR on a per-session file and returns what was written.
+        """
+        editor = "sh -c 'printf \"fix the bug\\n\" > \"$0\"'"
+        with patch.object(input_utils, 'PROMPT_EDITOR_MODE', 'blocking'), \
+                patch.dict(os.environ, {'PROMPT_EDITOR': '', 'EDITOR': editor}), \
+                patch('builtins.input', return_value='e'), patch('builtins.print'):
+            self.assertEqual(input_utils.get_user_input(), 'fix the bug')
+            path = input_utils.get_prompt_file()
+        self.assertNotEqual(os.path.dirname(path), os.getcwd())
+        self.assertFalse(os.path.exists(os.path.join(os.getcwd(), 'prompt.txt')))
+
+    def test_empty_input(self):
+        """
+        Test that closing the editor without writing anything returns None.
+        """
+        with patch.object(input_utils, 'PROMPT_EDITOR_MODE', 'blocking'), \
+                patch.dict(os.environ, {'PROMPT_EDITOR': 'true'}), \
+                patch('builtins.input', return_value='e'), patch('builtins.print'):
+            self.assertIsNone(input_utils.get_user_input())
+
+
+if __name__ == '__main__':
+    unittest.main()
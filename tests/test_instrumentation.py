@@ -0,0 +1,129 @@
+import os
+import json
+import asyncio
+import tempfile
+import unittest
+from api_clients.anthropic_client import AnthropicClient
+from api_clients.async_client import AsyncOpenAIClient, create_async_http_client
+from api_clients.http_session import _create_requests_session
+from api_clients.instrumentation import Instrumentation, JSONLSink, PrometheusTextfileSink, format_stats
+from api_clients.request_scheduler import RequestScheduler
+from tests.mock_provider_server import MockProviderServer
+
+
+class TestInstrumentation(unittest.TestCase):
+    """
+    This class contains unit tests for the instrumentation of the hot paths.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_turn_groups_the_values(self):
+        """
+        Test that the values recorded during a turn are added up in it, nested turns included.
+        """
+        instrumentation = Instrumentation(enabled=True)
+        with instrumentation.turn(client='test') as turn:
+            instrumentation.record('request_bytes', 100)
+            with instrumentation.turn(client='nested') as nested:
+                instrumentation.record('request_bytes', 50)
+        instrumentation.record('ingest_files', 3)
+
+        self.assertIs(nested, turn)
+        self.assertEqual(turn.metrics['request_bytes'], 150)
+        self.assertIn('total_seconds', turn.metrics)
+        self.assertEqual(instrumentation.turns, 1)
+        self.assertIs(instrumentation.last_turn, turn)
+        summary = instrumentation.summary()
+        self.assertEqual(summary['request_bytes']['count'], 1)
+        self.assertEqual(summary['ingest_files']['mean'], 3)
+
+    def test_disabled(self):
+        """
+        Test that nothing is recorded when the instrumentation is disabled.
+        """
+        instrumentation = Instrumentation(enabled=False)
+        with instrumentation.turn(client='test') as turn:
+            with instrumentation.span('build_seconds'):
+                instrumentation.record('request_bytes', 100)
+        self.assertIsNone(turn)
+        self.assertEqual(instrumentation.summary(), {})
+
+    def test_sinks(self):
+        """
+        Test that the turns are appended to the JSONL sink and summarised in the Prometheus textfile.
+        """
+        jsonl_path = os.path.join(self.directory.name, 'turns.jsonl')
+        prometheus_path = os.path.join(self.directory.name, 'metrics.prom')
+        instrumentation = Instrumentation(enabled=True, sinks=[JSONLSink(jsonl_path), PrometheusTextfileSink(prometheus_path)])
+        for ttfb in (0.1, 0.3):
+            with instrumentation.turn(client='test', model='m'):
+                instrumentation.record('ttfb_seconds', ttfb)
+        instrumentation.close()
+
+        with open(jsonl_path, 'r', encoding='utf-8') as f:
+            turns = [json.loads(line) for line in f]
+        self.assertEqual([turn['ttfb_seconds'] for turn in turns], [0.1, 0.3])
+        self.assertEqual(turns[0]['model'], 'm')
+        with open(prometheus_path, 'r', encoding='utf-8') as f:
+            metrics = f.read()
+        self.assertIn('term_chatbot_turns_total 2', metrics)
+        self.assertIn('# TYPE term_chatbot_ttfb_seconds summary', metrics)
+        self.assertIn('term_chatbot_ttfb_seconds_count 2', metrics)
+        self.assertIn('term_chatbot_ttfb_seconds{quantile="0.95"} 0.3', metrics)
+
+    def test_client_turn_breakdown(self):
+        """
+        Test the breakdown of real turns against the mock server: a new connection, then a reused one, streamed or not.
+        """
+        with MockProviderServer(response_tokens=5, latency=0.02) as server:
+            client = AnthropicClient(api_key='test-api-key', api_url=server.anthropic_url, session=_create_requests_session(2))
+            client.model = 'claude-3-haiku-20240307'
+            client.instrumentation = Instrumentation(enabled=True)
+
+            client.send_request("first question")
+            first = client.instrumentation.last_turn
+            for name in ('build_seconds', 'serialise_seconds', 'queue_seconds', 'connect_seconds', 'ttfb_seconds',
+                         'transfer_seconds', 'parse_seconds', 'request_bytes', 'response_bytes', 'output_tokens'):
+                self.assertIn(name, first.metrics)
+            self.assertGreaterEqual(first.metrics['ttfb_seconds'], 0.02)
+            self.assertEqual(first.metrics['output_tokens'], 5)
+
+            list(client.stream_request("second question"))
+            second = client.instrumentation.last_turn
+            self.assertTrue(second.labels['stream'])
+            self.assertNotIn('connect_seconds', second.metrics)  # the pooled connection is reused
+            self.assertGreaterEqual(second.metrics['first_token_seconds'], second.metrics['ttfb_seconds'])
+            self.assertGreater(second.metrics['response_bytes'], 0)
+
+        report = format_stats(client.instrumentation)
+        self.assertIn('Session: 2 turns', report)
+        self.assertIn('network', report)
+        self.assertIn('ttfb', report)
+
+    def test_async_client_turn(self):
+        """
+        Test that the async clients record the connection and the time to the headers through the httpx trace.
+        """
+        async def run(server):
+            async with create_async_http_client() as http_client:
+                client = AsyncOpenAIClient(api_key='test-api-key', api_url=server.openai_url, session=http_client)
+                client.model = 'gpt-4'
+                client.scheduler = RequestScheduler('test-api-key', base_delay=0, max_delay=0)
+                client.instrumentation = Instrumentation(enabled=True)
+                await client.send_request("a question")
+                return client.instrumentation.last_turn
+
+        with MockProviderServer(response_tokens=3, latency=0.02) as server:
+            turn = asyncio.run(run(server))
+        self.assertIn('connect_seconds', turn.metrics)
+        self.assertGreaterEqual(turn.metrics['ttfb_seconds'], 0.02)
+        self.assertEqual(turn.labels['client'], 'AsyncOpenAIClient')
+
+
+if __name__ == '__main__':
+    unittest.main()
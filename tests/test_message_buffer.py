@@ -0,0 +1,66 @@
+import json
+import unittest
+from unittest.mock import patch
+from api_clients.anthropic_client import AnthropicClient
+from api_clients.openai_client import OpenAIClient
+from api_clients.message_buffer import MessageBuffer
+
+
+class TestMessageBuffer(unittest.TestCase):
+    """
+    This class contains unit tests for the incremental request payload construction.
+    """
+
+    def make_history(self, client, turns):
+        for i in range(turns):
+            client.update_chat_history(f'question {i}', f'answer {i}')
+
+    def test_request_body_matches_request_data(self):
+        """
+        Test that the incrementally built body is the same request as `_get_request_data`.
+        """
+        for client in (AnthropicClient(api_key='key', api_url='https://api.anthropic.com/v1/messages'),
+                       OpenAIClient(api_key='key', api_url='https://api.openai.com/v1/chat/completions')):
+            self.make_history(client, 3)
+            body = client._encode_request('new question "with quotes" ✨')
+            self.assertEqual(json.loads(body), client._get_request_data('new question "with quotes" ✨', client.chat_history))
+
+    def test_only_new_messages_are_encoded(self):
+        """
+        Test that the messages already in the buffer are not formatted again.
+        """
+        client = AnthropicClient(api_key='key', api_url='https://api.anthropic.com/v1/messages')
+        self.make_history(client, 5)
+
+        with patch.object(client.message_buffer, '_format_message', wraps=client._format_message) as format_message:
+            client.update_chat_history('question 5', 'answer 5')
+            client._encode_request('question 6')
+
+        self.assertEqual(format_message.call_count, 2)
+        self.assertEqual(len(client.message_buffer), 12)
+
+    def test_sync_after_history_truncation(self):
+        """
+        Test that the buffer follows the history when its oldest messages are removed.
+        """
+        buffer = MessageBuffer(lambda message: {"role": message["sender"], "content": message["text"]})
+        messages = [{"sender": "user", "text": str(i)} for i in range(6)]
+        buffer.sync(messages)
+
+        del messages[:2]
+        buffer.sync(messages)
+
+        self.assertEqual([json.loads(fragment)["content"] for fragment in buffer.fragments], ['2', '3', '4', '5'])
+
+    def test_stream_request_body(self):
+        """
+        Test that the streaming options are part of the encoded body.
+        """
+        client = OpenAIClient(api_key='key', api_url='https://api.openai.com/v1/chat/completions')
+        data = json.loads(client._encode_request('Hi', stream=True))
+        self.assertTrue(data['stream'])
+        self.assertEqual(data['messages'], [{"role": "user", "content": "Hi"}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import os
+import json
+import tempfile
+import unittest
+import tracemalloc
+from api_clients.anthropic_client import AnthropicClient
+from api_clients.message_store import BlobStore, ComposedText, Message, message_parts
+from assistants.coding_assistant import CodingAssistant
+from utils.file_utils import save_chat_history
+
+
+class TestMessageStore(unittest.TestCase):
+    """
+    This class contains unit tests for the compact messages and the blob store of the chat history.
+    """
+
+    def test_blobs_are_deduplicated(self):
+        """
+        Test that a text stored twice is kept once, as the first object stored.
+        """
+        store = BlobStore()
+        text = 'x' * 10000
+        first = store.put(text)
+        second = store.put(''.join(['x'] * 10000))
+        self.assertEqual(first, second)
+        self.assertEqual(len(store), 1)
+        self.assertIs(store.get(second), text)
+        self.assertEqual(store.size, 10000)
+
+    def test_message_reads_like_a_dictionary(self):
+        """
+        Test that a message has the keys and the timestamp format of the former dictionaries.
+        """
+        message = Message('user', 'hello', '2024-05-01 10:30:00', cache=True)
+        self.assertEqual(message["text"], 'hello')
+        self.assertEqual(message["timestamp"], '2024-05-01 10:30:00')
+        self.assertIsInstance(message.created, int)
+        self.assertEqual(dict(message), {"sender": "user", "text": "hello", "timestamp": "2024-05-01 10:30:00", "cache": True})
+
+        message = Message('assistant', 'hi')
+        self.assertNotIn('cache', message)
+        self.assertIsNone(message.get('cache'))
+        self.assertRaises(KeyError, lambda: message['cache'])
+        self.assertIs(message.sender, Message(''.join(['assis', 'tant']), 'hi').sender)
+
+    def test_large_texts_are_stored_by_reference(self):
+        """
+        Test that the large parts of a ComposedText are stored once and shared between messages.
+        """
+        store = BlobStore()
+        content = 'def f():\n    return 1\n' * 500
+        prompt = ComposedText(['#main.py\n', content, '\nend'])
+        first = Message('user', prompt, store=store)
+        second = Message('user', ComposedText(['#main.py\n', content, '\nagain']), store=store)
+
+        self.assertEqual(first.text, str(prompt))
+        self.assertEqual(len(store), 1)
+        self.assertIs(message_parts(first)[1], content)
+        self.assertIs(message_parts(second)[1], content)
+        self.assertEqual(message_parts({"text": "plain"}), ("plain",))
+
+    def test_client_history_uses_the_blob_store(self):
+        """
+        Test that the client history keeps the project files of the initial prompt by reference,
+        and that the journal-less export is unchanged.
+        """
+        client = AnthropicClient(api_key='key', api_url='https://api.anthropic.com/v1/messages')
+        content = 'print("hello")\n' * 1000
+        assistant = CodingAssistant('Bot', 'help', 'coder', 'terminal', 'calm', 'precise', ['tasks'], '/tmp/project')
+        assistant.project_files = {'a.py': content, 'b.py': 'x = 1\n'}
+        prompt = assistant.generate_initial_prompt()
+        self.assertIn(f'#a.py\n{content}\n\n#b.py\nx = 1\n', prompt)
+
+        client.update_chat_history(prompt, 'plan', cache=True)
+        message = client.chat_history["messages"][0]
+        self.assertEqual(message["text"], prompt)
+        self.assertIs(message_parts(message)[2], content)
+        self.assertEqual(len(client.blob_store), 1)
+
+        with tempfile.TemporaryDirectory() as directory:
+            save_chat_history(client, directory=directory)
+            with open(os.path.join(directory, sorted(os.listdir(directory))[0])) as f:
+                exported = json.load(f)
+        self.assertEqual(exported["messages"][0]["text"], prompt)
+        self.assertTrue(exported["messages"][0]["cache"])
+        self.assertEqual(exported["messages"][1]["sender"], 'assistant')
+
+    def test_repeated_texts_take_less_memory(self):
+        """
+        Test that a history repeating a large text takes less memory than the same history of dictionaries.
+        """
+        content = 'y' * 100000
+
+        def measure(build):
+            tracemalloc.start()
+            history = build()
+            size, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.assertEqual(len(history), 20)
+            return size
+
+        store = BlobStore()
+        # each turn brings its own copy of the text, e.g. read from a file again
+        dicts = measure(lambda: [{"sender": "user", "text": content + '.', "timestamp": "2024-05-01 10:30:00"}
+                                 for _ in range(20)])
+        messages = measure(lambda: [Message("user", content + '.', store=store) for _ in range(20)])
+        self.assertLess(messages * 10, dicts)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import os
+import json
+import tempfile
+import unittest
+from unittest.mock import patch
+from api_clients.anthropic_client import AnthropicClient
+from api_clients.openai_client import OpenAIClient
+from api_clients.model_registry import ModelRegistry, get_model_registry
+from utils.pricing_model import PricingModel
+
+REGISTRY = {
+    "providers": {
+        "anthropic": {"label": "Anthropic", "client": "api_clients.anthropic_client.AnthropicClient", "context_window": 200000, "max_tokens": 2000,
+                      "prompt_caching": True},
+        "openai": {"label": "OpenAI", "client": "api_clients.openai_client.OpenAIClient", "context_window": 8192, "max_tokens": 1000}
+    },
+    "models": {
+        "claude-test": {"provider": "anthropic", "pricing": {"input": 1.0, "output": 5.0, "batch_discount": 0.4}},
+        "gpt-test": {"provider": "openai", "context_window": 128000, "streaming": False,
+                     "pricing": {"input": 2.0, "output": 8.0}}
+    }
+}
+
+
+class TestModelRegistry(unittest.TestCase):
+    """
+    This class contains unit tests for the model registry.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'models.json')
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(REGISTRY, f)
+        self.registry = ModelRegistry.load(self.path)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_model_settings(self):
+        """
+        Test that a model gets its provider's defaults overridden by its own entry.
+        """
+        settings = self.registry.get("gpt-test")
+        self.assertEqual(settings["provider"], "openai")
+        self.assertEqual(settings["context_window"], 128000)
+        self.assertEqual(settings["max_tokens"], 1000)
+        self.assertFalse(settings["streaming"])
+        self.assertFalse(settings["prompt_caching"])
+        self.assertTrue(self.registry.get("claude-test")["prompt_caching"])
+
+    def test_unknown_model(self):
+        """
+        Test that an unregistered model gets the defaults of its provider, or of its model family, without pricing.
+        """
+        settings = self.registry.get("claude-4-new")
+        self.assertEqual(settings["provider"], "anthropic")
+        self.assertEqual(settings["max_tokens"], 2000)
+        self.assertIsNone(settings["pricing"])
+        self.assertEqual(self.registry.get("my-model", "openai")["context_window"], 8192)
+        self.assertIsNone(self.registry.get("my-model")["provider"])
+
+    def test_available_models(self):
+        """
+        Test that the menus offer the registered models, unless the environment selects them.
+        """
+        with patch.dict(os.environ, {}, clear=False):
+            os.environ.pop("AVAILABLE_OPENAI_MODELS", None)
+            self.assertEqual(self.registry.models("openai"), ["gpt-test"])
+            os.environ["AVAILABLE_OPENAI_MODELS"] = "gpt-b, gpt-a"
+            self.assertEqual(self.registry.models("openai"), ["gpt-b", "gpt-a"])
+
+    def test_missing_registry(self):
+        """
+        Test that a missing registry file leaves every model with the defaults.
+        """
+        registry = ModelRegistry.load(os.path.join(self.directory.name, 'missing.json'))
+        self.assertEqual(registry.get("gpt-test")["max_tokens"], 1000)
+        with patch.dict(os.environ, {}, clear=False):
+            os.environ.pop("AVAILABLE_OPENAI_MODELS", None)
+            self.assertEqual(registry.models("openai"), [])
+
+    def test_pricing(self):
+        """
+        Test that the costs use the registry prices, with the batch rate of the model or the default discount.
+        """
+        pricing_model = PricingModel(self.registry)
+        self.assertAlmostEqual(pricing_model.get_token_cost("claude-test", 1_000_000, 1_000_000), 6.0)
+        self.assertAlmostEqual(pricing_model.get_token_cost("claude-test", 1_000_000, 1_000_000, batch=True), 2.4)
+        self.assertAlmostEqual(pricing_model.get_token_cost("gpt-test", 1_000_000, 0, batch=True), 1.0)
+        self.assertIsNone(pricing_model.get_token_cost("unknown-model", 100, 100))
+
+    def test_clients_use_the_registry(self):
+        """
+        Test that the clients take their default model from their own provider and their output cap from the registry.
+        """
+        openai_client = OpenAIClient(api_key='key', api_url='https://api.example.com/v1')
+        self.assertEqual(get_model_registry().get(openai_client.model)["provider"], "openai")
+        self.assertEqual(openai_client._get_request_params()["max_tokens"], openai_client.model_info["max_tokens"])
+
+        anthropic_client = AnthropicClient(api_key='key', api_url='https://api.example.com/v1')
+        anthropic_client.model = 'claude-unregistered'
+        self.assertEqual(anthropic_client.model_info["provider"], "anthropic")
+        self.assertEqual(anthropic_client._get_request_params()["max_tokens"], 2000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+import os
+import tempfile
+import unittest
+from utils.gitignore import GitIgnoreMatcher, parse_gitignore
+from unittest.mock import patch
+from utils import project_ingest
+from utils.project_ingest import ingest_project
+from utils.project_snapshot import ProjectSnapshot
+from assistants.coding_assistant import CodingAssistant
+
+
+class TestGitIgnore(unittest.TestCase):
+    """
+    This class contains unit tests for the gitignore pattern matching.
+    """
+
+    def matcher(self, *lines):
+        return GitIgnoreMatcher().child('', parse_gitignore(lines))
+
+    def test_name_patterns_match_at_any_depth(self):
+        """
+        Test that a pattern without a slash matches a name in any directory.
+        """
+        matcher = self.matcher('*.pyc', 'build')
+        self.assertTrue(matcher.is_ignored('a.pyc'))
+        self.assertTrue(matcher.is_ignored('src/pkg/a.pyc'))
+        self.assertTrue(matcher.is_ignored('src/build', is_dir=True))
+        self.assertFalse(matcher.is_ignored('src/a.py'))
+
+    def test_anchored_and_dir_only_patterns(self):
+        """
+        Test that patterns with a slash are anchored and that a trailing slash only matches directories.
+        """
+        matcher = self.matcher('/dist', 'docs/*.md', 'logs/')
+        self.assertTrue(matcher.is_ignored('dist', is_dir=True))
+        self.assertFalse(matcher.is_ignored('src/dist', is_dir=True))
+        self.assertTrue(matcher.is_ignored('docs/index.md'))
+        self.assertFalse(matcher.is_ignored('docs/api/index.md'))
+        self.assertTrue(matcher.is_ignored('logs', is_dir=True))
+        self.assertFalse(matcher.is_ignored('logs'))
+
+    def test_double_star_and_negation(self):
+        """
+        Test `**` patterns and that the last matching pattern wins.
+        """
+        matcher = self.matcher('**/generated/**', '*.log', '!keep.log', '# comment')
+        self.assertTrue(matcher.is_ignored('generated/a.py'))
+        self.assertTrue(matcher.is_ignored('src/generated/sub/a.py'))
+        self.assertTrue(matcher.is_ignored('debug.log'))
+        self.assertFalse(matcher.is_ignored('src/keep.log'))
+
+    def test_nested_rules_override_parents(self):
+        """
+        Test that the rules of a nested .gitignore apply relative to its directory and override the root ones.
+        """
+        matcher = self.matcher('*.txt').child('sub', parse_gitignore(['!notes.txt', '/local']))
+        self.assertTrue(matcher.is_ignored('sub/other.txt'))
+        self.assertFalse(matcher.is_ignored('sub/notes.txt'))
+        self.assertTrue(matcher.is_ignored('notes.txt'))
+        self.assertTrue(matcher.is_ignored('sub/local', is_dir=True))
+        self.assertFalse(matcher.is_ignored('local', is_dir=True))
+
+
+class TestProjectIngest(unittest.TestCase):
+    """
+    This class contains unit tests for the project ingestion.
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, path, content):
+        full_path = os.path.join(self.root, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        mode = 'wb' if isinstance(content, bytes) else 'w'
+        with open(full_path, mode) as f:
+            f.write(content)
+
+    def test_ingest_project(self):
+        """
+        Test that ignored, binary, non UTF-8 and oversized files are skipped and the others are read.
+        """
+        self.write('.gitignore', 'node_modules/\n*.log\n')
+        self.write('main.py', 'print("hello")\n')
+        self.write('src/app.log', 'log')
+        self.write('src/.gitignore', '!important.log\n')
+        self.write('src/important.log', 'keep me')
+        self.write('node_modules/lib/index.js', 'module.exports = {}')
+        self.write('.git/config', '[core]')
+        self.write('image.png', b'\x89PNG\r\n\x1a\n\x00\x00')
+        self.write('latin1.txt', 'caf\xe9'.encode('latin-1'))
+        self.write('big.txt', 'x' * 200)
+
+        project_files, summary = ingest_project(self.root, max_file_size=100, workers=2)
+
+        self.assertEqual(sorted(project_files), ['.gitignore', 'main.py', 'src/.gitignore', 'src/important.log'])
+        self.assertEqual(project_files['main.py'], 'print("hello")\n')
+        self.assertEqual(summary["files"], 4)
+        self.assertEqual(summary["skipped"], {"ignored": 3, "oversized": 1, "binary": 2})
+
+
+class TestProjectSnapshot(unittest.TestCase):
+    """
+    This class contains unit tests for the on-disk project snapshots.
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmp.name, 'project')
+        self.cache_dir = os.path.join(self.tmp.name, 'cache')
+        os.makedirs(self.root)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, path, content):
+        full_path = os.path.join(self.root, path)
+        with open(full_path, 'w') as f:
+            f.write(content)
+        # make sure the modification time changes even on coarse-grained file systems
+        stat = os.stat(full_path)
+        os.utime(full_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    def test_only_changed_files_are_read_again(self):
+        """
+        Test that a second ingestion reuses the snapshot for the unchanged files.
+        """
+        self.write('a.py', 'a = 1\n')
+        self.write('b.py', 'b = 1\n')
+        snapshot = ProjectSnapshot.load(self.root, cache_dir=self.cache_dir)
+        ingest_project(self.root, snapshot=snapshot)
+        snapshot.save()
+
+        self.write('b.py', 'b = 2\n')
+        snapshot = ProjectSnapshot.load(self.root, cache_dir=self.cache_dir)
+        with patch.object(project_ingest, 'read_text_file', wraps=project_ingest.read_text_file) as read_text_file:
+            project_files, summary = ingest_project(self.root, snapshot=snapshot)
+
+        read_text_file.assert_called_once_with(os.path.join(self.root, 'b.py'))
+        self.assertEqual(project_files, {'a.py': 'a = 1\n', 'b.py': 'b = 2\n'})
+        self.assertEqual(summary["cached"], 1)
+        self.assertEqual(snapshot.files['b.py']["content"], 'b = 2\n')
+
+    def test_refresh_sends_only_the_changes(self):
+        """
+        Test that /refresh builds a prompt with the added, modified and deleted files only.
+        """
+        self.write('keep.py', 'unchanged = True\n')
+        self.write('edit.py', 'x = 1\ny = 2\n')
+        self.write('old.py', 'old = True\n')
+        assistant = CodingAssistant('name', 'motivation', 'role', 'environment', [], [], [], self.root)
+        with patch('utils.project_snapshot.PROJECT_CACHE_DIR', self.cache_dir), patch('builtins.print'):
+            assistant.process_project_folder()
+            self.assertIsNone(assistant.refresh_project())
+
+            self.write('edit.py', 'x = 1\ny = 3\n')
+            self.write('new.py', 'new = True\n')
+            os.remove(os.path.join(self.root, 'old.py'))
+            prompt = assistant.refresh_project()
+
+        self.assertIn('#new.py\nnew = True', prompt)
+        self.assertIn('-y = 2\n+y = 3', prompt)
+        self.assertIn('Deleted files:\nold.py', prompt)
+        self.assertNotIn('unchanged', prompt)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,194 @@
+import os
+import json
+import asyncio
+import tempfile
+import unittest
+from unittest.mock import patch
+import httpx
+from api_clients.anthropic_client import AnthropicClient, AVAILABLE_ANTHROPIC_MODELS
+from api_clients.openai_client import OpenAIClient, AVAILABLE_OPENAI_MODELS
+from api_clients.async_client import AsyncAnthropicClient
+from api_clients.response_cache import ResponseCache
+from api_clients.tool_use import ToolCallCollector
+from assistants.coding_assistant import CodingAssistant
+from utils.project_tools import ProjectTools
+from utils.repo_map import build_repo_map, outline_python
+from tests.mock_provider_server import MockProviderServer
+
+PROJECT_FILES = {
+    'app.py': 'import os\n\n\ndef main(argv=None) -> int:\n    return run(argv)\n',
+    'core/engine.py': 'class Engine(Base):\n    def start(self, port=80):\n        pass\n\n    async def stop(self):\n        pass\n',
+    'core/README.md': 'The engine.\n',
+    'docs/guide.md': 'Run main.\n'
+}
+
+
+class TestProjectTools(unittest.TestCase):
+    """
+    This class contains unit tests for the repo map and the project tools.
+    """
+
+    def test_repo_map(self):
+        """
+        Test that the repo map has the file tree and the outline of the Python files.
+        """
+        self.assertEqual(outline_python(PROJECT_FILES['core/engine.py']),
+                         ['class Engine(Base)  [L1]', '  def start(self, port=80)  [L2]', '  async def stop(self)  [L5]'])
+        self.assertEqual(outline_python('def broken(:\n'), [])
+        self.assertEqual(build_repo_map(PROJECT_FILES).split('\n'), [
+            'app.py (5 lines)',
+            '  def main(argv=None) -> int  [L4]',
+            'core/',
+            '  README.md (1 lines)',
+            '  engine.py (6 lines)',
+            '    class Engine(Base)  [L1]',
+            '      def start(self, port=80)  [L2]',
+            '      async def stop(self)  [L5]',
+            'docs/',
+            '  guide.md (1 lines)'])
+
+    def test_tools(self):
+        """
+        Test the read_file, grep and list_dir tools, and that the errors are returned to the model.
+        """
+        tools = ProjectTools(PROJECT_FILES, max_result_chars=200)
+        self.assertEqual(tools.call('read_file', {"path": "./core/engine.py", "start_line": 2, "end_line": 3}),
+                         '2:     def start(self, port=80):\n3:         pass')
+        self.assertEqual(tools.call('grep', {"pattern": r"def \w+\(self"}),
+                         'core/engine.py:2: def start(self, port=80):\ncore/engine.py:5: async def stop(self):')
+        self.assertEqual(tools.call('grep', {"pattern": "main", "path": "*.md"}), 'docs/guide.md:1: Run main.')
+        self.assertEqual(tools.call('list_dir', {}), 'app.py\ncore/\ndocs/')
+        self.assertEqual(tools.call('list_dir', {"path": "core"}), 'README.md\nengine.py')
+        self.assertIn('no such file', tools.call('read_file', {"path": "missing.py"}))
+        self.assertTrue(tools.call('grep', {"pattern": "("}).startswith('Error:'))
+        self.assertTrue(tools.call('read_file', {"file": "app.py"}).startswith('Error:'))
+        self.assertEqual(tools.call('delete', {}), 'Error: unknown tool delete.')
+
+        tools.project_files = {'big.txt': 'x' * 500}
+        self.assertTrue(tools.call('read_file', {"path": "big.txt"}).endswith('[truncated, read the rest by line range]'))
+
+    def test_tool_call_collector(self):
+        """
+        Test that the streamed fragments of the tool calls are assembled.
+        """
+        collector = ToolCallCollector()
+        collector.add(1, 'call_b', 'grep')
+        collector.add(1, partial_json='{"pattern": ')
+        collector.add(1, partial_json='"main"}')
+        collector.add(0, 'call_a', 'list_dir', {})
+        self.assertTrue(collector)
+        self.assertEqual(collector.finish(), [{"id": "call_a", "name": "list_dir", "arguments": {}},
+                                              {"id": "call_b", "name": "grep", "arguments": {"pattern": "main"}}])
+        self.assertFalse(collector)
+
+
+class TestToolLoop(unittest.TestCase):
+    """
+    This class contains unit tests for the tool loop of the API clients, against the mock provider server.
+    """
+
+    def setUp(self):
+        calls = [("grep", {"pattern": "def main"}), ("read_file", {"path": "app.py", "start_line": 4, "end_line": 4})]
+        self.server = MockProviderServer(response_tokens=3, tool_calls=calls).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def make_client(self, client_class, model):
+        api_url = self.server.anthropic_url if client_class is AnthropicClient else self.server.openai_url
+        client = client_class(api_key='key', api_url=api_url)
+        client.model = model
+        client.tools = ProjectTools(PROJECT_FILES)
+        return client
+
+    def test_anthropic_tool_loop(self):
+        """
+        Test that the tool calls are answered until the model answers with text, and that only
+        the prompt and the final response are kept in the chat history.
+        """
+        client = self.make_client(AnthropicClient, AVAILABLE_ANTHROPIC_MODELS[0])
+        response, token_usage = client.send_request('Where is main?')
+
+        # the answer echoes the last tool result
+        self.assertEqual(response, 'Let me look.\n\nLet me look.\n\n4: def main(argv=None) ')
+        self.assertEqual(token_usage["output_tokens"], 23)
+        self.assertEqual(len(self.server.requests), 3)
+        last_request = json.loads(self.server.requests[-1]["body"])
+        self.assertEqual([tool["name"] for tool in last_request["tools"]], ['read_file', 'grep', 'list_dir'])
+        self.assertEqual(last_request["messages"][2]["content"][0]["content"], 'app.py:4: def main(argv=None) -> int:')
+        self.assertEqual([message.text for message in client.chat_history["messages"]], ['Where is main?', response])
+
+    def test_openai_streamed_tool_loop(self):
+        """
+        Test the tool loop of a streamed OpenAI response, whose tool call arguments arrive in fragments.
+        """
+        client = self.make_client(OpenAIClient, AVAILABLE_OPENAI_MODELS[0])
+        deltas = list(client.stream_request('Where is main?'))
+
+        self.assertEqual(''.join(deltas), '4: def main(argv=None) ')
+        self.assertEqual(client.last_token_usage["output_tokens"], 23)
+        messages = json.loads(self.server.requests[-1]["body"])["messages"]
+        self.assertEqual([message["role"] for message in messages], ['user', 'assistant', 'tool', 'assistant', 'tool'])
+        self.assertEqual(json.loads(messages[3]["tool_calls"][0]["function"]["arguments"]),
+                         {"path": "app.py", "start_line": 4, "end_line": 4})
+        self.assertEqual(len(client.chat_history["messages"]), 2)
+
+    def test_async_streamed_tool_loop(self):
+        """
+        Test the tool loop of the async client, with the Anthropic streamed tool calls.
+        """
+        async def run():
+            async with httpx.AsyncClient() as http_client:
+                client = AsyncAnthropicClient(api_key='key', api_url=self.server.anthropic_url, session=http_client)
+                client.model = AVAILABLE_ANTHROPIC_MODELS[0]
+                client.tools = ProjectTools(PROJECT_FILES)
+                return client, [delta async for delta in client.stream_request('Where is main?')]
+
+        client, deltas = asyncio.run(run())
+        self.assertEqual(''.join(deltas), '4: def main(argv=None) ')
+        self.assertEqual(client.chat_history["messages"][-1].text, '4: def main(argv=None) ')
+
+    def test_tool_loop_replay(self):
+        """
+        Test that every round of a turn using tools is recorded in the response cache, with its tool calls,
+        so the turn is replayed without any request, streamed or not.
+        """
+        cache = ResponseCache(':memory:')
+        client = self.make_client(OpenAIClient, AVAILABLE_OPENAI_MODELS[0])
+        client.response_cache = cache
+        recorded = ''.join(client.stream_request('Where is main?'))
+        self.assertEqual(len(cache), 3)
+
+        cache.replay = True
+        requests = len(self.server.requests)
+        replayed = self.make_client(OpenAIClient, AVAILABLE_OPENAI_MODELS[0])
+        replayed.response_cache = cache
+        self.assertEqual(''.join(replayed.stream_request('Where is main?')), recorded)
+        replayed = self.make_client(OpenAIClient, AVAILABLE_OPENAI_MODELS[0])
+        replayed.response_cache = cache
+        self.assertEqual(replayed.send_request('Where is main?')[0], recorded)
+        self.assertEqual(len(self.server.requests), requests)
+
+    def test_lazy_coding_assistant(self):
+        """
+        Test that the lazy initial prompt has the repo map and not the file contents.
+        """
+        with tempfile.TemporaryDirectory() as root:
+            for path, content in PROJECT_FILES.items():
+                os.makedirs(os.path.join(root, os.path.dirname(path)), exist_ok=True)
+                with open(os.path.join(root, path), 'w') as f:
+                    f.write(content)
+            assistant = CodingAssistant('name', 'motivation', 'role', 'environment', [], [], [], root, lazy=True)
+            with patch('assistants.coding_assistant.PROJECT_CACHE', False), patch('builtins.print'):
+                assistant.process_project_folder()
+            prompt = str(assistant.generate_initial_prompt())
+
+        self.assertIn('class Engine(Base)  [L1]', prompt)
+        self.assertIn('read_file', prompt)
+        self.assertNotIn('return run(argv)', prompt)
+        self.assertEqual(assistant.tools.project_files, assistant.project_files)
+        self.assertEqual(assistant.augment_prompt('Where is main?'), 'Where is main?')
+
+
+if __name__ == '__main__':
+    unittest.main()
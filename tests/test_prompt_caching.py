@@ -0,0 +1,73 @@
+import json
+import unittest
+from unittest.mock import Mock
+from api_clients.anthropic_client import AnthropicClient
+from api_clients.openai_client import OpenAIClient
+from utils.pricing_model import PricingModel
+
+
+class TestPromptCaching(unittest.TestCase):
+    """
+    This class contains unit tests for the prompt caching support.
+    """
+
+    def test_anthropic_cache_breakpoints(self):
+        """
+        Test that the pinned project context and the new prompt get cache_control breakpoints.
+        """
+        client = AnthropicClient(api_key='key', api_url='https://api.anthropic.com/v1/messages')
+        client.update_chat_history('project context', 'plan', cache=True)
+        client.update_chat_history('question', 'answer')
+
+        messages = json.loads(client._encode_request('next question'))['messages']
+
+        self.assertEqual(messages[0]['content'][0]['cache_control'], {'type': 'ephemeral'})
+        self.assertEqual(messages[2]['content'], 'question')
+        self.assertEqual(messages[4]['content'][0]['cache_control'], {'type': 'ephemeral'})
+
+    def test_anthropic_caching_disabled(self):
+        """
+        Test that no breakpoint is sent when prompt caching is disabled.
+        """
+        client = AnthropicClient(api_key='key', api_url='https://api.anthropic.com/v1/messages')
+        client.prompt_caching = False
+        client.update_chat_history('project context', 'plan', cache=True)
+        messages = json.loads(client._encode_request('next question'))['messages']
+        self.assertEqual(messages[0]['content'], 'project context')
+        self.assertEqual(messages[2]['content'], 'next question')
+
+    def test_cache_usage_parsing(self):
+        """
+        Test that the cache read/write tokens are reported separately from the input tokens.
+        """
+        anthropic_response = Mock()
+        anthropic_response.json.return_value = {
+            "content": [{"type": "text", "text": "ok"}],
+            "usage": {"input_tokens": 10, "output_tokens": 5, "cache_read_input_tokens": 900, "cache_creation_input_tokens": 50}
+        }
+        client = AnthropicClient(api_key='key', api_url='https://api.anthropic.com/v1/messages')
+        _, token_usage = client._parse_response(anthropic_response)
+        self.assertEqual(token_usage, {"input_tokens": 10, "output_tokens": 5, "cache_read_tokens": 900, "cache_write_tokens": 50})
+
+        openai_response = Mock()
+        openai_response.json.return_value = {
+            "choices": [{"message": {"content": "ok"}}],
+            "usage": {"prompt_tokens": 1000, "completion_tokens": 5, "prompt_tokens_details": {"cached_tokens": 768}}
+        }
+        client = OpenAIClient(api_key='key', api_url='https://api.openai.com/v1/chat/completions')
+        _, token_usage = client._parse_response(openai_response)
+        self.assertEqual(token_usage["input_tokens"], 232)
+        self.assertEqual(token_usage["cache_read_tokens"], 768)
+
+    def test_cache_pricing(self):
+        """
+        Test that the cache tokens are priced at the model's cache rates.
+        """
+        pricing_model = PricingModel()
+        token_usage = {"input_tokens": 0, "output_tokens": 0, "cache_read_tokens": 1_000_000, "cache_write_tokens": 1_000_000}
+        self.assertAlmostEqual(pricing_model.get_usage_cost("claude-3-haiku-20240307", token_usage), 0.33)
+        self.assertAlmostEqual(pricing_model.get_usage_cost("gpt-4", token_usage), 60.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
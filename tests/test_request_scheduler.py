@@ -0,0 +1,135 @@
+import unittest
+from unittest.mock import Mock
+import requests
+from api_clients.request_scheduler import RequestScheduler, TokenBucket, get_retry_after, parse_reset
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def mock_response(status_code, headers=None):
+    return Mock(status_code=status_code, headers=headers or {})
+
+
+class TestRequestScheduler(unittest.TestCase):
+    """
+    This class contains unit tests for the retry and rate limit scheduler.
+    """
+
+    def setUp(self):
+        RequestScheduler._budgets.clear()
+        self.clock = FakeClock()
+
+    def make_scheduler(self, **kwargs):
+        return RequestScheduler('test-api-key', sleep=self.clock.sleep, clock=self.clock, **kwargs)
+
+    def test_retries_overloaded_errors(self):
+        """
+        Test that 529/503 responses are retried and the successful response is returned.
+        """
+        responses = [mock_response(529), mock_response(503), mock_response(200)]
+        scheduler = self.make_scheduler(requests_per_minute=0, tokens_per_minute=0)
+
+        response = scheduler.execute(lambda: responses.pop(0))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(responses, [])
+
+    def test_honours_retry_after(self):
+        """
+        Test that the retry-after header sets the delay before the next attempt.
+        """
+        responses = [mock_response(429, {'retry-after': '7'}), mock_response(200)]
+        scheduler = self.make_scheduler(requests_per_minute=0, tokens_per_minute=0, base_delay=0.0)
+
+        scheduler.execute(lambda: responses.pop(0))
+
+        self.assertAlmostEqual(self.clock.now, 7.0)
+
+    def test_gives_up_after_max_retries(self):
+        """
+        Test that the last response is returned once the retries are exhausted, and errors are re-raised.
+        """
+        scheduler = self.make_scheduler(max_retries=2, requests_per_minute=0, tokens_per_minute=0)
+        calls = []
+
+        response = scheduler.execute(lambda: calls.append(1) or mock_response(500))
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(len(calls), 3)
+
+        def fail():
+            raise requests.ConnectionError('connection reset')
+        with self.assertRaises(requests.ConnectionError):
+            scheduler.execute(fail)
+
+    def test_client_errors_are_not_retried(self):
+        """
+        Test that a 400 response is returned immediately.
+        """
+        calls = []
+        scheduler = self.make_scheduler(requests_per_minute=0, tokens_per_minute=0)
+        response = scheduler.execute(lambda: calls.append(1) or mock_response(400))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(calls), 1)
+
+    def test_requests_per_minute_budget(self):
+        """
+        Test that requests are throttled once the requests/min budget is spent.
+        """
+        scheduler = self.make_scheduler(requests_per_minute=2, tokens_per_minute=0)
+        for _ in range(3):
+            scheduler.execute(lambda: mock_response(200))
+        self.assertAlmostEqual(self.clock.now, 30.0)
+
+    def test_budgets_are_shared_per_api_key(self):
+        """
+        Test that the schedulers of the same API key share their budgets.
+        """
+        first = self.make_scheduler(requests_per_minute=10)
+        second = self.make_scheduler(requests_per_minute=10)
+        self.assertIs(first.budgets, second.budgets)
+
+    def test_budgets_sync_with_headers(self):
+        """
+        Test that the remaining budget reported by the provider is applied to the token bucket.
+        """
+        scheduler = self.make_scheduler(requests_per_minute=0, tokens_per_minute=0)
+        headers = {'x-ratelimit-limit-requests': '100', 'x-ratelimit-remaining-requests': '0',
+                   'x-ratelimit-reset-requests': '6s'}
+        scheduler.execute(lambda: mock_response(200, headers))
+        scheduler.execute(lambda: mock_response(200))
+        self.assertGreater(self.clock.now, 0.0)
+
+    def test_token_bucket_refill(self):
+        """
+        Test that the token bucket refills over its period.
+        """
+        bucket = TokenBucket(60, clock=self.clock)
+        self.assertEqual(bucket.reserve(60), 0.0)
+        self.assertAlmostEqual(bucket.reserve(30), 30.0)
+        self.clock.now += 30.0
+        self.assertEqual(bucket.reserve(0), 0.0)
+
+    def test_parse_headers(self):
+        """
+        Test the parsing of the retry-after and reset headers of both providers.
+        """
+        self.assertEqual(get_retry_after({'retry-after-ms': '1500'}), 1.5)
+        self.assertEqual(get_retry_after({'retry-after': '3'}), 3.0)
+        self.assertIsNone(get_retry_after({}))
+        self.assertEqual(parse_reset('6m0s'), 360.0)
+        self.assertEqual(parse_reset('20ms'), 0.02)
+        self.assertEqual(parse_reset('2000-01-01T00:00:00Z'), 0.0)
+        self.assertIsNone(parse_reset('soon'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+from unittest.mock import Mock, patch
+from api_clients.anthropic_client import AnthropicClient
+from api_clients.response_cache import ResponseCache, CacheMissError, make_cache_key
+
+
+class TestResponseCache(unittest.TestCase):
+    """
+    This class contains unit tests for the local response cache and the replay mode.
+    """
+
+    def make_client(self, cache):
+        client = AnthropicClient(api_key='key', api_url='https://api.anthropic.com/v1/messages')
+        client.model = 'claude-3-haiku-20240307'
+        client.response_cache = cache
+        return client
+
+    def mock_response(self, text):
+        response = Mock(status_code=200, headers={})
+        response.json.return_value = {"content": [{"type": "text", "text": text}],
+                                      "usage": {"input_tokens": 10, "output_tokens": 5}}
+        return response
+
+    def test_key_ignores_transport_fields(self):
+        """
+        Test that streaming and prompt caching markers don't change the cache key, but the content does.
+        """
+        url = 'https://api.example.com'
+        plain = b'{"model":"m","messages":[{"role":"user","content":"hi"}]}'
+        streamed = b'{"stream":true,"model":"m","messages":[{"role":"user","content":"hi"}]}'
+        marked = b'{"model":"m","messages":[{"role":"user","content":"hi","cache_control":{"type":"ephemeral"}}]}'
+        other = b'{"model":"m","messages":[{"role":"user","content":"hello"}]}'
+        self.assertEqual(make_cache_key(url, plain), make_cache_key(url, streamed))
+        self.assertEqual(make_cache_key(url, plain), make_cache_key(url, marked))
+        self.assertNotEqual(make_cache_key(url, plain), make_cache_key(url, other))
+
+    def test_identical_requests_are_served_from_cache(self):
+        """
+        Test that an identical request (same history and prompt) is served from the cache, for free.
+        """
+        cache = ResponseCache(':memory:')
+        first, second = self.make_client(cache), self.make_client(cache)
+        with patch('requests.Session.post', return_value=self.mock_response('recorded')) as mock_post:
+            self.assertEqual(first.send_request('hello')[0], 'recorded')
+            response, token_usage = second.send_request('hello')
+            self.assertEqual(mock_post.call_count, 1)
+        self.assertEqual(response, 'recorded')
+        self.assertEqual(token_usage["input_tokens"], 0)
+        self.assertEqual(second.chat_history["messages"][-1]["text"], 'recorded')
+
+        # a streamed request with the same content is a hit too
+        third = self.make_client(cache)
+        self.assertEqual(list(third.stream_request('hello')), ['recorded'])
+
+    def test_replay_mode(self):
+        """
+        Test that the replay mode serves recorded responses and fails without touching the network on a miss.
+        """
+        cache = ResponseCache(':memory:')
+        with patch('requests.Session.post', return_value=self.mock_response('recorded')):
+            self.make_client(cache).send_request('hello')
+
+        cache.replay = True
+        with patch('requests.Session.post') as mock_post:
+            self.assertEqual(self.make_client(cache).send_request('hello')[0], 'recorded')
+            with self.assertRaises(CacheMissError):
+                self.make_client(cache).send_request('something new')
+            mock_post.assert_not_called()
+
+    def test_ttl_and_lru_eviction(self):
+        """
+        Test that expired entries are ignored and the least recently used ones are evicted.
+        """
+        now = [1000.0]
+        cache = ResponseCache(':memory:', ttl=60, max_entries=2, clock=lambda: now[0])
+        cache.put('a', 'm', 'A', {})
+        now[0] += 1
+        cache.put('b', 'm', 'B', {})
+        now[0] += 1
+        self.assertEqual(cache.get('a')[0], 'A')  # 'a' is now more recently used than 'b'
+        now[0] += 1
+        cache.put('c', 'm', 'C', {})
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(len(cache), 2)
+
+        now[0] += 120
+        self.assertIsNone(cache.get('a'))
+
+
+if __name__ == '__main__':
+    unittest.main()
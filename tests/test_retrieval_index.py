@@ -0,0 +1,103 @@
+import unittest
+from unittest.mock import patch
+from assistants import coding_assistant
+from assistants.coding_assistant import CodingAssistant
+from utils.retrieval_index import RetrievalIndex, chunk_file, tokenize
+
+PROJECT_FILES = {
+    "api/client.py": "class HttpClient:\n    def send_request(self, prompt):\n        return self.session.post(prompt)\n",
+    "utils/pricing.py": "def get_token_cost(model, input_tokens, output_tokens):\n    return input_tokens * 0.01\n",
+    "utils/history.py": "def save_chat_history(history, directory):\n    with open(directory, 'w') as f:\n        f.write(history)\n",
+    "README.md": "# Chat app\nA terminal chat application with a pricing model.\n"
+}
+
+
+class TestRetrievalIndex(unittest.TestCase):
+    """
+    This class contains unit tests for the BM25 retrieval index.
+    """
+
+    def test_tokenize_splits_identifiers(self):
+        """
+        Test that identifiers are kept whole and split into their snake_case and camelCase parts.
+        """
+        self.assertEqual(tokenize("save_chat_history HttpClient"),
+                         ['save_chat_history', 'save', 'chat', 'history', 'httpclient', 'http', 'client'])
+
+    def test_chunk_file(self):
+        """
+        Test that files are split into line ranges with their symbols.
+        """
+        chunks = chunk_file("a.py", "def one():\n    pass\ndef two():\n    pass\nx = 1\n", chunk_lines=2)
+        self.assertEqual([(chunk["start"], chunk["end"]) for chunk in chunks], [(1, 2), (3, 4), (5, 5)])
+        self.assertEqual(chunks[1]["symbols"], ['two'])
+        self.assertEqual(''.join(chunk["text"] for chunk in chunks), "def one():\n    pass\ndef two():\n    pass\nx = 1\n")
+
+    def test_search_ranks_relevant_files_first(self):
+        """
+        Test that the chunks matching the query best are ranked first and unrelated chunks are left out.
+        """
+        index = RetrievalIndex.from_files(PROJECT_FILES)
+        results = index.search("fix the token cost computation")
+        self.assertEqual(results[0][0]["path"], "utils/pricing.py")
+        self.assertNotIn("utils/history.py", [chunk["path"] for chunk, _ in results])
+
+        results = index.search("where is the chat history saved?")
+        self.assertEqual(results[0][0]["path"], "utils/history.py")
+
+    def test_select_respects_budget_and_exclusions(self):
+        """
+        Test that the selection stays within the token budget and skips the excluded chunks.
+        """
+        index = RetrievalIndex.from_files(PROJECT_FILES)
+        query = "chat history pricing token cost"
+        ranked = [chunk for chunk, _ in index.search(query)]
+        selected = index.select(query, ranked[0]["tokens"])
+        self.assertEqual(selected, [ranked[0]])
+
+        selected = index.select(query, 10_000, exclude={ranked[0]["id"]})
+        self.assertNotIn(ranked[0], selected)
+        self.assertEqual(len(selected), len(ranked) - 1)
+
+
+class TestCodingAssistantRetrieval(unittest.TestCase):
+    """
+    This class contains unit tests for the relevance-ranked project prompt of the CodingAssistant.
+    """
+
+    def make_assistant(self, tasks):
+        assistant = CodingAssistant('name', 'motivation', 'role', 'environment', [], [], tasks, '/project')
+        assistant.project_files = dict(PROJECT_FILES)
+        return assistant
+
+    def test_small_project_is_sent_in_full(self):
+        """
+        Test that a project within the budget is sent in full and turns are not augmented.
+        """
+        assistant = self.make_assistant(["Improve the pricing"])
+        prompt = assistant.generate_initial_prompt()
+        for file_path in PROJECT_FILES:
+            self.assertIn(f"#{file_path}\n", prompt)
+        self.assertEqual(assistant.augment_prompt("save the history"), "save the history")
+
+    def test_big_project_sends_relevant_chunks(self):
+        """
+        Test that only the relevant chunks of a project over budget are sent, and that each turn
+        brings the relevant chunks not sent yet.
+        """
+        assistant = self.make_assistant(["Fix the token cost of the pricing"])
+        with patch.object(coding_assistant, 'RETRIEVAL_TOKEN_BUDGET', 65):
+            prompt = assistant.generate_initial_prompt()
+        self.assertIn("#utils/pricing.py\n", prompt)
+        self.assertNotIn("def save_chat_history", prompt)
+        self.assertIn("Other project files, not included:", prompt)
+
+        augmented = assistant.augment_prompt("save the chat history")
+        self.assertIn("<relevant-project-excerpts>\n#utils/history.py\n", augmented)
+        self.assertNotIn("get_token_cost", augmented)
+        # already sent chunks are not sent again
+        self.assertEqual(assistant.augment_prompt("save the chat history"), "save the chat history")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import json
+import tempfile
+import unittest
+from api_clients.anthropic_client import AnthropicClient
+from utils.file_utils import save_chat_history
+from utils.session_journal import SessionJournal, load_journal, find_latest_journal
+
+
+class TestSessionJournal(unittest.TestCase):
+    """
+    This class contains unit tests for the append-only session journal.
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def make_client(self):
+        client = AnthropicClient(api_key='key', api_url='https://api.anthropic.com/v1/messages')
+        client.journal = SessionJournal.create('AnthropicClient', client.model, directory=self.tmp.name)
+        return client
+
+    def test_turns_are_journaled(self):
+        """
+        Test that each turn is appended to the journal and can be reloaded.
+        """
+        client = self.make_client()
+        client.update_chat_history('project context', 'plan', cache=True)
+        client.update_chat_history('question', 'answer')
+        client.journal.flush()
+
+        header, messages = load_journal(client.journal.path)
+        self.assertEqual(header["chatbot"], 'AnthropicClient')
+        self.assertEqual(header["model"], client.model)
+        self.assertEqual([message["text"] for message in messages], ['project context', 'plan', 'question', 'answer'])
+        self.assertTrue(messages[0]["cache"])
+        self.assertEqual(find_latest_journal(self.tmp.name), client.journal.path)
+        client.journal.close()
+
+    def test_resume_after_crash(self):
+        """
+        Test that a journal with a truncated last record can be resumed and appended to.
+        """
+        client = self.make_client()
+        client.update_chat_history('question', 'answer')
+        client.journal.close()
+        with open(client.journal.path, 'a') as f:
+            f.write('{"type": "message", "message": {"sen')  # killed while writing
+
+        header, messages = load_journal(client.journal.path)
+        self.assertEqual(len(messages), 2)
+
+        journal = SessionJournal(client.journal.path)
+        journal.append_messages([{"sender": "user", "text": "again", "timestamp": "now"}])
+        journal.close()
+        _, messages = load_journal(client.journal.path)
+        self.assertEqual([message["text"] for message in messages], ['question', 'answer', 'again'])
+
+    def test_exports_are_generated_from_the_journal(self):
+        """
+        Test that saving the chat history exports the journal to JSON and Markdown.
+        """
+        client = self.make_client()
+        client.update_chat_history('question', 'answer')
+        export_directory = os.path.join(self.tmp.name, 'exports')
+        save_chat_history(client, directory=export_directory)
+        client.journal.close()
+
+        names = sorted(os.listdir(export_directory))
+        with open(os.path.join(export_directory, names[0])) as f:
+            exported = json.load(f)
+        with open(os.path.join(export_directory, names[1])) as f:
+            markdown = f.read()
+        self.assertEqual([message["text"] for message in exported["messages"]], ['question', 'answer'])
+        self.assertIn('**User (', markdown)
+        self.assertIn('** answer', markdown)
+
+
+if __name__ == '__main__':
+    unittest.main()
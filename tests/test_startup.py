@@ -0,0 +1,58 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from benchmarks.bench_startup import imported_lazy_modules, parse_importtime
+from utils.config import Config, load_env_file
+
+
+class TestStartup(unittest.TestCase):
+    """
+    This class contains unit tests for the fast startup of the app and its configuration.
+    """
+
+    def test_heavy_modules_are_lazy(self):
+        """
+        Test that importing the app doesn't import the provider clients, the HTTP stack, NumPy or pytz.
+        """
+        self.assertEqual(imported_lazy_modules(), [])
+
+    def test_parse_importtime(self):
+        """
+        Test that the import time report is limited to the modules imported by the app.
+        """
+        stderr = "import time: self [us] | cumulative | imported package\n" \
+                 "import time:       100 |        100 |   certifi.core\n" \
+                 "import time:        50 |        150 | certifi\n" \
+                 "import time:       200 |        200 |     json.decoder\n" \
+                 "import time:       100 |        300 |   json\n" \
+                 "import time:       400 |        700 | app\n"
+        self.assertEqual(parse_importtime(stderr), {"json.decoder": 200, "json": 300, "app": 700})
+
+    def test_config(self):
+        """
+        Test that the settings are parsed from the environment, with their defaults.
+        """
+        config = Config({"ANTHROPIC_API_KEY": "key", "STREAM_RESPONSES": "false"})
+        self.assertEqual(config.api_settings("anthropic"), ("key", "https://api.anthropic.com/v1/messages"))
+        self.assertEqual(config.api_settings("openai")[0], None)
+        self.assertFalse(config.stream_responses)
+        self.assertTrue(config.preflight_estimate)
+
+    def test_load_env_file(self):
+        """
+        Test that the .env file is loaded without overriding the variables already set.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, '.env')
+            with open(path, 'w') as f:
+                f.write("TERM_CHATBOT_TEST_A=from-file\nTERM_CHATBOT_TEST_B=from-file\n")
+            with patch.dict(os.environ, {"TERM_CHATBOT_TEST_B": "from-env"}):
+                self.assertTrue(load_env_file(path))
+                self.assertEqual(os.environ["TERM_CHATBOT_TEST_A"], "from-file")
+                self.assertEqual(os.environ["TERM_CHATBOT_TEST_B"], "from-env")
+            self.assertFalse(load_env_file(os.path.join(directory, 'missing.env')))
+
+
+if __name__ == '__main__':
+    unittest.main()
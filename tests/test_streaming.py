@@ -0,0 +1,111 @@
+import json
+import unittest
+from unittest.mock import patch, Mock
+from api_clients.anthropic_client import AnthropicClient
+from api_clients.openai_client import OpenAIClient
+from api_clients.sse import iter_sse_events
+
+
+ANTHROPIC_STREAM = [
+    'event: message_start',
+    'data: {"type": "message_start", "message": {"usage": {"input_tokens": 12, "output_tokens": 1}}}',
+    '',
+    'event: content_block_delta',
+    'data: {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": "Hello"}}',
+    '',
+    ': keep-alive',
+    'event: content_block_delta',
+    'data: {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": " world"}}',
+    '',
+    'event: message_delta',
+    'data: {"type": "message_delta", "usage": {"output_tokens": 7}}',
+    '',
+    'event: message_stop',
+    'data: {"type": "message_stop"}',
+    '',
+]
+
+OPENAI_STREAM = [
+    'data: {"choices": [{"delta": {"role": "assistant"}}]}',
+    '',
+    'data: {"choices": [{"delta": {"content": "Hello"}}]}',
+    '',
+    'data: {"choices": [{"delta": {"content": " world"}}]}',
+    '',
+    'data: {"choices": [], "usage": {"prompt_tokens": 9, "completion_tokens": 2}}',
+    '',
+    'data: [DONE]',
+    '',
+]
+
+
+def mock_stream_response(lines):
+    mock_response = Mock(status_code=200, headers={})
+    mock_response.iter_lines.return_value = iter(lines)
+    return mock_response
+
+
+class TestStreaming(unittest.TestCase):
+    """
+    This class contains unit tests for the streaming mode of the API clients.
+    """
+
+    def test_sse_decoder(self):
+        """
+        Test that the SSE decoder groups the lines into events and skips comments.
+        """
+        events = list(iter_sse_events(ANTHROPIC_STREAM))
+        self.assertEqual(len(events), 5)
+        self.assertEqual(events[1][0], 'content_block_delta')
+        self.assertEqual(events[1][1]['delta']['text'], 'Hello')
+
+    @patch('requests.Session.post')
+    def test_anthropic_stream_request(self, mock_post):
+        """
+        Test that the Anthropic client yields the text deltas and records the usage and history.
+        """
+        mock_post.return_value = mock_stream_response(ANTHROPIC_STREAM)
+        client = AnthropicClient(api_key='test-api-key', api_url='https://api.anthropic.com/v1/messages')
+
+        deltas = list(client.stream_request('Hi'))
+
+        self.assertEqual(deltas, ['Hello', ' world'])
+        self.assertEqual(client.last_response, 'Hello world')
+        self.assertEqual((client.last_token_usage["input_tokens"], client.last_token_usage["output_tokens"]), (12, 7))
+        self.assertEqual(client.chat_history["messages"][-1]["text"], 'Hello world')
+        self.assertTrue(json.loads(mock_post.call_args.kwargs['data'])['stream'])
+
+    @patch('requests.Session.post')
+    def test_openai_stream_request(self, mock_post):
+        """
+        Test that the OpenAI client yields the text deltas and reads the usage from the last chunk.
+        """
+        mock_post.return_value = mock_stream_response(OPENAI_STREAM)
+        client = OpenAIClient(api_key='test-api-key', api_url='https://api.openai.com/v1/chat/completions')
+
+        deltas = list(client.stream_request('Hi'))
+
+        self.assertEqual(deltas, ['Hello', ' world'])
+        self.assertEqual((client.last_token_usage["input_tokens"], client.last_token_usage["output_tokens"]), (9, 2))
+        self.assertEqual(json.loads(mock_post.call_args.kwargs['data'])['stream_options'], {'include_usage': True})
+
+    @patch('requests.Session.post')
+    def test_interrupted_stream_keeps_partial_response(self, mock_post):
+        """
+        Test that stopping the stream early keeps the partial response in the chat history.
+        """
+        mock_response = mock_stream_response(ANTHROPIC_STREAM)
+        mock_post.return_value = mock_response
+        client = AnthropicClient(api_key='test-api-key', api_url='https://api.anthropic.com/v1/messages')
+
+        stream = client.stream_request('Hi')
+        self.assertEqual(next(stream), 'Hello')
+        stream.close()
+
+        self.assertEqual(client.last_response, 'Hello')
+        self.assertEqual(client.chat_history["messages"][-1]["text"], 'Hello')
+        mock_response.close.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import unittest
+from unittest.mock import patch
+import app
+from core.chat_engine import ChatSession
+from api_clients.anthropic_client import AnthropicClient
+from api_clients.context_manager import ContextWindowManager
+from api_clients.token_estimator import TokenEstimator, model_family, heuristic_tokens
+from assistants import coding_assistant
+from assistants.coding_assistant import CodingAssistant
+from utils.pricing_model import PricingModel
+
+
+class TestTokenEstimator(unittest.TestCase):
+    """
+    This class contains unit tests for the local token estimator and the pre-flight estimate of the requests.
+    """
+
+    def make_client(self, model='claude-3-haiku-20240307', context_window=200000):
+        client = AnthropicClient(api_key='key', api_url='https://api.example.com/v1')
+        client.model = model
+        client.context_manager = ContextWindowManager(context_windows={model: context_window},
+                                                      token_estimator=TokenEstimator(mode='heuristic'))
+        return client
+
+    def test_model_family(self):
+        """
+        Test that the models are matched to their tokenizer family.
+        """
+        self.assertEqual(model_family('claude-3-opus-20240229'), 'anthropic')
+        self.assertEqual(model_family('gpt-4o'), 'openai')
+        self.assertEqual(model_family('o1-mini'), 'openai')
+        self.assertEqual(model_family('mistral-large'), 'default')
+        self.assertEqual(model_family(None), 'default')
+
+    def test_heuristic_tokens(self):
+        """
+        Test that the heuristic grows with the text and counts code denser than prose.
+        """
+        self.assertEqual(heuristic_tokens(''), 0)
+        short = heuristic_tokens('The quick brown fox')
+        self.assertLess(short, heuristic_tokens('The quick brown fox jumps over the lazy dog'))
+        self.assertGreaterEqual(short, 4)
+        prose = 'the total cost of the request is added to the session'
+        code = 'total_cost += cost(req["in"], req["out"]) * 1e-6;'
+        self.assertGreater(heuristic_tokens(code) / len(code), heuristic_tokens(prose) / len(prose))
+        self.assertGreater(heuristic_tokens('日本語のテキスト'), 5)
+
+    def test_counts_are_memoised(self):
+        """
+        Test that a text is tokenised once per tokenizer, so the history isn't re-tokenised each turn.
+        """
+        estimator = TokenEstimator(mode='heuristic')
+        messages = [{"sender": "user", "text": "hello " * 50}, {"sender": "AI", "text": "world " * 50}]
+        first = estimator.count_messages(messages, 'claude-3-haiku-20240307')
+        self.assertEqual(estimator.count_messages(messages, 'claude-3-haiku-20240307'), first)
+        self.assertEqual(estimator.cache_info().misses, 2)
+        self.assertEqual(estimator.cache_info().hits, 2)
+        estimator.count(messages[0]["text"], 'gpt-4')
+        self.assertEqual(estimator.cache_info().misses, 3)
+
+    def test_estimate_request(self):
+        """
+        Test the pre-flight estimate: a history over budget is compacted, a prompt over budget can't fit.
+        """
+        client = self.make_client(context_window=1000 + 2000 / 0.9)
+        client.update_chat_history('small question', 'small answer')
+        estimate = client.context_manager.estimate_request(client, 'hello')
+        self.assertEqual(estimate["max_output_tokens"], 2000)
+        self.assertEqual(estimate["budget"], 900)
+        self.assertFalse(estimate["compaction"])
+        self.assertTrue(estimate["fits"])
+
+        for i in range(5):
+            client.update_chat_history('question ' * 100, 'answer ' * 100)
+        estimate = client.context_manager.estimate_request(client, 'hello')
+        self.assertGreater(estimate["input_tokens"], 900)
+        self.assertTrue(estimate["compaction"])
+        self.assertTrue(estimate["fits"])
+
+        self.assertFalse(client.context_manager.estimate_request(client, 'word ' * 2000)["fits"])
+
+    def test_preflight_check(self):
+        """
+        Test that the estimate is printed, and that a request that can't fit is only sent if confirmed.
+        """
+        client = self.make_client(context_window=1000 + 2000 / 0.9)
+        session = ChatSession(client, pricing_model=PricingModel())
+        with patch('builtins.print') as printed, patch('builtins.input') as asked:
+            self.assertTrue(app.preflight_check(session, 'hello'))
+            asked.assert_not_called()
+            self.assertIn('input tokens', printed.call_args_list[0].args[0])
+
+            asked.return_value = 'n'
+            self.assertFalse(app.preflight_check(session, 'word ' * 2000))
+            asked.return_value = 'y'
+            self.assertTrue(app.preflight_check(session, 'word ' * 2000))
+
+    def test_project_dump_within_the_context_budget(self):
+        """
+        Test that the project files of the CodingAssistant are limited to a share of the model's context budget.
+        """
+        project_files = {f'module_{i}.py': f'def function_{i}(value):\n    return value * {i}\n' * 20 for i in range(10)}
+        assistant = CodingAssistant('name', 'motivation', 'role', 'environment', [], [], ['multiply values'],
+                                    '/project', context_budget=400, model='gpt-4')
+        assistant.project_files = project_files
+        with patch.object(coding_assistant, 'RETRIEVAL_CONTEXT_SHARE', 0.5):
+            self.assertEqual(assistant.project_token_budget, 200)
+            prompt = assistant.get_project_files_prompt()
+        self.assertFalse(assistant.full_project_sent)
+        self.assertIn("Other project files, not included:", prompt)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,307 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+from utils.pricing_model import PricingModel
+
+# Number of prompts sent concurrently in batch mode, can be overridden in the .env file
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '8'))
+
+
+def parse_prompt_line(line, line_number):
+    """
+    Parse a line of the batch input: a JSON object with a "prompt" (and optionally an "id" and a "model"),
+    or a plain text prompt. Items without an id are identified by their line number.
+
+    Args:
+        line (str): The input line.
+        line_number (int): The line number, from 1.
+
+    Returns:
+        dict: The batch item, or None for a blank line.
+
+    Raises:
+        ValueError: If the line is JSON but not an object with a prompt.
+    """
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        item = json.loads(line)
+    except ValueError:
+        item = line
+    if isinstance(item, str):
+        return {"id": str(line_number), "prompt": item}
+    if not isinstance(item, dict) or not isinstance(item.get("prompt"), str):
+        raise ValueError(f'Line {line_number}: expected a JSON object with a "prompt".')
+    item["id"] = str(item.get("id", line_number))
+    return item
+
+
+def invalid_line_result(line_number, error):
+    """
+    Return the result record of an input line that can't be parsed, written like a failed item so the
+    rest of the batch still runs.
+    """
+    logging.error(f'Batch input line {line_number} skipped: {str(error)}')
+    return {"id": str(line_number), "model": None, "response": None, "token_usage": None, "cost": None,
+            "error": str(error)}
+
+
+def load_completed_ids(output_path):
+    """
+    Return the ids of the items already answered in an output file, to resume an interrupted batch.
+    Failed items are not included, so they are retried.
+
+    Args:
+        output_path (str): The path of the JSONL output.
+
+    Returns:
+        set: The ids of the completed items.
+    """
+    completed = set()
+    try:
+        with open(output_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except ValueError:  # truncated by the interruption
+                    continue
+                if isinstance(result, dict) and result.get("error") is None and "id" in result:
+                    completed.add(result["id"])
+    except FileNotFoundError:
+        pass
+    return completed
+
+
+def run_provider_batch(job, input_file, output_file, completed_ids=(), state_path=None, pricing_model=None,
+                       poll_interval=None, on_poll=None):
+    """
+    Run the prompts of the input through a provider batch API, at the batch price: they are submitted as
+    one batch, which is polled until it is done, then its results are appended to the output.
+    While the batch is running its id is saved in `state_path`, so an interrupted run waits for the same
+    batch instead of submitting the prompts again.
+
+    Args:
+        job (ProviderBatchJob): The batch job of the provider, see `create_batch_job`.
+        input_file (file): The JSONL (or plain text) input.
+        output_file (file): The JSONL output, flushed after each result.
+        completed_ids (set, optional): The ids of the items to skip (already answered).
+        state_path (str, optional): The file keeping the running batch. Defaults to none (no resume).
+        pricing_model (PricingModel, optional): The pricing model for the costs. Defaults to a new PricingModel.
+        poll_interval (float, optional): The first delay between the polls, see `ProviderBatchJob.wait`.
+        on_poll (callable, optional): Called with the batch object after each poll.
+
+    Returns:
+        dict: The summary: items "done", "failed" and "skipped", total "cost" and "seconds".
+    """
+    pricing_model = pricing_model or PricingModel()
+    summary = {"done": 0, "failed": 0, "skipped": 0, "cost": 0.0}
+    start = time.perf_counter()
+
+    state = _load_batch_state(state_path)
+    if state is None:
+        items = []
+        for line_number, line in enumerate(input_file, start=1):
+            try:
+                item = parse_prompt_line(line, line_number)
+            except ValueError as e:
+                output_file.write(json.dumps(invalid_line_result(line_number, e), ensure_ascii=False) + '\n')
+                output_file.flush()
+                summary["failed"] += 1
+                continue
+            if item is None:
+                continue
+            if item["id"] in completed_ids:
+                summary["skipped"] += 1
+                continue
+            items.append(item)
+        if not items:
+            summary["seconds"] = time.perf_counter() - start
+            return summary
+        # the custom ids of the providers are restricted, the item ids are mapped back from the positions
+        requests = [(str(position), job.build_request(item["prompt"], item.get("model"))) for position, item in enumerate(items)]
+        job.submit(requests)
+        state = {"batch_id": job.batch_id, "ids": [item["id"] for item in items],
+                 "models": [params["model"] for _, params in requests]}
+        _save_batch_state(state_path, state)
+    else:
+        job.batch_id = state["batch_id"]
+        logging.info(f'Resuming the provider batch {job.batch_id}')
+
+    job.wait(poll_interval=poll_interval, on_poll=on_poll)
+    for custom_id, response, token_usage, error in job.results():
+        position = int(custom_id)
+        result = {"id": state["ids"][position], "model": state["models"][position], "batch_id": job.batch_id}
+        if result["id"] in completed_ids:
+            continue
+        if error is None:
+            cost = pricing_model.get_usage_cost(result["model"], token_usage, batch=True)
+            result.update({"response": response, "token_usage": token_usage, "cost": cost, "error": None})
+            summary["done"] += 1
+            summary["cost"] += cost or 0.0
+        else:
+            result.update({"response": None, "token_usage": None, "cost": None, "error": error})
+            summary["failed"] += 1
+        output_file.write(json.dumps(result, ensure_ascii=False) + '\n')
+        output_file.flush()
+
+    if state_path is not None and os.path.exists(state_path):
+        os.remove(state_path)
+    summary["seconds"] = time.perf_counter() - start
+    return summary
+
+
+def _load_batch_state(state_path):
+    if state_path is None:
+        return None
+    try:
+        with open(state_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _save_batch_state(state_path, state):
+    if state_path is None:
+        return
+    with open(state_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+
+
+class BatchRunner:
+    """
+    This class runs batch prompts through async API clients with a bounded pool of workers, and writes
+    one JSONL result per prompt, in completion order, as soon as it is available.
+    Each prompt is sent in its own conversation.
+    """
+
+    def __init__(self, client_factory, concurrency=None, pricing_model=None):
+        """
+        Initialize the BatchRunner.
+
+        Args:
+            client_factory (callable): Takes the shared async HTTP client and returns a new async API client with its model set.
+            concurrency (int, optional): The number of prompts in flight. Defaults to BATCH_CONCURRENCY.
+            pricing_model (PricingModel, optional): The pricing model for the costs. Defaults to a new PricingModel.
+        """
+        self.client_factory = client_factory
+        self.concurrency = concurrency or BATCH_CONCURRENCY
+        self.pricing_model = pricing_model or PricingModel()
+
+    async def run(self, input_file, output_file, http_client, completed_ids=()):
+        """
+        Run all the prompts of the input.
+
+        Args:
+            input_file (file): The JSONL (or plain text) input, read line by line.
+            output_file (file): The JSONL output, flushed after each result.
+            http_client (httpx.AsyncClient): The async HTTP client shared by the API clients.
+            completed_ids (set, optional): The ids of the items to skip (already answered).
+
+        Returns:
+            dict: The summary: items "done", "failed" and "skipped", total "cost" and "seconds".
+        """
+        summary = {"done": 0, "failed": 0, "skipped": 0, "cost": 0.0}
+        start = time.perf_counter()
+        queue = asyncio.Queue(maxsize=self.concurrency * 2)
+
+        async def worker():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                result = await self.process(item, http_client)
+                output_file.write(json.dumps(result, ensure_ascii=False) + '\n')
+                output_file.flush()
+                if result["error"] is None:
+                    summary["done"] += 1
+                    summary["cost"] += result["cost"] or 0.0
+                else:
+                    summary["failed"] += 1
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        try:
+            line_number = 0
+            while True:
+                # read in a thread, so a slow stdin doesn't block the requests in flight
+                line = await asyncio.to_thread(input_file.readline)
+                if not line:
+                    break
+                line_number += 1
+                try:
+                    item = parse_prompt_line(line, line_number)
+                except ValueError as e:
+                    output_file.write(json.dumps(invalid_line_result(line_number, e), ensure_ascii=False) + '\n')
+                    output_file.flush()
+                    summary["failed"] += 1
+                    continue
+                if item is None:
+                    continue
+                if item["id"] in completed_ids:
+                    summary["skipped"] += 1
+                    continue
+                await queue.put(item)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+
+        summary["seconds"] = time.perf_counter() - start
+        return summary
+
+    async def process(self, item, http_client):
+        """
+        Send a batch item and return its result record.
+        """
+        ai_chatbot = self.client_factory(http_client)
+        if item.get("model"):
+            ai_chatbot.model = item["model"]
+        result = {"id": item["id"], "model": ai_chatbot.model}
+
+        start = time.perf_counter()
+        try:
+            response, token_usage = await ai_chatbot.send_request(item["prompt"])
+        except Exception as e:
+            logging.error(f'Batch item {item["id"]} failed: {str(e)}')
+            result.update({"response": None, "token_usage": None, "cost": None, "error": str(e)})
+        else:
+            result.update({"response": response, "token_usage": token_usage,
+                           "cost": self.pricing_model.get_usage_cost(ai_chatbot.model, token_usage), "error": None})
+        result["latency"] = round(time.perf_counter() - start, 3)
+        return result
+
+
+def format_batch_summary(summary):
+    """
+    Return a one-line description of a batch summary.
+    """
+    return f"Batch done in {summary['seconds']:.1f}s: {summary['done']} answered, {summary['failed']} failed, " \
+           f"{summary['skipped']} skipped (already answered). Cost: 💵{summary['cost']:.5f}$"
+
+
+def open_batch_input(path):
+    """
+    Open the batch input, '-' for stdin.
+    """
+    if path == '-':
+        return sys.stdin
+    return open(path, 'r', encoding='utf-8')
+
+
+def open_batch_output(path, resume=True):
+    """
+    Open the batch output, in append mode to resume a batch, or truncated to start over.
+    """
+    output_file = open(path, 'a' if resume else 'w', encoding='utf-8')
+    if output_file.tell():
+        with open(path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                # terminate the line truncated by the interruption, so the next results stay readable
+                output_file.write('\n')
+    return output_file
@@ -0,0 +1,223 @@
+import os
+import re
+import sqlite3
+import logging
+from datetime import datetime
+
+# Archive settings, can be overridden in the .env file
+CHAT_ARCHIVE = os.getenv('CHAT_ARCHIVE', 'true').lower() != 'false'
+CHAT_ARCHIVE_PATH = os.getenv('CHAT_ARCHIVE_PATH', os.path.join('chat_histories', 'archive.sqlite3'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    session_key TEXT UNIQUE NOT NULL,
+    chatbot TEXT,
+    model TEXT,
+    started TEXT,
+    saved TEXT NOT NULL,
+    cost REAL,
+    turns INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_model ON sessions (model);
+CREATE INDEX IF NOT EXISTS sessions_started ON sessions (started);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    session_id INTEGER NOT NULL REFERENCES sessions (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    sender TEXT NOT NULL,
+    text TEXT NOT NULL,
+    timestamp TEXT
+);
+CREATE INDEX IF NOT EXISTS messages_session ON messages (session_id, position);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(text, content='messages', content_rowid='id', tokenize='porter unicode61');
+CREATE TRIGGER IF NOT EXISTS messages_after_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_after_delete AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+"""
+
+# Filters of the in-chat /search command, e.g. `/search retry model:gpt-4 since:2024-05-01 maxcost:0.5`
+SEARCH_FILTERS = ('model', 'since', 'until', 'mincost', 'maxcost')
+
+
+def to_match_query(query):
+    """
+    Turn free text into an FTS5 query matching all its words, so punctuation can't break the syntax.
+    A trailing `*` on a word is kept as a prefix search.
+    """
+    terms = re.findall(r'\w+\*?', query)
+    return ' '.join(f'"{term.rstrip("*")}"' + ('*' if term.endswith('*') else '') for term in terms)
+
+
+def parse_search_command(arguments):
+    """
+    Parse the arguments of the in-chat /search command into a query and filters.
+
+    Args:
+        arguments (str): The text after `/search`.
+
+    Returns:
+        tuple: The query (str) and the filters (dict with the keys of SEARCH_FILTERS that were given).
+    """
+    words = []
+    filters = {}
+    for word in arguments.split():
+        name, separator, value = word.partition(':')
+        if separator and name.lower() in SEARCH_FILTERS and value:
+            filters[name.lower()] = value
+        else:
+            words.append(word)
+    for name in ('mincost', 'maxcost'):
+        if name in filters:
+            try:
+                filters[name] = float(filters[name])
+            except ValueError:
+                del filters[name]
+    return ' '.join(words), filters
+
+
+class ChatArchive:
+    """
+    This class is a SQLite archive of the saved chat sessions, with a full-text (FTS5) index of the
+    messages, to search all the past conversations without scanning the export files.
+    """
+
+    def __init__(self, path=None):
+        """
+        Initialize the ChatArchive, creating the database if needed.
+
+        Args:
+            path (str, optional): The path of the SQLite database. Defaults to CHAT_ARCHIVE_PATH.
+        """
+        self.path = path or CHAT_ARCHIVE_PATH
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._connection = sqlite3.connect(self.path)
+        self._connection.row_factory = sqlite3.Row
+        self._connection.execute("PRAGMA foreign_keys = ON")
+        self._connection.executescript(SCHEMA)
+
+    def close(self):
+        self._connection.close()
+
+    def archive_session(self, session_key, messages, chatbot=None, model=None, cost=None):
+        """
+        Store a session, replacing its previous version if it was archived already (e.g. saved twice).
+
+        Args:
+            session_key (str): The unique key of the session (e.g. its journal path).
+            messages (list): The chat history messages, in order.
+            chatbot (str, optional): The name of the API client class.
+            model (str, optional): The model of the session.
+            cost (float, optional): The total cost of the session.
+
+        Returns:
+            int: The id of the archived session.
+        """
+        started = messages[0].get("timestamp") if messages else None
+        saved = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with self._connection:
+            self._connection.execute("DELETE FROM sessions WHERE session_key = ?", (session_key,))
+            cursor = self._connection.execute(
+                "INSERT INTO sessions (session_key, chatbot, model, started, saved, cost, turns) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (session_key, chatbot, model, started or saved, saved, cost, len(messages) // 2))
+            session_id = cursor.lastrowid
+            self._connection.executemany(
+                "INSERT INTO messages (session_id, position, sender, text, timestamp) VALUES (?, ?, ?, ?, ?)",
+                [(session_id, position, message["sender"], message["text"], message.get("timestamp"))
+                 for position, message in enumerate(messages)])
+        return session_id
+
+    def search(self, query, model=None, since=None, until=None, mincost=None, maxcost=None, limit=20):
+        """
+        Full-text search of the archived messages, best matches first.
+
+        Args:
+            query (str): The words to search for (all must match).
+            model (str, optional): Only the sessions of models containing this text.
+            since (str, optional): Only the sessions started on or after this date (YYYY-MM-DD).
+            until (str, optional): Only the sessions started on or before this date (YYYY-MM-DD).
+            mincost (float, optional): Only the sessions that cost at least this much.
+            maxcost (float, optional): Only the sessions that cost at most this much.
+            limit (int, optional): The maximum number of results. Defaults to 20.
+
+        Returns:
+            list: The matches, dictionaries with the session id, model, started date, cost, sender and snippet.
+        """
+        match_query = to_match_query(query)
+        if not match_query:
+            return []
+        conditions = ["messages_fts MATCH ?"]
+        parameters = [match_query]
+        if model:
+            conditions.append("s.model LIKE ?")
+            parameters.append(f"%{model}%")
+        if since:
+            conditions.append("s.started >= ?")
+            parameters.append(since)
+        if until:
+            # dates are compared as text, so the whole `until` day is included
+            conditions.append("substr(s.started, 1, ?) <= ?")
+            parameters += [len(until), until]
+        if mincost is not None:
+            conditions.append("s.cost >= ?")
+            parameters.append(mincost)
+        if maxcost is not None:
+            conditions.append("s.cost <= ?")
+            parameters.append(maxcost)
+        parameters.append(limit)
+
+        rows = self._connection.execute(
+            "SELECT s.id AS session_id, s.model, s.started, s.cost, m.sender, "
+            "snippet(messages_fts, 0, '[', ']', '…', 16) AS snippet "
+            "FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid JOIN sessions s ON s.id = m.session_id "
+            f"WHERE {' AND '.join(conditions)} ORDER BY bm25(messages_fts) LIMIT ?", parameters).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_session(self, session_id):
+        """
+        Return an archived session with its messages.
+
+        Args:
+            session_id (int): The id of the session.
+
+        Returns:
+            dict: The session columns and its "messages", or None if there is no such session.
+        """
+        row = self._connection.execute("SELECT * FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        if row is None:
+            return None
+        session = dict(row)
+        session["messages"] = [dict(message) for message in self._connection.execute(
+            "SELECT sender, text, timestamp FROM messages WHERE session_id = ? ORDER BY position", (session_id,))]
+        return session
+
+
+def format_search_results(results):
+    """
+    Return the search results as printable lines.
+    """
+    if not results:
+        return "No match found."
+    lines = []
+    for result in results:
+        cost = f"💵{result['cost']:.5f}$" if result['cost'] is not None else "💵?"
+        snippet = ' '.join(result['snippet'].split())
+        lines.append(f"#{result['session_id']} {result['started']} {result['model']} {cost} {result['sender']}: {snippet}")
+    return '\n'.join(lines)
+
+
+def open_archive():
+    """
+    Open the chat archive, or return None if it is disabled or can't be opened.
+    """
+    if not CHAT_ARCHIVE:
+        return None
+    try:
+        return ChatArchive()
+    except sqlite3.Error as e:
+        logging.error(f'Cannot open the chat archive {CHAT_ARCHIVE_PATH}: {str(e)}')
+        return None
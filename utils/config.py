@@ -0,0 +1,85 @@
+import os
+import threading
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_API_URLS = {
+    "anthropic": "https://api.anthropic.com/v1/messages",
+    "openai": "https://api.openai.com/v1/chat/completions"
+}
+
+
+def load_env_file(path=None):
+    """
+    Load the .env file into the environment, without overriding the variables already set.
+    python-dotenv is only imported when there is a file to load.
+
+    Args:
+        path (str, optional): The .env file. Defaults to the one in the working directory, then the project root.
+
+    Returns:
+        bool: Whether a file was loaded.
+    """
+    candidates = [path] if path else [os.path.join(os.getcwd(), '.env'), os.path.join(PROJECT_ROOT, '.env')]
+    for candidate in candidates:
+        if os.path.isfile(candidate):
+            from dotenv import load_dotenv
+            return load_dotenv(candidate)
+    return False
+
+
+class Config:
+    """
+    This class holds the settings of the app, parsed once from the environment (and the .env file).
+    The settings of the modules loaded on demand (HTTP, caching, batch...) are still read by
+    each module when it is imported, after the .env file has been loaded.
+    """
+
+    def __init__(self, environ=None):
+        """
+        Initialize the Config.
+
+        Args:
+            environ (dict, optional): The environment variables. Defaults to os.environ.
+        """
+        environ = os.environ if environ is None else environ
+        self.api_keys = {
+            "anthropic": environ.get('ANTHROPIC_API_KEY'),
+            "openai": environ.get('OPENAI_API_KEY')
+        }
+        self.api_urls = {
+            "anthropic": environ.get('ANTHROPIC_API_URL', DEFAULT_API_URLS["anthropic"]),
+            "openai": environ.get('OPENAI_API_URL', DEFAULT_API_URLS["openai"])
+        }
+        # Stream the responses token by token (set STREAM_RESPONSES=false to wait for the full response)
+        self.stream_responses = environ.get('STREAM_RESPONSES', 'true').lower() != 'false'
+        # Show the estimated input tokens and cost of each request before sending it (set PREFLIGHT_ESTIMATE=false to hide them)
+        self.preflight_estimate = environ.get('PREFLIGHT_ESTIMATE', 'true').lower() != 'false'
+
+    def api_settings(self, provider):
+        """
+        Return the API key and URL of a provider.
+
+        Args:
+            provider (str): The provider, e.g. 'anthropic'.
+
+        Returns:
+            tuple: The API key (None if not set) and the API URL.
+        """
+        return self.api_keys.get(provider), self.api_urls.get(provider)
+
+
+_config = None
+_config_lock = threading.Lock()
+
+
+def get_config():
+    """
+    Return the shared configuration, loading the .env file and parsing the environment on first use.
+    """
+    global _config
+    with _config_lock:
+        if _config is None:
+            load_env_file()
+            _config = Config()
+        return _config
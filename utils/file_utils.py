@@ -1,29 +1,49 @@
 import json
 import os
 from datetime import datetime 
+from utils.session_journal import export_journal
+from api_clients.instrumentation import get_instrumentation
+from api_clients.message_store import to_dict
 
-def save_chat_history(self, directory="chat_histories"):
+def save_chat_history(self, directory="chat_histories", archive=None, cost=None):
     """Saves the chat history to a JSON file and as a Markdown file in the specified directory.
 
     Args:
         directory (str, optional): The directory to save the chat history. Defaults to "chat_histories".
+        archive (ChatArchive, optional): The searchable archive to also store the session in.
+        cost (float, optional): The total cost of the session, stored in the archive.
     """
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"chat_history_{timestamp}"
-    filepath = os.path.join(directory, filename)
+    with get_instrumentation().span('save_history_seconds'):
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"chat_history_{timestamp}"
+        filepath = os.path.join(directory, filename)
 
-    os.makedirs(directory, exist_ok=True)  # Create the directory if it doesn't exist
+        os.makedirs(directory, exist_ok=True)  # Create the directory if it doesn't exist
 
-    # Ensure that any context is also saved
-    if "context" not in self.chat_history:  
-        self.chat_history["context"] = {}
+        # the turns compacted out of the context window are still part of the conversation
+        messages = self.chat_history.get('compacted_messages', []) + self.chat_history['messages']
 
-    with open(filepath + '.json', "w") as f:
-        json.dump(self.chat_history, f, indent=4)  
+        # the session journal already has every turn, the exports are generated from it
+        journal = getattr(self, 'journal', None)
+        if journal is not None:
+            journal.flush()
+            export_journal(journal.path, filepath)
+        else:
+            # Ensure that any context is also saved
+            if "context" not in self.chat_history:  
+                self.chat_history["context"] = {}
 
-    with open(filepath + '.md', "w") as f:
-        for message in self.chat_history['messages']:
-            if message['sender'] == 'user':
-                f.write(f"**User ({message['timestamp']}):** {message['text']}\n\n")
-            else:  
-                f.write(f"**Assistant ({message['timestamp']}):** {message['text']}\n\n") 
+            with open(filepath + '.json', "w") as f:
+                json.dump(self.chat_history, f, indent=4, default=to_dict)  
+
+            with open(filepath + '.md', "w") as f:
+                for message in messages:
+                    if message['sender'] == 'user':
+                        f.write(f"**User ({message['timestamp']}):** {message['text']}\n\n")
+                    else:  
+                        f.write(f"**Assistant ({message['timestamp']}):** {message['text']}\n\n")
+
+        if archive is not None:
+            # a resumed session keeps its journal, so saving it again replaces its archived version
+            session_key = journal.path if journal is not None else filepath
+            archive.archive_session(session_key, messages, chatbot=type(self).__name__, model=self.model, cost=cost)
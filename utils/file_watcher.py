@@ -0,0 +1,185 @@
+import os
+import sys
+import time
+import errno
+import select
+import ctypes
+import ctypes.util
+import logging
+
+# Interval of the polling fallback, when inotify is not available (seconds)
+FILE_WATCH_POLL_INTERVAL = float(os.getenv('FILE_WATCH_POLL_INTERVAL', '0.1'))
+
+# inotify events signalling that a file of the watched directory may have changed
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+
+class InotifyBackend:
+    """
+    This class waits for changes in a directory with Linux inotify (through libc, no dependency needed).
+    The directory is watched rather than the file, so editors saving through a rename are seen too.
+    """
+
+    def __init__(self, directory):
+        """
+        Initialize the InotifyBackend.
+
+        Args:
+            directory (str): The directory to watch.
+
+        Raises:
+            OSError: If inotify is not available.
+        """
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, f'inotify_add_watch failed for {directory}')
+
+    def wait(self, timeout=None):
+        """
+        Block until the directory changes or the timeout expires.
+
+        Returns:
+            bool: True if a change was notified.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        try:
+            # the events themselves don't matter, the caller checks the file
+            while os.read(self.fd, 4096):
+                pass
+        except OSError as e:
+            if e.errno != errno.EAGAIN:
+                raise
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingBackend:
+    """
+    This class waits for changes of a file by polling its stat (modification time and size),
+    without reading it.
+    """
+
+    def __init__(self, path, interval=None):
+        """
+        Initialize the PollingBackend.
+
+        Args:
+            path (str): The file to watch.
+            interval (float, optional): The polling interval in seconds. Defaults to FILE_WATCH_POLL_INTERVAL.
+        """
+        self.path = path
+        self.interval = interval or FILE_WATCH_POLL_INTERVAL
+        self._last_stat = self._stat()
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def wait(self, timeout=None):
+        """
+        Block until the file changes or the timeout expires.
+
+        Returns:
+            bool: True if a change was seen.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            current_stat = self._stat()
+            if current_stat != self._last_stat:
+                self._last_stat = current_stat
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(self.interval)
+
+    def close(self):
+        pass
+
+
+class FileWatcher:
+    """
+    This class waits for a file to reach a given state, checking it only when it changes.
+    It uses inotify when available and falls back to polling the file stat.
+    """
+
+    def __init__(self, path, use_inotify=True):
+        """
+        Initialize the FileWatcher.
+
+        Args:
+            path (str): The file to watch.
+            use_inotify (bool, optional): Whether to try inotify before polling. Defaults to True.
+        """
+        self.path = path
+        self.backend = None
+        if use_inotify and sys.platform.startswith('linux'):
+            try:
+                self.backend = InotifyBackend(os.path.dirname(os.path.abspath(path)))
+            except (OSError, AttributeError, TypeError) as e:
+                logging.info(f'inotify not available, polling {path}: {str(e)}')
+        if self.backend is None:
+            self.backend = PollingBackend(path)
+
+    def wait_for(self, predicate, timeout=None):
+        """
+        Block until `predicate()` is true, evaluating it once and then after each change of the file.
+
+        Args:
+            predicate (callable): The condition to wait for.
+            timeout (float, optional): The maximum time to wait in seconds. Defaults to no limit.
+
+        Returns:
+            bool: True if the condition was met, False on timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not predicate():
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            self.backend.wait(remaining)
+        return True
+
+    def close(self):
+        self.backend.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_tail(path, size):
+    """
+    Read the last bytes of a file, so checking for an end marker doesn't re-read the whole file.
+
+    Args:
+        path (str): The file.
+        size (int): The number of bytes to read.
+
+    Returns:
+        bytes: The last bytes of the file (empty if it doesn't exist).
+    """
+    try:
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - size))
+            return f.read()
+    except FileNotFoundError:
+        return b''
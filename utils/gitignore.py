@@ -0,0 +1,177 @@
+import re
+
+
+class GitIgnoreRule:
+    """
+    This class represents a single pattern of a `.gitignore` file, compiled to a regular expression.
+    """
+
+    def __init__(self, pattern):
+        """
+        Initialize the GitIgnoreRule from a stripped, non-empty, non-comment line.
+
+        Args:
+            pattern (str): The pattern line.
+        """
+        self.negated = False
+        if pattern.startswith('!'):
+            self.negated = True
+            pattern = pattern[1:]
+        elif pattern.startswith('\\!') or pattern.startswith('\\#'):
+            pattern = pattern[1:]
+
+        self.dir_only = pattern.endswith('/')
+        pattern = pattern.rstrip('/')
+
+        # a pattern with a slash (other than a trailing one) is relative to the .gitignore directory,
+        # otherwise it matches a name at any depth
+        self.anchored = '/' in pattern
+        pattern = pattern.lstrip('/')
+        self.pattern = pattern
+        self.regex = re.compile(f"^{_translate(pattern)}$", re.DOTALL)
+
+    def matches(self, path, is_dir):
+        """
+        Check whether the rule matches a path.
+
+        Args:
+            path (str): The path relative to the directory of the .gitignore file, with `/` separators.
+            is_dir (bool): Whether the path is a directory.
+
+        Returns:
+            bool: True if the rule matches.
+        """
+        if self.dir_only and not is_dir:
+            return False
+        if self.anchored:
+            return self.regex.match(path) is not None
+        return self.regex.match(path.rsplit('/', 1)[-1]) is not None
+
+
+def parse_gitignore(lines):
+    """
+    Parse the lines of a `.gitignore` file.
+
+    Args:
+        lines (iterable): The lines of the file.
+
+    Returns:
+        list: The GitIgnoreRule objects, in order.
+    """
+    rules = []
+    for line in lines:
+        line = line.rstrip('\n').rstrip('\r')
+        # trailing spaces are ignored unless escaped
+        stripped = line.rstrip(' ')
+        if stripped.endswith('\\') and len(stripped) < len(line):
+            stripped += ' '
+        if not stripped or stripped.startswith('#'):
+            continue
+        rules.append(GitIgnoreRule(stripped))
+    return rules
+
+
+class GitIgnoreMatcher:
+    """
+    This class matches paths against a stack of `.gitignore` files (the root one and the nested ones),
+    with git's precedence: the last matching pattern wins, and deeper files override their parents.
+    """
+
+    def __init__(self, rule_sets=()):
+        """
+        Initialize the GitIgnoreMatcher.
+
+        Args:
+            rule_sets (tuple, optional): The (base directory, rules) pairs, outermost first.
+        """
+        self.rule_sets = tuple(rule_sets)
+
+    def child(self, base, rules):
+        """
+        Return a matcher extended with the rules of a nested `.gitignore` file.
+
+        Args:
+            base (str): The directory of the .gitignore file, relative to the project root ('' for the root).
+            rules (list): The rules of the file.
+
+        Returns:
+            GitIgnoreMatcher: The extended matcher (self if there are no rules).
+        """
+        if not rules:
+            return self
+        return GitIgnoreMatcher(self.rule_sets + ((base, rules),))
+
+    def is_ignored(self, path, is_dir=False):
+        """
+        Check whether a path is ignored.
+
+        Args:
+            path (str): The path relative to the project root, with `/` separators.
+            is_dir (bool, optional): Whether the path is a directory. Defaults to False.
+
+        Returns:
+            bool: True if the path is ignored.
+        """
+        ignored = False
+        for base, rules in self.rule_sets:
+            if base:
+                if not path.startswith(base + '/'):
+                    continue
+                relative_path = path[len(base) + 1:]
+            else:
+                relative_path = path
+            for rule in rules:
+                if rule.matches(relative_path, is_dir):
+                    ignored = not rule.negated
+        return ignored
+
+
+def _translate(pattern):
+    """
+    Translate a gitignore glob to a regular expression: `*` and `?` don't match `/`,
+    `**` matches across directories and `[...]` is a character class.
+    """
+    i = 0
+    n = len(pattern)
+    result = ''
+    while i < n:
+        char = pattern[i]
+        if char == '*':
+            if pattern[i:i + 2] == '**' and (i == 0 or pattern[i - 1] == '/') and (i + 2 == n or pattern[i + 2] == '/'):
+                if i + 2 == n:
+                    result += '.*'      # trailing `/**`: everything inside
+                    i += 2
+                else:
+                    result += '(?:.*/)?'  # `**/`: zero or more directories
+                    i += 3
+                continue
+            while i < n and pattern[i] == '*':
+                i += 1
+            result += '[^/]*'
+            continue
+        if char == '?':
+            result += '[^/]'
+        elif char == '[':
+            start = i + 1
+            if pattern[start:start + 1] in ('!', '^'):
+                start += 1
+            if pattern[start:start + 1] == ']':  # a leading `]` is part of the class
+                start += 1
+            end = pattern.find(']', start)
+            if end == -1:
+                result += re.escape(char)
+            else:
+                char_class = pattern[i + 1:end]
+                if char_class[0] in '!^':
+                    char_class = '^' + char_class[1:]
+                elif char_class[0] == '[':
+                    char_class = '\\' + char_class
+                result += '[' + char_class + ']'
+                i = end
+        elif char == '\\' and i + 1 < n:
+            i += 1
+            result += re.escape(pattern[i])
+        else:
+            result += re.escape(char)
+        i += 1
+    return result
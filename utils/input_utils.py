@@ -1,47 +1,139 @@
-import readline
 import os
-import time
+import shlex
+import shutil
+import atexit
+import logging
+import tempfile
+import subprocess
+from utils.file_watcher import FileWatcher, read_tail
+
+# 'tmux' opens the editor in a tmux pane, 'blocking' runs it in the terminal until it exits,
+# 'auto' uses tmux when running inside a tmux session
+PROMPT_EDITOR_MODE = os.getenv('PROMPT_EDITOR_MODE', 'auto')
+MARKER = 'send'
+
+_session_dir = None
+
+
+def get_editor():
+    """
+    Return the editor command: PROMPT_EDITOR, then EDITOR, then nvim.
+    """
+    return os.environ.get('PROMPT_EDITOR') or os.environ.get('EDITOR') or 'nvim'
+
+
+def get_prompt_file():
+    """
+    Return an empty prompt file in a directory private to this session, so concurrent sessions
+    don't collide. The directory is removed when the app exits.
+    """
+    global _session_dir
+    if _session_dir is None:
+        _session_dir = tempfile.mkdtemp(prefix='term_chatbot_')
+        atexit.register(shutil.rmtree, _session_dir, True)
+    path = os.path.join(_session_dir, 'prompt.md')
+    with open(path, 'w') as f:
+        f.write('')
+    return path
+
+
+def use_tmux():
+    if PROMPT_EDITOR_MODE == 'tmux':
+        return True
+    if PROMPT_EDITOR_MODE == 'blocking':
+        return False
+    return bool(os.environ.get('TMUX')) and shutil.which('tmux') is not None
+
+
+def has_marker(path):
+    """
+    Check whether the prompt file ends with the send marker, reading only its end.
+    """
+    tail = read_tail(path, len(MARKER) + 16).decode('utf-8', errors='ignore').strip()
+    return tail == MARKER or tail.endswith(f"\n{MARKER}")
+
+
+def read_prompt_file(path):
+    """
+    Read the prompt file, without the send marker.
+    """
+    try:
+        with open(path, 'r') as f:
+            content = f.read().strip()
+    except FileNotFoundError:
+        return ''
+    if content == MARKER:
+        return ''
+    if content.endswith(f"\n{MARKER}"):
+        content = content[:-len(MARKER) - 1]
+    return content.strip()
+
+
+def edit_in_tmux_pane(path, editor):
+    """
+    Open the editor in a new tmux pane and wait, without polling, until the prompt is sent: either the
+    editor is closed (the pane then appends the marker) or the marker is typed on the last line and saved.
+    """
+    command = f"{editor} {shlex.quote(path)}; echo {MARKER} >> {shlex.quote(path)}"
+    with FileWatcher(path) as watcher:
+        result = subprocess.run(['tmux', 'split-window', '-v', '-P', '-F', '#{pane_id}', command],
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f'tmux split-window failed: {result.stderr.strip()}')
+        pane_id = result.stdout.strip()
+        subprocess.run(['tmux', 'resize-pane', '-t', pane_id, '-D', '10'], capture_output=True)
+
+        watcher.wait_for(lambda: has_marker(path))
+
+    # the pane closes itself with the editor, kill it in case the marker was typed in the editor
+    subprocess.run(['tmux', 'kill-pane', '-t', pane_id], capture_output=True)
+
+
+def edit_in_terminal(path, editor):
+    """
+    Run the editor in the terminal and wait for it to exit.
+    """
+    subprocess.run(shlex.split(editor) + [path])
+
+
+def editor_edit_mode():
+    """
+    Get the user input from an editor, in a tmux pane or in the terminal depending on PROMPT_EDITOR_MODE.
+
+    Returns:
+        str: The user input, or None if nothing was written.
+    """
+    editor = get_editor()
+    path = get_prompt_file()
+
+    try:
+        if use_tmux():
+            print(f"Close the editor, or type '{MARKER}' on a new line and save, to send the message.")
+            edit_in_tmux_pane(path, editor)
+        else:
+            print("Save and close the editor to send the message.")
+            edit_in_terminal(path, editor)
+    except (OSError, RuntimeError) as e:
+        logging.error(f'Editor mode failed: {str(e)}')
+        print(f"The editor could not be opened: {str(e)}")
+        return None
 
-def get_user_input():
-    editor = os.environ.get('PROMPT_EDITOR', 'nvim')
-    marker = 'send'
+    user_input = read_prompt_file(path)
+    os.remove(path)
+    if user_input:
+        return user_input
+    print("No input provided. Exiting gracefully.")
+    return None
 
+
+def get_user_input():
+    # line editing of the prompts, loaded on first use rather than at startup
+    import readline  # noqa: F401
     while True:
         edit_mode = input("Editing mode ('e' for editor, 'k' for keyboard, 'q' to quit): ")
 
         if edit_mode == 'e':
-            print("Type 'send; on a new line to send message.")
-            with open('prompt.txt', 'w') as f:
-                f.write('')
-
-            # Open tmux and split the screen
-            os.system('tmux split-window -v && tmux resize-pane -D 10')
-            os.system(f'tmux send-keys "{editor} prompt.txt; echo {marker} >> prompt.txt" C-m')
-
-            # Wait for the marker to appear in the file
-            while True:
-                with open('prompt.txt', 'r') as f:
-                    content = f.read().strip()
-                    if content.endswith(f"\n{marker}"):
-                        break
-                time.sleep(0.1)
-
-            # Kill the tmux window
-            os.system('tmux kill-pane')
-
-            if os.path.exists('prompt.txt'):
-                with open('prompt.txt', 'r') as f:
-                    user_input = f.read().strip().replace(f'\n{marker}', '').strip()
-                os.remove('prompt.txt')
-            else:
-                user_input = ''
-
-            if user_input:
-                return user_input
-            else:
-                print("No input provided. Exiting gracefully.")
-                return None
-
+            return editor_edit_mode()
         elif edit_mode == 'k':
             return default_edit_mode()
         elif edit_mode == 'q':
@@ -51,6 +143,7 @@ def get_user_input():
 
 def default_edit_mode():
     # Implementation of the default editing mode with keyboard navigation
+    import readline
 
     def custom_key_bindings(user_input):
         def pre_input_hook():
@@ -1,21 +1,40 @@
+from api_clients.model_registry import get_model_registry
+
+
 class PricingModel:
-    def __init__(self):
-        self.pricing_data = {
-            "claude-3-haiku-20240307": {"input": 0.25, "output": 1.25},
-            "claude-3-sonnet-20240229": {"input": 3.0, "output": 15.0},
-            "claude-3-opus-20240229": {"input": 15.0, "output": 75.0},
-            "gpt-3.5-turbo": {"input": 0.5, "output": 1.5},
-            "gpt-4": {"input": 30.0, "output": 60.0},
-            "gpt-4-turbo-preview": {"input": 10.0, "output": 30.0}
-        }
-
-    def get_token_cost(self, model, input_tokens, output_tokens):
-        pricing = self.pricing_data.get(model.lower(), None)
+    # Both providers bill the requests of their batch APIs at half price, unless the registry says otherwise
+    BATCH_DISCOUNT = 0.5
+
+    def __init__(self, registry=None):
+        """
+        Initialize the PricingModel.
+
+        Args:
+            registry (ModelRegistry, optional): The prices of the models. Defaults to the shared model registry.
+        """
+        self.registry = registry or get_model_registry()
+
+    def get_token_cost(self, model, input_tokens, output_tokens, cache_read_tokens=0, cache_write_tokens=0, batch=False):
+        # $ per million tokens, cache_read/cache_write default to the input price when the model has no cache pricing
+        pricing = self.registry.pricing(model.lower())
         if pricing is None:
             return None
 
         input_cost = pricing["input"] * input_tokens / 1_000_000
         output_cost = pricing["output"] * output_tokens / 1_000_000
-        total_cost = input_cost + output_cost
+        cache_read_cost = pricing.get("cache_read", pricing["input"]) * cache_read_tokens / 1_000_000
+        cache_write_cost = pricing.get("cache_write", pricing["input"]) * cache_write_tokens / 1_000_000
+        total_cost = input_cost + output_cost + cache_read_cost + cache_write_cost
+        if batch:
+            total_cost *= pricing.get("batch_discount", self.BATCH_DISCOUNT)
 
         return total_cost
+
+    def get_usage_cost(self, model, token_usage, batch=False):
+        """
+        Return the cost of a request from the token usage dictionary returned by the API clients.
+        Set `batch` for the requests sent through a provider batch API.
+        """
+        return self.get_token_cost(model, token_usage["input_tokens"], token_usage["output_tokens"],
+                                   token_usage.get("cache_read_tokens", 0), token_usage.get("cache_write_tokens", 0),
+                                   batch=batch)
@@ -0,0 +1,185 @@
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from utils.gitignore import GitIgnoreMatcher, parse_gitignore
+
+# Ingestion settings, can be overridden in the .env file
+PROJECT_MAX_FILE_SIZE = int(os.getenv('PROJECT_MAX_FILE_SIZE', str(1024 * 1024)))  # bytes
+PROJECT_READ_WORKERS = int(os.getenv('PROJECT_READ_WORKERS', '8'))
+
+# Directories never worth sending, even without a .gitignore
+ALWAYS_IGNORED_DIRS = {'.git', '.hg', '.svn'}
+
+# Bytes sniffed to detect binary files
+BINARY_SNIFF_SIZE = 8192
+
+
+def scan_project(project_folder, max_file_size=None):
+    """
+    Walk the project folder and list the files to ingest. Ignored directories are pruned before
+    descending, following the root and nested `.gitignore` files (and `.git/info/exclude`).
+
+    Args:
+        project_folder (str): The path to the project folder.
+        max_file_size (int, optional): Files bigger than this (in bytes) are skipped. Defaults to PROJECT_MAX_FILE_SIZE.
+
+    Returns:
+        tuple: The list of (relative path, absolute path, os.stat_result) of the files to read,
+        and a dictionary counting the skipped files by reason.
+    """
+    max_file_size = PROJECT_MAX_FILE_SIZE if max_file_size is None else max_file_size
+    skipped = {"ignored": 0, "oversized": 0}
+    files = []
+
+    matcher = GitIgnoreMatcher()
+    exclude_path = os.path.join(project_folder, '.git', 'info', 'exclude')
+    matcher = matcher.child('', _read_gitignore(exclude_path))
+
+    stack = [('', matcher)]
+    while stack:
+        relative_dir, matcher = stack.pop()
+        directory = os.path.join(project_folder, relative_dir)
+        matcher = matcher.child(relative_dir, _read_gitignore(os.path.join(directory, '.gitignore')))
+
+        try:
+            entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+        except OSError as e:
+            logging.warning(f'Cannot read directory {directory}: {str(e)}')
+            continue
+
+        subdirectories = []
+        for entry in entries:
+            relative_path = f"{relative_dir}/{entry.name}" if relative_dir else entry.name
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+            except OSError:
+                continue
+
+            if is_dir:
+                if entry.name in ALWAYS_IGNORED_DIRS or matcher.is_ignored(relative_path, is_dir=True):
+                    skipped["ignored"] += 1
+                    continue
+                subdirectories.append((relative_path, matcher))
+                continue
+
+            if not entry.is_file() or matcher.is_ignored(relative_path):
+                skipped["ignored"] += 1
+                continue
+
+            stat = entry.stat()
+            if stat.st_size > max_file_size:
+                skipped["oversized"] += 1
+                logging.debug(f'Skipped oversized file: {relative_path} ({stat.st_size} bytes)')
+                continue
+            files.append((relative_path, entry.path, stat))
+
+        # reversed so the directories are visited in alphabetical order
+        stack.extend(reversed(subdirectories))
+
+    return files, skipped
+
+
+def read_text_file(path):
+    """
+    Read a file as UTF-8 text.
+
+    Args:
+        path (str): The path to the file.
+
+    Returns:
+        str: The content of the file, or None if it is binary, not UTF-8 or unreadable.
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError as e:
+        logging.warning(f'Cannot read file {path}: {str(e)}')
+        return None
+
+    if b'\0' in data[:BINARY_SNIFF_SIZE]:
+        return None
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        return None
+
+
+def ingest_project(project_folder, max_file_size=None, workers=None, snapshot=None):
+    """
+    Read the text files of a project folder, in a thread pool. With a snapshot, the files unchanged
+    since it was taken are not read again, and the snapshot is updated with the current files.
+
+    Args:
+        project_folder (str): The path to the project folder.
+        max_file_size (int, optional): Files bigger than this (in bytes) are skipped. Defaults to PROJECT_MAX_FILE_SIZE.
+        workers (int, optional): The number of reader threads. Defaults to PROJECT_READ_WORKERS.
+        snapshot (ProjectSnapshot, optional): The snapshot of the previous ingestion.
+
+    Returns:
+        tuple: A dictionary of file contents keyed by relative path, and a summary dictionary
+        (files read, files reused from the snapshot, skipped files by reason, bytes read and duration).
+    """
+    start = time.perf_counter()
+    files, skipped = scan_project(project_folder, max_file_size)
+
+    contents = [None] * len(files)
+    to_read = []
+    for i, (relative_path, _, stat) in enumerate(files):
+        if snapshot is not None:
+            contents[i] = snapshot.get_content(relative_path, stat)
+        if contents[i] is None:
+            to_read.append(i)
+    cached = len(files) - len(to_read)
+
+    with ThreadPoolExecutor(max_workers=workers or PROJECT_READ_WORKERS) as executor:
+        for i, content in zip(to_read, executor.map(read_text_file, [files[i][1] for i in to_read])):
+            contents[i] = content
+
+    project_files = {}
+    snapshot_files = {}
+    total_bytes = 0
+    skipped["binary"] = 0
+    for (relative_path, _, stat), content in zip(files, contents):
+        if content is None:
+            skipped["binary"] += 1
+            logging.debug(f'Skipped binary or non UTF-8 file: {relative_path}')
+            continue
+        project_files[relative_path] = content
+        total_bytes += stat.st_size
+        if snapshot is not None:
+            entry = snapshot.files.get(relative_path)
+            if entry is None or entry["content"] is not content:
+                entry = snapshot.make_entry(stat, content)
+            snapshot_files[relative_path] = entry
+
+    if snapshot is not None:
+        snapshot.files = snapshot_files
+
+    summary = {
+        "files": len(project_files),
+        "cached": cached,
+        "bytes": total_bytes,
+        "skipped": skipped,
+        "seconds": time.perf_counter() - start
+    }
+    return project_files, summary
+
+
+def format_ingestion_summary(summary):
+    """
+    Return a one-line description of an ingestion summary.
+    """
+    skipped = summary["skipped"]
+    cached = f", {summary['cached']} from cache" if summary.get("cached") else ''
+    return f"Read {summary['files']} files ({summary['bytes'] / 1024:.1f} KB{cached}) in {summary['seconds']:.2f}s, " \
+           f"skipped {skipped.get('ignored', 0)} ignored, {skipped.get('binary', 0)} binary and " \
+           f"{skipped.get('oversized', 0)} oversized."
+
+
+def _read_gitignore(path):
+    try:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            return parse_gitignore(f)
+    except OSError:
+        return []
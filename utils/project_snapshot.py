@@ -0,0 +1,130 @@
+import os
+import json
+import difflib
+import hashlib
+import logging
+
+# Project snapshot cache settings, can be overridden in the .env file
+PROJECT_CACHE = os.getenv('PROJECT_CACHE', 'true').lower() != 'false'
+PROJECT_CACHE_DIR = os.getenv('PROJECT_CACHE_DIR', os.path.join('~', '.cache', 'term_chatbot', 'projects'))
+
+# Bumped when the format of the snapshot files changes, older snapshots are then ignored
+SNAPSHOT_VERSION = 1
+
+
+class ProjectSnapshot:
+    """
+    This class is the on-disk snapshot of an ingested project: for each file its modification time,
+    size and content. It lets a restart re-read only the files that changed since the
+    last ingestion, and tells which files changed during a session.
+    """
+
+    def __init__(self, project_folder, files=None, cache_dir=None):
+        """
+        Initialize the ProjectSnapshot.
+
+        Args:
+            project_folder (str): The path to the project folder.
+            files (dict, optional): The file entries ({"mtime_ns", "size", "content"}) keyed by relative path.
+            cache_dir (str, optional): The directory of the snapshot files. Defaults to PROJECT_CACHE_DIR.
+        """
+        self.project_folder = os.path.abspath(project_folder)
+        self.files = files or {}
+        self.cache_dir = os.path.expanduser(cache_dir or PROJECT_CACHE_DIR)
+
+    @property
+    def path(self):
+        """
+        The path of the snapshot file, keyed by the absolute path of the project.
+        """
+        key = hashlib.sha256(self.project_folder.encode('utf-8')).hexdigest()[:32]
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    @classmethod
+    def load(cls, project_folder, cache_dir=None):
+        """
+        Load the snapshot of a project, or return an empty one if there is none (or it can't be read).
+
+        Args:
+            project_folder (str): The path to the project folder.
+            cache_dir (str, optional): The directory of the snapshot files. Defaults to PROJECT_CACHE_DIR.
+
+        Returns:
+            ProjectSnapshot: The snapshot.
+        """
+        snapshot = cls(project_folder, cache_dir=cache_dir)
+        try:
+            with open(snapshot.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return snapshot
+        except (OSError, ValueError) as e:
+            logging.warning(f'Cannot read the project snapshot {snapshot.path}: {str(e)}')
+            return snapshot
+
+        if data.get("version") == SNAPSHOT_VERSION and data.get("project_folder") == snapshot.project_folder:
+            snapshot.files = data.get("files", {})
+        return snapshot
+
+    def save(self):
+        """
+        Write the snapshot to disk, atomically so an interrupted write never leaves a corrupt snapshot.
+        """
+        data = {"version": SNAPSHOT_VERSION, "project_folder": self.project_folder, "files": self.files}
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logging.warning(f'Cannot write the project snapshot {self.path}: {str(e)}')
+
+    def get_content(self, relative_path, stat):
+        """
+        Return the cached content of a file if it is unchanged (same modification time and size).
+
+        Args:
+            relative_path (str): The path of the file relative to the project folder.
+            stat (os.stat_result): The current stat of the file.
+
+        Returns:
+            str: The cached content, or None if the file is new or changed.
+        """
+        entry = self.files.get(relative_path)
+        if entry is None or entry["mtime_ns"] != stat.st_mtime_ns or entry["size"] != stat.st_size:
+            return None
+        return entry["content"]
+
+    @staticmethod
+    def make_entry(stat, content):
+        """
+        Return the snapshot entry of a file.
+        """
+        return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "content": content}
+
+
+def diff_project_files(old_files, new_files):
+    """
+    Compare two versions of the project files.
+
+    Args:
+        old_files (dict): The previous file contents keyed by relative path.
+        new_files (dict): The current file contents keyed by relative path.
+
+    Returns:
+        dict: The sorted lists of "added", "modified" and "deleted" relative paths.
+    """
+    return {
+        "added": sorted(path for path in new_files if path not in old_files),
+        "modified": sorted(path for path in new_files if path in old_files and new_files[path] != old_files[path]),
+        "deleted": sorted(path for path in old_files if path not in new_files)
+    }
+
+
+def format_unified_diff(relative_path, old_content, new_content):
+    """
+    Return the unified diff of a modified file.
+    """
+    return ''.join(difflib.unified_diff(old_content.splitlines(keepends=True), new_content.splitlines(keepends=True),
+                                        fromfile=f"a/{relative_path}", tofile=f"b/{relative_path}"))
@@ -0,0 +1,148 @@
+import os
+import re
+import fnmatch
+
+# Limits of the tool results, can be overridden in the .env file: a result longer than TOOL_RESULT_MAX_CHARS
+# is cut (the model can read the rest by line range), grep stops after GREP_MAX_MATCHES matching lines
+TOOL_RESULT_MAX_CHARS = int(os.getenv('TOOL_RESULT_MAX_CHARS', '20000'))
+GREP_MAX_MATCHES = int(os.getenv('GREP_MAX_MATCHES', '100'))
+
+# The tools, with their parameters as JSON schemas, in the provider neutral format of `BaseAPIClient._format_tools`
+TOOL_DEFINITIONS = [
+    {
+        "name": "read_file",
+        "description": "Read a file of the project, or a range of its lines. The lines are numbered from 1.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "path": {"type": "string", "description": "The path of the file, relative to the project folder."},
+                "start_line": {"type": "integer", "description": "The first line to read. Defaults to the first line."},
+                "end_line": {"type": "integer", "description": "The last line to read. Defaults to the last line."}
+            },
+            "required": ["path"]
+        }
+    },
+    {
+        "name": "grep",
+        "description": "Search the project files for a regular expression. Returns the matching lines with their path and line number.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "pattern": {"type": "string", "description": "The regular expression (Python syntax)."},
+                "path": {"type": "string", "description": "Only search the files matching this glob, e.g. 'src/*.py'. Defaults to all the files."}
+            },
+            "required": ["pattern"]
+        }
+    },
+    {
+        "name": "list_dir",
+        "description": "List the files and the subdirectories of a directory of the project.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "path": {"type": "string", "description": "The directory, relative to the project folder. Defaults to the project folder."}
+            }
+        }
+    }
+]
+
+
+class ProjectTools:
+    """
+    This class serves the project files to the model through tool calls: `read_file`, `grep` and
+    `list_dir` are answered from the ingested files in memory, so only the files the model asks for
+    are sent. It is set as the `tools` of an API client, which runs the tool loop.
+    """
+
+    def __init__(self, project_files, max_result_chars=None):
+        """
+        Initialize the ProjectTools.
+
+        Args:
+            project_files (dict): The file contents keyed by relative path ('/' separated).
+            max_result_chars (int, optional): The longest result, in characters. Defaults to TOOL_RESULT_MAX_CHARS.
+        """
+        self.project_files = project_files
+        self.max_result_chars = max_result_chars or TOOL_RESULT_MAX_CHARS
+        self.definitions = TOOL_DEFINITIONS
+
+    def call(self, name, arguments):
+        """
+        Call a tool. The errors are returned to the model as the result, so it can correct its call.
+
+        Args:
+            name (str): The name of the tool.
+            arguments (dict): The arguments of the call.
+
+        Returns:
+            str: The result of the call.
+        """
+        tool = {"read_file": self.read_file, "grep": self.grep, "list_dir": self.list_dir}.get(name)
+        if tool is None:
+            return f"Error: unknown tool {name}."
+        try:
+            return self._truncate(tool(**arguments))
+        except (TypeError, ValueError, re.error) as e:
+            return f"Error: {str(e)}"
+
+    def read_file(self, path, start_line=None, end_line=None):
+        """
+        Return the lines of a file, numbered, e.g. `12: def main():`.
+        """
+        path = _normalize_path(path)
+        if path not in self.project_files:
+            raise ValueError(f"no such file: {path}.")
+        lines = self.project_files[path].splitlines()
+        start = max(1, int(start_line or 1))
+        end = min(len(lines), int(end_line or len(lines)))
+        if start > end and lines:
+            raise ValueError(f"the line range {start}-{end} is empty, {path} has {len(lines)} lines.")
+        width = len(str(end))
+        return '\n'.join(f"{number:>{width}}: {lines[number - 1]}" for number in range(start, end + 1))
+
+    def grep(self, pattern, path=None):
+        """
+        Return the lines matching a regular expression, e.g. `app.py:12: def main():`.
+        """
+        regex = re.compile(pattern)
+        matches = []
+        for file_path in sorted(self.project_files):
+            if path and not fnmatch.fnmatch(file_path, _normalize_path(path)):
+                continue
+            for number, line in enumerate(self.project_files[file_path].splitlines(), start=1):
+                if regex.search(line):
+                    matches.append(f"{file_path}:{number}: {line.strip()}")
+                    if len(matches) >= GREP_MAX_MATCHES:
+                        matches.append(f"[stopped after {GREP_MAX_MATCHES} matches, narrow the pattern or the path]")
+                        return '\n'.join(matches)
+        return '\n'.join(matches) or "No match."
+
+    def list_dir(self, path=''):
+        """
+        Return the subdirectories (with a trailing /) and the files of a directory.
+        """
+        prefix = _normalize_path(path)
+        prefix = f"{prefix}/" if prefix else ''
+        entries = set()
+        for file_path in self.project_files:
+            if file_path.startswith(prefix):
+                name, separator, _ = file_path[len(prefix):].partition('/')
+                entries.add(name + separator)
+        if not entries:
+            raise ValueError(f"no such directory: {path}.")
+        return '\n'.join(sorted(entries))
+
+    def _truncate(self, result):
+        if len(result) <= self.max_result_chars:
+            return result
+        return result[:self.max_result_chars] + "\n[truncated, read the rest by line range]"
+
+
+def _normalize_path(path):
+    """
+    Return a path relative to the project folder, '/' separated, e.g. './src/app.py' -> 'src/app.py'.
+    """
+    path = (path or '').replace('\\', '/').strip()
+    while path.startswith('./'):
+        path = path[2:]
+    return path.strip('/') if path != '.' else ''
@@ -0,0 +1,67 @@
+import ast
+import logging
+
+
+def outline_python(source):
+    """
+    Return the outline of a Python module: its classes and functions with their signatures and
+    line numbers, the methods indented under their class.
+
+    Args:
+        source (str): The source code.
+
+    Returns:
+        list: The lines of the outline, empty if the source can't be parsed.
+    """
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError) as e:
+        logging.debug(f'Cannot outline the Python source: {str(e)}')
+        return []
+    lines = []
+    _outline_nodes(tree.body, '', lines)
+    return lines
+
+
+def _outline_nodes(nodes, indent, lines):
+    for node in nodes:
+        if isinstance(node, ast.ClassDef):
+            bases = ', '.join(ast.unparse(base) for base in node.bases)
+            lines.append(f"{indent}class {node.name}{f'({bases})' if bases else ''}  [L{node.lineno}]")
+            _outline_nodes(node.body, indent + '  ', lines)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            prefix = 'async def' if isinstance(node, ast.AsyncFunctionDef) else 'def'
+            returns = f" -> {ast.unparse(node.returns)}" if node.returns else ''
+            lines.append(f"{indent}{prefix} {node.name}({ast.unparse(node.args)}){returns}  [L{node.lineno}]")
+
+
+def build_repo_map(project_files):
+    """
+    Build the map of a project: its file tree with the line count of each file, and the outline
+    of the Python files (see `outline_python`). It stands for the project in the initial prompt
+    when the files are read on demand, at a fraction of their tokens.
+
+    Args:
+        project_files (dict): The file contents keyed by relative path ('/' separated).
+
+    Returns:
+        str: The repo map.
+    """
+    lines = []
+    current_dirs = []
+    for file_path in sorted(project_files, key=lambda path: path.split('/')):
+        *dirs, name = file_path.split('/')
+        # print the directories not printed yet, indented by depth
+        common = 0
+        while common < min(len(dirs), len(current_dirs)) and dirs[common] == current_dirs[common]:
+            common += 1
+        for depth in range(common, len(dirs)):
+            lines.append(f"{'  ' * depth}{dirs[depth]}/")
+        current_dirs = dirs
+
+        content = project_files[file_path]
+        indent = '  ' * len(dirs)
+        lines.append(f"{indent}{name} ({len(content.splitlines())} lines)")
+        if name.endswith('.py'):
+            lines.extend(f"{indent}  {line}" for line in outline_python(content))
+    return '\n'.join(lines)
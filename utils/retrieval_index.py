@@ -0,0 +1,223 @@
+import os
+import re
+import hashlib
+from collections import Counter
+import numpy as np
+from api_clients.token_estimator import estimate_tokens
+
+# Retrieval settings, can be overridden in the .env file
+RETRIEVAL_CHUNK_LINES = int(os.getenv('RETRIEVAL_CHUNK_LINES', '60'))
+
+WORD_PATTERN = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+# splits camelCase, PascalCase and HTTPServer like identifiers
+CAMEL_CASE_PATTERN = re.compile(r'[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+')
+SYMBOL_PATTERN = re.compile(r'\b(?:def|class|function|func|fn|interface|struct|enum|trait|type|module)\s+([A-Za-z_][A-Za-z0-9_]*)')
+
+STOP_WORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in', 'is', 'it', 'of', 'on', 'or',
+    'that', 'the', 'this', 'to', 'was', 'we', 'with', 'you', 'can', 'please', 'should', 'would'
+}
+
+# Symbol names and file paths count as much as this many occurrences in the chunk text
+SYMBOL_WEIGHT = 3
+PATH_WEIGHT = 2
+
+
+def tokenize(text):
+    """
+    Split a text into lowercase search terms. Identifiers are kept whole and also split into
+    their snake_case and camelCase parts, so `process_project_folder` matches "project folder".
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        list: The terms, in order and with repetitions.
+    """
+    terms = []
+    for word in WORD_PATTERN.findall(text):
+        lower = word.lower()
+        if len(lower) > 1 and lower not in STOP_WORDS:
+            terms.append(lower)
+        parts = [part.lower() for piece in word.split('_') for part in CAMEL_CASE_PATTERN.findall(piece)]
+        if len(parts) > 1:
+            terms.extend(part for part in parts if len(part) > 1 and part not in STOP_WORDS)
+    return terms
+
+
+def chunk_file(file_path, content, chunk_lines=None):
+    """
+    Split a file into chunks of consecutive lines.
+
+    Args:
+        file_path (str): The path of the file relative to the project folder.
+        content (str): The content of the file.
+        chunk_lines (int, optional): The number of lines per chunk. Defaults to RETRIEVAL_CHUNK_LINES.
+
+    Returns:
+        list: The chunks, dictionaries with the "id", "path", "start" and "end" lines (1-based, inclusive),
+        "text", "symbols" and estimated "tokens".
+    """
+    chunk_lines = chunk_lines or RETRIEVAL_CHUNK_LINES
+    lines = content.splitlines(keepends=True) or ['']
+    chunks = []
+    for start in range(0, len(lines), chunk_lines):
+        text = ''.join(lines[start:start + chunk_lines])
+        chunks.append({
+            "id": f"{file_path}:{hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]}",
+            "path": file_path,
+            "start": start + 1,
+            "end": min(start + chunk_lines, len(lines)),
+            "text": text,
+            "symbols": SYMBOL_PATTERN.findall(text),
+            "tokens": estimate_tokens(text)
+        })
+    return chunks
+
+
+class RetrievalIndex:
+    """
+    This class is a BM25 index over the chunks of the project files, built offline and scored with NumPy.
+    The postings are stored term by term (CSR layout): the chunks containing a term are a contiguous slice,
+    so scoring a query only touches the postings of its terms.
+    """
+
+    def __init__(self, chunks, k1=1.5, b=0.75):
+        """
+        Initialize the RetrievalIndex.
+
+        Args:
+            chunks (list): The chunks to index, as returned by `chunk_file`.
+            k1 (float, optional): The BM25 term frequency saturation. Defaults to 1.5.
+            b (float, optional): The BM25 length normalisation. Defaults to 0.75.
+        """
+        self.chunks = chunks
+        self.vocabulary = {}
+        doc_ids, term_ids, counts = [], [], []
+        lengths = np.zeros(len(chunks), dtype=np.float32)
+        for doc_id, chunk in enumerate(chunks):
+            terms = Counter(tokenize(chunk["text"]))
+            for symbol in chunk["symbols"]:
+                for term in tokenize(symbol):
+                    terms[term] += SYMBOL_WEIGHT
+            for term in tokenize(chunk["path"]):
+                terms[term] += PATH_WEIGHT
+            lengths[doc_id] = sum(terms.values())
+            for term, count in terms.items():
+                doc_ids.append(doc_id)
+                term_ids.append(self.vocabulary.setdefault(term, len(self.vocabulary)))
+                counts.append(count)
+
+        term_ids = np.array(term_ids, dtype=np.int64)
+        order = np.argsort(term_ids, kind='stable')
+        self._doc_ids = np.array(doc_ids, dtype=np.int64)[order]
+        term_frequencies = np.array(counts, dtype=np.float32)[order]
+        self._term_offsets = np.zeros(len(self.vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(self.vocabulary)), out=self._term_offsets[1:])
+
+        document_frequencies = np.diff(self._term_offsets).astype(np.float32)
+        self._idf = np.log1p((len(chunks) - document_frequencies + 0.5) / (document_frequencies + 0.5))
+        # the BM25 weight of each posting only depends on the index, so it is computed once
+        average_length = lengths.mean() if len(chunks) else 1.0
+        length_norms = k1 * (1 - b + b * lengths / max(average_length, 1.0))
+        self._weights = term_frequencies * (k1 + 1) / (term_frequencies + length_norms[self._doc_ids])
+
+    @classmethod
+    def from_files(cls, project_files, chunk_lines=None):
+        """
+        Build the index of the project files.
+
+        Args:
+            project_files (dict): The file contents keyed by relative path.
+            chunk_lines (int, optional): The number of lines per chunk. Defaults to RETRIEVAL_CHUNK_LINES.
+
+        Returns:
+            RetrievalIndex: The index.
+        """
+        chunks = []
+        for file_path, content in sorted(project_files.items()):
+            chunks.extend(chunk_file(file_path, content, chunk_lines))
+        return cls(chunks)
+
+    def score(self, query):
+        """
+        Return the BM25 score of every chunk for a query.
+
+        Args:
+            query (str): The query text.
+
+        Returns:
+            numpy.ndarray: The scores, indexed like `chunks`.
+        """
+        scores = np.zeros(len(self.chunks), dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = self._term_offsets[term_id], self._term_offsets[term_id + 1]
+            # a chunk appears once per term, so the fancy indexed addition has no duplicates
+            scores[self._doc_ids[start:end]] += self._idf[term_id] * self._weights[start:end]
+        return scores
+
+    def search(self, query, limit=None):
+        """
+        Rank the chunks matching a query.
+
+        Args:
+            query (str): The query text.
+            limit (int, optional): The maximum number of results. Defaults to all the matching chunks.
+
+        Returns:
+            list: The (chunk, score) pairs, best first.
+        """
+        scores = self.score(query)
+        ranked = np.argsort(-scores, kind='stable')
+        ranked = ranked[scores[ranked] > 0][:limit]
+        return [(self.chunks[i], float(scores[i])) for i in ranked]
+
+    def select(self, query, token_budget, exclude=()):
+        """
+        Select the most relevant chunks for a query within a token budget.
+
+        Args:
+            query (str): The query text.
+            token_budget (int): The maximum estimated tokens of the selected chunks.
+            exclude (set, optional): The ids of the chunks not to select (e.g. already sent).
+
+        Returns:
+            list: The selected chunks, best first.
+        """
+        selected = []
+        remaining = token_budget
+        for chunk, _ in self.search(query):
+            if chunk["id"] in exclude or chunk["tokens"] > remaining:
+                continue
+            selected.append(chunk)
+            remaining -= chunk["tokens"]
+        return selected
+
+
+def format_chunks(chunks, project_files):
+    """
+    Format selected chunks for a prompt, in file and line order. Files selected in full are shown
+    like in the full project prompt, the others with the line ranges of their chunks.
+
+    Args:
+        chunks (list): The chunks.
+        project_files (dict): The file contents keyed by relative path.
+
+    Returns:
+        str: The formatted chunks.
+    """
+    by_file = {}
+    for chunk in sorted(chunks, key=lambda chunk: (chunk["path"], chunk["start"])):
+        by_file.setdefault(chunk["path"], []).append(chunk)
+
+    sections = []
+    for file_path, file_chunks in by_file.items():
+        if ''.join(chunk["text"] for chunk in file_chunks) == project_files.get(file_path):
+            sections.append(f"#{file_path}\n{project_files[file_path]}")
+            continue
+        for chunk in file_chunks:
+            sections.append(f"#{file_path} (lines {chunk['start']}-{chunk['end']})\n{chunk['text']}")
+    return "\n\n".join(sections)
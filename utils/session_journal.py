@@ -0,0 +1,237 @@
+import os
+import json
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime
+
+# Session journal settings, can be overridden in the .env file
+CHAT_JOURNAL = os.getenv('CHAT_JOURNAL', 'true').lower() != 'false'
+CHAT_JOURNAL_FSYNC = os.getenv('CHAT_JOURNAL_FSYNC', 'false').lower() == 'true'
+CHAT_JOURNAL_DIR = os.getenv('CHAT_JOURNAL_DIR', os.path.join('chat_histories', 'sessions'))
+
+
+class SessionJournal:
+    """
+    This class is an append-only JSONL journal of a chat session, one record per line: a session header
+    then the messages as they are exchanged. The records are written by a background thread, so the
+    chat never waits on the disk, and each turn is flushed (and optionally fsynced) as soon as it is
+    written, so a crash loses at most the turn in progress.
+    """
+
+    def __init__(self, path, fsync=None):
+        """
+        Initialize the SessionJournal, opening the file in append mode.
+
+        Args:
+            path (str): The path of the journal file.
+            fsync (bool, optional): Whether to fsync after each write. Defaults to CHAT_JOURNAL_FSYNC.
+        """
+        self.path = path
+        self.fsync = CHAT_JOURNAL_FSYNC if fsync is None else fsync
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+        if self._file.tell() and not _ends_with_newline(path):
+            # terminate the line truncated by a crash, so the next records stay readable
+            self._file.write('\n')
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    @classmethod
+    def create(cls, chatbot, model, directory=None, fsync=None, session_id=None, settings=None):
+        """
+        Start the journal of a new session, with its header.
+
+        Args:
+            chatbot (str): The name of the API client class.
+            model (str): The model of the session.
+            directory (str, optional): The directory of the journals. Defaults to CHAT_JOURNAL_DIR.
+            fsync (bool, optional): Whether to fsync after each write. Defaults to CHAT_JOURNAL_FSYNC.
+            session_id (str, optional): The id of the session, in the file name. Defaults to the time and the process id.
+            settings (dict, optional): The other settings of the session, to resume it (e.g. its assistant). Defaults to none.
+
+        Returns:
+            SessionJournal: The journal.
+        """
+        session_id = session_id or f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.getpid()}"
+        path = journal_path(session_id, directory)
+        journal = cls(path, fsync=fsync)
+        journal.append({"type": "session", "chatbot": chatbot, "model": model, **(settings or {}),
+                        "started": datetime.now().strftime('%Y-%m-%d %H:%M:%S')})
+        return journal
+
+    def append(self, record):
+        """
+        Queue a record to be written.
+        """
+        if self._closed:
+            raise ValueError(f'The session journal {self.path} is closed.')
+        self._queue.put(record)
+
+    def append_messages(self, messages):
+        """
+        Queue chat history messages to be written. They are copied, as the history may annotate them later.
+        """
+        for message in messages:
+            self.append({"type": "message", "message": dict(message)})
+
+    def flush(self):
+        """
+        Block until all the queued records are written.
+        """
+        self._queue.join()
+
+    def close(self):
+        """
+        Write the queued records and close the file.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        # the journals closed by their session aren't kept alive until the exit
+        atexit.unregister(self.close)
+        self._queue.put(None)
+        self._thread.join()
+        self._file.close()
+
+    def _write_loop(self):
+        while True:
+            records = [self._queue.get()]
+            # write the records queued meanwhile in the same batch
+            while True:
+                try:
+                    records.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in records
+            try:
+                lines = [json.dumps(record, ensure_ascii=False) + '\n' for record in records if record is not None]
+                self._file.write(''.join(lines))
+                self._file.flush()
+                if self.fsync:
+                    os.fsync(self._file.fileno())
+            except (OSError, TypeError, ValueError) as e:
+                logging.error(f'Failed to write to the session journal {self.path}: {str(e)}')
+            finally:
+                for _ in records:
+                    self._queue.task_done()
+            if stop:
+                return
+
+
+def journal_path(session_id, directory=None):
+    """
+    Return the path of the journal of a session id.
+    """
+    return os.path.join(directory or CHAT_JOURNAL_DIR, f"session_{session_id}.jsonl")
+
+
+def journal_session_id(path):
+    """
+    Return the session id of a journal path, the reverse of `journal_path`.
+    """
+    name = os.path.basename(path)
+    if name.startswith('session_'):
+        name = name[len('session_'):]
+    return name[:-len('.jsonl')] if name.endswith('.jsonl') else name
+
+
+def iter_journal(path):
+    """
+    Read the records of a journal one line at a time. A truncated last line (the process was
+    killed while writing it) is skipped.
+
+    Args:
+        path (str): The path of the journal file.
+
+    Yields:
+        dict: The records.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            try:
+                yield json.loads(line)
+            except ValueError:
+                logging.warning(f'Skipped an unreadable record in {path} (line {line_number}).')
+
+
+def load_journal(path):
+    """
+    Load a session journal.
+
+    Args:
+        path (str): The path of the journal file.
+
+    Returns:
+        tuple: The session header (dict, empty if missing) and the messages (list).
+    """
+    header = {}
+    messages = []
+    for record in iter_journal(path):
+        if record.get("type") == "session" and not header:
+            header = record
+        elif record.get("type") == "message":
+            messages.append(record["message"])
+    return header, messages
+
+
+def load_journal_usage(path):
+    """
+    Return the total usage of the turns of a journal (its "usage" records): cost, input and output tokens.
+    """
+    usage = {"cost": 0.0, "input_tokens": 0, "output_tokens": 0}
+    for record in iter_journal(path):
+        if record.get("type") == "usage":
+            for key in usage:
+                usage[key] += record.get(key) or 0
+    return usage
+
+
+def find_latest_journal(directory=None):
+    """
+    Return the path of the most recent journal, or None if there is none.
+    """
+    directory = directory or CHAT_JOURNAL_DIR
+    try:
+        paths = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.jsonl')]
+    except FileNotFoundError:
+        return None
+    return max(paths, key=os.path.getmtime, default=None)
+
+
+def export_journal(path, filepath):
+    """
+    Generate the JSON and Markdown exports of a journal, streaming the records so the whole
+    session is never held in memory nor written in one go.
+
+    Args:
+        path (str): The path of the journal file.
+        filepath (str): The path of the exports, without extension.
+    """
+    with open(filepath + '.json', 'w', encoding='utf-8') as json_file, open(filepath + '.md', 'w', encoding='utf-8') as md_file:
+        json_file.write('{\n    "messages": [')
+        separator = '\n'
+        for record in iter_journal(path):
+            if record.get("type") == "session":
+                md_file.write(f"*Session with {record.get('model')} ({record.get('chatbot')}), started {record.get('started')}*\n\n")
+                continue
+            if record.get("type") != "message":
+                continue
+            message = record["message"]
+            json_file.write(separator + '        ' + json.dumps(message, ensure_ascii=False))
+            separator = ',\n'
+            if message['sender'] == 'user':
+                md_file.write(f"**User ({message['timestamp']}):** {message['text']}\n\n")
+            else:
+                md_file.write(f"**Assistant ({message['timestamp']}):** {message['text']}\n\n")
+        json_file.write('\n    ]\n}\n')
+
+
+def _ends_with_newline(path):
+    with open(path, 'rb') as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b'\n'
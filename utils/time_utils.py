@@ -1,8 +1,15 @@
-import pytz
 from datetime import datetime
+from functools import lru_cache
+
+TIMEZONE = 'Asia/Ho_Chi_Minh'
+
+@lru_cache(maxsize=None)
+def get_timezone():
+    # pytz and its timezone data are only loaded when a timestamp is first shown
+    import pytz
+    return pytz.timezone(TIMEZONE)
 
 #Timezone
 def get_current_time():
-    desired_timezone = pytz.timezone('Asia/Ho_Chi_Minh')
-    current_timestamp = datetime.now(desired_timezone).strftime('%Y-%m-%d %H:%M:%S')
+    current_timestamp = datetime.now(get_timezone()).strftime('%Y-%m-%d %H:%M:%S')
     return ('['+ current_timestamp +']')